@@ -0,0 +1,22 @@
+"""Lecture des nombres décimaux reçus par les vues JSON."""
+from decimal import Decimal, InvalidOperation
+
+# Au-delà, les produits et arrondis au centime dépassent la précision du contexte décimal
+CHIFFRES_ENTIERS_MAX = 12
+
+
+def decimal_fini(valeur):
+    """``Decimal`` d'une valeur JSON (nombre ou chaîne).
+
+    Lève ``ValueError`` si la valeur n'est pas un nombre, n'est pas finie
+    (« NaN », « Infinity ») ou dépasse ``CHIFFRES_ENTIERS_MAX`` chiffres avant
+    la virgule : un ``NaN`` accepté ferait échouer la moindre comparaison, un
+    infini ou un nombre démesuré l'arrondi des montants.
+    """
+    try:
+        nombre = Decimal(str(valeur))
+    except InvalidOperation:
+        raise ValueError(f"Nombre invalide : {valeur!r}")
+    if not nombre.is_finite() or nombre.adjusted() >= CHIFFRES_ENTIERS_MAX:
+        raise ValueError(f"Nombre invalide : {valeur!r}")
+    return nombre
@@ -0,0 +1,87 @@
+"""Pagination de l'admin sans COUNT(*) complet sur les grandes tables.
+
+PostgreSQL : sans filtre ni recherche, le nombre de lignes est celui des
+statistiques du planificateur (``pg_class.reltuples``) ; avec un filtre, celui
+que le planificateur prévoit pour la requête (``EXPLAIN``). Le comptage exact
+n'est fait que pour une petite table ou un filtre sélectif, dont l'estimation
+reste sous ``SEUIL_ESTIMATION`` : il ne porte alors que sur peu de lignes.
+
+SQLite n'a pas d'estimation : le comptage est exact. Celui d'une table entière
+(parcours de son plus petit index) est fait à chaque fois ; celui d'une requête
+filtrée est mis en cache sous une version lue en base, nombre de lignes et plus
+grande clé de la table. Tout ajout ou suppression la change, qu'il passe par
+``save``, ``bulk_create`` ou un autre processus (clés ``AUTOINCREMENT`` jamais
+réutilisées) ; seules les modifications qui font entrer ou sortir une ligne du
+filtre, ou qui touchent une table jointe, attendent l'expiration du cache.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, Max
+from django.utils.functional import cached_property
+
+# En dessous de ce nombre de lignes, le comptage exact est assez rapide
+SEUIL_ESTIMATION = 10000
+
+
+class PaginateurApproximatif(Paginator):
+
+    def _table_entiere(self):
+        requete = self.object_list.query
+        return not requete.where and not requete.distinct and not requete.is_sliced
+
+    def _estimation_table(self, connexion, table):
+        with connexion.cursor() as curseur:
+            curseur.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)', [table])
+            ligne = curseur.fetchone()
+        # reltuples vaut -1 tant que la table n'a jamais été analysée
+        return ligne[0] if ligne and ligne[0] >= 0 else None
+
+    def _estimation_requete(self, connexion):
+        sql, params = self.object_list.order_by().query.sql_with_params()
+        with connexion.cursor() as curseur:
+            curseur.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = curseur.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def _compte_postgresql(self, connexion, table):
+        estimation = self._estimation_table(connexion, table)
+        if estimation is None or estimation < SEUIL_ESTIMATION:
+            return super().count
+        if self._table_entiere():
+            return estimation
+        estimation = self._estimation_requete(connexion)
+        # Filtre sélectif : peu de lignes à compter, le nombre exact est bon marché
+        return estimation if estimation >= SEUIL_ESTIMATION else super().count
+
+    def _compte_sqlite(self, alias, table):
+        tout = self.object_list.model._base_manager.using(alias)
+        version = tout.aggregate(nombre=Count('pk'), cle_max=Max('pk'))
+        if self._table_entiere():
+            return version['nombre']
+        sql, params = self.object_list.order_by().query.sql_with_params()
+        requete = hashlib.md5(repr((sql, params)).encode(), usedforsecurity=False).hexdigest()
+        duree = getattr(settings, 'PAGINATION_COMPTE_CACHE', 300)
+        return cache.get_or_set(
+            f"pagination:compte:{alias}:{table}:{version['nombre']}:{version['cle_max']}:{requete}",
+            self.object_list.count, duree,
+        )
+
+    @cached_property
+    def count(self):
+        if getattr(self.object_list, 'query', None) is None:
+            return super().count
+        alias = self.object_list.db
+        table = self.object_list.model._meta.db_table
+        connexion = connections[alias]
+        if connexion.vendor == 'postgresql':
+            return self._compte_postgresql(connexion, table)
+        if connexion.vendor == 'sqlite':
+            return self._compte_sqlite(alias, table)
+        return super().count
@@ -59,6 +59,7 @@ INSTALLED_APPS = [
     'orders',
     'production',
     'reports',
+    'search',
     'stock',
 ]
 
@@ -160,6 +161,28 @@ if os.environ.get('DEBUG') == 'False':
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Stock : refuser les sorties qui rendraient le solde d'une matière négatif
+STOCK_INTERDIRE_NEGATIF = os.environ.get('STOCK_INTERDIRE_NEGATIF', 'False') == 'True'
+
+# Stock : délai d'approvisionnement (jours) en deçà duquel une rupture prévue est signalée
+STOCK_DELAI_APPROVISIONNEMENT = int(os.environ.get('STOCK_DELAI_APPROVISIONNEMENT', '7'))
+
+# Production : écart toléré (en %) entre quantité planifiée et produite avant signalement
+PRODUCTION_TOLERANCE_RENDEMENT = float(os.environ.get('PRODUCTION_TOLERANCE_RENDEMENT', '5'))
+
+# Commandes : capacité de la centrale (m³ par jour) et rotations d'un camion par jour
+CENTRALE_CAPACITE_JOURNALIERE = float(os.environ.get('CENTRALE_CAPACITE_JOURNALIERE', '300'))
+LIVRAISON_ROTATIONS_JOURNALIERES = int(os.environ.get('LIVRAISON_ROTATIONS_JOURNALIERES', '4'))
+
+# Commandes : jours avant la livraison souhaitée en deçà desquels une commande non lancée est à risque
+COMMANDES_JOURS_ALERTE = int(os.environ.get('COMMANDES_JOURS_ALERTE', '2'))
+
+# Factures : moteur PDF, 'pisa' (gabarit HTML) ou 'reportlab' (dessin direct, plus rapide)
+FACTURE_PDF_MOTEUR = os.environ.get('FACTURE_PDF_MOTEUR', 'pisa')
+
+# Durée (secondes) du cache des nombres de lignes des listes non filtrées de l'admin (SQLite)
+PAGINATION_COMPTE_CACHE = int(os.environ.get('PAGINATION_COMPTE_CACHE', '300'))
+
 JAZZMIN_SETTINGS = {
     "site_title": "Sitrad",
     "site_header": "Sitrad",
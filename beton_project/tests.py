@@ -0,0 +1,89 @@
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+
+from customers.models import Client
+from inventory.models import MatierePremiere
+from stock.models import MouvementStock
+from stock.services import enregistrer_mouvements
+from .paginators import SEUIL_ESTIMATION, PaginateurApproximatif
+
+
+def compte(liste):
+    if hasattr(liste, 'order_by'):
+        liste = liste.order_by('pk')
+    return PaginateurApproximatif(liste, 10).count
+
+
+class PaginateurApproximatifTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for numero in range(3):
+            Client.objects.create(nom=f'Client {numero}', adresse=f'{numero} rue A, Lyon')
+
+    @skipUnless(connection.vendor == 'sqlite', 'cache du comptage : SQLite seulement')
+    def test_compte_filtre_en_cache_invalide_par_ajout_et_suppression(self):
+        filtres = Client.objects.filter(nom__startswith='Client')
+        self.assertEqual(compte(filtres), 3)
+        # Seule la version (nombre de lignes et plus grande clé) est lue
+        with self.assertNumQueries(1):
+            self.assertEqual(compte(filtres), 3)
+        Client.objects.create(nom='Client 3', adresse='3 rue A, Lyon')
+        self.assertEqual(compte(filtres), 4)
+        Client.objects.filter(nom='Client 0').delete()
+        self.assertEqual(compte(filtres), 3)
+        # Suppression puis ajout : même nombre de lignes, plus grande clé différente
+        Client.objects.filter(nom='Client 1').delete()
+        Client.objects.create(nom='Client 4', adresse='4 rue A, Lyon')
+        self.assertEqual(compte(filtres.filter(nom='Client 1')), 0)
+
+    @skipUnless(connection.vendor == 'sqlite', 'cache du comptage : SQLite seulement')
+    def test_compte_filtre_en_cache_par_requete(self):
+        self.assertEqual(compte(Client.objects.filter(nom='Client 1')), 1)
+        self.assertEqual(compte(Client.objects.filter(nom__startswith='Client')), 3)
+        with self.assertNumQueries(1):
+            self.assertEqual(compte(Client.objects.filter(nom='Client 1')), 1)
+
+    @skipUnless(connection.vendor == 'sqlite', 'cache du comptage : SQLite seulement')
+    def test_modification_sans_effet_sur_le_compte(self):
+        compte(Client.objects.filter(nom__startswith='Client'))
+        client = Client.objects.get(nom='Client 0')
+        client.adresse = '9 rue Z, Lyon'
+        client.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(compte(Client.objects.filter(nom__startswith='Client')), 3)
+
+    @skipUnless(connection.vendor == 'sqlite', 'cache du comptage : SQLite seulement')
+    def test_ajout_en_masse_sans_signal(self):
+        ciment = MatierePremiere.objects.create(nom='Ciment', unite_mesure='kg')
+        entrees = MouvementStock.objects.filter(type_mouvement='entree')
+        self.assertEqual(compte(entrees), 0)
+        # enregistrer_mouvements écrit par bulk_create, sans post_save
+        enregistrer_mouvements([MouvementStock(matiere_premiere=ciment, quantite=10, type_mouvement='entree')])
+        self.assertEqual(compte(entrees), 1)
+        self.assertEqual(compte(MouvementStock.objects.all()), 1)
+
+    def test_liste_hors_queryset(self):
+        self.assertEqual(compte([1, 2, 3]), 3)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'estimations du planificateur : PostgreSQL seulement')
+class EstimationPostgresqlTests(TestCase):
+    def setUp(self):
+        for numero in range(3):
+            Client.objects.create(nom=f'Client {numero}', adresse=f'{numero} rue A, Lyon')
+
+    def test_petite_table_comptee_exactement(self):
+        self.assertEqual(compte(Client.objects.all()), 3)
+
+    def test_filtre_selectif_compte_exactement(self):
+        with mock.patch.object(PaginateurApproximatif, '_estimation_table', return_value=10 * SEUIL_ESTIMATION):
+            self.assertEqual(compte(Client.objects.all()), 10 * SEUIL_ESTIMATION)
+            self.assertEqual(compte(Client.objects.filter(nom='Client 1')), 1)
+
+    def test_filtre_peu_selectif_estime(self):
+        with mock.patch.object(PaginateurApproximatif, '_estimation_table', return_value=10 * SEUIL_ESTIMATION), \
+                mock.patch.object(PaginateurApproximatif, '_estimation_requete', return_value=5 * SEUIL_ESTIMATION):
+            self.assertEqual(compte(Client.objects.filter(nom__startswith='Client')), 5 * SEUIL_ESTIMATION)
@@ -23,4 +23,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('reports/', include('reports.urls')),
     path('billing/', include('billing.urls')),
+    path('orders/', include('orders.urls')),
 ]
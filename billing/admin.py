@@ -1,5 +1,9 @@
-from django.contrib import admin
-from .models import Facture, LigneFacture
+from django import forms
+from django.contrib import admin, messages
+from .models import (
+    AffectationPaiement, Facture, LigneFacture, Paiement, PalierTarif, SupplementLivraison, Tarif, TarifClient,
+)
+from .paiements import affecter_paiement
 from django.urls import reverse
 from django.utils.html import format_html
 
@@ -8,15 +12,110 @@ class LigneFactureInline(admin.TabularInline):
     extra = 1
     readonly_fields = ('montant_ligne',)
 
+class AffectationFactureInline(admin.TabularInline):
+    """Paiements imputés à la facture (créés par billing.paiements)"""
+    model = AffectationPaiement
+    fields = ('paiement', 'montant', 'date_creation')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    verbose_name_plural = "Paiements affectés"
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+class FactureForm(forms.ModelForm):
+    class Meta:
+        model = Facture
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'statut' in self.fields:
+            # « Payée » découle des affectations de paiements (billing.paiements), jamais d'une saisie
+            self.fields['statut'].choices = [
+                choix for choix in Facture.STATUT_CHOICES
+                if choix[0] != 'payee' and (choix[0] != 'brouillon' or self.instance.statut == 'brouillon')
+            ]
+
 @admin.register(Facture)
 class FactureAdmin(admin.ModelAdmin):
-    list_display = ('id', 'commande', 'date_facturation', 'montant_total', 'statut', 'view_pdf_link')
+    form = FactureForm
+    list_display = ('id', 'commande', 'date_facturation', 'montant_total', 'montant_paye', 'statut', 'view_pdf_link')
     list_filter = ('date_facturation', 'statut')
-    search_fields = ('commande__id', 'commande__client__nom', 'reference')
-    inlines = [LigneFactureInline]
-    readonly_fields = ('montant_total',)
+    search_fields = ('commande__id', 'commande__client__nom')
+    inlines = [LigneFactureInline, AffectationFactureInline]
+
+    def get_readonly_fields(self, request, obj=None):
+        # Une facture payée, entamée ou annulée ne change plus de statut à la main :
+        # montant payé et statut resteraient sinon en désaccord avec les affectations
+        if obj is not None and (obj.statut in ('payee', 'annulee') or obj.montant_paye):
+            return ('montant_total', 'montant_paye', 'statut')
+        return ('montant_total', 'montant_paye')
 
     def view_pdf_link(self, obj):
         url = reverse('facture_pdf', args=[obj.id])
         return format_html('<a href="{url}">Voir PDF</a>', url=url)
     view_pdf_link.short_description = "Facture PDF"
+
+class PalierTarifInline(admin.TabularInline):
+    model = PalierTarif
+    extra = 1
+
+@admin.register(Tarif)
+class TarifAdmin(admin.ModelAdmin):
+    list_display = ('formule', 'prix_unitaire', 'date_modification')
+    search_fields = ('formule__nom',)
+    list_select_related = ('formule',)
+    inlines = [PalierTarifInline]
+
+@admin.register(TarifClient)
+class TarifClientAdmin(admin.ModelAdmin):
+    list_display = ('client', 'formule', 'prix_unitaire', 'date_modification')
+    list_filter = ('formule',)
+    search_fields = ('client__nom', 'formule__nom')
+    list_select_related = ('client', 'formule')
+    autocomplete_fields = ('client',)
+
+@admin.register(SupplementLivraison)
+class SupplementLivraisonAdmin(admin.ModelAdmin):
+    list_display = ('distance_min_km', 'supplement_m3', 'date_modification')
+    ordering = ('distance_min_km',)
+
+class AffectationPaiementInline(admin.TabularInline):
+    model = AffectationPaiement
+    fields = ('facture', 'montant', 'date_creation')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+@admin.register(Paiement)
+class PaiementAdmin(admin.ModelAdmin):
+    list_display = ('id', 'client', 'date_paiement', 'montant', 'montant_affecte', 'mode', 'reference')
+    list_filter = ('mode', 'date_paiement')
+    search_fields = ('client__nom', 'reference')
+    list_select_related = ('client',)
+    autocomplete_fields = ('client',)
+    date_hierarchy = 'date_paiement'
+    inlines = [AffectationPaiementInline]
+    actions = ['affecter']
+
+    def get_readonly_fields(self, request, obj=None):
+        # Une fois affecté, un paiement ne change plus de client ni de montant (le supprimer pour corriger)
+        if obj is not None:
+            return ('client', 'montant', 'montant_affecte')
+        return ('montant_affecte',)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if not change:
+            affecte = affecter_paiement(form.instance)
+            self.message_user(request, f"{affecte} € affectés aux factures ouvertes du client.", messages.INFO)
+
+    @admin.action(description="Affecter le montant disponible aux factures ouvertes")
+    def affecter(self, request, queryset):
+        total = sum(affecter_paiement(paiement) for paiement in queryset)
+        self.message_user(request, f"{total} € affectés.", messages.SUCCESS)
@@ -0,0 +1,98 @@
+"""Balance âgée des créances clients.
+
+Le reste à payer de toutes les factures ouvertes (envoyées et non soldées),
+quelle que soit leur date, est réparti par client en tranches d'ancienneté
+depuis la date de facturation, en une seule requête d'agrégation
+conditionnelle.
+
+Le résultat est mis en cache pour la journée, sous une version lue en base
+(nombre de factures, plus grande clé, dernière modification) : toute facture
+créée, modifiée ou supprimée la change, quel que soit le processus qui l'a
+écrite, création en masse et affectations de paiements comprises (elles
+mettent à jour ``date_modification``).
+"""
+import hashlib
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
+
+from .models import Facture
+
+STATUTS_OUVERTS = ['envoyee']
+# (clé, libellé, ancienneté minimale en jours), de la plus récente à la plus ancienne
+TRANCHES = [
+    ('courant', 'Non échu (< 30 j)', 0),
+    ('j30', '30 à 59 j', 30),
+    ('j60', '60 à 89 j', 60),
+    ('j90', '90 à 119 j', 90),
+    ('j120', '120 j et plus', 120),
+]
+
+
+@dataclass
+class LigneBalance:
+    client_id: int
+    client: str
+    nombre_factures: int
+    # Montants dus par tranche, dans l'ordre de TRANCHES
+    tranches: list
+    total: Decimal
+
+    @property
+    def plus_ancienne(self):
+        """Clé de la tranche la plus ancienne ayant un montant dû"""
+        for (cle, _, _), montant in reversed(list(zip(TRANCHES, self.tranches))):
+            if montant:
+                return cle
+        return None
+
+
+def _filtres_tranches(aujourd_hui):
+    """Condition sur la date de facturation de chaque tranche"""
+    filtres = []
+    for i, (_, _, debut) in enumerate(TRANCHES):
+        condition = Q(date_facturation__lte=aujourd_hui - timedelta(days=debut))
+        if i + 1 < len(TRANCHES):
+            condition &= Q(date_facturation__gt=aujourd_hui - timedelta(days=TRANCHES[i + 1][2]))
+        filtres.append(condition)
+    # Une facture datée du futur reste non échue
+    filtres[0] |= Q(date_facturation__gt=aujourd_hui)
+    return filtres
+
+
+def calculer_balance_agee(aujourd_hui=None):
+    aujourd_hui = aujourd_hui or timezone.localdate()
+    cles = [cle for cle, _, _ in TRANCHES]
+    reste = F('montant_total') - F('montant_paye')
+    lignes = Facture.objects.filter(statut__in=STATUTS_OUVERTS).values(
+        'commande__client_id', 'commande__client__nom'
+    ).annotate(
+        nombre_factures=Count('id'),
+        total=Sum(reste),
+        **{cle: Sum(reste, filter=condition) for cle, condition in zip(cles, _filtres_tranches(aujourd_hui))},
+    ).order_by('-total')
+    return [
+        LigneBalance(
+            client_id=ligne['commande__client_id'],
+            client=ligne['commande__client__nom'],
+            nombre_factures=ligne['nombre_factures'],
+            tranches=[ligne[cle] or Decimal('0') for cle in cles],
+            total=ligne['total'] or Decimal('0'),
+        )
+        for ligne in lignes
+    ]
+
+
+def _version():
+    """Empreinte des factures : toute création, modification ou suppression la change"""
+    etat = Facture.objects.aggregate(nombre=Count('pk'), cle_max=Max('pk'), derniere=Max('date_modification'))
+    return hashlib.md5(repr((timezone.localdate(), etat)).encode(), usedforsecurity=False).hexdigest()
+
+
+def balance_agee():
+    """Balance âgée en cache, recalculée après tout changement d'une facture"""
+    return cache.get_or_set(f'billing:balance_agee:{_version()}', calculer_balance_agee, 24 * 3600)
@@ -0,0 +1,50 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from billing.models import Facture
+from billing.pdf import MOTEURS
+
+
+class Command(BaseCommand):
+    help = "Compare les moteurs PDF des factures : temps de rendu et pic mémoire par facture"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--facture', type=int, help='Facture à rendre (la plus riche en lignes par défaut)')
+        parser.add_argument('--repetitions', type=int, default=20)
+        parser.add_argument('--moteurs', nargs='+', choices=sorted(MOTEURS), default=sorted(MOTEURS))
+
+    def handle(self, *args, **options):
+        # Client et lignes lus une fois : seul le rendu est mesuré
+        factures = Facture.objects.select_related('commande__client').prefetch_related('lignes')
+        if options['facture']:
+            facture = factures.filter(pk=options['facture']).first()
+        else:
+            facture = factures.annotate(nombre_lignes=Count('lignes')).order_by('-nombre_lignes', '-id').first()
+        if facture is None:
+            raise CommandError("Aucune facture à rendre")
+
+        repetitions = options['repetitions']
+        self.stdout.write(f"Facture {facture.id} ({len(facture.lignes.all())} ligne(s)), {repetitions} rendus")
+        for nom in options['moteurs']:
+            rendre = MOTEURS[nom]
+            # Premier rendu à part : chargement des modules, polices et du logo
+            debut = time.perf_counter()
+            taille = len(rendre(facture))
+            premier = time.perf_counter() - debut
+
+            debut = time.perf_counter()
+            for _ in range(repetitions):
+                rendre(facture)
+            moyenne = (time.perf_counter() - debut) / repetitions
+
+            tracemalloc.start()
+            rendre(facture)
+            _, pic = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(
+                f"  {nom:<10} premier rendu {premier * 1000:7.1f} ms, ensuite {moyenne * 1000:7.1f} ms/facture, "
+                f"pic mémoire {pic / 1024:8.0f} Ko, {taille / 1024:.0f} Ko"
+            )
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.services import TAILLE_LOT, commandes_a_facturer, facturer_commandes
+
+
+def _date(valeur):
+    try:
+        return datetime.strptime(valeur, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Date invalide : {valeur} (format attendu AAAA-MM-JJ)")
+
+
+class Command(BaseCommand):
+    help = "Facture en masse les commandes livrées et non facturées d'une période, au tarif en vigueur"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--debut', type=_date, help='Première date de livraison (AAAA-MM-JJ)')
+        parser.add_argument('--fin', type=_date, help='Dernière date de livraison (AAAA-MM-JJ)')
+        parser.add_argument('--statut', default='brouillon', choices=['brouillon', 'envoyee'])
+        parser.add_argument('--taille-lot', type=int, default=TAILLE_LOT)
+
+    def handle(self, *args, **options):
+        commandes = commandes_a_facturer(options['debut'], options['fin'])
+        resultat = facturer_commandes(commandes, statut=options['statut'], taille_lot=options['taille_lot'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultat.factures} facture(s), {resultat.lignes} ligne(s), {resultat.montant_total} €"
+        ))
+        for commande_id, formules in resultat.sans_tarif.items():
+            self.stdout.write(self.style.WARNING(
+                f"Commande {commande_id} non facturée : pas de tarif pour {', '.join(formules)}"
+            ))
+        if resultat.sans_lignes:
+            self.stdout.write(self.style.WARNING(
+                f"Commande(s) non facturée(s), sans ligne : {', '.join(map(str, resultat.sans_lignes))}"
+            ))
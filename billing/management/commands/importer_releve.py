@@ -0,0 +1,50 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.releves import LECTEURS, TAILLE_LOT, ReleveInvalide, importer_releve
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe un relevé bancaire (CSV ou OFX) et enregistre les virements rapprochés "
+        "des factures ouvertes (numéro de facture, client) ; un montant seul est proposé, pas enregistré"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier')
+        parser.add_argument('--format', choices=sorted(LECTEURS), help="Déduit de l'extension par défaut")
+        parser.add_argument('--simulation', action='store_true', help="Rapproche sans rien enregistrer")
+        parser.add_argument('--taille-lot', type=int, default=TAILLE_LOT)
+
+    def handle(self, *args, **options):
+        chemin = Path(options['fichier'])
+        format_releve = options['format'] or chemin.suffix.lstrip('.').lower()
+        if format_releve not in LECTEURS:
+            raise CommandError(f"Format inconnu : {format_releve} (préciser --format)")
+        try:
+            with chemin.open('rb') as fichier:
+                resultat = importer_releve(
+                    fichier, format_releve, simulation=options['simulation'], taille_lot=options['taille_lot'],
+                )
+        except (OSError, ReleveInvalide) as erreur:
+            raise CommandError(str(erreur))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultat.lignes} ligne(s) lue(s), {resultat.ignorees} ignorée(s), "
+            f"{resultat.paiements} paiement(s) pour {resultat.montant} €"
+            + (" (simulation, rien n'a été enregistré)" if options['simulation'] else "")
+        ))
+        for mode, nombre in sorted(resultat.rapprochements.items()):
+            self.stdout.write(f"  rapprochement par {mode} : {nombre}")
+        for suggestion in resultat.suggestions[:20]:
+            ligne = suggestion.ligne
+            self.stdout.write(self.style.WARNING(
+                f"À confirmer : {ligne.date} {ligne.montant} € {ligne.libelle} -> facture F{suggestion.facture_id}"
+            ))
+        if len(resultat.suggestions) > 20:
+            self.stdout.write(self.style.WARNING(f"... et {len(resultat.suggestions) - 20} autre(s) à confirmer"))
+        for ligne in resultat.non_rapprochees[:20]:
+            self.stdout.write(self.style.WARNING(f"Non rapprochée : {ligne.date} {ligne.montant} € {ligne.libelle}"))
+        if len(resultat.non_rapprochees) > 20:
+            self.stdout.write(self.style.WARNING(f"... et {len(resultat.non_rapprochees) - 20} autre(s)"))
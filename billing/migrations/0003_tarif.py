@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0002_facture_date_modification'),
+        ('formulas', '0002_formulebeton_quantite_produite_reference'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lignefacture',
+            name='formule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='formulas.formulebeton'),
+        ),
+        migrations.CreateModel(
+            name='Tarif',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prix_unitaire', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('date_modification', models.DateTimeField(auto_now=True)),
+                ('formule', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tarif', to='formulas.formulebeton')),
+            ],
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0003_tarif'),
+        ('customers', '0005_chantier_distance_km'),
+        ('formulas', '0002_formulebeton_quantite_produite_reference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupplementLivraison',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance_min_km', models.DecimalField(decimal_places=1, max_digits=7, unique=True)),
+                ('supplement_m3', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('date_modification', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['distance_min_km'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PalierTarif',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('volume_min', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('prix_unitaire', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('date_modification', models.DateTimeField(auto_now=True)),
+                ('tarif', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='paliers', to='billing.tarif')),
+            ],
+            options={
+                'ordering': ['tarif', 'volume_min'],
+                'unique_together': {('tarif', 'volume_min')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TarifClient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prix_unitaire', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('date_modification', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tarifs', to='customers.client')),
+                ('formule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='formulas.formulebeton')),
+            ],
+            options={
+                'unique_together': {('client', 'formule')},
+            },
+        ),
+    ]
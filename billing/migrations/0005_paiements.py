@@ -0,0 +1,65 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def renseigner_montants_payes(apps, schema_editor):
+    # Les factures déjà payées l'ont été sans paiement enregistré : elles sont réputées soldées
+    Facture = apps.get_model('billing', 'Facture')
+    StatistiquesClient = apps.get_model('customers', 'StatistiquesClient')
+    Facture.objects.filter(statut='payee').update(montant_paye=F('montant_total'))
+    restes = Facture.objects.filter(statut='envoyee').values('commande__client_id').annotate(
+        reste=Sum('montant_total')
+    ).values_list('commande__client_id', 'reste')
+    for client_id, reste in restes:
+        StatistiquesClient.objects.filter(client_id=client_id).update(encours=reste)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0004_supplementlivraison_paliertarif_tarifclient'),
+        ('customers', '0006_statistiquesclient_encours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facture',
+            name='montant_paye',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='Paiement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_paiement', models.DateField(default=django.utils.timezone.localdate)),
+                ('montant', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('mode', models.CharField(choices=[('virement', 'Virement'), ('cheque', 'Chèque'), ('especes', 'Espèces'), ('carte', 'Carte bancaire'), ('prelevement', 'Prélèvement')], default='virement', max_length=20)),
+                ('reference', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('commentaire', models.TextField(blank=True)),
+                ('montant_affecte', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='paiements', to='customers.client')),
+            ],
+            options={
+                'ordering': ['-date_paiement', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AffectationPaiement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('montant', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('facture', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='affectations', to='billing.facture')),
+                ('paiement', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='affectations', to='billing.paiement')),
+            ],
+            options={
+                'unique_together': {('paiement', 'facture')},
+            },
+        ),
+        migrations.RunPython(renseigner_montants_payes, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,8 @@
 from django.db import models
+from django.utils import timezone
 from orders.models import Commande
+from formulas.models import FormuleBeton
+from customers.models import Client
 
 class Facture(models.Model):
     STATUT_CHOICES = [
@@ -12,12 +15,21 @@ class Facture(models.Model):
     date_facturation = models.DateField(auto_now_add=True)
     montant_total = models.DecimalField(max_digits=10, decimal_places=2)
     statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='brouillon')
+    # Somme des affectations de paiements, tenue à jour par billing.paiements
+    montant_paye = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    date_modification = models.DateTimeField(auto_now=True)
+
+    @property
+    def reste_a_payer(self):
+        return self.montant_total - self.montant_paye
 
     def __str__(self):
         return f"Facture {self.id} pour la commande {self.commande.id}"
 
 class LigneFacture(models.Model):
     facture = models.ForeignKey(Facture, related_name='lignes', on_delete=models.CASCADE)
+    # Renseignée par la facturation automatique (vide pour une ligne libre)
+    formule = models.ForeignKey(FormuleBeton, null=True, blank=True, on_delete=models.SET_NULL)
     description = models.CharField(max_length=255)
     quantite = models.DecimalField(max_digits=10, decimal_places=2)
     prix_unitaire = models.DecimalField(max_digits=10, decimal_places=2)
@@ -25,3 +37,93 @@ class LigneFacture(models.Model):
 
     def __str__(self):
         return f"Ligne pour facture {self.facture.id}: {self.description}"
+
+class Tarif(models.Model):
+    """Prix de base au m³ d'une formule (voir billing.tarification)"""
+    formule = models.OneToOneField(FormuleBeton, related_name='tarif', on_delete=models.CASCADE)
+    prix_unitaire = models.DecimalField(max_digits=10, decimal_places=2)
+    date_modification = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.formule.nom} : {self.prix_unitaire} €/m³"
+
+class PalierTarif(models.Model):
+    """Prix au m³ d'une formule à partir d'un volume commandé"""
+    tarif = models.ForeignKey(Tarif, related_name='paliers', on_delete=models.CASCADE)
+    volume_min = models.DecimalField(max_digits=10, decimal_places=2)
+    prix_unitaire = models.DecimalField(max_digits=10, decimal_places=2)
+    date_modification = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('tarif', 'volume_min')
+        ordering = ['tarif', 'volume_min']
+
+    def __str__(self):
+        return f"{self.tarif.formule.nom} dès {self.volume_min} m³ : {self.prix_unitaire} €/m³"
+
+class TarifClient(models.Model):
+    """Prix négocié d'une formule pour un client ; prioritaire sur le prix de base et les paliers"""
+    client = models.ForeignKey(Client, related_name='tarifs', on_delete=models.CASCADE)
+    formule = models.ForeignKey(FormuleBeton, on_delete=models.CASCADE)
+    prix_unitaire = models.DecimalField(max_digits=10, decimal_places=2)
+    date_modification = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('client', 'formule')
+
+    def __str__(self):
+        return f"{self.client.nom} - {self.formule.nom} : {self.prix_unitaire} €/m³"
+
+class SupplementLivraison(models.Model):
+    """Supplément au m³ livré à partir d'une distance du chantier"""
+    distance_min_km = models.DecimalField(max_digits=7, decimal_places=1, unique=True)
+    supplement_m3 = models.DecimalField(max_digits=10, decimal_places=2)
+    date_modification = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['distance_min_km']
+
+    def __str__(self):
+        return f"Dès {self.distance_min_km} km : +{self.supplement_m3} €/m³"
+
+class Paiement(models.Model):
+    """Règlement reçu d'un client, affecté à ses factures (voir billing.paiements)"""
+    MODE_CHOICES = [
+        ('virement', 'Virement'),
+        ('cheque', 'Chèque'),
+        ('especes', 'Espèces'),
+        ('carte', 'Carte bancaire'),
+        ('prelevement', 'Prélèvement'),
+    ]
+    client = models.ForeignKey(Client, related_name='paiements', on_delete=models.PROTECT)
+    date_paiement = models.DateField(default=timezone.localdate)
+    montant = models.DecimalField(max_digits=12, decimal_places=2)
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES, default='virement')
+    reference = models.CharField(max_length=100, blank=True, db_index=True)
+    commentaire = models.TextField(blank=True)
+    # Part déjà affectée à des factures ; le reste est un avoir du client
+    montant_affecte = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    date_creation = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-date_paiement', '-id']
+
+    @property
+    def montant_disponible(self):
+        return self.montant - self.montant_affecte
+
+    def __str__(self):
+        return f"Paiement {self.id} de {self.client.nom} : {self.montant} €"
+
+class AffectationPaiement(models.Model):
+    """Part d'un paiement imputée à une facture"""
+    paiement = models.ForeignKey(Paiement, related_name='affectations', on_delete=models.CASCADE)
+    facture = models.ForeignKey(Facture, related_name='affectations', on_delete=models.CASCADE)
+    montant = models.DecimalField(max_digits=12, decimal_places=2)
+    date_creation = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('paiement', 'facture')
+
+    def __str__(self):
+        return f"{self.montant} € du paiement {self.paiement_id} sur la facture {self.facture_id}"
@@ -0,0 +1,126 @@
+"""Enregistrement et affectation des paiements clients.
+
+Un paiement est imputé aux factures envoyées de son client, les plus
+anciennes d'abord (ou à celles désignées). Chaque affectation augmente le
+montant payé de la facture, qui passe à « payée » une fois soldée, et la part
+affectée du paiement ; ces deux cumuls sont tenus à jour de façon
+incrémentale, sous verrou, sans jamais réagréger l'historique des paiements.
+
+L'encours du client (``StatistiquesClient.encours``) est recalculé pour ce
+seul client à la validation de la transaction, comme ses autres statistiques.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from . import balance_agee
+from .models import AffectationPaiement, Facture, Paiement
+
+
+class PaiementInvalide(ValueError):
+    pass
+
+
+def apres_affectation(*client_ids):
+    """Encours des clients à rafraîchir après des affectations en masse"""
+    from customers.services import planifier_recalcul
+
+    # Les mises à jour en masse n'envoient pas de signaux
+    planifier_recalcul(*client_ids)
+
+
+def affecter_paiement(paiement, facture_ids=None):
+    """Impute la part disponible d'un paiement aux factures ouvertes de son client.
+
+    Renvoie le montant affecté. ``facture_ids`` restreint l'imputation à ces
+    factures (toujours les plus anciennes d'abord).
+    """
+    with transaction.atomic():
+        paiement = Paiement.objects.select_for_update().get(pk=paiement.pk)
+        disponible = paiement.montant_disponible
+        if disponible <= 0:
+            return Decimal('0')
+
+        factures = Facture.objects.select_for_update().filter(
+            commande__client_id=paiement.client_id,
+            statut__in=balance_agee.STATUTS_OUVERTS,
+            montant_paye__lt=F('montant_total'),
+        ).order_by('date_facturation', 'id')
+        if facture_ids is not None:
+            factures = factures.filter(id__in=facture_ids)
+
+        existantes = {
+            affectation.facture_id: affectation
+            for affectation in AffectationPaiement.objects.filter(paiement=paiement)
+        }
+        maintenant = timezone.now()
+        modifiees, nouvelles, augmentees = [], [], []
+        for facture in factures:
+            if disponible <= 0:
+                break
+            part = min(facture.reste_a_payer, disponible)
+            disponible -= part
+            facture.montant_paye += part
+            if facture.montant_paye >= facture.montant_total:
+                facture.statut = 'payee'
+            facture.date_modification = maintenant
+            modifiees.append(facture)
+            if facture.id in existantes:
+                existantes[facture.id].montant += part
+                augmentees.append(existantes[facture.id])
+            else:
+                nouvelles.append(AffectationPaiement(paiement=paiement, facture=facture, montant=part))
+
+        affecte = paiement.montant_disponible - disponible
+        if not affecte:
+            return affecte
+        Facture.objects.bulk_update(modifiees, ['montant_paye', 'statut', 'date_modification'])
+        AffectationPaiement.objects.bulk_create(nouvelles)
+        AffectationPaiement.objects.bulk_update(augmentees, ['montant'])
+        Paiement.objects.filter(pk=paiement.pk).update(montant_affecte=F('montant_affecte') + affecte)
+        apres_affectation(paiement.client_id)
+    return affecte
+
+
+def enregistrer_paiement(client_id, montant, date_paiement=None, mode='virement', reference='',
+                         commentaire='', facture_ids=None):
+    """Crée un paiement et l'affecte aussitôt ; le reste éventuel devient un avoir"""
+    montant = Decimal(montant)
+    if montant <= 0:
+        raise PaiementInvalide("Le montant d'un paiement doit être positif.")
+    with transaction.atomic():
+        paiement = Paiement.objects.create(
+            client_id=client_id,
+            montant=montant,
+            date_paiement=date_paiement or timezone.localdate(),
+            mode=mode,
+            reference=reference,
+            commentaire=commentaire,
+        )
+        affecter_paiement(paiement, facture_ids)
+    paiement.refresh_from_db(fields=['montant_affecte'])
+    return paiement
+
+
+def annuler_affectations(affectations):
+    """Retire des factures et des paiements les montants d'affectations supprimées.
+
+    Une facture payée redevient envoyée si elle n'est plus soldée.
+    """
+    maintenant = timezone.now()
+    client_ids = set()
+    for facture_id, paiement_id, montant in affectations:
+        reste = F('montant_paye') - montant
+        Facture.objects.filter(pk=facture_id).update(
+            montant_paye=reste,
+            statut=Case(
+                When(statut='payee', montant_total__gt=reste, then=Value('envoyee')),
+                default=F('statut'),
+            ),
+            date_modification=maintenant,
+        )
+        Paiement.objects.filter(pk=paiement_id).update(montant_affecte=F('montant_affecte') - montant)
+        client_ids.update(Facture.objects.filter(pk=facture_id).values_list('commande__client_id', flat=True))
+    apres_affectation(*client_ids)
@@ -0,0 +1,256 @@
+"""Rendu PDF des factures.
+
+Deux moteurs, choisis par le réglage ``FACTURE_PDF_MOTEUR`` :
+
+- ``pisa`` : le gabarit HTML ``billing/facture_pdf.html`` converti par
+  xhtml2pdf (analyse HTML et mise en page CSS à chaque facture) ;
+- ``reportlab`` : la même mise en page dessinée directement sur le canevas.
+  Polices standard, logo, styles et bloc société sont préparés une fois par
+  processus ; une facture ne coûte plus que le dessin de ses lignes.
+
+``bench_factures_pdf`` compare les deux moteurs (temps et mémoire par facture).
+"""
+import io
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.template.loader import get_template
+from num2words import num2words
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfgen.canvas import Canvas
+from xhtml2pdf import pisa
+
+TAUX_TVA = Decimal('0.20')
+SOCIETE = [
+    ('Capital', '10 000 000.00 DH'),
+    ('IF', '3383587'),
+    ('RC', '74157'),
+    ('ICE', '000096411000092'),
+    ('CNSS', '7938220'),
+    ('Adresse', 'N11 IMM 05 RES. EL OSRA AV.TARIK BEN ZIAD-TEMARA'),
+    ('TEL', '06 61 63 75 18'),
+    ('Email', 'sitrad.office@gmail.com'),
+    ('Patente', '26944649'),
+]
+PIED_DE_PAGE = "SITRAD S.A.R.L - Ensemble nous construisons l'avenir"
+
+
+class RenduImpossible(Exception):
+    pass
+
+
+def total_en_lettres(facture):
+    return num2words(facture.montant_total, lang='fr')
+
+
+def montants(facture):
+    """``(hors taxes, TVA)`` d'une facture.
+
+    Le total (et donc les lignes qui le composent) s'entend TTC : c'est le
+    montant que règlent les paiements et que suit la balance âgée.
+    """
+    hors_taxes = (facture.montant_total / (1 + TAUX_TVA)).quantize(Decimal('0.01'))
+    return hors_taxes, facture.montant_total - hors_taxes
+
+
+# ==================== PISA ====================
+
+def rendre_pisa(facture):
+    html = get_template('billing/facture_pdf.html').render({
+        'facture': facture,
+        'total_en_lettres': total_en_lettres(facture),
+        'montants': montants(facture),
+    })
+    sortie = io.BytesIO()
+    if pisa.CreatePDF(html, dest=sortie).err:
+        raise RenduImpossible(html)
+    return sortie.getvalue()
+
+
+# ==================== REPORTLAB ====================
+
+@lru_cache(maxsize=None)
+def _ressources():
+    """Logo et mesures préparés une fois par processus"""
+    chemin = finders.find('images/logo.png')
+    logo = ImageReader(chemin) if chemin else None
+    largeur_logo = 150 * 0.75
+    hauteur_logo = 0
+    if logo:
+        largeur, hauteur = logo.getSize()
+        hauteur_logo = largeur_logo * hauteur / largeur
+    return {
+        'page': A4,
+        'marge': 1 * cm,
+        'logo': logo,
+        'logo_taille': (largeur_logo, hauteur_logo),
+    }
+
+
+# Colonnes du tableau : libellé, largeur relative, alignement à droite
+COLONNES = [
+    ('Désignation', 0.46, False),
+    ('Ut', 0.08, False),
+    ('PU TTC', 0.16, True),
+    ('Qté', 0.12, True),
+    ('Total TTC', 0.18, True),
+]
+HAUTEUR_LIGNE = 12
+POLICE, POLICE_GRASSE, TAILLE = 'Helvetica', 'Helvetica-Bold', 9
+
+
+class _Page:
+    """Curseur vertical sur le canevas, avec saut de page"""
+
+    def __init__(self, canevas, ressources):
+        self.canevas = canevas
+        self.largeur, self.hauteur = ressources['page']
+        self.marge = ressources['marge']
+        self.y = self.hauteur - self.marge
+
+    def pied(self):
+        self.canevas.setFont(POLICE, 8)
+        self.canevas.drawCentredString(self.largeur / 2, self.marge / 2, PIED_DE_PAGE)
+
+    def reserver(self, hauteur):
+        """Passe à la page suivante s'il ne reste pas ``hauteur`` points ; renvoie True si saut"""
+        if self.y - hauteur >= self.marge + 12:
+            return False
+        self.pied()
+        self.canevas.showPage()
+        self.y = self.hauteur - self.marge
+        return True
+
+
+def _entete(page, ressources, facture):
+    canevas = page.canevas
+    logo = ressources['logo']
+    largeur_logo, hauteur_logo = ressources['logo_taille']
+    if logo:
+        canevas.drawImage(logo, page.marge, page.y - hauteur_logo, largeur_logo, hauteur_logo, mask='auto')
+
+    y = page.y - TAILLE
+    droite = page.largeur - page.marge
+    for libelle, valeur in SOCIETE:
+        canevas.setFont(POLICE, TAILLE)
+        canevas.drawRightString(droite, y, valeur)
+        canevas.setFont(POLICE_GRASSE, TAILLE)
+        canevas.drawRightString(droite - canevas.stringWidth(valeur, POLICE, TAILLE) - 3, y, f"{libelle}:")
+        y -= HAUTEUR_LIGNE
+    page.y = min(y, page.y - hauteur_logo) - 18
+
+    canevas.setFont(POLICE_GRASSE, 18)
+    canevas.drawString(page.marge, page.y, f"Facture N° F{facture.id}")
+    page.y -= 24
+
+    client = facture.commande.client
+    gauche = [('Client', client.nom), ('Commande', str(facture.commande_id))]
+    milieu = page.largeur / 2 + 10
+    droite_infos = [('Date', facture.date_facturation.strftime('%d/%m/%Y') if facture.date_facturation else '')]
+    for i in range(max(len(gauche), len(droite_infos))):
+        for colonne, x in ((gauche, page.marge), (droite_infos, milieu)):
+            if i < len(colonne):
+                libelle, valeur = colonne[i]
+                canevas.setFont(POLICE_GRASSE, TAILLE)
+                canevas.drawString(x, page.y, f"{libelle}:")
+                canevas.setFont(POLICE, TAILLE)
+                canevas.drawString(x + canevas.stringWidth(f"{libelle}: ", POLICE_GRASSE, TAILLE), page.y, valeur)
+        page.y -= HAUTEUR_LIGNE
+    page.y -= 10
+
+
+def _tableau(page, lignes):
+    canevas = page.canevas
+    largeur = page.largeur - 2 * page.marge
+    positions = []
+    x = page.marge
+    for libelle, part, a_droite in COLONNES:
+        positions.append((x, largeur * part, a_droite))
+        x += largeur * part
+
+    def titres():
+        canevas.setFillGray(0.95)
+        canevas.rect(page.marge, page.y - 4, largeur, HAUTEUR_LIGNE + 4, stroke=1, fill=1)
+        canevas.setFillGray(0)
+        canevas.setFont(POLICE_GRASSE, TAILLE)
+        for (libelle, _, a_droite), (x, largeur_colonne, _) in zip(COLONNES, positions):
+            if a_droite:
+                canevas.drawRightString(x + largeur_colonne - 4, page.y, libelle)
+            else:
+                canevas.drawString(x + 4, page.y, libelle)
+        page.y -= HAUTEUR_LIGNE + 4
+
+    canevas.setStrokeGray(0.85)
+    titres()
+    canevas.setFont(POLICE, TAILLE)
+    for ligne in lignes:
+        designation = simpleSplit(ligne.description, POLICE, TAILLE, positions[0][1] - 8) or ['']
+        hauteur = HAUTEUR_LIGNE * len(designation) + 4
+        if page.reserver(hauteur):
+            titres()
+            canevas.setFont(POLICE, TAILLE)
+        valeurs = ['m³' if ligne.formule_id else '', str(ligne.prix_unitaire), str(ligne.quantite),
+                   str(ligne.montant_ligne)]
+        canevas.rect(page.marge, page.y - hauteur + HAUTEUR_LIGNE, largeur, hauteur, stroke=1, fill=0)
+        for i, texte in enumerate(designation):
+            canevas.drawString(positions[0][0] + 4, page.y - i * HAUTEUR_LIGNE, texte)
+        for valeur, (x, largeur_colonne, a_droite) in zip(valeurs, positions[1:]):
+            if a_droite:
+                canevas.drawRightString(x + largeur_colonne - 4, page.y, valeur)
+            else:
+                canevas.drawString(x + 4, page.y, valeur)
+        page.y -= hauteur
+    page.y -= 10
+
+
+def _totaux(page, facture):
+    canevas = page.canevas
+    hors_taxes, tva = montants(facture)
+    page.reserver(4 * HAUTEUR_LIGNE + 40)
+    droite = page.largeur - page.marge
+    gauche = droite - (page.largeur - 2 * page.marge) * 0.4
+    for libelle, valeur, police in (
+        ('Total HT', hors_taxes, POLICE),
+        (f'TVA {TAUX_TVA * 100:.0f}%', tva, POLICE),
+        ('Total TTC', facture.montant_total, POLICE_GRASSE),
+    ):
+        canevas.setFont(police, TAILLE)
+        canevas.drawString(gauche, page.y, libelle)
+        canevas.drawRightString(droite, page.y, str(valeur))
+        page.y -= HAUTEUR_LIGNE + 2
+    page.y -= 10
+
+    canevas.setFont(POLICE, TAILLE)
+    phrase = f"Arrêtée la présente facture, à la somme en DH T.T.C de : {total_en_lettres(facture)}"
+    for texte in simpleSplit(phrase, POLICE, TAILLE, page.largeur - 2 * page.marge):
+        page.reserver(HAUTEUR_LIGNE)
+        canevas.drawString(page.marge, page.y, texte)
+        page.y -= HAUTEUR_LIGNE
+
+
+def rendre_reportlab(facture):
+    ressources = _ressources()
+    sortie = io.BytesIO()
+    canevas = Canvas(sortie, pagesize=ressources['page'], pageCompression=1)
+    canevas.setTitle(f"Facture {facture.id}")
+    page = _Page(canevas, ressources)
+    _entete(page, ressources, facture)
+    _tableau(page, facture.lignes.all())
+    _totaux(page, facture)
+    page.pied()
+    canevas.showPage()
+    canevas.save()
+    return sortie.getvalue()
+
+
+MOTEURS = {'pisa': rendre_pisa, 'reportlab': rendre_reportlab}
+
+
+def rendre_facture(facture, moteur=None):
+    """PDF d'une facture avec le moteur demandé (celui du réglage par défaut)"""
+    moteur = moteur or getattr(settings, 'FACTURE_PDF_MOTEUR', 'pisa')
+    return MOTEURS[moteur](facture)
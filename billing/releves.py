@@ -0,0 +1,356 @@
+"""Import des relevés bancaires et rapprochement automatique des virements.
+
+Le fichier (CSV ou OFX) est lu ligne à ligne, sans être chargé en mémoire.
+Les factures ouvertes sont verrouillées et indexées une seule fois par import
+dans des dictionnaires : par numéro de facture, par reste à payer, par client
+et reste à payer ; les clients le sont par nom normalisé. Chaque crédit du
+relevé est rapproché, dans l'ordre :
+
+1. du numéro de facture cité dans le libellé (``F123``, ``FACTURE 123``), si
+   le libellé nomme aussi le client de la facture ou si le montant en solde
+   le reste ;
+2. du client nommé dans le libellé et d'une facture de ce client au même reste ;
+3. du seul client nommé : le paiement est imputé à ses factures les plus anciennes.
+
+Un crédit qui n'a pour lui que son montant, égal au reste d'une facture unique
+tous clients confondus, n'est pas enregistré : un remboursement fournisseur ou
+le virement d'un autre client tomberait aussi bien sur cette facture. Il est
+rendu comme suggestion, à confirmer à la main (``confirmer_suggestion``).
+
+Les paiements et affectations sont ensuite écrits par lots (``bulk_create``),
+les montants payés par une mise à jour par lot de factures. L'identifiant de chaque ligne (FITID, ou
+empreinte date-montant-libellé en CSV) est gardé comme référence du paiement :
+réimporter un relevé n'enregistre pas deux fois le même virement.
+"""
+import csv
+import hashlib
+import io
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from customers.models import Client
+
+from . import balance_agee
+from .models import AffectationPaiement, Facture, Paiement
+from .paiements import apres_affectation, enregistrer_paiement
+
+TAILLE_LOT = 1000
+# Nombre maximal de mots d'un nom de client cherché dans un libellé
+MOTS_NOM_MAX = 5
+REFERENCE_FACTURE = re.compile(r'\bF(?:ACT(?:URE)?)?\s*(?:N\s*)?(\d+)\b')
+PREFIXE_CSV = 'RLV-'
+
+
+class ReleveInvalide(ValueError):
+    pass
+
+
+@dataclass
+class LigneReleve:
+    date: date
+    montant: Decimal
+    libelle: str
+    identifiant: str
+
+
+@dataclass
+class Suggestion:
+    """Crédit égal au reste d'une seule facture, sans autre indice : à confirmer"""
+    ligne: LigneReleve
+    facture_id: int
+    client_id: int
+
+
+@dataclass
+class ResultatImport:
+    lignes: int = 0
+    # Débits et lignes déjà importées, ignorés
+    ignorees: int = 0
+    paiements: int = 0
+    montant: Decimal = Decimal('0')
+    # Mode de rapprochement -> nombre de lignes
+    rapprochements: dict = field(default_factory=dict)
+    non_rapprochees: list = field(default_factory=list)
+    suggestions: list = field(default_factory=list)
+
+
+def _normaliser(texte):
+    texte = unicodedata.normalize('NFKD', texte or '')
+    texte = ''.join(caractere for caractere in texte if not unicodedata.combining(caractere))
+    return ' '.join(re.sub(r'[^A-Z0-9]+', ' ', texte.upper()).split())
+
+
+def _montant(valeur):
+    valeur = (valeur or '').strip().replace('\xa0', '').replace(' ', '')
+    if ',' in valeur:
+        valeur = valeur.replace('.', '').replace(',', '.')
+    try:
+        return Decimal(valeur)
+    except InvalidOperation:
+        raise ReleveInvalide(f"Montant invalide : {valeur!r}")
+
+
+@lru_cache(maxsize=1024)
+def _date(valeur):
+    valeur = (valeur or '').strip()
+    # Les dates OFX (AAAAMMJJHHMMSS[fuseau]) sont réduites au jour ; un relevé compte peu de dates distinctes
+    essais = [(valeur, format_date) for format_date in ('%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y')]
+    essais.append((valeur[:8], '%Y%m%d'))
+    for texte, format_date in essais:
+        try:
+            return datetime.strptime(texte, format_date).date()
+        except ValueError:
+            continue
+    raise ReleveInvalide(f"Date invalide : {valeur!r}")
+
+
+# ==================== LECTURE ====================
+
+COLONNES_CSV = {
+    'date': ('date', 'date operation', 'date valeur'),
+    'montant': ('montant', 'credit', 'montant eur'),
+    'libelle': ('libelle', 'libelle operation', 'description'),
+    'identifiant': ('reference', 'identifiant', 'id'),
+}
+
+
+def lire_csv(fichier):
+    """Lignes d'un relevé CSV (séparateur ``;`` ou ``,``, en-tête obligatoire)"""
+    texte = io.TextIOWrapper(fichier, encoding='utf-8-sig', newline='')
+    entete = texte.readline()
+    separateur = ';' if entete.count(';') >= entete.count(',') else ','
+    noms = [_normaliser(nom).lower() for nom in next(csv.reader([entete], delimiter=separateur))]
+    index = {}
+    for cle, alias in COLONNES_CSV.items():
+        for i, nom in enumerate(noms):
+            if nom in alias:
+                index[cle] = i
+                break
+    if not {'date', 'montant', 'libelle'} <= index.keys():
+        raise ReleveInvalide("Colonnes attendues : date, montant, libellé (référence facultative)")
+
+    vues = {}
+    for valeurs in csv.reader(texte, delimiter=separateur):
+        if not any(valeurs):
+            continue
+        jour = _date(valeurs[index['date']])
+        montant = _montant(valeurs[index['montant']])
+        libelle = valeurs[index['libelle']].strip()
+        identifiant = valeurs[index['identifiant']].strip() if 'identifiant' in index else ''
+        if not identifiant:
+            # Deux virements identiques le même jour restent distincts par leur rang
+            empreinte = hashlib.sha1(f'{jour}|{montant}|{libelle}'.encode()).hexdigest()[:20]
+            vues[empreinte] = vues.get(empreinte, 0) + 1
+            identifiant = f'{PREFIXE_CSV}{empreinte}-{vues[empreinte]}'
+        yield LigneReleve(jour, montant, libelle, identifiant)
+
+
+BALISE_OFX = re.compile(r'<(\w+)>([^<\r\n]*)')
+
+
+def lire_ofx(fichier):
+    """Transactions d'un relevé OFX (SGML ou XML), balise par balise"""
+    transaction_en_cours = None
+    for ligne in io.TextIOWrapper(fichier, encoding='latin-1'):
+        for balise, valeur in BALISE_OFX.findall(ligne):
+            balise = balise.upper()
+            if balise == 'STMTTRN':
+                transaction_en_cours = {}
+            elif transaction_en_cours is not None and valeur.strip():
+                transaction_en_cours[balise] = valeur.strip()
+        if transaction_en_cours is not None and '</STMTTRN>' in ligne.upper():
+            yield LigneReleve(
+                _date(transaction_en_cours.get('DTPOSTED', '')),
+                _montant(transaction_en_cours.get('TRNAMT')),
+                ' '.join(filter(None, [transaction_en_cours.get('NAME'), transaction_en_cours.get('MEMO')])),
+                transaction_en_cours.get('FITID', ''),
+            )
+            transaction_en_cours = None
+
+
+LECTEURS = {'csv': lire_csv, 'ofx': lire_ofx}
+
+
+# ==================== RAPPROCHEMENT ====================
+
+class Index:
+    """Factures ouvertes et clients, indexés une fois pour tout le relevé"""
+
+    def __init__(self, factures, clients):
+        # facture_id -> [client_id, reste, facture] ; le reste diminue au fil des affectations
+        self.factures = {facture.id: [client_id, facture.reste_a_payer, facture] for facture, client_id in factures}
+        self.par_reste = {}
+        self.par_client_reste = {}
+        self.par_client = {}
+        for facture_id, (client_id, reste, _) in self.factures.items():
+            self.par_reste.setdefault(reste, []).append(facture_id)
+            self.par_client_reste.setdefault((client_id, reste), []).append(facture_id)
+            # Les factures arrivent des plus anciennes aux plus récentes
+            self.par_client.setdefault(client_id, []).append(facture_id)
+        # Un nom porté par plusieurs clients ne permet pas de conclure
+        self.clients = {}
+        for client_id, nom in clients:
+            cle = _normaliser(nom)
+            if cle:
+                self.clients[cle] = None if cle in self.clients else client_id
+
+    def ouverte(self, facture_id):
+        return facture_id in self.factures and self.factures[facture_id][1] > 0
+
+    def client_du_libelle(self, mots):
+        for taille in range(min(MOTS_NOM_MAX, len(mots)), 0, -1):
+            for debut in range(len(mots) - taille + 1):
+                client_id = self.clients.get(' '.join(mots[debut:debut + taille]))
+                if client_id:
+                    return client_id
+        return None
+
+    def unique(self, candidats, montant):
+        # Les index sont construits sur le reste initial : une facture entamée entre-temps est écartée
+        ouvertes = [facture_id for facture_id in candidats if self.factures[facture_id][1] == montant]
+        return ouvertes[0] if len(ouvertes) == 1 else None
+
+    def rapprocher(self, ligne):
+        """Renvoie ``(mode, client_id, factures candidates)`` ou ``None``.
+
+        Le mode ``suggestion`` (montant seul) n'est pas à enregistrer.
+        """
+        libelle = _normaliser(ligne.libelle)
+        client_id = self.client_du_libelle(libelle.split())
+        for numero in REFERENCE_FACTURE.findall(libelle):
+            facture_id = int(numero)
+            if self.ouverte(facture_id):
+                client_facture, reste, _ = self.factures[facture_id]
+                # Un numéro cité ne suffit pas : client ou montant doivent concorder
+                if client_facture == client_id or reste == ligne.montant:
+                    return 'reference', client_facture, [facture_id]
+        if client_id:
+            facture_id = self.unique(self.par_client_reste.get((client_id, ligne.montant), []), ligne.montant)
+            if facture_id:
+                return 'client_montant', client_id, [facture_id]
+            return 'client', client_id, self.par_client.get(client_id, [])
+        facture_id = self.unique(self.par_reste.get(ligne.montant, []), ligne.montant)
+        if facture_id:
+            return 'suggestion', self.factures[facture_id][0], [facture_id]
+        return None
+
+    def affecter(self, montant, facture_ids):
+        """Impute un montant aux factures, dans l'ordre ; renvoie ``[(facture_id, part)]``"""
+        parts = []
+        for facture_id in facture_ids:
+            if montant <= 0:
+                break
+            entree = self.factures[facture_id]
+            part = min(entree[1], montant)
+            if part <= 0:
+                continue
+            entree[1] -= part
+            montant -= part
+            parts.append((facture_id, part))
+        return parts
+
+
+def _ecrire(lot):
+    """Enregistre un lot de paiements rapprochés et leurs affectations"""
+    paiements = Paiement.objects.bulk_create([paiement for paiement, _ in lot])
+    AffectationPaiement.objects.bulk_create([
+        AffectationPaiement(paiement=paiement, facture_id=facture_id, montant=part)
+        for paiement, (_, parts) in zip(paiements, lot)
+        for facture_id, part in parts
+    ])
+
+
+def importer_releve(fichier, format='csv', simulation=False, taille_lot=TAILLE_LOT):
+    """Importe un relevé et enregistre les paiements rapprochés (rien n'est écrit en simulation)"""
+    if format not in LECTEURS:
+        raise ReleveInvalide(f"Format inconnu : {format}")
+    resultat = ResultatImport()
+
+    with transaction.atomic():
+        factures = Facture.objects.select_for_update(of=('self',)).filter(
+            statut__in=balance_agee.STATUTS_OUVERTS, montant_paye__lt=F('montant_total'),
+        ).order_by('date_facturation', 'id').only('id', 'montant_total', 'montant_paye', 'statut')
+        index = Index(
+            ((facture, facture.client_id) for facture in factures.annotate(client_id=F('commande__client_id'))),
+            Client.objects.values_list('id', 'nom'),
+        )
+        deja_importees = set(Paiement.objects.exclude(reference='').values_list('reference', flat=True))
+
+        lot = []
+        clients = set()
+        for ligne in LECTEURS[format](fichier):
+            resultat.lignes += 1
+            if ligne.montant <= 0 or ligne.identifiant in deja_importees:
+                resultat.ignorees += 1
+                continue
+            deja_importees.add(ligne.identifiant)
+            rapprochement = index.rapprocher(ligne)
+            if rapprochement is None:
+                resultat.non_rapprochees.append(ligne)
+                continue
+            mode, client_id, facture_ids = rapprochement
+            if mode == 'suggestion':
+                resultat.suggestions.append(Suggestion(ligne, facture_ids[0], client_id))
+                continue
+            parts = index.affecter(ligne.montant, facture_ids)
+            resultat.rapprochements[mode] = resultat.rapprochements.get(mode, 0) + 1
+            resultat.paiements += 1
+            resultat.montant += ligne.montant
+            clients.add(client_id)
+            lot.append((Paiement(
+                client_id=client_id,
+                date_paiement=ligne.date,
+                montant=ligne.montant,
+                mode='virement',
+                reference=ligne.identifiant[:100],
+                commentaire=ligne.libelle,
+                montant_affecte=sum((part for _, part in parts), Decimal('0')),
+            ), parts))
+            if len(lot) >= taille_lot and not simulation:
+                _ecrire(lot)
+                lot = []
+        if simulation:
+            return resultat
+        _ecrire(lot)
+
+        # Montants payés, par lots d'identifiants : les factures soldées reprennent leur montant total,
+        # les factures entamées la somme de leurs affectations (celles de l'import comprises)
+        maintenant = timezone.now()
+        soldees = [facture.id for _, reste, facture in index.factures.values() if reste <= 0]
+        entamees = [
+            facture.id for _, reste, facture in index.factures.values() if 0 < reste != facture.reste_a_payer
+        ]
+        affectations = AffectationPaiement.objects.filter(facture=OuterRef('pk')).values('facture').annotate(
+            total=Sum('montant')
+        ).values('total')
+        for debut in range(0, len(soldees), taille_lot):
+            Facture.objects.filter(id__in=soldees[debut:debut + taille_lot]).update(
+                montant_paye=F('montant_total'), statut='payee', date_modification=maintenant,
+            )
+        for debut in range(0, len(entamees), taille_lot):
+            Facture.objects.filter(id__in=entamees[debut:debut + taille_lot]).update(
+                montant_paye=Subquery(affectations), date_modification=maintenant,
+            )
+        if clients:
+            apres_affectation(*clients)
+    return resultat
+
+
+def confirmer_suggestion(suggestion):
+    """Enregistre le paiement d'une suggestion confirmée ; un nouvel import l'ignorera"""
+    return enregistrer_paiement(
+        suggestion.client_id,
+        suggestion.ligne.montant,
+        date_paiement=suggestion.ligne.date,
+        reference=suggestion.ligne.identifiant[:100],
+        commentaire=suggestion.ligne.libelle,
+        facture_ids=[suggestion.facture_id],
+    )
@@ -0,0 +1,124 @@
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, Q
+from django.db.models.functions import Coalesce
+
+from orders.models import Commande, LigneCommande
+
+from .models import Facture, LigneFacture
+from .tarification import grille
+
+TAILLE_LOT = 500
+
+
+@dataclass
+class ResultatFacturation:
+    """Bilan d'une facturation automatique"""
+    factures: int = 0
+    lignes: int = 0
+    montant_total: Decimal = Decimal('0')
+    # Commandes laissées de côté : id -> formules sans tarif
+    sans_tarif: dict = field(default_factory=dict)
+    # Commandes laissées de côté faute de lignes à facturer
+    sans_lignes: list = field(default_factory=list)
+
+
+def commandes_a_facturer(date_debut=None, date_fin=None):
+    """Commandes livrées sans facture, la date de livraison tombant dans la période.
+
+    La date retenue est celle de la dernière livraison effectuée, à défaut la
+    date de livraison souhaitée.
+    """
+    commandes = Commande.objects.filter(statut='livree', facture__isnull=True).annotate(
+        date_livree=Coalesce(
+            Max('livraison__date_livraison', filter=Q(livraison__statut='livree')),
+            'date_livraison_souhaitee',
+        )
+    )
+    if date_debut:
+        commandes = commandes.filter(date_livree__gte=date_debut)
+    if date_fin:
+        commandes = commandes.filter(date_livree__lte=date_fin)
+    return commandes
+
+
+def _description(formule):
+    return f"Béton {formule.nom} ({formule.resistance_requise})"
+
+
+def facturer_commandes(commandes, statut='brouillon', taille_lot=TAILLE_LOT):
+    """Crée une facture et ses lignes pour chaque commande, par lots.
+
+    Chaque lot tient en une transaction et une poignée de requêtes : verrou des
+    commandes encore sans facture, lecture de leurs lignes, puis ``bulk_create``
+    des factures et des lignes. Les prix viennent de la grille tarifaire
+    compilée (prix client, paliers, supplément selon la distance du chantier).
+    Une commande sans ligne, ou dont une formule n'a pas de tarif, n'est pas
+    facturée ; elle est signalée dans le résultat.
+    """
+    from customers.services import planifier_recalcul
+
+    tarifs = grille()
+    resultat = ResultatFacturation()
+    ids = list(commandes.order_by('id').values_list('id', flat=True))
+
+    for debut in range(0, len(ids), taille_lot):
+        with transaction.atomic():
+            # Une facturation concurrente a pu passer : seules les commandes encore sans facture restent
+            lot = {
+                commande_id: (client_id, distance_km)
+                for commande_id, client_id, distance_km in Commande.objects.select_for_update(of=('self',)).filter(
+                    id__in=ids[debut:debut + taille_lot], facture__isnull=True
+                ).values_list('id', 'client_id', 'chantier__distance_km')
+            }
+            lignes_par_commande = {}
+            for ligne in LigneCommande.objects.filter(commande_id__in=lot).select_related('formule').order_by('id'):
+                lignes_par_commande.setdefault(ligne.commande_id, []).append(ligne)
+            resultat.sans_lignes.extend(sorted(lot.keys() - lignes_par_commande.keys()))
+
+            factures = []
+            lignes_facture = []
+            for commande_id, lignes in lignes_par_commande.items():
+                client_id, distance_km = lot[commande_id]
+                devis = tarifs.chiffrer(
+                    [(ligne.formule_id, ligne.quantite) for ligne in lignes], client_id, distance_km
+                )
+                if devis.sans_tarif:
+                    resultat.sans_tarif[commande_id] = sorted(
+                        {ligne.formule.nom for ligne in lignes if ligne.formule_id in devis.sans_tarif}
+                    )
+                    continue
+                facture = Facture(commande_id=commande_id, statut=statut, montant_total=devis.montant_total)
+                for ligne, chiffrage in zip(lignes, devis.lignes):
+                    lignes_facture.append(LigneFacture(
+                        facture=facture,
+                        formule_id=ligne.formule_id,
+                        description=_description(ligne.formule),
+                        quantite=ligne.quantite,
+                        prix_unitaire=chiffrage.prix_unitaire,
+                        montant_ligne=chiffrage.montant,
+                    ))
+                if devis.montant_supplement:
+                    lignes_facture.append(LigneFacture(
+                        facture=facture,
+                        description=f"Supplément de livraison ({distance_km} km)",
+                        quantite=devis.volume_total,
+                        prix_unitaire=devis.supplement_m3,
+                        montant_ligne=devis.montant_supplement,
+                    ))
+                factures.append(facture)
+
+            # Les factures reçoivent leur clé au bulk_create, reprise ensuite par leurs lignes
+            Facture.objects.bulk_create(factures)
+            LigneFacture.objects.bulk_create(lignes_facture)
+
+            # bulk_create n'envoie pas de signaux : statistiques client recalculées ici
+            planifier_recalcul(*(lot[facture.commande_id][0] for facture in factures))
+
+        resultat.factures += len(factures)
+        resultat.lignes += len(lignes_facture)
+        resultat.montant_total += sum((facture.montant_total for facture in factures), Decimal('0'))
+
+    return resultat
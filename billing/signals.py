@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import AffectationPaiement, PalierTarif, SupplementLivraison, Tarif, TarifClient
+from .paiements import annuler_affectations
+from .tarification import invalider
+
+def invalider_grille(sender, **kwargs):
+    # Après validation : une grille rechargée avant le commit reprendrait les anciens prix
+    transaction.on_commit(invalider)
+
+for modele in (Tarif, PalierTarif, TarifClient, SupplementLivraison):
+    post_save.connect(invalider_grille, sender=modele, dispatch_uid=f'billing_grille_{modele._meta.model_name}_save')
+    post_delete.connect(invalider_grille, sender=modele, dispatch_uid=f'billing_grille_{modele._meta.model_name}_delete')
+
+@receiver(post_delete, sender=AffectationPaiement)
+def annuler_affectation(sender, instance, **kwargs):
+    annuler_affectations([(instance.facture_id, instance.paiement_id, instance.montant)])
@@ -0,0 +1,156 @@
+"""Grille tarifaire compilée et chiffrage des devis.
+
+La grille (prix de base, paliers de volume, prix clients, suppléments de
+livraison) est chargée en quatre requêtes puis gardée en mémoire : chiffrer
+une commande de n lignes ne fait ensuite plus aucune requête.
+
+Toute modification d'un tarif incrémente un numéro de version en cache
+(``billing.signals``) : le processus qui la voit recompile sa grille. Avec un
+cache non partagé entre processus (LocMemCache), la grille des autres processus
+est de toute façon recompilée après ``DUREE_MAX`` secondes.
+"""
+import time
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from decimal import Decimal
+from threading import Lock
+
+from django.core.cache import cache
+
+from .models import PalierTarif, SupplementLivraison, Tarif, TarifClient
+
+PRECISION_MONTANT = Decimal('0.01')
+CLE_VERSION = 'billing:tarifs:version'
+DUREE_MAX = 60
+
+
+@dataclass
+class LigneDevis:
+    formule_id: int
+    quantite: Decimal
+    prix_unitaire: Decimal = None
+    montant: Decimal = None
+    # 'client', 'palier' ou 'base' ; None si la formule n'a pas de tarif
+    origine: str = None
+
+
+@dataclass
+class Devis:
+    lignes: list
+    volume_total: Decimal = Decimal('0')
+    supplement_m3: Decimal = Decimal('0')
+    montant_supplement: Decimal = Decimal('0')
+    montant_total: Decimal = Decimal('0')
+    # Formules sans tarif : le devis est incomplet
+    sans_tarif: list = field(default_factory=list)
+
+
+class GrilleTarifaire:
+    """Tarifs compilés en dictionnaires et listes triées"""
+
+    def __init__(self, base, paliers, clients, supplements):
+        self.base = base
+        # formule -> (volumes minimum triés, prix correspondants)
+        self.paliers = paliers
+        self.clients = clients
+        self.supplements = supplements
+
+    @classmethod
+    def charger(cls):
+        tarifs = dict(Tarif.objects.values_list('id', 'formule_id'))
+        base = dict(Tarif.objects.values_list('formule_id', 'prix_unitaire'))
+        paliers = {}
+        for tarif_id, volume_min, prix in PalierTarif.objects.order_by('volume_min').values_list(
+            'tarif_id', 'volume_min', 'prix_unitaire'
+        ):
+            volumes, prix_paliers = paliers.setdefault(tarifs[tarif_id], ([], []))
+            volumes.append(volume_min)
+            prix_paliers.append(prix)
+        clients = {
+            (client_id, formule_id): prix
+            for client_id, formule_id, prix in TarifClient.objects.values_list('client_id', 'formule_id', 'prix_unitaire')
+        }
+        supplements = list(SupplementLivraison.objects.order_by('distance_min_km').values_list(
+            'distance_min_km', 'supplement_m3'
+        ))
+        return cls(base, paliers, clients, supplements)
+
+    def prix_unitaire(self, formule_id, volume, client_id=None):
+        """Renvoie ``(prix, origine)`` ; ``(None, None)`` si la formule n'a pas de tarif"""
+        if client_id is not None and (client_id, formule_id) in self.clients:
+            return self.clients[client_id, formule_id], 'client'
+        if formule_id in self.paliers:
+            volumes, prix = self.paliers[formule_id]
+            index = bisect_right(volumes, volume) - 1
+            if index >= 0:
+                return prix[index], 'palier'
+        if formule_id in self.base:
+            return self.base[formule_id], 'base'
+        return None, None
+
+    def supplement_m3(self, distance_km):
+        if distance_km is None:
+            return Decimal('0')
+        supplement = Decimal('0')
+        for distance_min, montant in self.supplements:
+            if distance_km < distance_min:
+                break
+            supplement = montant
+        return supplement
+
+    def chiffrer(self, lignes, client_id=None, distance_km=None):
+        """Chiffre des lignes ``(formule_id, quantite)``.
+
+        Les paliers s'appliquent au volume total commandé par formule, toutes
+        lignes confondues ; le supplément de livraison au volume total.
+        """
+        lignes = [LigneDevis(formule_id, Decimal(quantite)) for formule_id, quantite in lignes]
+        volumes = {}
+        for ligne in lignes:
+            volumes[ligne.formule_id] = volumes.get(ligne.formule_id, Decimal('0')) + ligne.quantite
+
+        devis = Devis(lignes=lignes)
+        for ligne in lignes:
+            prix, origine = self.prix_unitaire(ligne.formule_id, volumes[ligne.formule_id], client_id)
+            devis.volume_total += ligne.quantite
+            if prix is None:
+                if ligne.formule_id not in devis.sans_tarif:
+                    devis.sans_tarif.append(ligne.formule_id)
+                continue
+            ligne.prix_unitaire = prix
+            ligne.origine = origine
+            ligne.montant = (ligne.quantite * prix).quantize(PRECISION_MONTANT)
+            devis.montant_total += ligne.montant
+
+        devis.supplement_m3 = self.supplement_m3(distance_km)
+        devis.montant_supplement = (devis.volume_total * devis.supplement_m3).quantize(PRECISION_MONTANT)
+        devis.montant_total += devis.montant_supplement
+        return devis
+
+
+_verrou = Lock()
+_grille = None
+_version = None
+_chargee_le = 0.0
+
+
+def grille():
+    """Grille compilée courante, recompilée si un tarif a changé"""
+    global _grille, _version, _chargee_le
+    version = cache.get(CLE_VERSION, 0)
+    with _verrou:
+        if _grille is None or version != _version or time.monotonic() - _chargee_le > DUREE_MAX:
+            _grille = GrilleTarifaire.charger()
+            _version = version
+            _chargee_le = time.monotonic()
+        return _grille
+
+
+def invalider():
+    """Périme la grille compilée (appelé à chaque modification de tarif)"""
+    global _grille
+    _grille = None
+    try:
+        cache.incr(CLE_VERSION)
+    except ValueError:
+        cache.set(CLE_VERSION, 1, None)
@@ -1,3 +1,481 @@
-from django.test import TestCase
+import io
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from customers.models import Chantier, Client
+from formulas.models import FormuleBeton
+from logistics.models import Livraison
+from orders.models import Commande, LigneCommande
+from .balance_agee import balance_agee, calculer_balance_agee
+from .models import (
+    AffectationPaiement, Facture, LigneFacture, Paiement, PalierTarif, SupplementLivraison, Tarif, TarifClient,
+)
+from .paiements import PaiementInvalide, affecter_paiement, enregistrer_paiement
+from .pdf import montants, rendre_pisa, rendre_reportlab
+from .releves import ReleveInvalide, _date, _montant, confirmer_suggestion, importer_releve
+from .services import commandes_a_facturer, facturer_commandes
+from .tarification import grille, invalider
+
+
+class DonneesFacturation:
+    """Deux formules tarifées, un client et un chantier à 30 km"""
+
+    def setUp(self):
+        self.client_beton = Client.objects.create(nom='Client', adresse='1 rue A, Lyon')
+        self.chantier = Chantier.objects.create(
+            nom='Chantier', adresse='2 rue B, Lyon', client=self.client_beton, distance_km=Decimal('30'),
+        )
+        self.b25 = FormuleBeton.objects.create(nom='B25', resistance_requise='C25/30')
+        self.b30 = FormuleBeton.objects.create(nom='B30', resistance_requise='C30/37')
+        tarif = Tarif.objects.create(formule=self.b25, prix_unitaire=Decimal('100'))
+        PalierTarif.objects.create(tarif=tarif, volume_min=Decimal('10'), prix_unitaire=Decimal('90'))
+        Tarif.objects.create(formule=self.b30, prix_unitaire=Decimal('120'))
+        SupplementLivraison.objects.create(distance_min_km=Decimal('20'), supplement_m3=Decimal('5'))
+        # Les signaux n'invalident la grille qu'à la validation, jamais atteinte dans un TestCase
+        invalider()
+
+    def commander(self, *lignes, statut='livree', date_livraison=date(2030, 1, 10), client=None, chantier=None):
+        commande = Commande.objects.create(
+            client=client or self.client_beton, chantier=chantier or self.chantier,
+            date_livraison_souhaitee=date_livraison, statut=statut,
+        )
+        for formule, quantite in lignes:
+            LigneCommande.objects.create(commande=commande, formule=formule, quantite=quantite)
+        return commande
+
+
+class FacturationEnMasseTests(DonneesFacturation, TestCase):
+    def test_facture_et_lignes_au_tarif(self):
+        commande = self.commander((self.b25, 6), (self.b25, 4), (self.b30, 2))
+        resultat = facturer_commandes(commandes_a_facturer())
+        self.assertEqual((resultat.factures, resultat.lignes), (1, 4))
+
+        facture = Facture.objects.get(commande=commande)
+        self.assertEqual(facture.statut, 'brouillon')
+        lignes = list(facture.lignes.order_by('id').values_list('formule_id', 'prix_unitaire', 'montant_ligne'))
+        # Palier atteint par le volume cumulé des deux lignes B25 ; supplément sur les 12 m³
+        self.assertEqual(lignes, [
+            (self.b25.id, Decimal('90'), Decimal('540')),
+            (self.b25.id, Decimal('90'), Decimal('360')),
+            (self.b30.id, Decimal('120'), Decimal('240')),
+            (None, Decimal('5'), Decimal('60')),
+        ])
+        self.assertEqual(facture.montant_total, Decimal('1200'))
+        self.assertEqual(resultat.montant_total, Decimal('1200'))
+
+    def test_prix_client_prioritaire(self):
+        TarifClient.objects.create(client=self.client_beton, formule=self.b25, prix_unitaire=Decimal('80'))
+        invalider()
+        commande = self.commander((self.b25, 12))
+        facturer_commandes(commandes_a_facturer(), statut='envoyee')
+        facture = Facture.objects.get(commande=commande)
+        self.assertEqual(facture.statut, 'envoyee')
+        self.assertEqual(facture.montant_total, Decimal('1020'))
+
+    def test_commande_sans_tarif_signalee(self):
+        sans_tarif = FormuleBeton.objects.create(nom='B40', resistance_requise='C40/50')
+        commande = self.commander((self.b25, 2), (sans_tarif, 3))
+        resultat = facturer_commandes(commandes_a_facturer())
+        self.assertEqual(resultat.factures, 0)
+        self.assertEqual(resultat.sans_tarif, {commande.id: ['B40']})
+        self.assertFalse(Facture.objects.exists())
+
+    def test_commande_sans_ligne_signalee(self):
+        vide = self.commander()
+        commande = self.commander((self.b25, 2))
+        resultat = facturer_commandes(commandes_a_facturer())
+        self.assertEqual(resultat.factures, 1)
+        self.assertEqual(resultat.sans_lignes, [vide.id])
+        self.assertTrue(Facture.objects.filter(commande=commande).exists())
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_action_admin_signale_les_commandes_ecartees(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        vide = self.commander()
+        self.commander((self.b25, 2))
+        reponse = self.client.post('/admin/orders/commande/', {
+            'action': 'facturer', '_selected_action': list(Commande.objects.values_list('pk', flat=True)),
+        }, follow=True)
+        self.assertEqual(
+            [str(message) for message in reponse.context['messages']],
+            ['1 facture(s) créée(s) pour un total de 210.00 €.', f'Commande(s) non facturée(s), sans ligne : {vide.id}.'],
+        )
+
+    def test_commandes_eligibles(self):
+        livree = self.commander((self.b25, 2))
+        self.commander((self.b25, 2), statut='validee')
+        deja_facturee = self.commander((self.b25, 2))
+        Facture.objects.create(commande=deja_facturee, montant_total=200)
+        self.assertEqual(list(commandes_a_facturer()), [livree])
+
+    def test_periode_sur_la_derniere_livraison(self):
+        commande = self.commander((self.b25, 2), date_livraison=date(2030, 1, 10))
+        # La livraison effective prime sur la date souhaitée ; une livraison annulée est ignorée
+        Livraison.objects.create(commande=commande, date_livraison=date(2030, 2, 3), adresse_livraison='x', statut='livree')
+        Livraison.objects.create(commande=commande, date_livraison=date(2030, 3, 1), adresse_livraison='x', statut='annulee')
+        self.assertFalse(commandes_a_facturer(date(2030, 1, 1), date(2030, 1, 31)).exists())
+        self.assertEqual(list(commandes_a_facturer(date(2030, 2, 1), date(2030, 2, 28))), [commande])
+
+    def test_par_lots(self):
+        for _ in range(5):
+            self.commander((self.b30, 1))
+        resultat = facturer_commandes(commandes_a_facturer(), taille_lot=2)
+        self.assertEqual(resultat.factures, 5)
+        self.assertEqual(Facture.objects.count(), 5)
+        # Une seconde passe ne refacture rien
+        self.assertEqual(facturer_commandes(commandes_a_facturer()).factures, 0)
+
+
+class GrilleTarifaireTests(DonneesFacturation, TestCase):
+    def test_paliers_sur_le_volume_par_formule(self):
+        tarifs = grille()
+        self.assertEqual(tarifs.prix_unitaire(self.b25.id, Decimal('9.99')), (Decimal('100'), 'base'))
+        self.assertEqual(tarifs.prix_unitaire(self.b25.id, Decimal('10')), (Decimal('90'), 'palier'))
+        devis = tarifs.chiffrer([(self.b25.id, 6), (self.b25.id, 4), (self.b30.id, 20)])
+        self.assertEqual([ligne.prix_unitaire for ligne in devis.lignes], [Decimal('90'), Decimal('90'), Decimal('120')])
+
+    def test_prix_client(self):
+        TarifClient.objects.create(client=self.client_beton, formule=self.b25, prix_unitaire=Decimal('80'))
+        invalider()
+        tarifs = grille()
+        self.assertEqual(tarifs.prix_unitaire(self.b25.id, Decimal('50'), self.client_beton.id), (Decimal('80'), 'client'))
+        autre = Client.objects.create(nom='Autre', adresse='3 rue C, Lyon')
+        self.assertEqual(tarifs.prix_unitaire(self.b25.id, Decimal('50'), autre.id), (Decimal('90'), 'palier'))
+
+    def test_supplement_selon_la_distance(self):
+        SupplementLivraison.objects.create(distance_min_km=Decimal('50'), supplement_m3=Decimal('9'))
+        invalider()
+        tarifs = grille()
+        self.assertEqual(tarifs.supplement_m3(None), Decimal('0'))
+        self.assertEqual(tarifs.supplement_m3(Decimal('19.9')), Decimal('0'))
+        self.assertEqual(tarifs.supplement_m3(Decimal('20')), Decimal('5'))
+        self.assertEqual(tarifs.supplement_m3(Decimal('80')), Decimal('9'))
+        devis = tarifs.chiffrer([(self.b30.id, Decimal('2.5'))], distance_km=Decimal('60'))
+        self.assertEqual((devis.montant_supplement, devis.montant_total), (Decimal('22.50'), Decimal('322.50')))
+
+    def test_grille_recompilee_apres_invalidation(self):
+        self.assertEqual(grille().prix_unitaire(self.b30.id, 1), (Decimal('120'), 'base'))
+        Tarif.objects.filter(formule=self.b30).update(prix_unitaire=Decimal('130'))
+        invalider()
+        self.assertEqual(grille().prix_unitaire(self.b30.id, 1), (Decimal('130'), 'base'))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class VueDevisTests(DonneesFacturation, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+
+    def chiffrer(self, corps):
+        corps = corps if isinstance(corps, str) else json.dumps(corps)
+        return self.client.post('/billing/devis/', corps, content_type='application/json')
+
+    def test_devis_du_chantier(self):
+        reponse = self.chiffrer({'chantier': self.chantier.id, 'lignes': [{'formule': self.b25.id, 'quantite': '12'}]})
+        self.assertEqual(reponse.status_code, 200)
+        resultat = reponse.json()
+        self.assertEqual(resultat['lignes'][0]['origine'], 'palier')
+        self.assertEqual(Decimal(resultat['montant_supplement']), Decimal('60'))
+        self.assertEqual(Decimal(resultat['montant_total']), Decimal('1140'))
+
+    def test_nombres_invalides_refuses(self):
+        for quantite in ['NaN', 'Infinity', '-Infinity', 'abc', '1e30', '0', '-2']:
+            with self.subTest(quantite=quantite):
+                reponse = self.chiffrer({'lignes': [{'formule': self.b25.id, 'quantite': quantite}]})
+                self.assertEqual(reponse.status_code, 400)
+                self.assertIn('erreur', reponse.json())
+        # Littéraux non standard acceptés par le module json
+        reponse = self.chiffrer('{"lignes": [{"formule": %d, "quantite": NaN}]}' % self.b25.id)
+        self.assertEqual(reponse.status_code, 400)
+        reponse = self.chiffrer({'lignes': [{'formule': self.b25.id, 'quantite': 1}], 'distance_km': 'Infinity'})
+        self.assertEqual(reponse.status_code, 400)
+
+    def test_identifiants_invalides_refuses(self):
+        for cle, valeur in [('chantier', 'abc'), ('chantier', '1.5'), ('chantier', [1]), ('client', 'x')]:
+            with self.subTest(cle=cle, valeur=valeur):
+                reponse = self.chiffrer({cle: valeur, 'lignes': [{'formule': self.b25.id, 'quantite': 1}]})
+                self.assertEqual(reponse.status_code, 400)
+                self.assertIn('erreur', reponse.json())
+        reponse = self.chiffrer({'chantier': str(self.chantier.id), 'lignes': [{'formule': self.b25.id, 'quantite': 1}]})
+        self.assertEqual(reponse.status_code, 200)
+
+
+class BalanceAgeeTests(DonneesFacturation, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.aujourd_hui = timezone.localdate()
+
+    def facturer(self, montant, jours, statut='envoyee', client=None):
+        facture = Facture.objects.create(
+            commande=self.commander((self.b30, 1), client=client), montant_total=montant, statut=statut,
+        )
+        Facture.objects.filter(pk=facture.pk).update(date_facturation=self.aujourd_hui - timedelta(days=jours))
+        return facture
+
+    def test_tranches_d_anciennete(self):
+        for montant, jours in [(100, 0), (200, 29), (300, 30), (400, 75), (500, 119), (600, 120), (700, -3)]:
+            self.facturer(montant, jours)
+        # Brouillon et payée hors balance
+        self.facturer(1000, 10, statut='brouillon')
+        self.facturer(1000, 10, statut='payee')
+        [ligne] = calculer_balance_agee(self.aujourd_hui)
+        self.assertEqual(ligne.tranches, [1000, 300, 400, 500, 600])
+        self.assertEqual((ligne.total, ligne.nombre_factures), (2800, 7))
+        self.assertEqual(ligne.plus_ancienne, 'j120')
+
+    def test_reste_a_payer_par_client(self):
+        self.facturer(1000, 45)
+        autre = Client.objects.create(nom='Autre', adresse='3 rue C, Lyon')
+        self.facturer(300, 5, client=autre)
+        enregistrer_paiement(self.client_beton.pk, 400)
+        lignes = calculer_balance_agee(self.aujourd_hui)
+        self.assertEqual([(ligne.client, ligne.total) for ligne in lignes], [('Client', 600), ('Autre', 300)])
+        self.assertEqual(lignes[0].plus_ancienne, 'j30')
+
+    def test_cache_suit_les_factures(self):
+        facture = self.facturer(1000, 45)
+        self.assertEqual(balance_agee()[0].total, 1000)
+        enregistrer_paiement(self.client_beton.pk, 400)
+        self.assertEqual(balance_agee()[0].total, 600)
+        facture.statut = 'annulee'
+        facture.save()
+        self.assertEqual(balance_agee(), [])
+        # Facturation en masse, sans signaux
+        self.commander((self.b30, 2))
+        facturer_commandes(commandes_a_facturer(), statut='envoyee')
+        self.assertEqual(balance_agee()[0].total, 250)
+
+
+class PaiementsTests(DonneesFacturation, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.ancienne = Facture.objects.create(commande=self.commander((self.b30, 1)), montant_total=300, statut='envoyee')
+        Facture.objects.filter(pk=self.ancienne.pk).update(date_facturation=date(2030, 1, 1))
+        self.recente = Facture.objects.create(commande=self.commander((self.b30, 1)), montant_total=500, statut='envoyee')
+        Facture.objects.filter(pk=self.recente.pk).update(date_facturation=date(2030, 2, 1))
+        # Brouillon : jamais imputé
+        Facture.objects.create(commande=self.commander((self.b30, 1)), montant_total=900)
+
+    def etat(self, facture):
+        facture.refresh_from_db()
+        return facture.statut, facture.montant_paye
+
+    def test_plus_anciennes_d_abord_et_avoir(self):
+        paiement = enregistrer_paiement(self.client_beton.pk, 400)
+        self.assertEqual(self.etat(self.ancienne), ('payee', 300))
+        self.assertEqual(self.etat(self.recente), ('envoyee', 100))
+        self.assertEqual(paiement.montant_affecte, 400)
+        paiement = enregistrer_paiement(self.client_beton.pk, 1000)
+        self.assertEqual(self.etat(self.recente), ('payee', 500))
+        # Le reste devient un avoir, affecté plus tard à une nouvelle facture
+        self.assertEqual(paiement.montant_disponible, 600)
+        nouvelle = Facture.objects.create(commande=self.commander((self.b30, 1)), montant_total=200, statut='envoyee')
+        self.assertEqual(affecter_paiement(paiement), 200)
+        self.assertEqual(self.etat(nouvelle), ('payee', 200))
+
+    def test_factures_designees(self):
+        enregistrer_paiement(self.client_beton.pk, 200, facture_ids=[self.recente.pk])
+        self.assertEqual(self.etat(self.ancienne), ('envoyee', 0))
+        self.assertEqual(self.etat(self.recente), ('envoyee', 200))
+
+    def test_montant_positif(self):
+        with self.assertRaises(PaiementInvalide):
+            enregistrer_paiement(self.client_beton.pk, 0)
+
+    def test_suppression_d_affectation_annulee(self):
+        paiement = enregistrer_paiement(self.client_beton.pk, 400)
+        AffectationPaiement.objects.get(facture=self.ancienne).delete()
+        self.assertEqual(self.etat(self.ancienne), ('envoyee', 0))
+        paiement.refresh_from_db()
+        self.assertEqual(paiement.montant_affecte, 100)
+
+    def test_suppression_du_paiement(self):
+        enregistrer_paiement(self.client_beton.pk, 400).delete()
+        self.assertEqual(self.etat(self.ancienne), ('envoyee', 0))
+        self.assertEqual(self.etat(self.recente), ('envoyee', 0))
+        self.assertFalse(AffectationPaiement.objects.exists())
+        self.assertFalse(Paiement.objects.exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AdminFactureTests(DonneesFacturation, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        self.facture = Facture.objects.create(commande=self.commander((self.b30, 1)), montant_total=300, statut='envoyee')
+
+    def formulaire(self):
+        return self.client.get(f'/admin/billing/facture/{self.facture.pk}/change/').context['adminform'].form
+
+    def test_payee_jamais_saisie(self):
+        self.assertEqual([valeur for valeur, _ in self.formulaire().fields['statut'].choices], ['envoyee', 'annulee'])
+
+    def test_statut_fige_une_fois_entamee(self):
+        enregistrer_paiement(self.client_beton.pk, 100)
+        self.assertNotIn('statut', self.formulaire().fields)
+        enregistrer_paiement(self.client_beton.pk, 200)
+        self.facture.refresh_from_db()
+        self.assertEqual(self.facture.statut, 'payee')
+        self.assertNotIn('statut', self.formulaire().fields)
+
+
+class ReleveBancaireTests(DonneesFacturation, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client_beton.nom = 'Dupont Béton'
+        self.client_beton.save()
+        self.martin = Client.objects.create(nom='Martin', adresse='3 rue C, Lyon')
+        self.f1 = self.facturer(300, date(2030, 1, 1))
+        self.f2 = self.facturer(500, date(2030, 1, 2))
+        self.f3 = self.facturer(450, date(2030, 1, 3), client=self.martin)
+
+    def facturer(self, montant, jour, client=None):
+        facture = Facture.objects.create(
+            commande=self.commander((self.b30, 1), client=client), montant_total=montant, statut='envoyee',
+        )
+        Facture.objects.filter(pk=facture.pk).update(date_facturation=jour)
+        return facture
+
+    def etat(self, facture):
+        facture.refresh_from_db()
+        return facture.statut, facture.montant_paye
+
+    def releve_csv(self):
+        return io.BytesIO((
+            'Date;Libellé;Montant\n'
+            f'05/02/2030;VIR SEPA REGLEMENT FACTURE {self.f2.pk};500,00\n'
+            '05/02/2030;VIR DUPONT BETON SARL;300,00\n'
+            '06/02/2030;VIREMENT RECU;450,00\n'
+            '06/02/2030;PRELEVEMENT;-50,00\n'
+            '07/02/2030;INCONNU;999,00\n'
+        ).encode())
+
+    def test_lecture_des_montants_et_dates(self):
+        self.assertEqual(_montant('1 234,56'), Decimal('1234.56'))
+        self.assertEqual(_montant('1234.56'), Decimal('1234.56'))
+        self.assertEqual(_date('20300205120000[+1:CET]'), date(2030, 2, 5))
+        with self.assertRaises(ReleveInvalide):
+            _montant('abc')
+
+    def test_rapprochement_csv(self):
+        resultat = importer_releve(self.releve_csv())
+        self.assertEqual((resultat.lignes, resultat.ignorees, resultat.paiements), (5, 1, 2))
+        self.assertEqual(resultat.rapprochements, {'reference': 1, 'client_montant': 1})
+        self.assertEqual([ligne.libelle for ligne in resultat.non_rapprochees], ['INCONNU'])
+        self.assertEqual(self.etat(self.f1), ('payee', 300))
+        self.assertEqual(self.etat(self.f2), ('payee', 500))
+
+    def test_montant_seul_propose_sans_paiement(self):
+        resultat = importer_releve(self.releve_csv())
+        [suggestion] = resultat.suggestions
+        self.assertEqual(
+            (suggestion.ligne.libelle, suggestion.facture_id, suggestion.client_id),
+            ('VIREMENT RECU', self.f3.pk, self.martin.pk),
+        )
+        self.assertEqual(self.etat(self.f3), ('envoyee', 0))
+        self.assertFalse(Paiement.objects.filter(client=self.martin).exists())
+        # Confirmée à la main : paiement enregistré, la ligne n'est plus proposée au prochain import
+        confirmer_suggestion(suggestion)
+        self.assertEqual(self.etat(self.f3), ('payee', 450))
+        resultat = importer_releve(self.releve_csv())
+        self.assertEqual((resultat.ignorees, resultat.suggestions), (4, []))
+
+    def test_reference_sans_client_ni_montant_concordant(self):
+        releve = io.BytesIO((
+            'date;libelle;montant\n'
+            # Numéro cité, montant différent, aucun client nommé : rien n'est imputé
+            f'2030-02-05;VIR FACTURE {self.f2.pk};200,00\n'
+            # Numéro d'une facture de Martin dans le virement de Dupont : imputé à Dupont, pas à la facture citée
+            f'2030-02-05;DUPONT BETON FACTURE {self.f3.pk};100,00\n'
+            # Client de la facture nommé : acompte accepté sur la facture citée
+            f'2030-02-06;DUPONT BETON ACOMPTE F{self.f2.pk};200,00\n'
+        ).encode())
+        resultat = importer_releve(releve)
+        self.assertEqual(resultat.rapprochements, {'client': 1, 'reference': 1})
+        self.assertEqual([ligne.montant for ligne in resultat.non_rapprochees], [200])
+        self.assertEqual(self.etat(self.f3), ('envoyee', 0))
+        self.assertEqual(self.etat(self.f1), ('envoyee', 100))
+        self.assertEqual(self.etat(self.f2), ('envoyee', 200))
+
+    def test_reimport_sans_doublon(self):
+        importer_releve(self.releve_csv())
+        resultat = importer_releve(self.releve_csv())
+        self.assertEqual((resultat.ignorees, resultat.paiements), (3, 0))
+        self.assertEqual(len(resultat.suggestions), 1)
+        self.assertEqual(Paiement.objects.count(), 2)
+
+    def test_simulation_n_ecrit_rien(self):
+        resultat = importer_releve(self.releve_csv(), simulation=True)
+        self.assertEqual(resultat.paiements, 2)
+        self.assertFalse(Paiement.objects.exists())
+        self.assertEqual(self.etat(self.f1), ('envoyee', 0))
+
+    def test_ofx_client_seul_sur_les_plus_anciennes(self):
+        releve = io.BytesIO(
+            b'<OFX><BANKTRANLIST>\n<STMTTRN>\n<TRNTYPE>CREDIT\n<DTPOSTED>20300210\n<TRNAMT>400.00\n'
+            b'<FITID>ABC123\n<NAME>DUPONT BETON\n<MEMO>ACOMPTE\n</STMTTRN>\n</BANKTRANLIST></OFX>\n'
+        )
+        resultat = importer_releve(releve, 'ofx')
+        self.assertEqual(resultat.rapprochements, {'client': 1})
+        self.assertEqual(self.etat(self.f1), ('payee', 300))
+        self.assertEqual(self.etat(self.f2), ('envoyee', 100))
+        paiement = Paiement.objects.get()
+        self.assertEqual((paiement.reference, paiement.montant_affecte), ('ABC123', 400))
+
+    def test_montant_ambigu_non_rapproche(self):
+        self.facturer(450, date(2030, 1, 4))
+        resultat = importer_releve(io.BytesIO(b'date,libelle,montant\n2030-02-06,VIREMENT,450.00\n'))
+        self.assertEqual((resultat.paiements, resultat.suggestions), (0, []))
+        self.assertEqual(len(resultat.non_rapprochees), 1)
+
+
+class FacturePdfTests(DonneesFacturation, TestCase):
+    def facture(self, *montants_lignes):
+        facture = Facture.objects.create(
+            commande=self.commander((self.b25, 1)), montant_total=sum(montants_lignes, Decimal('0')),
+        )
+        for numero, montant in enumerate(montants_lignes):
+            LigneFacture.objects.create(
+                facture=facture, formule=self.b25, description=f'Ligne {numero}', quantite=1,
+                prix_unitaire=montant, montant_ligne=montant,
+            )
+        return Facture.objects.select_related('commande__client').prefetch_related('lignes').get(pk=facture.pk)
+
+    def test_total_ttc_decompose(self):
+        facture = self.facture(Decimal('1000.00'), Decimal('200.00'))
+        self.assertEqual(montants(facture), (Decimal('1000.00'), Decimal('200.00')))
+        facture.montant_total = Decimal('100.00')
+        self.assertEqual(montants(facture), (Decimal('83.33'), Decimal('16.67')))
+
+    def test_gabarit_pisa_en_ttc(self):
+        facture = self.facture(Decimal('1200.00'))
+        with mock.patch('billing.pdf.pisa.CreatePDF', return_value=mock.Mock(err=0)) as creer:
+            rendre_pisa(facture)
+        html = creer.call_args.args[0]
+        self.assertIn('<th>Total TTC</th>', html)
+        self.assertNotIn(' HT</th>', html)
+        self.assertRegex(html, r'Total HT</td>\s*<td>1000\.00</td>')
+        self.assertRegex(html, r'TVA 20%</td>\s*<td>200\.00</td>')
+
+    def test_reportlab_sur_plusieurs_pages(self):
+        facture = self.facture(*[Decimal('10.00')] * 120)
+        with self.assertNumQueries(0):
+            contenu = rendre_reportlab(facture)
+        self.assertTrue(contenu.startswith(b'%PDF'))
+        self.assertGreater(contenu.count(b'/Type /Page\n'), 1)
+
+    def test_banc_sur_la_facture_la_plus_riche_en_lignes(self):
+        riche = self.facture(*[Decimal('10.00')] * 3)
+        self.facture(Decimal('10.00'))
+        sortie = io.StringIO()
+        call_command('bench_factures_pdf', repetitions=1, moteurs=['reportlab'], stdout=sortie)
+        self.assertIn(f'Facture {riche.pk} (3 ligne(s))', sortie.getvalue())
@@ -3,4 +3,5 @@ from . import views
 
 urlpatterns = [
     path('<int:facture_id>/pdf/', views.facture_pdf, name='facture_pdf'),
+    path('devis/', views.devis, name='devis'),
 ]
\ No newline at end of file
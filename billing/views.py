@@ -1,29 +1,88 @@
+import json
+
 from django.shortcuts import render, get_object_or_404
 from .models import Facture
-from django.http import HttpResponse
-from django.template.loader import get_template
-from xhtml2pdf import pisa
-from num2words import num2words
+from .tarification import grille
+from customers.models import Chantier
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_POST
+from .pdf import RenduImpossible, rendre_facture
+from beton_project.decimaux import decimal_fini
 
 def facture_pdf(request, facture_id):
-    facture = get_object_or_404(Facture, id=facture_id)
-    total_en_lettres = num2words(facture.montant_total, lang='fr')
-    template_path = 'billing/facture_pdf.html'
-    context = {
-        'facture': facture,
-        'total_en_lettres': total_en_lettres
-    }
-    # Create a Django response object, and specify content_type as pdf
-    response = HttpResponse(content_type='application/pdf')
+    facture = get_object_or_404(
+        Facture.objects.select_related('commande__client').prefetch_related('lignes'), id=facture_id
+    )
+    try:
+        contenu = rendre_facture(facture)
+    except RenduImpossible as erreur:
+        return HttpResponse('We had some errors <pre>' + str(erreur) + '</pre>')
+    response = HttpResponse(contenu, content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="facture_{facture.id}.pdf"'
-    # find the template and render it.
-    template = get_template(template_path)
-    html = template.render(context)
-
-    # create a pdf
-    pisa_status = pisa.CreatePDF(
-       html, dest=response)
-    # if error then show some funy view
-    if pisa_status.err:
-       return HttpResponse('We had some errors <pre>' + html + '</pre>')
     return response
+
+
+class DevisInvalide(ValueError):
+    pass
+
+
+def _lire_devis(corps):
+    try:
+        donnees = json.loads(corps or b'{}')
+        lignes = [
+            (int(ligne['formule']), decimal_fini(ligne['quantite']))
+            for ligne in donnees['lignes']
+        ]
+    except (ValueError, TypeError, KeyError):
+        raise DevisInvalide("Corps attendu : {\"lignes\": [{\"formule\": id, \"quantite\": m3}, ...]}")
+    if not lignes or any(quantite <= 0 for _, quantite in lignes):
+        raise DevisInvalide("Au moins une ligne, de quantité positive.")
+    for cle in ('client', 'chantier'):
+        if donnees.get(cle) is not None:
+            try:
+                donnees[cle] = int(str(donnees[cle]))
+            except ValueError:
+                raise DevisInvalide(f"Identifiant de {cle} invalide.")
+    return donnees, lignes
+
+
+@staff_member_required
+@require_POST
+def devis(request):
+    """Chiffre une commande de plusieurs lignes avec la grille tarifaire, sans requête par ligne"""
+    try:
+        donnees, lignes = _lire_devis(request.body)
+    except DevisInvalide as erreur:
+        return JsonResponse({'erreur': str(erreur)}, status=400)
+
+    client_id = donnees.get('client')
+    distance_km = donnees.get('distance_km')
+    if donnees.get('chantier') is not None:
+        chantier = get_object_or_404(Chantier.objects.only('client_id', 'distance_km'), pk=donnees['chantier'])
+        client_id = chantier.client_id
+        if distance_km is None:
+            distance_km = chantier.distance_km
+    try:
+        distance_km = decimal_fini(distance_km) if distance_km is not None else None
+    except ValueError:
+        return JsonResponse({'erreur': "Distance invalide."}, status=400)
+
+    resultat = grille().chiffrer(lignes, client_id=client_id, distance_km=distance_km)
+    return JsonResponse({
+        'lignes': [
+            {
+                'formule': ligne.formule_id,
+                'quantite': ligne.quantite,
+                'prix_unitaire': ligne.prix_unitaire,
+                'montant': ligne.montant,
+                'origine': ligne.origine,
+            }
+            for ligne in resultat.lignes
+        ],
+        'volume_total': resultat.volume_total,
+        'supplement_m3': resultat.supplement_m3,
+        'montant_supplement': resultat.montant_supplement,
+        'montant_total': resultat.montant_total,
+        'sans_tarif': resultat.sans_tarif,
+    })
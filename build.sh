@@ -20,6 +20,22 @@ python -c "import django; print('Django version:', django.get_version())"
 echo "🔄 Exécution des migrations..."
 python manage.py migrate --noinput
 
+# Villes normalisées des clients et chantiers (seules les adresses modifiées sont réécrites)
+echo "🔄 Normalisation des villes..."
+python manage.py normaliser_villes
+
+# Index de recherche de l'admin (tenu à jour ensuite par les signaux)
+echo "🔄 Indexation de la recherche..."
+python manage.py reindexer_recherche
+
+# Coût matière des formules (tenu à jour ensuite à chaque entrée de stock valorisée)
+echo "🔄 Calcul du coût des formules..."
+python manage.py recalculer_couts_formules
+
+# Registres de charge journalière des commandes (tenus à jour ensuite par les signaux)
+echo "🔄 Calcul des charges journalières..."
+python manage.py recalculer_charges
+
 # Collecte des fichiers statiques
 echo "🔄 Collecte des fichiers statiques..."
 python manage.py collectstatic --noinput --clear
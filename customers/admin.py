@@ -1,18 +1,36 @@
 from django.contrib import admin
-from .models import Client, Chantier
+from .models import Client, Chantier, StatistiquesClient
+from search.admin import RechercheIndexeeMixin
 
 class ChantierInline(admin.TabularInline):
     model = Chantier
     extra = 1
 
 @admin.register(Client)
-class ClientAdmin(admin.ModelAdmin):
+class ClientAdmin(RechercheIndexeeMixin, admin.ModelAdmin):
     inlines = [ChantierInline]
-    list_display = ('nom', 'adresse', 'telephone', 'email')
+    list_display = ('nom', 'adresse', 'ville', 'telephone', 'email')
+    list_filter = ('ville',)
     search_fields = ('nom', 'adresse', 'email')
 
 @admin.register(Chantier)
-class ChantierAdmin(admin.ModelAdmin):
-    list_display = ('nom', 'client', 'adresse')
-    list_filter = ('client',)
+class ChantierAdmin(RechercheIndexeeMixin, admin.ModelAdmin):
+    list_display = ('nom', 'client', 'adresse', 'ville', 'region', 'distance_km')
+    list_filter = ('client', 'region', 'ville')
     search_fields = ('nom', 'adresse')
+
+@admin.register(StatistiquesClient)
+class StatistiquesClientAdmin(admin.ModelAdmin):
+    list_display = ('client', 'nombre_commandes', 'chiffre_affaires', 'encours', 'volume_total', 'premiere_commande', 'derniere_commande')
+    search_fields = ('client__nom',)
+    list_select_related = ('client',)
+    ordering = ('-chiffre_affaires',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
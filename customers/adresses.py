@@ -0,0 +1,69 @@
+"""Extraction de la ville à partir d'une adresse postale saisie librement.
+
+La ville est normalisée (majuscules, sans accents ni tirets) pour que « Fès »,
+« FES » et « fes » donnent la même clé de regroupement. La région se déduit du
+préfixe du code postal ; sans code postal, ou pour un préfixe inconnu, elle
+reste vide.
+"""
+import re
+import unicodedata
+
+CODE_POSTAL_VILLE = re.compile(r'\b(?P<code_postal>\d{5})\s+(?P<ville>[^\d,;]+?)(?:\s+cedex(?:\s+\d+)?)?\s*$', re.IGNORECASE)
+CEDEX = re.compile(r'\s+CEDEX(\s+\d+)?$')
+ABREVIATIONS = {'ST': 'SAINT', 'STE': 'SAINTE'}
+
+# Régions du Maroc (découpage de 2015) par préfixe de code postal : les deux
+# premiers chiffres désignent la province, trois chiffres lèvent les ambiguïtés
+# (villes rattachées à une autre région que le reste de leur préfixe).
+REGIONS = {
+    'Tanger-Tétouan-Al Hoceïma': '90 91 92 93 32 162',
+    "L'Oriental": '60 61 62 63 65 351',
+    'Fès-Meknès': '30 31 33 34 35 50 51 53',
+    'Rabat-Salé-Kénitra': '10 11 12 14 15 16',
+    'Béni Mellal-Khénifra': '22 23 25 54',
+    'Casablanca-Settat': '13 20 24 26 27 28',
+    'Marrakech-Safi': '40 41 42 43 44 46',
+    'Drâa-Tafilalet': '45 47 52 543',
+    'Souss-Massa': '80 83 84 85 86 87',
+    'Guelmim-Oued Noun': '81 82 852',
+    'Laâyoune-Sakia El Hamra': '70 71 72',
+    'Dakhla-Oued Ed-Dahab': '73',
+}
+REGION_PREFIXE = {
+    prefixe: region for region, prefixes in REGIONS.items() for prefixe in prefixes.split()
+}
+
+
+def normaliser_ville(nom):
+    """Forme normalisée d'un nom de ville (``''`` si vide)"""
+    nom = unicodedata.normalize('NFKD', nom or '')
+    nom = ''.join(caractere for caractere in nom if not unicodedata.combining(caractere))
+    nom = re.sub(r"[-'’.]", ' ', nom.upper())
+    nom = CEDEX.sub('', ' '.join(nom.split()))
+    return ' '.join(ABREVIATIONS.get(mot, mot) for mot in nom.split())
+
+
+def region_code_postal(code_postal):
+    """Région d'un code postal marocain (``''`` si inconnue)"""
+    code_postal = code_postal or ''
+    return REGION_PREFIXE.get(code_postal[:3]) or REGION_PREFIXE.get(code_postal[:2], '')
+
+
+def extraire_localite(adresse):
+    """``(ville, region)`` d'une adresse.
+
+    La ville est celle qui suit le code postal, sinon le dernier segment sans
+    chiffres ; la région n'est connue qu'avec un code postal.
+    """
+    segments = [segment.strip() for segment in re.split(r'[,;\n]', adresse or '') if segment.strip()]
+    for segment in reversed(segments):
+        correspondance = CODE_POSTAL_VILLE.search(segment)
+        if correspondance:
+            return (
+                normaliser_ville(correspondance.group('ville')),
+                region_code_postal(correspondance.group('code_postal')),
+            )
+    if len(segments) > 1 and not re.search(r'\d', segments[-1]):
+        return normaliser_ville(segments[-1]), ''
+    return '', ''
+
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from customers.adresses import extraire_localite
+from customers.models import Client, Chantier
+
+
+class Command(BaseCommand):
+    help = (
+        "Renseigne la ville normalisée et la région des clients et des chantiers à "
+        "partir de leur adresse (mises à jour groupées, seules les lignes modifiées sont écrites)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--taille-lot', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        taille_lot = options['taille_lot']
+        # Les clients d'abord : un chantier sans ville propre reprend celle de son client
+        lignes = Client.objects.only('id', 'adresse', 'ville', 'region')
+        nombre = self._normaliser(Client, lignes, lambda client: extraire_localite(client.adresse), taille_lot)
+        self.stdout.write(f"{Client._meta.verbose_name_plural} : {nombre} ville(s) mise(s) à jour")
+        lignes = Chantier.objects.select_related('client').only(
+            'id', 'adresse', 'ville', 'region', 'client__ville', 'client__region',
+        )
+        nombre = self._normaliser(Chantier, lignes, Chantier.localite, taille_lot)
+        self.stdout.write(f"{Chantier._meta.verbose_name_plural} : {nombre} ville(s) mise(s) à jour")
+
+    def _normaliser(self, modele, lignes, localite, taille_lot):
+        nombre = 0
+        lot = []
+        for instance in lignes.order_by('id').iterator(chunk_size=taille_lot):
+            nouvelle = localite(instance)
+            if nouvelle != (instance.ville, instance.region):
+                instance.ville, instance.region = nouvelle
+                lot.append(instance)
+            if len(lot) >= taille_lot:
+                nombre += self._enregistrer(modele, lot)
+                lot = []
+        if lot:
+            nombre += self._enregistrer(modele, lot)
+        return nombre
+
+    def _enregistrer(self, modele, lot):
+        with transaction.atomic():
+            modele.objects.bulk_update(lot, ['ville', 'region'])
+        return len(lot)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from customers.services import recalculer_statistiques
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les statistiques de fidélité des clients à partir des commandes "
+        "et des factures (réparation après import ou mise à jour en masse)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('clients', nargs='*', type=int, help='Identifiants des clients (tous par défaut)')
+
+    def handle(self, *args, **options):
+        nombre = recalculer_statistiques(options['clients'] or None)
+        self.stdout.write(self.style.SUCCESS(f"{nombre} client(s) recalculé(s)"))
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def initialiser_statistiques(apps, schema_editor):
+    Client = apps.get_model('customers', 'Client')
+    Commande = apps.get_model('orders', 'Commande')
+    LigneCommande = apps.get_model('orders', 'LigneCommande')
+    Facture = apps.get_model('billing', 'Facture')
+    StatistiquesClient = apps.get_model('customers', 'StatistiquesClient')
+    commandes = {
+        ligne['client_id']: ligne
+        for ligne in Commande.objects.exclude(statut='annulee').values('client_id').annotate(
+            nombre=Count('id'), premiere=Min('date_commande'), derniere=Max('date_commande'),
+        )
+    }
+    volumes = dict(
+        LigneCommande.objects.exclude(commande__statut='annulee').values('commande__client_id').annotate(
+            volume=Sum('quantite')
+        ).values_list('commande__client_id', 'volume')
+    )
+    chiffres = dict(
+        Facture.objects.exclude(statut='annulee').values('commande__client_id').annotate(
+            ca=Sum('montant_total')
+        ).values_list('commande__client_id', 'ca')
+    )
+    StatistiquesClient.objects.bulk_create([
+        StatistiquesClient(
+            client_id=client_id,
+            nombre_commandes=commandes.get(client_id, {}).get('nombre', 0),
+            chiffre_affaires=chiffres.get(client_id) or 0,
+            volume_total=volumes.get(client_id) or 0,
+            premiere_commande=commandes.get(client_id, {}).get('premiere'),
+            derniere_commande=commandes.get(client_id, {}).get('derniere'),
+        )
+        for client_id in Client.objects.values_list('id', flat=True)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0002_facture_date_modification'),
+        ('customers', '0002_client_date_modification'),
+        ('orders', '0002_commande_date_modification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatistiquesClient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre_commandes', models.PositiveIntegerField(default=0)),
+                ('chiffre_affaires', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('volume_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('premiere_commande', models.DateField(blank=True, null=True)),
+                ('derniere_commande', models.DateField(blank=True, null=True)),
+                ('date_maj', models.DateTimeField(auto_now=True)),
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='statistiques', to='customers.client')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-chiffre_affaires'], name='stats_client_ca_idx'), models.Index(fields=['derniere_commande'], name='stats_client_recence_idx')],
+            },
+        ),
+        migrations.RunPython(initialiser_statistiques, migrations.RunPython.noop),
+    ]
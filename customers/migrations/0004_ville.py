@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_statistiquesclient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chantier',
+            name='ville',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='ville',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0004_ville'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chantier',
+            name='distance_km',
+            field=models.DecimalField(blank=True, decimal_places=1, max_digits=7, null=True),
+        ),
+    ]
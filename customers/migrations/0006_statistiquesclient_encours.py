@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0005_chantier_distance_km'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='statistiquesclient',
+            name='encours',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0006_statistiquesclient_encours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chantier',
+            name='region',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='region',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+    ]
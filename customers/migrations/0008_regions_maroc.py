@@ -0,0 +1,39 @@
+from django.db import migrations
+
+from customers.adresses import extraire_localite
+
+
+def recalculer_regions(apps, schema_editor):
+    """Régions recalculées depuis l'adresse : les anciennes venaient des départements français"""
+    Client = apps.get_model('customers', 'Client')
+    Chantier = apps.get_model('customers', 'Chantier')
+    regions_clients = {}
+    lot = []
+    for client in Client.objects.only('id', 'adresse', 'region').iterator(chunk_size=2000):
+        region = regions_clients[client.pk] = extraire_localite(client.adresse)[1]
+        if region != client.region:
+            client.region = region
+            lot.append(client)
+    Client.objects.bulk_update(lot, ['region'], batch_size=2000)
+
+    lot = []
+    for chantier in Chantier.objects.only('id', 'adresse', 'client_id', 'region').iterator(chunk_size=2000):
+        # Un chantier sans ville propre reprend la localité de son client
+        ville, region = extraire_localite(chantier.adresse)
+        if not ville:
+            region = regions_clients.get(chantier.client_id, '')
+        if region != chantier.region:
+            chantier.region = region
+            lot.append(chantier)
+    Chantier.objects.bulk_update(lot, ['region'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0007_region'),
+    ]
+
+    operations = [
+        migrations.RunPython(recalculer_regions, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,32 @@
 from django.db import models
+from django.utils import timezone
+from .adresses import extraire_localite
+
+def _renseigner_localite(instance, kwargs, localite):
+    instance.ville, instance.region = localite
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'adresse' in update_fields:
+        kwargs['update_fields'] = {*update_fields, 'ville', 'region'}
 
 class Client(models.Model):
     nom = models.CharField(max_length=200)
     adresse = models.CharField(max_length=255)
     telephone = models.CharField(max_length=20, blank=True)
     email = models.EmailField(blank=True)
+    # Ville normalisée et région extraites de l'adresse
+    ville = models.CharField(max_length=100, blank=True, editable=False, db_index=True)
+    region = models.CharField(max_length=50, blank=True, editable=False)
+    date_modification = models.DateTimeField(auto_now=True)
+
+    def save(self, *args, **kwargs):
+        _renseigner_localite(self, kwargs, extraire_localite(self.adresse))
+        super().save(*args, **kwargs)
+        # Les chantiers sans ville propre reprennent celle du client
+        for chantier in self.chantiers.all():
+            localite = chantier.localite()
+            if localite != (chantier.ville, chantier.region):
+                chantier.ville, chantier.region = localite
+                chantier.save(update_fields=['ville', 'region'])
 
     def __str__(self):
         return self.nom
@@ -13,6 +35,71 @@ class Chantier(models.Model):
     nom = models.CharField(max_length=200)
     adresse = models.CharField(max_length=255)
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='chantiers')
+    # Localité livrée : celle de l'adresse du chantier, à défaut celle du client.
+    # Clé unique de regroupement géographique des ventes (reports.series)
+    ville = models.CharField(max_length=100, blank=True, editable=False, db_index=True)
+    region = models.CharField(max_length=50, blank=True, editable=False, db_index=True)
+    # Distance depuis la centrale, pour le supplément de livraison
+    distance_km = models.DecimalField(max_digits=7, decimal_places=1, null=True, blank=True)
+
+    def localite(self):
+        """``(ville, region)`` du chantier, à défaut celles du client"""
+        localite = extraire_localite(self.adresse)
+        if not localite[0]:
+            return self.client.ville, self.client.region
+        return localite
+
+    def save(self, *args, **kwargs):
+        _renseigner_localite(self, kwargs, self.localite())
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f'{self.nom} ({self.client.nom})'
+
+class StatistiquesClient(models.Model):
+    """Indicateurs de fidélité d'un client, tenus à jour par customers.services"""
+    RECENCES = [
+        ('actif', 'Actif (< 30 jours)'),
+        ('recent', 'Récent (< 90 jours)'),
+        ('inactif', 'Inactif (< 1 an)'),
+        ('perdu', 'Perdu (> 1 an)'),
+    ]
+
+    client = models.OneToOneField(Client, on_delete=models.CASCADE, related_name='statistiques')
+    nombre_commandes = models.PositiveIntegerField(default=0)
+    chiffre_affaires = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    volume_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    premiere_commande = models.DateField(null=True, blank=True)
+    derniere_commande = models.DateField(null=True, blank=True)
+    # Reste dû sur les factures envoyées, moins les paiements non affectés (négatif : avoir)
+    encours = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    date_maj = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-chiffre_affaires'], name='stats_client_ca_idx'),
+            models.Index(fields=['derniere_commande'], name='stats_client_recence_idx'),
+        ]
+
+    @property
+    def volume_moyen(self):
+        if not self.nombre_commandes:
+            return 0
+        return self.volume_total / self.nombre_commandes
+
+    @property
+    def recence(self):
+        # Calculée à la lecture : elle dépend du jour courant, pas seulement des données
+        if self.derniere_commande is None:
+            return None
+        jours = (timezone.localdate() - self.derniere_commande).days
+        if jours < 30:
+            return 'actif'
+        if jours < 90:
+            return 'recent'
+        if jours < 365:
+            return 'inactif'
+        return 'perdu'
+
+    def __str__(self):
+        return f'Statistiques de {self.client.nom}'
@@ -0,0 +1,116 @@
+from decimal import Decimal
+from threading import local
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum
+
+from .models import Client, StatistiquesClient
+
+CHAMPS_STATISTIQUES = [
+    'nombre_commandes', 'chiffre_affaires', 'volume_total',
+    'premiere_commande', 'derniere_commande', 'encours', 'date_maj',
+]
+
+_en_attente = local()
+
+
+def recalculer_statistiques(client_ids=None):
+    """Recalcule les statistiques des clients donnés (tous par défaut).
+
+    Commandes, volumes, factures et paiements sont agrégés séparément puis assemblés :
+    joindre ces tables dans une seule requête multiplierait les montants
+    par le nombre de lignes de chaque commande.
+    """
+    from billing.models import Facture, Paiement
+    from orders.models import Commande, LigneCommande
+
+    if client_ids is None:
+        client_ids = list(Client.objects.values_list('id', flat=True))
+    client_ids = set(client_ids)
+    if not client_ids:
+        return 0
+
+    # Les commandes et factures annulées ne comptent pas dans la valeur client
+    commandes = {
+        ligne['client_id']: ligne
+        for ligne in Commande.objects.filter(client_id__in=client_ids).exclude(
+            statut='annulee'
+        ).values('client_id').annotate(
+            nombre=Count('id'),
+            premiere=Min('date_commande'),
+            derniere=Max('date_commande'),
+        )
+    }
+    volumes = dict(
+        LigneCommande.objects.filter(commande__client_id__in=client_ids).exclude(
+            commande__statut='annulee'
+        ).values('commande__client_id').annotate(
+            volume=Sum('quantite')
+        ).values_list('commande__client_id', 'volume')
+    )
+    chiffres = dict(
+        Facture.objects.filter(commande__client_id__in=client_ids).exclude(
+            statut='annulee'
+        ).values('commande__client_id').annotate(
+            ca=Sum('montant_total')
+        ).values_list('commande__client_id', 'ca')
+    )
+
+    # Encours : reste dû des factures envoyées, moins la part non affectée des paiements
+    restes_dus = dict(
+        Facture.objects.filter(commande__client_id__in=client_ids, statut='envoyee').values(
+            'commande__client_id'
+        ).annotate(
+            reste=Sum(F('montant_total') - F('montant_paye'))
+        ).values_list('commande__client_id', 'reste')
+    )
+    avoirs = dict(
+        Paiement.objects.filter(client_id__in=client_ids).values('client_id').annotate(
+            avoir=Sum(F('montant') - F('montant_affecte'))
+        ).values_list('client_id', 'avoir')
+    )
+
+    # Un client supprimé entre-temps n'a plus de statistiques à tenir
+    existants = set(Client.objects.filter(id__in=client_ids).values_list('id', flat=True))
+    statistiques = []
+    for client_id in existants:
+        commande = commandes.get(client_id, {})
+        statistiques.append(StatistiquesClient(
+            client_id=client_id,
+            nombre_commandes=commande.get('nombre', 0),
+            chiffre_affaires=chiffres.get(client_id) or Decimal('0'),
+            volume_total=volumes.get(client_id) or Decimal('0'),
+            premiere_commande=commande.get('premiere'),
+            derniere_commande=commande.get('derniere'),
+            encours=(restes_dus.get(client_id) or Decimal('0')) - (avoirs.get(client_id) or Decimal('0')),
+        ))
+    StatistiquesClient.objects.bulk_create(
+        statistiques,
+        update_conflicts=True,
+        unique_fields=['client'],
+        update_fields=CHAMPS_STATISTIQUES,
+        batch_size=500,
+    )
+    return len(statistiques)
+
+
+def _recalculer_en_attente():
+    client_ids = getattr(_en_attente, 'client_ids', set())
+    _en_attente.client_ids = set()
+    if client_ids:
+        recalculer_statistiques(client_ids)
+
+
+def planifier_recalcul(*client_ids):
+    """Recalcule les statistiques des clients à la validation de la transaction.
+
+    Les clients touchés pendant une même transaction (une commande et ses
+    lignes saisies ensemble, par exemple) sont regroupés en un seul recalcul.
+    """
+    client_ids = {client_id for client_id in client_ids if client_id}
+    if not client_ids:
+        return
+    if not hasattr(_en_attente, 'client_ids'):
+        _en_attente.client_ids = set()
+    _en_attente.client_ids |= client_ids
+    transaction.on_commit(_recalculer_en_attente)
@@ -0,0 +1,38 @@
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from orders.models import Commande, LigneCommande
+from billing.models import Facture, Paiement
+from .services import planifier_recalcul
+
+@receiver(pre_save, sender=Commande)
+def memoriser_client_commande(sender, instance, **kwargs):
+    # Une commande réaffectée à un autre client change aussi les statistiques de l'ancien
+    instance._client_precedent_id = None
+    if instance.pk and not kwargs.get('raw'):
+        instance._client_precedent_id = Commande.objects.filter(
+            pk=instance.pk
+        ).values_list('client_id', flat=True).first()
+
+@receiver(post_save, sender=Commande)
+@receiver(post_delete, sender=Commande)
+def statistiques_apres_commande(sender, instance, **kwargs):
+    planifier_recalcul(instance.client_id, getattr(instance, '_client_precedent_id', None))
+
+@receiver(post_save, sender=LigneCommande)
+@receiver(post_delete, sender=LigneCommande)
+def statistiques_apres_ligne_commande(sender, instance, **kwargs):
+    planifier_recalcul(_client_de_commande(instance.commande_id))
+
+@receiver(post_save, sender=Facture)
+@receiver(post_delete, sender=Facture)
+def statistiques_apres_facture(sender, instance, **kwargs):
+    planifier_recalcul(_client_de_commande(instance.commande_id))
+
+@receiver(post_save, sender=Paiement)
+@receiver(post_delete, sender=Paiement)
+def statistiques_apres_paiement(sender, instance, **kwargs):
+    planifier_recalcul(instance.client_id)
+
+def _client_de_commande(commande_id):
+    # La commande peut déjà avoir été supprimée (suppression en cascade)
+    return Commande.objects.filter(pk=commande_id).values_list('client_id', flat=True).first()
@@ -1,3 +1,115 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+
+from django.apps import apps
 from django.test import TestCase
+from django.utils import timezone
+
+from billing.models import Facture
+from formulas.models import FormuleBeton
+from orders.models import Commande, LigneCommande
+from .adresses import extraire_localite
+from .models import Chantier, Client, StatistiquesClient
+from .services import recalculer_statistiques
+
+
+class StatistiquesClientTests(TestCase):
+    def setUp(self):
+        self.client_beton = Client.objects.create(nom='Client', adresse='1 rue A, Rabat')
+        self.chantier = Chantier.objects.create(nom='Chantier', adresse='2 rue B, Rabat', client=self.client_beton)
+        self.formule = FormuleBeton.objects.create(nom='B25', resistance_requise='C25/30')
+
+    def commander(self, *quantites, statut='en_attente', client=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            commande = Commande.objects.create(
+                client=client or self.client_beton, chantier=self.chantier,
+                date_livraison_souhaitee=date(2030, 1, 1), statut=statut,
+            )
+            for quantite in quantites:
+                LigneCommande.objects.create(commande=commande, formule=self.formule, quantite=quantite)
+        return commande
+
+    def statistiques(self, client=None):
+        return StatistiquesClient.objects.get(client=client or self.client_beton)
+
+    def test_recalcul_a_la_validation(self):
+        commande = self.commander(4, 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            Facture.objects.create(commande=commande, montant_total=1000, statut='envoyee')
+        statistiques = self.statistiques()
+        self.assertEqual(statistiques.nombre_commandes, 1)
+        self.assertEqual(statistiques.volume_total, Decimal('10'))
+        # Une facture de commande à deux lignes n'est comptée qu'une fois
+        self.assertEqual(statistiques.chiffre_affaires, Decimal('1000'))
+        self.assertEqual(statistiques.encours, Decimal('1000'))
+        self.assertEqual(statistiques.volume_moyen, Decimal('10'))
+
+    def test_commandes_annulees_ignorees(self):
+        self.commander(5)
+        self.commander(7, statut='annulee')
+        statistiques = self.statistiques()
+        self.assertEqual(statistiques.nombre_commandes, 1)
+        self.assertEqual(statistiques.volume_total, Decimal('5'))
+
+    def test_commande_reaffectee_recalcule_l_ancien_client(self):
+        commande = self.commander(5)
+        autre = Client.objects.create(nom='Autre', adresse='3 rue C, Fès')
+        with self.captureOnCommitCallbacks(execute=True):
+            commande.client = autre
+            commande.save()
+        self.assertEqual(self.statistiques().nombre_commandes, 0)
+        self.assertEqual(self.statistiques(autre).nombre_commandes, 1)
+
+    def test_recalcul_complet(self):
+        self.commander(5)
+        StatistiquesClient.objects.all().delete()
+        self.assertEqual(recalculer_statistiques(), 1)
+        self.assertEqual(self.statistiques().volume_total, Decimal('5'))
+
+    def test_recence(self):
+        statistiques = StatistiquesClient(client=self.client_beton)
+        self.assertIsNone(statistiques.recence)
+        aujourd_hui = timezone.localdate()
+        for jours, recence in [(0, 'actif'), (45, 'recent'), (200, 'inactif'), (400, 'perdu')]:
+            statistiques.derniere_commande = aujourd_hui - timedelta(days=jours)
+            self.assertEqual(statistiques.recence, recence)
+
+
+class LocaliteTests(TestCase):
+    def test_extraction(self):
+        self.assertEqual(
+            extraire_localite('Bd Zerktouni, 20250 Casablanca'), ('CASABLANCA', 'Casablanca-Settat'),
+        )
+        self.assertEqual(extraire_localite('Av. Mohammed V\n10000 Rabat'), ('RABAT', 'Rabat-Salé-Kénitra'))
+        self.assertEqual(extraire_localite('Zone franche, 90000 Tanger'), ('TANGER', 'Tanger-Tétouan-Al Hoceïma'))
+        self.assertEqual(extraire_localite('Route d\'Imouzzer, 30000 Fès'), ('FES', 'Fès-Meknès'))
+        # Préfixe partagé : Guercif relève de l'Oriental, Taza de Fès-Meknès
+        self.assertEqual(extraire_localite('Centre, 35100 Guercif')[1], "L'Oriental")
+        self.assertEqual(extraire_localite('1 rue A, Rabat'), ('RABAT', ''))
+        self.assertEqual(extraire_localite('1 rue A, 99000 Ailleurs'), ('AILLEURS', ''))
+        self.assertEqual(extraire_localite('1 rue A'), ('', ''))
+
+    def test_chantier_sans_ville_reprend_celle_du_client(self):
+        client = Client.objects.create(nom='Client', adresse='1 rue A, 10000 Rabat')
+        chantier = Chantier.objects.create(nom='Chantier', adresse='Zone B lot 12', client=client)
+        self.assertEqual((chantier.ville, chantier.region), ('RABAT', 'Rabat-Salé-Kénitra'))
+        propre = Chantier.objects.create(nom='Propre', adresse='2 rue C, 40000 Marrakech', client=client)
+
+        client.adresse = '5 bd D, 20250 Casablanca'
+        client.save()
+        chantier.refresh_from_db()
+        propre.refresh_from_db()
+        self.assertEqual((chantier.ville, chantier.region), ('CASABLANCA', 'Casablanca-Settat'))
+        self.assertEqual((propre.ville, propre.region), ('MARRAKECH', 'Marrakech-Safi'))
 
-# Create your tests here.
+    def test_migration_recalcule_les_regions(self):
+        client = Client.objects.create(nom='Client', adresse='1 rue A, 90000 Tanger')
+        chantier = Chantier.objects.create(nom='Chantier', adresse='Zone B lot 12', client=client)
+        # Régions déduites de l'ancienne table des départements français
+        Client.objects.update(region='Bourgogne-Franche-Comté')
+        Chantier.objects.update(region='Bourgogne-Franche-Comté')
+        import_module('customers.migrations.0008_regions_maroc').recalculer_regions(apps, None)
+        client.refresh_from_db()
+        chantier.refresh_from_db()
+        self.assertEqual((client.region, chantier.region), ('Tanger-Tétouan-Al Hoceïma', 'Tanger-Tétouan-Al Hoceïma'))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import FormuleBeton, CompositionFormule
+from .models import FormuleBeton, CompositionFormule, CoutFormule
 
 class CompositionFormuleInline(admin.TabularInline):
     model = CompositionFormule
@@ -8,8 +8,29 @@ class CompositionFormuleInline(admin.TabularInline):
 @admin.register(FormuleBeton)
 class FormuleBetonAdmin(admin.ModelAdmin):
     inlines = [CompositionFormuleInline]
-    list_display = ('nom', 'resistance_requise')
+    list_display = ('nom', 'resistance_requise', 'cout_m3')
     search_fields = ('nom',)
+    list_select_related = ('cout',)
+
+    @admin.display(description="Coût matière (€/m³)", ordering='cout__cout_m3')
+    def cout_m3(self, obj):
+        cout = getattr(obj, 'cout', None)
+        return cout.cout_m3 if cout else None
+
+@admin.register(CoutFormule)
+class CoutFormuleAdmin(admin.ModelAdmin):
+    list_display = ('formule', 'cout_m3', 'matieres_sans_cout', 'date_maj')
+    search_fields = ('formule__nom',)
+    list_select_related = ('formule',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 # Optional: Register CompositionFormule if you want to manage it directly
 # @admin.register(CompositionFormule)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FormulasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'formulas'
+
+    def ready(self):
+        import formulas.signals
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from formulas.services import recalculer_couts
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule le coût matière au m³ des formules à partir du coût moyen pondéré "
+        "des matières premières (réparation après import ou mise à jour en masse)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('formules', nargs='*', type=int, help='Identifiants des formules (toutes par défaut)')
+
+    def handle(self, *args, **options):
+        nombre = recalculer_couts(options['formules'] or None)
+        self.stdout.write(self.style.SUCCESS(f"{nombre} formule(s) recalculée(s)"))
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formulas', '0002_formulebeton_quantite_produite_reference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoutFormule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cout_m3', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('matieres_sans_cout', models.PositiveIntegerField(default=0)),
+                ('date_maj', models.DateTimeField(auto_now=True)),
+                ('formule', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='cout', to='formulas.formulebeton')),
+            ],
+        ),
+    ]
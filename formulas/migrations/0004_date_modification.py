@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formulas', '0003_coutformule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compositionformule',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='formulebeton',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
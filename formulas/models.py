@@ -6,6 +6,7 @@ class FormuleBeton(models.Model):
     description = models.TextField(blank=True)
     resistance_requise = models.CharField(max_length=50)  # e.g., 'C25/30'
     quantite_produite_reference = models.DecimalField(max_digits=10, decimal_places=2, default=1) # Ajout de la quantité de référence
+    date_modification = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.nom
@@ -14,9 +15,21 @@ class CompositionFormule(models.Model):
     formule = models.ForeignKey(FormuleBeton, related_name='composition', on_delete=models.CASCADE)
     matiere_premiere = models.ForeignKey(MatierePremiere, on_delete=models.CASCADE)
     quantite = models.DecimalField(max_digits=10, decimal_places=3)
+    date_modification = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('formule', 'matiere_premiere')
 
     def __str__(self):
         return f'{self.formule.nom} - {self.matiere_premiere.nom}: {self.quantite}'
+
+class CoutFormule(models.Model):
+    """Coût matière d'un m³ de formule, au coût moyen pondéré des matières (voir formulas.services)"""
+    formule = models.OneToOneField(FormuleBeton, related_name='cout', on_delete=models.CASCADE)
+    cout_m3 = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Matières de la composition sans coût connu : le coût est alors sous-estimé
+    matieres_sans_cout = models.PositiveIntegerField(default=0)
+    date_maj = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Coût de {self.formule.nom}: {self.cout_m3} €/m³"
@@ -0,0 +1,94 @@
+from decimal import Decimal
+from threading import local
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import CompositionFormule, CoutFormule, FormuleBeton
+
+PRECISION_COUT = Decimal('0.01')
+
+_en_attente = local()
+
+
+def recalculer_couts(formule_ids=None):
+    """Recalcule le coût au m³ des formules données (toutes par défaut).
+
+    Toute la matrice de composition concernée est évaluée en une seule requête
+    groupée : somme, par formule, des quantités par m³ multipliées par le coût
+    moyen pondéré de chaque matière.
+    """
+    formules = FormuleBeton.objects.all()
+    if formule_ids is not None:
+        formules = formules.filter(id__in=set(formule_ids))
+    # Quantité de référence nulle : aucun coût au m³ calculable
+    references = dict(formules.exclude(quantite_produite_reference=0).values_list('id', 'quantite_produite_reference'))
+    if not references:
+        return 0
+
+    cout_matiere = Coalesce(F('matiere_premiere__solde__cout_unitaire_moyen'), Value(Decimal('0')))
+    lignes = {
+        ligne['formule_id']: ligne
+        for ligne in CompositionFormule.objects.filter(formule_id__in=references).values('formule_id').annotate(
+            cout=Sum(ExpressionWrapper(
+                F('quantite') * cout_matiere,
+                output_field=DecimalField(max_digits=20, decimal_places=6),
+            )),
+            sans_cout=Count('id', filter=Q(matiere_premiere__solde__cout_unitaire_moyen__isnull=True)
+                            | Q(matiere_premiere__solde__cout_unitaire_moyen=0)),
+        )
+    }
+
+    couts = []
+    for formule_id, reference in references.items():
+        ligne = lignes.get(formule_id, {})
+        couts.append(CoutFormule(
+            formule_id=formule_id,
+            cout_m3=(Decimal(ligne.get('cout') or 0) / reference).quantize(PRECISION_COUT),
+            matieres_sans_cout=ligne.get('sans_cout', 0),
+        ))
+    CoutFormule.objects.bulk_create(
+        couts,
+        update_conflicts=True,
+        unique_fields=['formule'],
+        update_fields=['cout_m3', 'matieres_sans_cout', 'date_maj'],
+        batch_size=500,
+    )
+    return len(couts)
+
+
+def formules_utilisant(matiere_ids):
+    return CompositionFormule.objects.filter(
+        matiere_premiere_id__in=matiere_ids
+    ).values_list('formule_id', flat=True).distinct()
+
+
+def _recalculer_en_attente():
+    formule_ids = getattr(_en_attente, 'formule_ids', set())
+    matiere_ids = getattr(_en_attente, 'matiere_ids', set())
+    _en_attente.formule_ids = set()
+    _en_attente.matiere_ids = set()
+    if matiere_ids:
+        formule_ids |= set(formules_utilisant(matiere_ids))
+    if formule_ids:
+        recalculer_couts(formule_ids)
+
+
+def planifier_recalcul_couts(formule_ids=(), matiere_ids=()):
+    """Recalcule, à la validation de la transaction, le coût des formules touchées.
+
+    Seules les formules données et celles qui utilisent les matières données
+    (dont le coût moyen a changé) sont recalculées ; les demandes d'une même
+    transaction sont regroupées.
+    """
+    formule_ids = {formule_id for formule_id in formule_ids if formule_id}
+    matiere_ids = {matiere_id for matiere_id in matiere_ids if matiere_id}
+    if not formule_ids and not matiere_ids:
+        return
+    if not hasattr(_en_attente, 'formule_ids'):
+        _en_attente.formule_ids = set()
+        _en_attente.matiere_ids = set()
+    _en_attente.formule_ids |= formule_ids
+    _en_attente.matiere_ids |= matiere_ids
+    transaction.on_commit(_recalculer_en_attente)
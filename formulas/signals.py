@@ -0,0 +1,14 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import CompositionFormule, FormuleBeton
+from .services import planifier_recalcul_couts
+
+@receiver(post_save, sender=CompositionFormule)
+@receiver(post_delete, sender=CompositionFormule)
+def composition_modifiee(sender, instance, **kwargs):
+    planifier_recalcul_couts(formule_ids=[instance.formule_id])
+
+@receiver(post_save, sender=FormuleBeton)
+def formule_modifiee(sender, instance, **kwargs):
+    # La quantité de référence entre dans le coût au m³
+    planifier_recalcul_couts(formule_ids=[instance.pk])
@@ -1,3 +1,67 @@
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from inventory.models import MatierePremiere
+from stock.models import SoldeStock
+from stock.services import enregistrer_mouvement
+from .models import CompositionFormule, CoutFormule, FormuleBeton
+from .services import recalculer_couts
+
+
+class CoutFormuleTests(TestCase):
+    def setUp(self):
+        self.ciment = MatierePremiere.objects.create(nom='Ciment', unite_mesure='kg')
+        self.sable = MatierePremiere.objects.create(nom='Sable', unite_mesure='kg')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.formule = FormuleBeton.objects.create(nom='B25', resistance_requise='C25/30')
+            CompositionFormule.objects.create(formule=self.formule, matiere_premiere=self.ciment, quantite=300)
+            CompositionFormule.objects.create(formule=self.formule, matiere_premiere=self.sable, quantite=800)
+
+    def cout(self):
+        return CoutFormule.objects.get(formule=self.formule)
+
+    def test_cout_moyen_pondere_des_entrees(self):
+        enregistrer_mouvement(self.ciment, 100, 'entree', cout_unitaire=Decimal('0.10'))
+        enregistrer_mouvement(self.ciment, 300, 'entree', cout_unitaire=Decimal('0.14'))
+        self.assertEqual(SoldeStock.objects.get(matiere_premiere=self.ciment).cout_unitaire_moyen, Decimal('0.13'))
+        # Une sortie est valorisée au coût moyen sans le modifier
+        sortie = enregistrer_mouvement(self.ciment, 50, 'sortie')
+        self.assertEqual(sortie.cout_unitaire, Decimal('0.13'))
+        enregistrer_mouvement(self.ciment, 50, 'entree', cout_unitaire=Decimal('0.13'))
+        self.assertEqual(SoldeStock.objects.get(matiere_premiere=self.ciment).cout_unitaire_moyen, Decimal('0.13'))
+
+    def test_stock_negatif_compte_pour_zero(self):
+        enregistrer_mouvement(self.ciment, 100, 'sortie')
+        enregistrer_mouvement(self.ciment, 100, 'entree', cout_unitaire=Decimal('0.20'))
+        self.assertEqual(SoldeStock.objects.get(matiere_premiere=self.ciment).cout_unitaire_moyen, Decimal('0.20'))
+
+    def test_cout_recalcule_a_la_validation_d_une_entree(self):
+        self.assertEqual((self.cout().cout_m3, self.cout().matieres_sans_cout), (Decimal('0'), 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            enregistrer_mouvement(self.ciment, 1000, 'entree', cout_unitaire=Decimal('0.12'))
+        # Le sable n'a pas encore de coût : le coût est partiel et signalé
+        self.assertEqual((self.cout().cout_m3, self.cout().matieres_sans_cout), (Decimal('36.00'), 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            enregistrer_mouvement(self.sable, 1000, 'entree', cout_unitaire=Decimal('0.015'))
+        self.assertEqual((self.cout().cout_m3, self.cout().matieres_sans_cout), (Decimal('48.00'), 0))
+
+    def test_cout_au_m3_selon_la_quantite_de_reference(self):
+        enregistrer_mouvement(self.ciment, 1000, 'entree', cout_unitaire=Decimal('0.12'))
+        enregistrer_mouvement(self.sable, 1000, 'entree', cout_unitaire=Decimal('0.015'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.formule.quantite_produite_reference = 2
+            self.formule.save()
+        self.assertEqual(self.cout().cout_m3, Decimal('24.00'))
+
+    def test_composition_modifiee(self):
+        enregistrer_mouvement(self.ciment, 1000, 'entree', cout_unitaire=Decimal('0.12'))
+        with self.captureOnCommitCallbacks(execute=True):
+            CompositionFormule.objects.filter(matiere_premiere=self.sable).delete()
+        self.assertEqual((self.cout().cout_m3, self.cout().matieres_sans_cout), (Decimal('36.00'), 0))
+
+    def test_recalcul_complet(self):
+        enregistrer_mouvement(self.ciment, 1000, 'entree', cout_unitaire=Decimal('0.12'))
+        CoutFormule.objects.all().delete()
+        self.assertEqual(recalculer_couts(), 1)
+        self.assertEqual(self.cout().cout_m3, Decimal('36.00'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matierepremiere',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Vehicule, Livraison
+from search.admin import RechercheIndexeeMixin
 
 @admin.register(Vehicule)
 class VehiculeAdmin(admin.ModelAdmin):
@@ -7,7 +8,7 @@ class VehiculeAdmin(admin.ModelAdmin):
     search_fields = ('immatriculation', 'modele')
 
 @admin.register(Livraison)
-class LivraisonAdmin(admin.ModelAdmin):
+class LivraisonAdmin(RechercheIndexeeMixin, admin.ModelAdmin):
     list_display = ('commande', 'vehicule', 'date_livraison', 'statut')
     list_filter = ('date_livraison', 'statut', 'vehicule')
     search_fields = ('commande__client__nom', 'commande__id')
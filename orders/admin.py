@@ -1,13 +1,42 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from beton_project.paginators import PaginateurApproximatif
 from .models import Commande, LigneCommande
+from search.admin import RechercheIndexeeMixin
 
 class LigneCommandeInline(admin.TabularInline):
     model = LigneCommande
     extra = 1
 
 @admin.register(Commande)
-class CommandeAdmin(admin.ModelAdmin):
+class CommandeAdmin(RechercheIndexeeMixin, admin.ModelAdmin):
     list_display = ('id', 'client', 'chantier', 'date_commande', 'date_livraison_souhaitee', 'statut')
     list_filter = ('statut', 'date_commande', 'client')
     search_fields = ('client__nom', 'chantier__nom')
     inlines = [LigneCommandeInline]
+    list_select_related = ('client', 'chantier__client')
+    paginator = PaginateurApproximatif
+    show_full_result_count = False
+    actions = ['facturer']
+
+    @admin.action(description="Facturer les commandes livrées sélectionnées")
+    def facturer(self, request, queryset):
+        from billing.services import facturer_commandes
+
+        resultat = facturer_commandes(queryset.filter(statut='livree', facture__isnull=True))
+        self.message_user(
+            request,
+            f"{resultat.factures} facture(s) créée(s) pour un total de {resultat.montant_total} €.",
+            messages.SUCCESS,
+        )
+        for commande_id, formules in resultat.sans_tarif.items():
+            self.message_user(
+                request,
+                f"Commande {commande_id} non facturée : pas de tarif pour {', '.join(formules)}.",
+                messages.WARNING,
+            )
+        if resultat.sans_lignes:
+            self.message_user(
+                request,
+                f"Commande(s) non facturée(s), sans ligne : {', '.join(map(str, resultat.sans_lignes))}.",
+                messages.WARNING,
+            )
@@ -0,0 +1,231 @@
+"""Capacité journalière et faisabilité des dates de livraison.
+
+Deux registres sont tenus par jour de livraison souhaitée :
+
+- ``ChargeJournaliere`` : volume des commandes restant à livrer, comparé à la
+  capacité de la centrale et à celle de la flotte de camions ;
+- ``BesoinMatiereJournalier`` : matières nécessaires aux commandes non encore
+  produites, cumulées jusqu'à la date et comparées au stock.
+
+Ils sont recalculés, pour les seuls jours touchés, à la validation de chaque
+transaction qui modifie une commande ou ses lignes, ou la composition ou la
+quantité de référence d'une formule commandée. Vérifier une date ne
+relit donc que quelques lignes de registre, jamais les commandes.
+"""
+from dataclasses import dataclass, field
+from datetime import timedelta
+from decimal import Decimal
+from threading import local
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.utils import timezone
+
+from formulas.models import CompositionFormule
+from logistics.models import Vehicule
+from stock.models import SoldeStock
+
+from .models import STATUTS_OUVERTS, BesoinMatiereJournalier, ChargeJournaliere, Commande, LigneCommande
+
+# Commandes dont le béton reste à livrer, et celles dont il reste à produire
+STATUTS_A_LIVRER = STATUTS_OUVERTS
+STATUTS_A_PRODUIRE = ['en_attente', 'validee']
+JOURS_RECHERCHE = 30
+
+_en_attente = local()
+
+
+def _besoins_par_matiere(lignes, date_champ):
+    """Agrège les matières nécessaires à des lignes de commande, par date et matière (une requête)"""
+    # Filtre sur la composition avant values() : regroupement et somme réutilisent sa jointure
+    return lignes.filter(
+        formule__quantite_produite_reference__gt=0, formule__composition__isnull=False,
+    ).values(
+        date_champ, 'formule__composition__matiere_premiere_id',
+    ).annotate(quantite=Sum(ExpressionWrapper(
+        F('quantite') * F('formule__composition__quantite') / F('formule__quantite_produite_reference'),
+        output_field=DecimalField(max_digits=20, decimal_places=6),
+    ))).values_list(
+        date_champ, 'formule__composition__matiere_premiere_id', 'quantite',
+    )
+
+
+def recalculer_charges(dates=None):
+    """Recalcule les registres des jours donnés (tous les jours ouverts par défaut)"""
+    lignes = LigneCommande.objects.all()
+    if dates is not None:
+        dates = set(dates)
+        if not dates:
+            return 0
+        lignes = lignes.filter(commande__date_livraison_souhaitee__in=dates)
+
+    charges = [
+        ChargeJournaliere(date=jour, volume=volume)
+        for jour, volume in lignes.filter(commande__statut__in=STATUTS_A_LIVRER).values(
+            'commande__date_livraison_souhaitee'
+        ).annotate(volume=Sum('quantite')).values_list('commande__date_livraison_souhaitee', 'volume')
+    ]
+    besoins = [
+        BesoinMatiereJournalier(date=jour, matiere_premiere_id=matiere_id, quantite=quantite)
+        for jour, matiere_id, quantite in _besoins_par_matiere(
+            lignes.filter(commande__statut__in=STATUTS_A_PRODUIRE), 'commande__date_livraison_souhaitee',
+        )
+    ]
+
+    with transaction.atomic():
+        anciennes_charges = ChargeJournaliere.objects.all()
+        anciens_besoins = BesoinMatiereJournalier.objects.all()
+        if dates is not None:
+            anciennes_charges = anciennes_charges.filter(date__in=dates)
+            anciens_besoins = anciens_besoins.filter(date__in=dates)
+        anciennes_charges.delete()
+        anciens_besoins.delete()
+        ChargeJournaliere.objects.bulk_create(charges)
+        BesoinMatiereJournalier.objects.bulk_create(besoins, batch_size=500)
+    return len(charges)
+
+
+def _recalculer_en_attente():
+    dates = getattr(_en_attente, 'dates', set())
+    _en_attente.dates = set()
+    if dates:
+        recalculer_charges(dates)
+
+
+def planifier_recalcul_charges(*dates):
+    """Recalcule les registres des jours touchés, à la validation de la transaction"""
+    dates = {jour for jour in dates if jour}
+    if not dates:
+        return
+    if not hasattr(_en_attente, 'dates'):
+        _en_attente.dates = set()
+    _en_attente.dates |= dates
+    transaction.on_commit(_recalculer_en_attente)
+
+
+def planifier_recalcul_formule(formule_id):
+    """Recalcule les besoins des jours où des commandes à produire utilisent la formule"""
+    planifier_recalcul_charges(*LigneCommande.objects.filter(
+        formule_id=formule_id, commande__statut__in=STATUTS_A_PRODUIRE,
+    ).values_list('commande__date_livraison_souhaitee', flat=True).distinct())
+
+
+# ==================== FAISABILITÉ ====================
+
+@dataclass
+class ControleMatiere:
+    matiere_premiere_id: int
+    besoin: Decimal
+    disponible: Decimal
+
+    @property
+    def ok(self):
+        return self.besoin <= self.disponible
+
+
+@dataclass
+class Faisabilite:
+    date_livraison: object
+    volume: Decimal
+    capacite_centrale: Decimal
+    volume_reserve: Decimal
+    capacite_camions: Decimal
+    matieres: list = field(default_factory=list)
+    # Premier jour, à partir de la date demandée, où centrale et camions suffisent
+    date_proposee: object = None
+
+    @property
+    def date_passee(self):
+        return self.date_livraison < timezone.localdate()
+
+    @property
+    def centrale_ok(self):
+        return self.volume_reserve + self.volume <= self.capacite_centrale
+
+    @property
+    def camions_ok(self):
+        return self.volume_reserve + self.volume <= self.capacite_camions
+
+    @property
+    def matieres_ok(self):
+        return all(controle.ok for controle in self.matieres)
+
+    @property
+    def faisable(self):
+        return not self.date_passee and self.centrale_ok and self.camions_ok and self.matieres_ok
+
+
+def capacite_camions():
+    """Volume livrable par jour : capacité de la flotte multipliée par les rotations par camion"""
+    capacite = Vehicule.objects.aggregate(total=Sum('capacite'))['total'] or Decimal('0')
+    return capacite * getattr(settings, 'LIVRAISON_ROTATIONS_JOURNALIERES', 4)
+
+
+def verifier_faisabilite(lignes, date_livraison, exclure_commande=None, jours_recherche=JOURS_RECHERCHE):
+    """Vérifie qu'une commande de lignes ``(formule_id, quantite)`` peut être livrée à la date.
+
+    ``exclure_commande`` retire des registres la contribution d'une commande
+    existante (modification d'une commande déjà enregistrée).
+    """
+    lignes = [(formule_id, Decimal(quantite)) for formule_id, quantite in lignes]
+    volume = sum((quantite for _, quantite in lignes), Decimal('0'))
+    fin = date_livraison + timedelta(days=jours_recherche)
+
+    charges = dict(ChargeJournaliere.objects.filter(date__range=[date_livraison, fin]).values_list('date', 'volume'))
+
+    # Besoins de la nouvelle commande, par matière
+    references = {}
+    besoin = {}
+    for formule_id, matiere_id, quantite, reference in CompositionFormule.objects.filter(
+        formule_id__in={formule_id for formule_id, _ in lignes}
+    ).values_list('formule_id', 'matiere_premiere_id', 'quantite', 'formule__quantite_produite_reference'):
+        references.setdefault(formule_id, []).append((matiere_id, quantite, reference))
+    for formule_id, quantite in lignes:
+        for matiere_id, quantite_matiere, reference in references.get(formule_id, []):
+            if reference:
+                besoin[matiere_id] = besoin.get(matiere_id, Decimal('0')) + quantite_matiere / reference * quantite
+
+    # Besoins déjà réservés jusqu'à la date, pour les seules matières concernées
+    reserves = dict(BesoinMatiereJournalier.objects.filter(
+        date__lte=date_livraison, matiere_premiere_id__in=besoin,
+    ).values('matiere_premiere_id').annotate(total=Sum('quantite')).values_list('matiere_premiere_id', 'total'))
+    soldes = dict(SoldeStock.objects.filter(matiere_premiere_id__in=besoin).values_list('matiere_premiere_id', 'quantite'))
+
+    if exclure_commande is not None:
+        commande = Commande.objects.filter(pk=exclure_commande).values('date_livraison_souhaitee', 'statut').first()
+        if commande:
+            anciennes = LigneCommande.objects.filter(commande_id=exclure_commande)
+            jour = commande['date_livraison_souhaitee']
+            if commande['statut'] in STATUTS_A_LIVRER and jour in charges:
+                charges[jour] -= anciennes.aggregate(total=Sum('quantite'))['total'] or 0
+            if commande['statut'] in STATUTS_A_PRODUIRE and jour <= date_livraison:
+                for _, matiere_id, quantite in _besoins_par_matiere(anciennes, 'commande__date_livraison_souhaitee'):
+                    if matiere_id in reserves:
+                        reserves[matiere_id] -= quantite
+
+    resultat = Faisabilite(
+        date_livraison=date_livraison,
+        volume=volume,
+        capacite_centrale=Decimal(str(getattr(settings, 'CENTRALE_CAPACITE_JOURNALIERE', 300))),
+        volume_reserve=charges.get(date_livraison, Decimal('0')),
+        capacite_camions=capacite_camions(),
+        matieres=[
+            ControleMatiere(
+                matiere_premiere_id=matiere_id,
+                besoin=quantite.quantize(Decimal('0.001')),
+                disponible=(soldes.get(matiere_id, Decimal('0')) - reserves.get(matiere_id, Decimal('0'))),
+            )
+            for matiere_id, quantite in sorted(besoin.items())
+        ],
+    )
+
+    capacite = min(resultat.capacite_centrale, resultat.capacite_camions)
+    premier_jour = max(date_livraison, timezone.localdate())
+    for decalage in range((fin - premier_jour).days + 1):
+        jour = premier_jour + timedelta(days=decalage)
+        if charges.get(jour, Decimal('0')) + volume <= capacite:
+            resultat.date_proposee = jour
+            break
+    return resultat
+
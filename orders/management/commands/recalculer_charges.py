@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from orders.capacite import recalculer_charges
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les registres de charge journalière (volumes à livrer, matières à réserver) "
+        "des commandes ; à lancer après un import ou une modification des compositions de formules"
+    )
+
+    def handle(self, *args, **options):
+        nombre = recalculer_charges()
+        self.stdout.write(self.style.SUCCESS(f"{nombre} jour(s) de charge recalculé(s)"))
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_matierepremiere_date_modification'),
+        ('orders', '0002_commande_date_modification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChargeJournaliere',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('volume', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('date_maj', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BesoinMatiereJournalier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantite', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('matiere_premiere', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='besoins_journaliers', to='inventory.matierepremiere')),
+            ],
+            options={
+                'unique_together': {('date', 'matiere_premiere')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0005_chantier_distance_km'),
+        ('orders', '0003_charges_journalieres'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commande',
+            index=models.Index(condition=models.Q(('statut__in', ['en_attente', 'validee', 'en_production'])), fields=['date_livraison_souhaitee'], name='commande_ouverte_livraison_idx'),
+        ),
+    ]
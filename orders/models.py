@@ -1,6 +1,41 @@
+from datetime import timedelta
+
 from django.db import models
+from django.db.models import DateField, DurationField, ExpressionWrapper, F, Q, Value
+from django.utils import timezone
 from customers.models import Client, Chantier
 from formulas.models import FormuleBeton
+from inventory.models import MatierePremiere
+
+# Commandes restant à livrer : seules concernées par les retards et les alertes
+STATUTS_OUVERTS = ['en_attente', 'validee', 'en_production']
+
+class CommandeQuerySet(models.QuerySet):
+    def ouvertes(self):
+        # Même condition que l'index partiel commande_ouverte_livraison_idx
+        return self.filter(statut__in=STATUTS_OUVERTS)
+
+    def avec_retard(self, aujourd_hui=None):
+        """Annote ``en_retard`` et ``retard`` (durée depuis la date souhaitée, négative si à venir)"""
+        aujourd_hui = aujourd_hui or timezone.localdate()
+        return self.annotate(
+            en_retard=ExpressionWrapper(
+                Q(statut__in=STATUTS_OUVERTS, date_livraison_souhaitee__lt=aujourd_hui),
+                output_field=models.BooleanField(),
+            ),
+            retard=ExpressionWrapper(
+                Value(aujourd_hui, output_field=DateField()) - F('date_livraison_souhaitee'),
+                output_field=DurationField(),
+            ),
+        )
+
+    def a_risque(self, jours, aujourd_hui=None):
+        """Commandes ouvertes en retard ou attendues dans les ``jours`` à venir sans être en production"""
+        aujourd_hui = aujourd_hui or timezone.localdate()
+        # Une seule borne sur la date : parcours d'intervalle de l'index partiel
+        return self.ouvertes().filter(date_livraison_souhaitee__lte=aujourd_hui + timedelta(days=jours)).exclude(
+            statut='en_production', date_livraison_souhaitee__gte=aujourd_hui,
+        )
 
 class Commande(models.Model):
     client = models.ForeignKey(Client, on_delete=models.CASCADE)
@@ -8,6 +43,19 @@ class Commande(models.Model):
     date_commande = models.DateField(auto_now_add=True)
     date_livraison_souhaitee = models.DateField()
     statut = models.CharField(max_length=20, choices=[('en_attente', 'En attente'), ('validee', 'Validée'), ('en_production', 'En production'), ('livree', 'Livrée'), ('annulee', 'Annulée')], default='en_attente')
+    date_modification = models.DateTimeField(auto_now=True)
+
+    objects = CommandeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Index partiel : les commandes ouvertes sont peu nombreuses face à l'historique livré
+            models.Index(
+                fields=['date_livraison_souhaitee'],
+                name='commande_ouverte_livraison_idx',
+                condition=Q(statut__in=STATUTS_OUVERTS),
+            ),
+        ]
 
     def __str__(self):
         return f"Commande {self.id} - {self.client}"
@@ -19,3 +67,24 @@ class LigneCommande(models.Model):
 
     def __str__(self):
         return f"Ligne de commande pour {self.commande.id}"
+
+class ChargeJournaliere(models.Model):
+    """Volume des commandes à livrer, par jour de livraison souhaitée (voir orders.capacite)"""
+    date = models.DateField(unique=True)
+    volume = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    date_maj = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Charge du {self.date:%d/%m/%Y}: {self.volume} m³"
+
+class BesoinMatiereJournalier(models.Model):
+    """Matières nécessaires aux commandes non encore produites, par jour de livraison souhaitée"""
+    date = models.DateField()
+    matiere_premiere = models.ForeignKey(MatierePremiere, related_name='besoins_journaliers', on_delete=models.CASCADE)
+    quantite = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+
+    class Meta:
+        unique_together = ('date', 'matiere_premiere')
+
+    def __str__(self):
+        return f"Besoin en {self.matiere_premiere.nom} le {self.date:%d/%m/%Y}: {self.quantite}"
@@ -0,0 +1,46 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from formulas.models import CompositionFormule, FormuleBeton
+from .capacite import planifier_recalcul_charges, planifier_recalcul_formule
+from .models import Commande, LigneCommande
+
+@receiver(pre_save, sender=Commande)
+def memoriser_date_livraison(sender, instance, **kwargs):
+    # Un report de date libère la charge de l'ancien jour
+    instance._date_precedente = None
+    if instance.pk and not kwargs.get('raw'):
+        instance._date_precedente = Commande.objects.filter(pk=instance.pk).values_list(
+            'date_livraison_souhaitee', flat=True
+        ).first()
+
+@receiver(post_save, sender=Commande)
+def recalculer_charges_commande(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    planifier_recalcul_charges(instance.date_livraison_souhaitee, getattr(instance, '_date_precedente', None))
+
+@receiver(post_delete, sender=Commande)
+def liberer_charges_commande(sender, instance, **kwargs):
+    planifier_recalcul_charges(instance.date_livraison_souhaitee)
+
+@receiver([post_save, post_delete], sender=LigneCommande)
+def recalculer_charges_ligne(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    # La commande peut déjà avoir disparu (suppression en cascade) : elle se charge alors du recalcul
+    planifier_recalcul_charges(Commande.objects.filter(pk=instance.commande_id).values_list(
+        'date_livraison_souhaitee', flat=True
+    ).first())
+
+@receiver([post_save, post_delete], sender=CompositionFormule)
+def recalculer_besoins_composition(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    planifier_recalcul_formule(instance.formule_id)
+
+@receiver(post_save, sender=FormuleBeton)
+def recalculer_besoins_formule(sender, instance, **kwargs):
+    # La quantité de référence divise les besoins par m³
+    if kwargs.get('raw'):
+        return
+    planifier_recalcul_formule(instance.pk)
@@ -1,3 +1,216 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from customers.models import Chantier, Client
+from formulas.models import CompositionFormule, FormuleBeton
+from inventory.models import MatierePremiere
+from logistics.models import Vehicule
+from stock.services import enregistrer_mouvement
+from .capacite import recalculer_charges, verifier_faisabilite
+from .models import BesoinMatiereJournalier, ChargeJournaliere, Commande, LigneCommande
+
+
+class DonneesCommandes:
+    """Formule à deux matières, un client et son chantier"""
+
+    def setUp(self):
+        self.ciment = MatierePremiere.objects.create(nom='Ciment', unite_mesure='kg')
+        self.sable = MatierePremiere.objects.create(nom='Sable', unite_mesure='kg')
+        self.formule = FormuleBeton.objects.create(nom='B25', resistance_requise='C25/30')
+        CompositionFormule.objects.create(formule=self.formule, matiere_premiere=self.ciment, quantite=350)
+        CompositionFormule.objects.create(formule=self.formule, matiere_premiere=self.sable, quantite=800)
+        self.client_beton = Client.objects.create(nom='Client', adresse='1 rue A, Rabat')
+        self.chantier = Chantier.objects.create(nom='Chantier', adresse='2 rue B, Rabat', client=self.client_beton)
+        self.jour = timezone.localdate() + timedelta(days=5)
+
+    def commander(self, *quantites, jour=None, statut='en_attente'):
+        with self.captureOnCommitCallbacks(execute=True):
+            commande = Commande.objects.create(
+                client=self.client_beton, chantier=self.chantier,
+                date_livraison_souhaitee=jour or self.jour, statut=statut,
+            )
+            for quantite in quantites:
+                LigneCommande.objects.create(commande=commande, formule=self.formule, quantite=quantite)
+        return commande
+
+
+class RegistresCapaciteTests(DonneesCommandes, TestCase):
+    def besoins(self, jour=None):
+        return dict(BesoinMatiereJournalier.objects.filter(date=jour or self.jour).values_list(
+            'matiere_premiere_id', 'quantite',
+        ))
+
+    def test_registres_a_la_validation(self):
+        # Deux lignes de la même formule le même jour : une seule ligne de registre par matière
+        self.commander(2, 3)
+        self.commander(1)
+        self.assertEqual(ChargeJournaliere.objects.get(date=self.jour).volume, 6)
+        self.assertEqual(self.besoins(), {self.ciment.pk: 2100, self.sable.pk: 4800})
+
+    def test_quantite_de_reference(self):
+        FormuleBeton.objects.filter(pk=self.formule.pk).update(quantite_produite_reference=2)
+        self.commander(4)
+        self.assertEqual(self.besoins(), {self.ciment.pk: 700, self.sable.pk: 1600})
+
+    def test_report_libere_l_ancien_jour(self):
+        commande = self.commander(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            commande.date_livraison_souhaitee = self.jour + timedelta(days=1)
+            commande.save()
+        self.assertFalse(ChargeJournaliere.objects.filter(date=self.jour).exists())
+        self.assertEqual(self.besoins(), {})
+        self.assertEqual(ChargeJournaliere.objects.get(date=self.jour + timedelta(days=1)).volume, 2)
+
+    def test_commande_produite_hors_besoins(self):
+        commande = self.commander(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            commande.statut = 'en_production'
+            commande.save()
+        # Encore à livrer, mais ses matières sont déjà sorties du stock
+        self.assertEqual(ChargeJournaliere.objects.get(date=self.jour).volume, 2)
+        self.assertEqual(self.besoins(), {})
+
+    def test_formule_modifiee(self):
+        self.commander(2)
+        produite = self.commander(1, jour=self.jour + timedelta(days=1), statut='en_production')
+        with self.captureOnCommitCallbacks(execute=True):
+            composition = CompositionFormule.objects.get(matiere_premiere=self.ciment)
+            composition.quantite = 400
+            composition.save()
+        self.assertEqual(self.besoins(), {self.ciment.pk: 800, self.sable.pk: 1600})
+        with self.captureOnCommitCallbacks(execute=True):
+            CompositionFormule.objects.filter(matiere_premiere=self.sable).delete()
+        self.assertEqual(self.besoins(), {self.ciment.pk: 800})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.formule.quantite_produite_reference = 2
+            self.formule.save()
+        self.assertEqual(self.besoins(), {self.ciment.pk: 400})
+        # Commande déjà produite : aucun registre à recalculer pour son jour
+        self.assertEqual(self.besoins(produite.date_livraison_souhaitee), {})
+
+    def test_recalcul_complet(self):
+        self.commander(2)
+        BesoinMatiereJournalier.objects.all().delete()
+        self.assertEqual(recalculer_charges(), 1)
+        self.assertEqual(self.besoins(), {self.ciment.pk: 700, self.sable.pk: 1600})
+
+
+@override_settings(CENTRALE_CAPACITE_JOURNALIERE=10, LIVRAISON_ROTATIONS_JOURNALIERES=2)
+class FaisabiliteTests(DonneesCommandes, TestCase):
+    def setUp(self):
+        super().setUp()
+        Vehicule.objects.create(immatriculation='AA-001', modele='Toupie', capacite=8)
+        enregistrer_mouvement(self.ciment, 5000, 'entree')
+        enregistrer_mouvement(self.sable, 10000, 'entree')
+
+    def test_besoins_reserves_par_les_commandes(self):
+        self.commander(6)
+        resultat = verifier_faisabilite([(self.formule.pk, 4)], self.jour)
+        self.assertTrue(resultat.faisable)
+        self.assertEqual(resultat.volume_reserve, 6)
+        self.assertEqual(
+            [(controle.besoin, controle.disponible) for controle in resultat.matieres],
+            [(1400, 5000 - 2100), (3200, 10000 - 4800)],
+        )
+        # Au-delà de la capacité de la centrale : jour suivant proposé
+        resultat = verifier_faisabilite([(self.formule.pk, 5)], self.jour)
+        self.assertFalse(resultat.centrale_ok)
+        self.assertEqual(resultat.date_proposee, self.jour + timedelta(days=1))
+
+    def test_commande_modifiee_exclue(self):
+        commande = self.commander(6)
+        resultat = verifier_faisabilite([(self.formule.pk, 8)], self.jour, exclure_commande=commande.pk)
+        self.assertEqual(resultat.volume_reserve, 0)
+        self.assertEqual([controle.disponible for controle in resultat.matieres], [5000, 10000])
+        self.assertTrue(resultat.faisable)
+
+    def test_matiere_insuffisante(self):
+        resultat = verifier_faisabilite([(self.formule.pk, 15)], self.jour + timedelta(days=1))
+        self.assertFalse(resultat.matieres_ok)
+        self.assertFalse(resultat.faisable)
+
+    def test_date_passee(self):
+        resultat = verifier_faisabilite([(self.formule.pk, 1)], timezone.localdate() - timedelta(days=1))
+        self.assertTrue(resultat.date_passee)
+        self.assertFalse(resultat.faisable)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class VueFaisabiliteTests(DonneesCommandes, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+
+    def demander(self, quantite):
+        return self.client.post('/orders/faisabilite/', json.dumps({
+            'date_livraison': self.jour.isoformat(), 'lignes': [{'formule': self.formule.pk, 'quantite': quantite}],
+        }), content_type='application/json')
+
+    def test_reponse(self):
+        reponse = self.demander('2.5')
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(Decimal(reponse.json()['volume']), Decimal('2.5'))
+
+    def test_nombres_invalides_refuses(self):
+        for quantite in ['NaN', 'Infinity', 'abc', '0']:
+            with self.subTest(quantite=quantite):
+                reponse = self.demander(quantite)
+                self.assertEqual(reponse.status_code, 400)
+                self.assertIn('erreur', reponse.json())
+
+
+class RetardsCommandesTests(DonneesCommandes, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.aujourd_hui = timezone.localdate()
+        jours = {
+            'retard': -3, 'retard_livree': -3, 'retard_annulee': -3, 'demain': 1,
+            'demain_en_production': 1, 'lointaine': 10, 'hier_en_production': -1,
+        }
+        statuts = {
+            'retard_livree': 'livree', 'retard_annulee': 'annulee',
+            'demain_en_production': 'en_production', 'hier_en_production': 'en_production',
+        }
+        self.commandes = {
+            nom: self.commander(1, jour=self.aujourd_hui + timedelta(days=decalage), statut=statuts.get(nom, 'validee'))
+            for nom, decalage in jours.items()
+        }
+
+    def noms(self, commandes):
+        ids = {commande.pk: nom for nom, commande in self.commandes.items()}
+        return {ids[pk] for pk in commandes.values_list('pk', flat=True)}
+
+    def test_retard_annote_en_base(self):
+        commandes = {commande.pk: commande for commande in Commande.objects.avec_retard(self.aujourd_hui)}
+        retard = commandes[self.commandes['retard'].pk]
+        self.assertTrue(retard.en_retard)
+        self.assertEqual(retard.retard, timedelta(days=3))
+        # Livrée ou annulée : jamais en retard
+        self.assertFalse(commandes[self.commandes['retard_livree'].pk].en_retard)
+        self.assertFalse(commandes[self.commandes['retard_annulee'].pk].en_retard)
+        self.assertEqual(commandes[self.commandes['demain'].pk].retard, timedelta(days=-1))
+
+    def test_commandes_a_risque(self):
+        self.assertEqual(
+            self.noms(Commande.objects.a_risque(2, self.aujourd_hui)), {'retard', 'demain', 'hier_en_production'},
+        )
+
+    @override_settings(SECURE_SSL_REDIRECT=False, COMMANDES_JOURS_ALERTE=2)
+    def test_flux_d_alertes(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        reponse = self.client.get('/orders/alertes/')
+        self.assertEqual(reponse.status_code, 200)
+        alertes = reponse.json()['alertes']
+        self.assertEqual(
+            [(alerte['commande'], alerte['niveau'], alerte['jours_retard']) for alerte in alertes],
+            [
+                (self.commandes['retard'].pk, 'retard', 3),
+                (self.commandes['hier_en_production'].pk, 'retard', 1),
+                (self.commandes['demain'].pk, 'risque', -1),
+            ],
+        )
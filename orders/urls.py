@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('alertes/', views.alertes, name='alertes'),
+    path('faisabilite/', views.faisabilite, name='faisabilite'),
+]
@@ -1,3 +1,99 @@
-from django.shortcuts import render
+import json
+from datetime import date
 
-# Create your views here.
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET, require_POST
+
+from beton_project.decimaux import decimal_fini
+from .capacite import verifier_faisabilite
+from .models import Commande
+
+
+class DemandeInvalide(ValueError):
+    pass
+
+
+def _lire_demande(corps):
+    try:
+        donnees = json.loads(corps or b'{}')
+        date_livraison = date.fromisoformat(donnees['date_livraison'])
+        lignes = [
+            (int(ligne['formule']), decimal_fini(ligne['quantite']))
+            for ligne in donnees['lignes']
+        ]
+        commande = int(donnees['commande']) if donnees.get('commande') else None
+    except (ValueError, TypeError, KeyError):
+        raise DemandeInvalide(
+            "Corps attendu : {\"date_livraison\": \"AAAA-MM-JJ\", "
+            "\"lignes\": [{\"formule\": id, \"quantite\": m3}, ...], \"commande\": id (facultatif)}"
+        )
+    if not lignes or any(quantite <= 0 for _, quantite in lignes):
+        raise DemandeInvalide("Au moins une ligne, de quantité positive.")
+    return date_livraison, lignes, commande
+
+
+@staff_member_required
+@require_POST
+def faisabilite(request):
+    """Vérifie qu'une date de livraison peut être promise : matières, centrale, camions"""
+    try:
+        date_livraison, lignes, commande = _lire_demande(request.body)
+    except DemandeInvalide as erreur:
+        return JsonResponse({'erreur': str(erreur)}, status=400)
+
+    resultat = verifier_faisabilite(lignes, date_livraison, exclure_commande=commande)
+    return JsonResponse({
+        'faisable': resultat.faisable,
+        'date_livraison': resultat.date_livraison,
+        'date_passee': resultat.date_passee,
+        'volume': resultat.volume,
+        'centrale': {
+            'ok': resultat.centrale_ok,
+            'capacite': resultat.capacite_centrale,
+            'volume_reserve': resultat.volume_reserve,
+        },
+        'camions': {
+            'ok': resultat.camions_ok,
+            'capacite': resultat.capacite_camions,
+        },
+        'matieres': [
+            {
+                'matiere_premiere': controle.matiere_premiere_id,
+                'ok': controle.ok,
+                'besoin': controle.besoin,
+                'disponible': controle.disponible,
+            }
+            for controle in resultat.matieres
+        ],
+        'date_proposee': resultat.date_proposee,
+    })
+
+
+@staff_member_required
+@require_GET
+def alertes(request):
+    """Commandes en retard et à risque ; ne lit que les commandes ouvertes (index partiel)"""
+    aujourd_hui = timezone.localdate()
+    jours = getattr(settings, 'COMMANDES_JOURS_ALERTE', 2)
+    commandes = Commande.objects.a_risque(jours, aujourd_hui).avec_retard(aujourd_hui).order_by(
+        'date_livraison_souhaitee', 'id'
+    ).values_list('id', 'client__nom', 'chantier__nom', 'date_livraison_souhaitee', 'statut', 'en_retard', 'retard')
+    return JsonResponse({
+        'date': aujourd_hui,
+        'jours_alerte': jours,
+        'alertes': [
+            {
+                'commande': pk,
+                'client': client,
+                'chantier': chantier,
+                'date_livraison_souhaitee': date_livraison,
+                'statut': statut,
+                'niveau': 'retard' if en_retard else 'risque',
+                'jours_retard': retard.days,
+            }
+            for pk, client, chantier, date_livraison, statut, en_retard, retard in commandes
+        ],
+    })
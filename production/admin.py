@@ -1,8 +1,91 @@
+from django import forms
 from django.contrib import admin
+from beton_project.paginators import PaginateurApproximatif
 from .models import OrdreProduction, LotProduction
+from .services import lots_archives, manques_stock
+
+ERREUR_LOT_ARCHIVE = (
+    "Les sorties de stock du lot {} appartiennent à une période archivée : "
+    "le lot ne peut plus être modifié ni supprimé."
+)
+
+def _erreur_stock(manques):
+    return forms.ValidationError([
+        f"Stock insuffisant en {matiere.nom} : {disponible} {matiere.unite_mesure} disponible(s), {besoin} nécessaire(s)."
+        for matiere, disponible, besoin in manques
+    ])
+
+def _a_deduire(form, ordre_production):
+    """``(lot, remplacé)`` si l'enregistrement du formulaire déduit du stock, sinon None"""
+    quantite = form.cleaned_data.get('quantite_produite')
+    if ordre_production is None or quantite is None:
+        return None
+    if form.instance.pk is None:
+        return (ordre_production, quantite), None
+    if form.has_changed():
+        return (ordre_production, quantite), form.instance.pk
+    return None
+
+def _modifie_les_sorties(form):
+    # Même condition que le recalcul des sorties (production.signals)
+    return form.instance.pk is not None and bool({'quantite_produite', 'ordre_production'} & set(form.changed_data))
+
+def _erreur_lots_archives(lot_ids):
+    archives = lots_archives(lot_ids) if lot_ids else set()
+    if archives:
+        raise forms.ValidationError([ERREUR_LOT_ARCHIVE.format(lot_id) for lot_id in sorted(archives)])
+
+def _proteger_lots_archives(suppression, lots):
+    """Résultat de ``get_deleted_objects`` où les lots archivés sont protégés"""
+    a_supprimer, nombres, permissions, proteges = suppression
+    archives = lots_archives([lot.pk for lot in lots])
+    proteges = [*proteges, *(f"{lot} (sorties de stock archivées)" for lot in lots if lot.pk in archives)]
+    return a_supprimer, nombres, permissions, proteges
+
+class LotProductionForm(forms.ModelForm):
+    class Meta:
+        model = LotProduction
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if _modifie_les_sorties(self):
+            _erreur_lots_archives([self.instance.pk])
+        # Vérifié ici plutôt que par StockInsuffisant, levée pendant l'enregistrement (erreur 500)
+        deduction = _a_deduire(self, cleaned_data.get('ordre_production'))
+        if deduction is not None:
+            lot, remplace = deduction
+            manques = manques_stock([lot], remplaces=[remplace] if remplace else [])
+            if manques:
+                raise _erreur_stock(manques)
+        return cleaned_data
+
+class LotProductionFormSet(forms.BaseInlineFormSet):
+    def clean(self):
+        super().clean()
+        _erreur_lots_archives([
+            form.instance.pk for form in self.forms
+            if hasattr(form, 'cleaned_data') and (
+                _modifie_les_sorties(form) or form.instance.pk and self.can_delete and self._should_delete_form(form)
+            )
+        ])
+        # Tous les lots saisis ensemble consomment le même stock
+        lots, remplaces = [], []
+        for form in self.forms:
+            if not hasattr(form, 'cleaned_data') or self.can_delete and self._should_delete_form(form):
+                continue
+            deduction = _a_deduire(form, self.instance)
+            if deduction is not None:
+                lots.append(deduction[0])
+                if deduction[1]:
+                    remplaces.append(deduction[1])
+        manques = manques_stock(lots, remplaces) if lots else []
+        if manques:
+            raise _erreur_stock(manques)
 
 class LotProductionInline(admin.TabularInline):
     model = LotProduction
+    formset = LotProductionFormSet
     extra = 0
 
 @admin.register(OrdreProduction)
@@ -11,3 +94,20 @@ class OrdreProductionAdmin(admin.ModelAdmin):
     list_filter = ('statut', 'date_production')
     search_fields = ('commande__client__nom', 'formule__nom')
     inlines = [LotProductionInline]
+
+    def get_deleted_objects(self, objs, request):
+        lots = LotProduction.objects.filter(ordre_production__in=objs)
+        return _proteger_lots_archives(super().get_deleted_objects(objs, request), lots)
+
+@admin.register(LotProduction)
+class LotProductionAdmin(admin.ModelAdmin):
+    form = LotProductionForm
+    list_display = ('id', 'ordre_production', 'quantite_produite', 'date_heure_production')
+    list_filter = ('date_heure_production',)
+    search_fields = ('ordre_production__commande__client__nom',)
+    list_select_related = ('ordre_production__commande',)
+    paginator = PaginateurApproximatif
+    show_full_result_count = False
+
+    def get_deleted_objects(self, objs, request):
+        return _proteger_lots_archives(super().get_deleted_objects(objs, request), objs)
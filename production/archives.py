@@ -0,0 +1,40 @@
+"""Archivage des lots de production des périodes closes (voir stock.archives)"""
+from django.db import transaction
+
+from stock.archives import TAILLE_LOT, sources
+from stock.models import Archivage
+
+from .models import LotProduction, LotProductionArchive
+from .services import conserver_stock
+
+CHAMPS_LOT = ['id', 'ordre_production_id', 'quantite_produite', 'date_heure_production', 'date_modification']
+
+# Seules les commandes facturées (facture envoyée ou payée) sont considérées closes
+STATUTS_FACTURE_CLOS = ['envoyee', 'payee']
+
+
+def sources_lots(depuis=None):
+    return sources(LotProduction, LotProductionArchive, 'production.lotproduction', depuis)
+
+
+def archiver_lots(date_limite, taille_lot=TAILLE_LOT):
+    """Déplace vers l'archive les lots antérieurs à ``date_limite`` dont la commande est facturée"""
+    eligibles = LotProduction.objects.filter(
+        date_heure_production__lt=date_limite,
+        ordre_production__commande__facture__statut__in=STATUTS_FACTURE_CLOS,
+    )
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(eligibles.order_by('id').values_list('id', flat=True)[:taille_lot])
+            if not ids:
+                break
+            lots = list(LotProduction.objects.select_for_update().filter(id__in=ids).values(*CHAMPS_LOT))
+            LotProductionArchive.objects.bulk_create([LotProductionArchive(**lot) for lot in lots])
+            # Les sorties de stock du lot restent acquises
+            with conserver_stock():
+                LotProduction.objects.filter(id__in=ids).delete()
+        total += len(lots)
+
+    Archivage.objects.create(table='production.lotproduction', date_limite=date_limite, nombre_lignes=total)
+    return total
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lotproduction',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='ordreproduction',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
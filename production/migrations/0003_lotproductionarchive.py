@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0002_lotproduction_date_modification_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LotProductionArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantite_produite', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('date_heure_production', models.DateTimeField(db_index=True)),
+                ('date_modification', models.DateTimeField()),
+                ('ordre_production', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots_archives', to='production.ordreproduction')),
+            ],
+        ),
+    ]
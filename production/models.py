@@ -8,6 +8,7 @@ class OrdreProduction(models.Model):
     quantite_produire = models.DecimalField(max_digits=10, decimal_places=2)
     date_production = models.DateField()
     statut = models.CharField(max_length=20, choices=[('planifie', 'Planifié'), ('en_cours', 'En cours'), ('termine', 'Terminé'), ('annule', 'Annulé')], default='planifie')
+    date_modification = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Ordre de production {self.id} pour la commande {self.commande.id}"
@@ -16,6 +17,19 @@ class LotProduction(models.Model):
     ordre_production = models.ForeignKey(OrdreProduction, related_name='lots', on_delete=models.CASCADE)
     quantite_produite = models.DecimalField(max_digits=10, decimal_places=2)
     date_heure_production = models.DateTimeField(auto_now_add=True)
+    date_modification = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Lot {self.id} de l'ordre {self.ordre_production.id}"
+
+class LotProductionArchive(models.Model):
+    """Lot d'une période close et facturée, déplacé hors de la table courante (voir production.archives)"""
+    # Identifiant d'origine conservé
+    id = models.BigIntegerField(primary_key=True)
+    ordre_production = models.ForeignKey(OrdreProduction, related_name='lots_archives', on_delete=models.CASCADE)
+    quantite_produite = models.DecimalField(max_digits=10, decimal_places=2)
+    date_heure_production = models.DateTimeField(db_index=True)
+    date_modification = models.DateTimeField()
+
+    def __str__(self):
+        return f"Lot {self.id} de l'ordre {self.ordre_production_id} (archivé)"
@@ -0,0 +1,133 @@
+from contextlib import contextmanager
+from decimal import Decimal
+from threading import local
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+
+from inventory.models import MatierePremiere
+from stock.models import MouvementStock, MouvementStockArchive
+from stock.services import PRECISION_QUANTITE, enregistrer_mouvements, supprimer_mouvements
+
+_etat = local()
+
+
+class LotArchive(Exception):
+    """Levée quand on modifie ou supprime un lot dont les sorties de stock sont archivées"""
+
+    def __init__(self, lot_id):
+        self.lot_id = lot_id
+        super().__init__(
+            f"Les sorties de stock du lot {lot_id} appartiennent à une période archivée : "
+            f"le lot ne peut plus être modifié ni supprimé"
+        )
+
+
+def lots_archives(lot_ids):
+    """Lots dont des sorties de stock ont été archivées (période close)"""
+    return set(MouvementStockArchive.objects.filter(
+        lot_production_id__in=lot_ids
+    ).values_list('lot_production_id', flat=True).distinct())
+
+
+def verifier_lots_modifiables(lot_ids):
+    """Lève ``LotArchive`` si des sorties de stock d'un des lots sont archivées.
+
+    Reprendre ces sorties ne toucherait que la table courante, et la nouvelle
+    déduction serait ignorée (clé d'idempotence déjà présente dans l'archive) :
+    le stock resterait faux sans erreur.
+    """
+    archives = lots_archives(lot_ids)
+    if archives:
+        raise LotArchive(min(archives))
+
+
+def deduire_stock(lot):
+    """Enregistre les sorties de matières d'un lot, rattachées au lot"""
+    ordre_production = lot.ordre_production
+    formule = ordre_production.formule
+
+    mouvements = []
+    for composition in formule.composition.select_related('matiere_premiere'):
+        matiere_premiere = composition.matiere_premiere
+        quantite_necessaire = (composition.quantite / formule.quantite_produite_reference) * lot.quantite_produite
+
+        mouvements.append(MouvementStock(
+            matiere_premiere=matiere_premiere,
+            quantite=quantite_necessaire,
+            type_mouvement='sortie',
+            description=f"Production du lot {lot.id} (Ordre {ordre_production.id})",
+            type_source='lot',
+            lot_production=lot,
+            cle_idempotence=f"lot:{lot.id}:{matiere_premiere.id}",
+        ))
+
+    # Une seule transaction verrouille les soldes de toutes les matières du lot
+    return enregistrer_mouvements(mouvements)
+
+
+def besoins_lots(lots):
+    """Matières consommées par des lots ``(ordre_production, quantite_produite)`` : ``{matiere_id: quantite}``"""
+    besoins = {}
+    for ordre_production, quantite_produite in lots:
+        formule = ordre_production.formule
+        for composition in formule.composition.all():
+            # Même arrondi que les sorties enregistrées par deduire_stock
+            quantite = (composition.quantite / formule.quantite_produite_reference * quantite_produite).quantize(
+                PRECISION_QUANTITE
+            )
+            besoins[composition.matiere_premiere_id] = besoins.get(composition.matiere_premiere_id, 0) + quantite
+    return besoins
+
+
+def manques_stock(lots, remplaces=()):
+    """Matières dont le solde ne couvre pas les sorties de ``lots`` : ``[(matiere, disponible, besoin)]``.
+
+    ``remplaces`` : lots modifiés dont les sorties actuelles seront reprises
+    avant la nouvelle déduction. Toujours vide si le stock négatif est permis
+    (``STOCK_INTERDIRE_NEGATIF``).
+    """
+    if not getattr(settings, 'STOCK_INTERDIRE_NEGATIF', False):
+        return []
+    besoins = besoins_lots(lots)
+    repris = dict(
+        MouvementStock.objects.filter(lot_production_id__in=remplaces, type_mouvement='sortie').values(
+            'matiere_premiere_id'
+        ).annotate(total=Sum('quantite')).values_list('matiere_premiere_id', 'total')
+    )
+    manques = []
+    for matiere in MatierePremiere.objects.filter(id__in=besoins).select_related('solde').order_by('nom'):
+        disponible = matiere.stock_actuel + repris.get(matiere.id, Decimal('0'))
+        if besoins[matiere.id] > disponible:
+            manques.append((matiere, disponible, besoins[matiere.id]))
+    return manques
+
+
+def reprendre_stock(lot_ids):
+    """Annule les sorties de matières des lots (recherche par l'index du lot)"""
+    if stock_conserve():
+        return 0
+    return supprimer_mouvements(MouvementStock.objects.filter(lot_production_id__in=lot_ids))
+
+
+def recalculer_deduction(lot):
+    """Remplace les sorties d'un lot modifié (quantité ou ordre) par celles de son nouvel état"""
+    with transaction.atomic():
+        reprendre_stock([lot.pk])
+        return deduire_stock(lot)
+
+
+@contextmanager
+def conserver_stock():
+    """Supprime des lots sans reprendre leurs sorties de stock (archivage : le lot est déplacé, pas annulé)"""
+    precedent = stock_conserve()
+    _etat.conserver = True
+    try:
+        yield
+    finally:
+        _etat.conserver = precedent
+
+
+def stock_conserve():
+    return getattr(_etat, 'conserver', False)
@@ -1,22 +1,36 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from .models import LotProduction
-from stock.models import MouvementStock
+from .services import deduire_stock, recalculer_deduction, reprendre_stock, stock_conserve, verifier_lots_modifiables
+
+@receiver(pre_save, sender=LotProduction)
+def memoriser_lot(sender, instance, **kwargs):
+    # Seule une modification de la quantité ou de l'ordre change les sorties du lot
+    instance._etat_precedent = None
+    if instance.pk and not kwargs.get('raw'):
+        instance._etat_precedent = LotProduction.objects.filter(pk=instance.pk).values_list(
+            'quantite_produite', 'ordre_production_id'
+        ).first()
+        if instance._etat_precedent not in (None, (instance.quantite_produite, instance.ordre_production_id)):
+            verifier_lots_modifiables([instance.pk])
 
 @receiver(post_save, sender=LotProduction)
 def deduire_stock_apres_production(sender, instance, created, **kwargs):
+    if kwargs.get('raw'):
+        return
     if created:
-        ordre_production = instance.ordre_production
-        formule = ordre_production.formule
-        quantite_produite = instance.quantite_produite
+        deduire_stock(instance)
+        return
+    precedent = getattr(instance, '_etat_precedent', None)
+    if precedent is not None and precedent != (instance.quantite_produite, instance.ordre_production_id):
+        recalculer_deduction(instance)
 
-        for composition in formule.composition.all():
-            matiere_premiere = composition.matiere_premiere
-            quantite_necessaire = (composition.quantite / formule.quantite_produite_reference) * quantite_produite
+@receiver(pre_delete, sender=LotProduction)
+def verifier_suppression_lot(sender, instance, **kwargs):
+    # L'archivage déplace le lot sans toucher au stock
+    if not stock_conserve():
+        verifier_lots_modifiables([instance.pk])
 
-            MouvementStock.objects.create(
-                matiere_premiere=matiere_premiere,
-                quantite=quantite_necessaire,
-                type_mouvement='sortie',
-                description=f"Production du lot {instance.id} (Ordre {ordre_production.id})"
-            )
\ No newline at end of file
+@receiver(post_delete, sender=LotProduction)
+def reprendre_stock_apres_suppression(sender, instance, **kwargs):
+    reprendre_stock([instance.pk])
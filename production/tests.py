@@ -1,3 +1,186 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from billing.models import Facture
+from customers.models import Chantier, Client
+from formulas.models import CompositionFormule, FormuleBeton
+from inventory.models import MatierePremiere
+from orders.models import Commande
+from stock.archives import archiver_mouvements
+from stock.models import MouvementStock, MouvementStockArchive
+from stock.services import enregistrer_mouvement
+from .archives import archiver_lots
+from .models import LotProduction, LotProductionArchive, OrdreProduction
+from .services import LotArchive
+
+
+class DonneesProduction(TestCase):
+    def setUp(self):
+        self.ciment = MatierePremiere.objects.create(nom='Ciment', unite_mesure='kg')
+        self.sable = MatierePremiere.objects.create(nom='Sable', unite_mesure='kg')
+        self.formule = FormuleBeton.objects.create(nom='B25', resistance_requise='C25/30')
+        CompositionFormule.objects.create(formule=self.formule, matiere_premiere=self.ciment, quantite=350)
+        CompositionFormule.objects.create(formule=self.formule, matiere_premiere=self.sable, quantite=800)
+        client = Client.objects.create(nom='Client', adresse='1 rue A, Rabat')
+        chantier = Chantier.objects.create(nom='Chantier', adresse='2 rue B, Rabat', client=client)
+        commande = Commande.objects.create(client=client, chantier=chantier, date_livraison_souhaitee=date(2030, 1, 1))
+        self.ordre = OrdreProduction.objects.create(
+            commande=commande, formule=self.formule, quantite_produire=10, date_production=date(2030, 1, 1),
+        )
+
+
+class DeductionLotTests(DonneesProduction):
+    def test_lot_deduit_chaque_matiere(self):
+        lot = LotProduction.objects.create(ordre_production=self.ordre, quantite_produite=2)
+        self.assertEqual(self.ciment.solde.quantite, Decimal('-700'))
+        self.assertEqual(lot.mouvements_stock.count(), 2)
+
+    def test_modification_de_quantite_remplace_les_sorties(self):
+        lot = LotProduction.objects.create(ordre_production=self.ordre, quantite_produite=2)
+        lot.quantite_produite = 1
+        lot.save()
+        self.ciment.solde.refresh_from_db()
+        self.assertEqual(self.ciment.solde.quantite, Decimal('-350'))
+        self.assertEqual(lot.mouvements_stock.count(), 2)
+
+    def test_suppression_reprend_les_sorties(self):
+        lot = LotProduction.objects.create(ordre_production=self.ordre, quantite_produite=2)
+        lot.delete()
+        self.ciment.solde.refresh_from_db()
+        self.assertEqual(self.ciment.solde.quantite, 0)
+
+
+class SourceMouvementTests(DonneesProduction):
+    def test_sorties_rattachees_au_lot(self):
+        lot = LotProduction.objects.create(ordre_production=self.ordre, quantite_produite=2)
+        self.assertEqual(
+            set(MouvementStock.objects.values_list('type_source', 'lot_production_id', 'matiere_premiere_id')),
+            {('lot', lot.pk, self.ciment.pk), ('lot', lot.pk, self.sable.pk)},
+        )
+
+    def test_changement_d_ordre_reprend_la_formule(self):
+        autre = FormuleBeton.objects.create(nom='B30', resistance_requise='C30/37')
+        CompositionFormule.objects.create(formule=autre, matiere_premiere=self.ciment, quantite=400)
+        ordre = OrdreProduction.objects.create(
+            commande=self.ordre.commande, formule=autre, quantite_produire=5, date_production=date(2030, 1, 1),
+        )
+        lot = LotProduction.objects.create(ordre_production=self.ordre, quantite_produite=1)
+        lot.ordre_production = ordre
+        lot.save()
+        self.assertEqual(list(lot.mouvements_stock.values_list('matiere_premiere_id', 'quantite')), [(self.ciment.pk, 400)])
+        self.sable.solde.refresh_from_db()
+        self.assertEqual(self.sable.solde.quantite, 0)
+
+    def test_archive_conserve_la_source(self):
+        lot = LotProduction.objects.create(ordre_production=self.ordre, quantite_produite=1)
+        enregistrer_mouvement(self.ciment, 100, 'entree')
+        MouvementStock.objects.filter(type_source='saisie').update(type_source='reception', reference_source='BL-12')
+        archiver_mouvements(timezone.now() + timedelta(minutes=1))
+        self.assertEqual(MouvementStockArchive.objects.filter(lot_production_id=lot.pk).count(), 2)
+        self.assertTrue(MouvementStockArchive.objects.filter(type_source='reception', reference_source='BL-12').exists())
+
+    def test_migration_renseigne_les_anciennes_sorties(self):
+        lot = LotProduction.objects.create(ordre_production=self.ordre, quantite_produite=1)
+        # Sorties antérieures aux sources : clé d'idempotence, ou seulement la description
+        MouvementStock.objects.filter(matiere_premiere=self.ciment).update(type_source='saisie', lot_production=None)
+        MouvementStock.objects.filter(matiere_premiere=self.sable).update(
+            type_source='saisie', lot_production=None, cle_idempotence=None,
+        )
+        enregistrer_mouvement(self.ciment, 100, 'entree', description='Production du lot fournisseur')
+        import_module('stock.migrations.0005_source_mouvement').renseigner_sources(apps, None)
+        self.assertEqual(lot.mouvements_stock.count(), 2)
+        self.assertEqual(MouvementStock.objects.get(type_mouvement='entree').type_source, 'saisie')
+
+
+@override_settings(STOCK_INTERDIRE_NEGATIF=True, SECURE_SSL_REDIRECT=False)
+class AdminLotStockInsuffisantTests(DonneesProduction):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        enregistrer_mouvement(self.ciment, 1000, 'entree')
+        enregistrer_mouvement(self.sable, 1000, 'entree')
+
+    def test_lot_sans_stock_refuse_par_le_formulaire(self):
+        reponse = self.client.post('/admin/production/lotproduction/add/', {
+            'ordre_production': self.ordre.pk, 'quantite_produite': '2',
+        })
+        self.assertEqual(reponse.status_code, 200)
+        self.assertContains(reponse, 'Stock insuffisant en Sable')
+        self.assertFalse(LotProduction.objects.exists())
+
+    def test_lot_couvert_par_le_stock_enregistre(self):
+        reponse = self.client.post('/admin/production/lotproduction/add/', {
+            'ordre_production': self.ordre.pk, 'quantite_produite': '1',
+        })
+        self.assertEqual(reponse.status_code, 302)
+        self.sable.solde.refresh_from_db()
+        self.assertEqual(self.sable.solde.quantite, 200)
+
+    def test_modification_tient_compte_des_sorties_reprises(self):
+        lot = LotProduction.objects.create(ordre_production=self.ordre, quantite_produite=1)
+        reponse = self.client.post(f'/admin/production/lotproduction/{lot.pk}/change/', {
+            'ordre_production': self.ordre.pk, 'quantite_produite': '1.25',
+        })
+        self.assertEqual(reponse.status_code, 302)
+        lot.refresh_from_db()
+        self.assertEqual(lot.quantite_produite, Decimal('1.25'))
+
+    def test_lots_saisis_ensemble_dans_l_ordre(self):
+        donnees = {
+            'commande': self.ordre.commande_id, 'formule': self.formule.pk, 'quantite_produire': '10',
+            'date_production': '2030-01-01', 'statut': 'planifie',
+            'lots-TOTAL_FORMS': '2', 'lots-INITIAL_FORMS': '0', 'lots-MIN_NUM_FORMS': '0', 'lots-MAX_NUM_FORMS': '1000',
+            'lots-0-quantite_produite': '1', 'lots-1-quantite_produite': '0.5',
+        }
+        reponse = self.client.post(f'/admin/production/ordreproduction/{self.ordre.pk}/change/', donnees)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertContains(reponse, 'Stock insuffisant en Sable')
+        self.assertFalse(LotProduction.objects.exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class LotArchiveTests(DonneesProduction):
+    def setUp(self):
+        super().setUp()
+        self.lot = LotProduction.objects.create(ordre_production=self.ordre, quantite_produite=2)
+        archiver_mouvements(timezone.now() + timedelta(minutes=1))
+
+    def test_modification_refusee(self):
+        self.lot.quantite_produite = 1
+        with self.assertRaises(LotArchive), transaction.atomic():
+            self.lot.save()
+        self.assertEqual(LotProduction.objects.get().quantite_produite, 2)
+
+    def test_suppression_refusee(self):
+        with self.assertRaises(LotArchive), transaction.atomic():
+            self.lot.delete()
+        self.assertTrue(LotProduction.objects.exists())
+
+    def test_autres_champs_modifiables(self):
+        self.lot.date_heure_production = timezone.now() - timedelta(days=1)
+        self.lot.save()
+        self.ciment.solde.refresh_from_db()
+        self.assertEqual(self.ciment.solde.quantite, Decimal('-700'))
+
+    def test_archivage_du_lot_reste_possible(self):
+        Facture.objects.create(commande=self.ordre.commande, montant_total=100, statut='envoyee')
+        self.assertEqual(archiver_lots(timezone.now() + timedelta(minutes=1)), 1)
+        self.assertEqual(LotProductionArchive.objects.get().pk, self.lot.pk)
+        self.ciment.solde.refresh_from_db()
+        self.assertEqual(self.ciment.solde.quantite, Decimal('-700'))
+
+    def test_admin_refuse_la_modification(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        reponse = self.client.post(f'/admin/production/lotproduction/{self.lot.pk}/change/', {
+            'ordre_production': self.ordre.pk, 'quantite_produite': '1',
+        })
+        self.assertContains(reponse, 'période archivée')
+        reponse = self.client.get(f'/admin/production/lotproduction/{self.lot.pk}/delete/')
+        self.assertContains(reponse, 'sorties de stock archivées')
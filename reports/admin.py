@@ -5,8 +5,21 @@ from .models import Rapport
 
 @admin.register(Rapport)
 class RapportAdmin(admin.ModelAdmin):
-    list_display = ('nom', 'date_creation', 'view_dashboard_link')
+    list_display = ('nom', 'type_rapport', 'frequence', 'date_debut', 'date_fin', 'date_calcul', 'view_instantane_link', 'view_dashboard_link')
+    list_filter = ('type_rapport', 'frequence')
     search_fields = ('nom',)
+    date_hierarchy = 'date_debut'
+    # Les instantanés sont écrits par la commande prendre_instantanes
+    readonly_fields = ('type_rapport', 'frequence', 'date_debut', 'date_fin', 'date_calcul')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('donnees')
+
+    def view_instantane_link(self, obj):
+        if not obj.frequence:
+            return '-'
+        return format_html('<a href="{url}">Ouvrir</a>', url=obj.url_instantane())
+    view_instantane_link.short_description = "Instantané"
     
     def get_urls(self):
         from django.urls import path
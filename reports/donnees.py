@@ -0,0 +1,363 @@
+"""Requêtes des rapports, découpées en requêtes indépendantes.
+
+Chaque fonction ``requetes_*`` renvoie un dictionnaire ``nom -> callable`` dont
+les appels sont indépendants les uns des autres : les vues synchrones les
+exécutent en séquence (``executer``), les vues asynchrones en parallèle
+(``executer_en_parallele``). Les fonctions ``contexte_*`` transforment ensuite
+les résultats en contexte de template.
+
+``construire`` et ``construire_en_parallele`` enchaînent les deux étapes pour
+un type de rapport donné : vues HTML, export PDF et instantanés partagent ainsi
+le même calcul.
+
+Les tableaux et graphiques, plus coûteux, sont des séries JSON
+(``reports.series``) que la page demande en parallèle. Sous ASGI, ``isoler``
+fait tourner chacune de ces requêtes dans son propre thread, sur sa propre
+connexion.
+"""
+import asyncio
+from functools import partial
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.db.models import Sum, Count, F, Q
+from django.utils import timezone
+from datetime import datetime, timedelta
+
+from production.models import OrdreProduction
+from production.archives import sources_lots
+from orders.models import Commande
+from stock.archives import sources_mouvements
+from inventory.models import MatierePremiere
+from billing.models import Facture, Paiement
+
+# Seuils d'alerte (peuvent être configurés)
+SEUIL_CRITIQUE = Decimal('10.0')
+SEUIL_BAS = Decimal('50.0')
+
+
+def periode(request):
+    """Période demandée (30 derniers jours par défaut)"""
+    date_debut = request.GET.get('date_debut')
+    date_fin = request.GET.get('date_fin')
+
+    if not date_debut:
+        date_debut = (timezone.now() - timedelta(days=30)).date()
+    else:
+        date_debut = datetime.strptime(date_debut, '%Y-%m-%d').date()
+
+    if not date_fin:
+        date_fin = timezone.now().date()
+    else:
+        date_fin = datetime.strptime(date_fin, '%Y-%m-%d').date()
+
+    return date_debut, date_fin
+
+
+def additionner(aggregats):
+    """Somme, clé par clé, des agrégats calculés sur la table courante et son archive"""
+    total = {}
+    for aggregat in aggregats:
+        for cle, valeur in aggregat.items():
+            total[cle] = (total.get(cle) or 0) + (valeur or 0)
+    return total
+
+
+def executer(requetes):
+    """Exécute les requêtes les unes après les autres"""
+    return {nom: requete() for nom, requete in requetes.items()}
+
+
+def isoler(requete):
+    """Version asynchrone de ``requete`` exécutée dans un thread du pool, sur sa propre connexion.
+
+    Les méthodes ``a*`` de l'ORM et les vues synchrones passent toutes par le
+    même thread (``thread_sensitive=True``) : des requêtes lancées ensemble
+    (agrégats d'une page, séries qu'elle demande) s'y exécuteraient l'une
+    après l'autre.
+    """
+    def executer_requete():
+        close_old_connections()
+        try:
+            return requete()
+        finally:
+            close_old_connections()
+    return sync_to_async(executer_requete, thread_sensitive=False)
+
+
+async def executer_en_parallele(requetes):
+    """Exécute les requêtes simultanément, chacune sur sa propre connexion.
+
+    La durée totale tend vers celle de la requête la plus lente.
+    """
+    noms = list(requetes)
+    resultats = await asyncio.gather(*(isoler(requetes[nom])() for nom in noms))
+    return dict(zip(noms, resultats))
+
+
+# ==================== PRODUCTION ====================
+
+def requetes_production(date_debut, date_fin):
+    ordres = OrdreProduction.objects.filter(
+        date_production__range=[date_debut, date_fin]
+    )
+
+    return {
+        'stats': lambda: ordres.aggregate(
+            total_ordres=Count('id'),
+            ordres_termines=Count('id', filter=Q(statut='termine')),
+            ordres_en_cours=Count('id', filter=Q(statut='en_cours')),
+            quantite_totale_planifiee=Sum('quantite_produire'),
+        ),
+        'quantite_totale_produite': lambda: additionner(
+            lots.filter(ordre_production__in=ordres).aggregate(total=Sum('quantite_produite'))
+            for lots in sources_lots(date_debut)
+        )['total'],
+    }
+
+
+def contexte_production(date_debut, date_fin, resultats):
+    stats_production = resultats['stats']
+    stats_production['quantite_totale_planifiee'] = stats_production['quantite_totale_planifiee'] or 0
+    stats_production['quantite_totale_produite'] = resultats['quantite_totale_produite']
+
+    # Efficacité de production
+    if stats_production['quantite_totale_planifiee'] > 0:
+        stats_production['efficacite'] = (
+            stats_production['quantite_totale_produite'] /
+            stats_production['quantite_totale_planifiee'] * 100
+        )
+    else:
+        stats_production['efficacite'] = 0
+
+    return {
+        'title': 'Rapport de Production',
+        'date_debut': date_debut,
+        'date_fin': date_fin,
+        'stats_production': stats_production,
+    }
+
+
+# ==================== COMMANDES ====================
+
+def requetes_commandes(date_debut, date_fin, statut_filtre=None):
+    commandes = Commande.objects.filter(
+        date_commande__range=[date_debut, date_fin]
+    )
+
+    if statut_filtre:
+        commandes = commandes.filter(statut=statut_filtre)
+
+    return {
+        'stats': lambda: commandes.aggregate(
+            total_commandes=Count('id'),
+            en_attente=Count('id', filter=Q(statut='en_attente')),
+            validees=Count('id', filter=Q(statut='validee')),
+            en_production=Count('id', filter=Q(statut='en_production')),
+            livrees=Count('id', filter=Q(statut='livree')),
+            annulees=Count('id', filter=Q(statut='annulee')),
+        ),
+    }
+
+
+def contexte_commandes(date_debut, date_fin, statut_filtre, resultats):
+    return {
+        'title': 'Rapport des Commandes',
+        'date_debut': date_debut,
+        'date_fin': date_fin,
+        'statut_filtre': statut_filtre,
+        'stats_commandes': resultats['stats'],
+        'statuts_choices': Commande._meta.get_field('statut').choices,
+    }
+
+
+# ==================== COMMERCIAL ====================
+
+def requetes_commercial(date_debut, date_fin):
+    factures = Facture.objects.filter(
+        date_facturation__range=[date_debut, date_fin]
+    )
+
+    return {
+        'ca_stats': lambda: factures.aggregate(
+            ca_total=Sum('montant_total'),
+            # Montants réellement réglés, paiements partiels compris
+            ca_paye=Sum('montant_paye', filter=~Q(statut='annulee')),
+            ca_en_attente=Sum(F('montant_total') - F('montant_paye'), filter=~Q(statut__in=['payee', 'annulee'])),
+            nombre_factures=Count('id'),
+            factures_payees=Count('id', filter=Q(statut='payee')),
+        ),
+    }
+
+
+def contexte_commercial(date_debut, date_fin, resultats):
+    ca_stats = resultats['ca_stats']
+    for cle in ('ca_total', 'ca_paye', 'ca_en_attente'):
+        ca_stats[cle] = ca_stats[cle] or 0
+
+    return {
+        'title': 'Rapport Commercial',
+        'date_debut': date_debut,
+        'date_fin': date_fin,
+        'ca_stats': ca_stats,
+    }
+
+
+# ==================== STOCK ====================
+
+def requetes_stock():
+    # Mouvements récents (30 derniers jours)
+    date_limite = timezone.now() - timedelta(days=30)
+
+    return {
+        'matieres_premieres': lambda: list(MatierePremiere.objects.select_related('solde')),
+        'stats_mouvements': lambda: additionner(
+            mouvements.filter(date_mouvement__gte=date_limite).aggregate(
+                total_entrees=Sum('quantite', filter=Q(type_mouvement='entree')),
+                total_sorties=Sum('quantite', filter=Q(type_mouvement='sortie')),
+                nombre_mouvements=Count('id'),
+            )
+            for mouvements in sources_mouvements(date_limite)
+        ),
+    }
+
+
+def contexte_stock(resultats):
+    stocks_actuels = []
+    for matiere in resultats['matieres_premieres']:
+        stock_actuel = matiere.stock_actuel
+        niveau_alerte = 'normal'
+
+        if stock_actuel <= SEUIL_CRITIQUE:
+            niveau_alerte = 'critique'
+        elif stock_actuel <= SEUIL_BAS:
+            niveau_alerte = 'bas'
+
+        stocks_actuels.append({
+            'matiere': matiere,
+            'stock_actuel': stock_actuel,
+            'niveau_alerte': niveau_alerte
+        })
+
+    stats_mouvements = resultats['stats_mouvements']
+    stats_mouvements['total_entrees'] = stats_mouvements['total_entrees'] or 0
+    stats_mouvements['total_sorties'] = stats_mouvements['total_sorties'] or 0
+
+    # Alertes de stock
+    alertes = [stock for stock in stocks_actuels if stock['niveau_alerte'] in ['critique', 'bas']]
+
+    return {
+        'title': 'Rapport de Stock',
+        'stocks_actuels': stocks_actuels,
+        'stats_mouvements': stats_mouvements,
+        'alertes': alertes,
+        'seuil_critique': SEUIL_CRITIQUE,
+        'seuil_bas': SEUIL_BAS,
+    }
+
+
+# ==================== FINANCIER ====================
+
+def requetes_financier(date_debut, date_fin):
+    factures = Facture.objects.filter(
+        date_facturation__range=[date_debut, date_fin]
+    )
+
+    # Factures en retard de paiement (envoyées depuis plus de 30 jours)
+    date_limite_paiement = timezone.now().date() - timedelta(days=30)
+
+    return {
+        'stats': lambda: factures.aggregate(
+            ca_total=Sum('montant_total'),
+            ca_paye=Sum('montant_paye', filter=~Q(statut='annulee')),
+            ca_en_attente=Sum(F('montant_total') - F('montant_paye'), filter=Q(statut='envoyee')),
+            ca_brouillon=Sum('montant_total', filter=Q(statut='brouillon')),
+            nombre_factures=Count('id'),
+            factures_payees=Count('id', filter=Q(statut='payee')),
+            factures_en_attente=Count('id', filter=Q(statut='envoyee')),
+            factures_en_retard=Count('id', filter=Q(
+                statut='envoyee', date_facturation__lt=date_limite_paiement
+            )),
+        ),
+        # Trésorerie : toutes les créances ouvertes, encaissements des 30 derniers jours
+        'creances': lambda: Facture.objects.filter(statut='envoyee').aggregate(
+            creances_totales=Sum(F('montant_total') - F('montant_paye')),
+        ),
+        'encaissements': lambda: Paiement.objects.filter(
+            date_paiement__gt=timezone.localdate() - timedelta(days=30)
+        ).aggregate(encaissements_30j=Sum('montant')),
+    }
+
+
+def contexte_financier(date_debut, date_fin, resultats):
+    stats_financieres = resultats['stats']
+    for cle in ('ca_total', 'ca_paye', 'ca_en_attente', 'ca_brouillon'):
+        stats_financieres[cle] = stats_financieres[cle] or 0
+    stats_financieres['ca_facture'] = stats_financieres['ca_total']
+
+    # Taux de recouvrement
+    if stats_financieres['ca_facture'] > 0:
+        stats_financieres['taux_recouvrement'] = (
+            stats_financieres['ca_paye'] / stats_financieres['ca_facture'] * 100
+        )
+        stats_financieres['pourcentage_en_attente'] = (
+            stats_financieres['ca_en_attente'] / stats_financieres['ca_facture'] * 100
+        )
+    else:
+        stats_financieres['taux_recouvrement'] = 0
+        stats_financieres['pourcentage_en_attente'] = 0
+
+    if stats_financieres['nombre_factures']:
+        stats_financieres['montant_moyen'] = stats_financieres['ca_total'] / stats_financieres['nombre_factures']
+    else:
+        stats_financieres['montant_moyen'] = 0
+
+    return {
+        'title': 'Rapport Financier',
+        'date_debut': date_debut,
+        'date_fin': date_fin,
+        'stats_financieres': stats_financieres,
+        'tresorerie': {
+            'encaissements_30j': resultats['encaissements']['encaissements_30j'] or 0,
+            'creances_totales': resultats['creances']['creances_totales'] or 0,
+        },
+    }
+
+
+# ==================== CONSTRUCTION ====================
+
+TYPES_RAPPORT = ('production', 'commandes', 'commercial', 'stock', 'financier')
+
+
+def preparer(type_rapport, date_debut=None, date_fin=None, statut=None):
+    """``(requetes, mise_en_forme)`` d'un rapport ; ``mise_en_forme(resultats)`` donne le contexte.
+
+    Lève ``KeyError`` pour un type de rapport inconnu. Le rapport de stock
+    ignore la période, celui des commandes est seul à filtrer par statut.
+    """
+    if type_rapport == 'stock':
+        return requetes_stock(), contexte_stock
+    if type_rapport == 'commandes':
+        return (
+            requetes_commandes(date_debut, date_fin, statut),
+            partial(contexte_commandes, date_debut, date_fin, statut),
+        )
+    requetes, contexte = {
+        'production': (requetes_production, contexte_production),
+        'commercial': (requetes_commercial, contexte_commercial),
+        'financier': (requetes_financier, contexte_financier),
+    }[type_rapport]
+    return requetes(date_debut, date_fin), partial(contexte, date_debut, date_fin)
+
+
+def construire(type_rapport, date_debut=None, date_fin=None, statut=None):
+    """Contexte d'un rapport, requêtes exécutées en séquence"""
+    requetes, mise_en_forme = preparer(type_rapport, date_debut, date_fin, statut)
+    return mise_en_forme(executer(requetes))
+
+
+async def construire_en_parallele(type_rapport, date_debut=None, date_fin=None, statut=None):
+    """Contexte d'un rapport, requêtes exécutées en parallèle"""
+    requetes, mise_en_forme = preparer(type_rapport, date_debut, date_fin, statut)
+    return mise_en_forme(await executer_en_parallele(requetes))
@@ -0,0 +1,154 @@
+"""Instantanés programmés des rapports.
+
+Chaque nuit, ``prendre_instantanes`` calcule les cinq rapports sur la dernière
+période close de chaque fréquence (veille, semaine, mois précédents) et les
+enregistre dans ``Rapport`` : contexte de la page et toutes ses séries, en
+JSON compressé. Une période déjà enregistrée n'est pas recalculée.
+
+Les pages de rapport et les séries JSON servent un instantané lorsqu'on leur
+passe ``?instantane=<id>`` : une lecture et une décompression au lieu des
+requêtes sur la période. Un instantané ne change plus une fois pris, son ETag
+ne dépend que de sa date de calcul.
+
+Le rapport de stock décrit l'état courant et non une période : il n'est
+enregistré que pour la dernière période close, jamais en rattrapage.
+"""
+import json
+import zlib
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Model
+from django.http import Http404
+
+from .donnees import TYPES_RAPPORT, construire
+from .models import Rapport
+from .series import SERIES, en_colonnes
+
+FREQUENCES = [cle for cle, _ in Rapport.FREQUENCES]
+LIBELLES_FREQUENCE = dict(Rapport.FREQUENCES)
+# Rapports qui décrivent l'état courant, quelle que soit la période
+RAPPORTS_SANS_PERIODE = {'stock'}
+
+
+# ==================== PÉRIODES ====================
+
+def periode_close(frequence, jour):
+    """``(debut, fin)`` de la dernière période de ``frequence`` terminée avant ``jour``"""
+    if frequence == 'quotidien':
+        veille = jour - timedelta(days=1)
+        return veille, veille
+    if frequence == 'hebdomadaire':
+        fin = jour - timedelta(days=jour.weekday() + 1)
+        return fin - timedelta(days=6), fin
+    if frequence == 'mensuel':
+        fin = jour.replace(day=1) - timedelta(days=1)
+        return fin.replace(day=1), fin
+    raise ValueError(f"Fréquence inconnue : {frequence}")
+
+
+def periodes_closes(frequence, jour, depuis=None):
+    """Périodes closes avant ``jour``, des plus anciennes (contenant ``depuis``) à la plus récente"""
+    periodes = [periode_close(frequence, jour)]
+    if depuis is not None:
+        while periodes[-1][0] > depuis:
+            periodes.append(periode_close(frequence, periodes[-1][0]))
+    return periodes[::-1]
+
+
+# ==================== ENREGISTREMENT ====================
+
+def _simplifier(valeur):
+    """Contexte de template réduit à des types JSON (les templates relisent des nombres)"""
+    if isinstance(valeur, dict):
+        return {cle: _simplifier(v) for cle, v in valeur.items()}
+    if isinstance(valeur, (list, tuple)):
+        return [_simplifier(v) for v in valeur]
+    if isinstance(valeur, Decimal):
+        return float(valeur)
+    if isinstance(valeur, Model):
+        return {champ.attname: _simplifier(getattr(valeur, champ.attname)) for champ in valeur._meta.concrete_fields}
+    return valeur
+
+
+def compresser(donnees):
+    texte = json.dumps(donnees, cls=DjangoJSONEncoder, separators=(',', ':'), ensure_ascii=False)
+    return zlib.compress(texte.encode(), 9)
+
+
+def decompresser(donnees):
+    return json.loads(zlib.decompress(donnees))
+
+
+def calculer(type_rapport, date_debut, date_fin):
+    """Contexte et séries d'un rapport, prêts à être enregistrés"""
+    return {
+        'contexte': _simplifier(construire(type_rapport, date_debut, date_fin)),
+        'series': {
+            nom: en_colonnes(*construire_serie(date_debut, date_fin, statut=None))
+            for nom, construire_serie in SERIES[type_rapport].items()
+        },
+    }
+
+
+def prendre_instantane(type_rapport, frequence, date_debut, date_fin):
+    donnees = compresser(calculer(type_rapport, date_debut, date_fin))
+    rapport, _ = Rapport.objects.update_or_create(
+        type_rapport=type_rapport,
+        frequence=frequence,
+        date_debut=date_debut,
+        defaults={
+            'nom': f"{dict(Rapport.TYPES)[type_rapport]} - {LIBELLES_FREQUENCE[frequence].lower()} "
+                   f"du {date_debut:%d/%m/%Y} au {date_fin:%d/%m/%Y}",
+            'date_fin': date_fin,
+            'donnees': donnees,
+        },
+    )
+    return rapport
+
+
+def prendre_instantanes(jour, frequences=FREQUENCES, types=TYPES_RAPPORT, depuis=None, recalculer=False):
+    """Enregistre les instantanés manquants ; renvoie les rapports créés ou recalculés"""
+    pris = []
+    for frequence in frequences:
+        periodes = periodes_closes(frequence, jour, depuis)
+        for type_rapport in types:
+            if type_rapport in RAPPORTS_SANS_PERIODE:
+                cibles = periodes[-1:]
+            else:
+                cibles = periodes
+            existants = set(Rapport.objects.filter(
+                type_rapport=type_rapport, frequence=frequence, date_debut__in=[debut for debut, _ in cibles],
+            ).values_list('date_debut', flat=True))
+            for date_debut, date_fin in cibles:
+                if recalculer or date_debut not in existants:
+                    pris.append(prendre_instantane(type_rapport, frequence, date_debut, date_fin))
+    return pris
+
+
+# ==================== LECTURE ====================
+
+def id_instantane(request):
+    """Identifiant de l'instantané demandé par ``?instantane=<id>``, ou None"""
+    valeur = request.GET.get('instantane')
+    if not valeur:
+        return None
+    try:
+        return int(valeur)
+    except ValueError:
+        raise Http404("Instantané inconnu.")
+
+
+def contexte_instantane(rapport):
+    contexte = decompresser(rapport.donnees)['contexte']
+    # Les dates de période sont relues du modèle (le JSON ne garde que leur texte)
+    if 'date_debut' in contexte:
+        contexte.update(date_debut=rapport.date_debut, date_fin=rapport.date_fin)
+    contexte['instantane'] = rapport
+    return contexte
+
+
+def serie_instantane(rapport, serie):
+    """Série enregistrée, déjà au format de ``en_colonnes`` ; ``KeyError`` si absente"""
+    return decompresser(rapport.donnees)['series'][serie]
@@ -0,0 +1,40 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from reports.donnees import TYPES_RAPPORT
+from reports.instantanes import FREQUENCES, prendre_instantanes
+
+
+def _date(valeur):
+    try:
+        return date.fromisoformat(valeur)
+    except ValueError:
+        raise CommandError(f"Date invalide : {valeur} (AAAA-MM-JJ)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Enregistre les instantanés des rapports sur la dernière période close de chaque fréquence "
+        "(veille, semaine, mois) ; à lancer chaque nuit depuis cron, les périodes déjà prises sont ignorées"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--frequence', action='append', choices=FREQUENCES, help="Toutes par défaut")
+        parser.add_argument('--type', action='append', choices=TYPES_RAPPORT, help="Tous les rapports par défaut")
+        parser.add_argument('--date', type=_date, help="Jour de référence (aujourd'hui par défaut)")
+        parser.add_argument('--depuis', type=_date, help="Rattrape toutes les périodes closes depuis cette date")
+        parser.add_argument('--recalculer', action='store_true', help="Recalcule les périodes déjà enregistrées")
+
+    def handle(self, *args, **options):
+        pris = prendre_instantanes(
+            options['date'] or timezone.localdate(),
+            frequences=options['frequence'] or FREQUENCES,
+            types=options['type'] or TYPES_RAPPORT,
+            depuis=options['depuis'],
+            recalculer=options['recalculer'],
+        )
+        for rapport in pris:
+            self.stdout.write(f"  {rapport.nom} ({len(rapport.donnees) / 1024:.1f} Ko)")
+        self.stdout.write(self.style.SUCCESS(f"{len(pris)} instantané(s) enregistré(s)"))
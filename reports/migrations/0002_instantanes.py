@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rapport',
+            name='date_calcul',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='rapport',
+            name='date_debut',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rapport',
+            name='date_fin',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='rapport',
+            name='donnees',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='rapport',
+            name='frequence',
+            field=models.CharField(blank=True, choices=[('quotidien', 'Quotidien'), ('hebdomadaire', 'Hebdomadaire'), ('mensuel', 'Mensuel')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='rapport',
+            name='type_rapport',
+            field=models.CharField(blank=True, choices=[('production', 'Production'), ('commandes', 'Commandes'), ('commercial', 'Commercial'), ('stock', 'Stock'), ('financier', 'Financier')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='rapport',
+            name='contenu',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='rapport',
+            unique_together={('type_rapport', 'frequence', 'date_debut')},
+        ),
+    ]
@@ -1,9 +1,50 @@
 from django.db import models
+from django.urls import reverse
+from django.utils.http import urlencode
 
 class Rapport(models.Model):
+    TYPES = [
+        ('production', 'Production'),
+        ('commandes', 'Commandes'),
+        ('commercial', 'Commercial'),
+        ('stock', 'Stock'),
+        ('financier', 'Financier'),
+    ]
+    FREQUENCES = [
+        ('quotidien', 'Quotidien'),
+        ('hebdomadaire', 'Hebdomadaire'),
+        ('mensuel', 'Mensuel'),
+    ]
+
     nom = models.CharField(max_length=255)
     date_creation = models.DateTimeField(auto_now_add=True)
-    contenu = models.TextField()
+    contenu = models.TextField(blank=True)
+    # Instantanés programmés (reports.instantanes) : rapport calculé sur une période close
+    type_rapport = models.CharField(max_length=20, choices=TYPES, blank=True)
+    frequence = models.CharField(max_length=20, choices=FREQUENCES, blank=True)
+    date_debut = models.DateField(null=True, blank=True)
+    date_fin = models.DateField(null=True, blank=True)
+    # Contexte et séries du rapport en JSON compressé (zlib)
+    donnees = models.BinaryField(default=b'', editable=False)
+    date_calcul = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Un instantané par rapport et par période ; l'index sert aussi à lister les plus récents
+        unique_together = ('type_rapport', 'frequence', 'date_debut')
 
     def __str__(self):
         return self.nom
+
+    @property
+    def est_instantane(self):
+        return bool(self.donnees)
+
+    def url_instantane(self):
+        if not self.est_instantane:
+            return None
+        parametres = {
+            'instantane': self.pk,
+            'date_debut': self.date_debut.isoformat(),
+            'date_fin': self.date_fin.isoformat(),
+        }
+        return f"{reverse(f'reports:{self.type_rapport}')}?{urlencode(parametres)}"
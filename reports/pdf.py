@@ -0,0 +1,194 @@
+"""Export PDF des rapports.
+
+Le PDF d'un rapport assemble deux parties :
+
+- la synthèse, gabarit ``reports/pdf/<type>_pdf.html`` rendu avec le même
+  contexte que la page HTML (``donnees.construire``) ;
+- les tableaux, mêmes séries que celles servies en JSON aux pages
+  (``series.SERIES``), mis en page par ``reports/pdf/tableaux_pdf.html``.
+
+xhtml2pdf construit l'arbre et la mise en page de tout le document qu'on lui
+donne : un an d'ordres de production en un seul HTML occupe plusieurs
+centaines de Mo. Les lignes des tableaux sont donc lues au fil de l'eau et
+rendues par blocs d'au plus ``LIGNES_PAR_BLOC`` lignes, chaque bloc converti à
+part puis ajouté au document final, écrit dans un fichier temporaire. La mémoire
+d'un export ne dépend plus que de la taille d'un bloc.
+"""
+import io
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import islice
+from tempfile import SpooledTemporaryFile
+
+from django.template.loader import get_template
+from django.utils import timezone
+from pypdf import PdfWriter
+from xhtml2pdf import pisa
+
+from .donnees import construire
+from .series import SERIES
+
+LIGNES_PAR_BLOC = 500
+# Au-delà, le PDF final passe de la mémoire à un fichier sur disque
+TAILLE_EN_MEMOIRE = 5 * 1024 * 1024
+
+# Tableaux de chaque rapport : (série, titre, message si vide)
+TABLEAUX = {
+    'production': [
+        ('ordres', 'Ordres de production', 'Aucun ordre de production trouvé pour cette période.'),
+        ('par_formule', 'Production par formule', 'Aucune donnée de production par formule.'),
+        ('quotidienne', 'Production quotidienne', 'Aucune donnée de production quotidienne.'),
+    ],
+    'commandes': [
+        ('commandes', 'Commandes', 'Aucune commande trouvée pour cette période.'),
+        ('top_clients', 'Top clients', 'Aucune donnée client disponible.'),
+        ('quotidiennes', 'Commandes quotidiennes', 'Aucune donnée quotidienne disponible.'),
+    ],
+    'commercial': [
+        ('ca_par_client', "Chiffre d'affaires par client", 'Aucune donnée client disponible.'),
+        ('fidelite', 'Fidélité des clients', 'Aucune donnée de fidélité disponible.'),
+        ('ca_mensuel', 'CA mensuel', 'Aucune donnée mensuelle disponible.'),
+        ('repartition_geo', 'Répartition géographique', 'Aucune donnée géographique disponible.'),
+        ('repartition_region', 'Répartition par région', 'Aucune donnée géographique disponible.'),
+    ],
+    'stock': [
+        ('mouvements_recents', 'Mouvements récents (20 derniers)', 'Aucun mouvement de stock récent.'),
+        ('par_matiere', 'Mouvements par matière première', 'Aucune donnée de mouvement par matière première.'),
+        ('evolution', 'Évolution quotidienne', "Aucune donnée d'évolution quotidienne."),
+        ('previsions', 'Prévisions de rupture', 'Aucune matière première.'),
+        ('ecarts_inventaire', "Écarts d'inventaire", 'Aucun inventaire validé.'),
+    ],
+    'financier': [
+        ('par_statut', 'Factures par statut', 'Aucune donnée de répartition par statut.'),
+        ('top_clients', 'Top clients', "Aucune donnée de chiffre d'affaires par client."),
+        ('ca_mensuel', 'Évolution mensuelle', "Aucune donnée d'évolution mensuelle."),
+        ('marges', 'Marges par formule', 'Aucune facture détaillée par formule sur la période.'),
+        ('en_retard', 'Factures en retard de paiement', 'Aucune facture en retard de paiement.'),
+        ('balance_agee', 'Balance âgée des créances', 'Aucune créance ouverte.'),
+    ],
+}
+
+
+class RenduImpossible(Exception):
+    pass
+
+
+# ==================== FORMATS ====================
+
+def _nombre(valeur, decimales):
+    texte = f"{valeur or 0:,.{decimales}f}"
+    return texte.replace(',', ' ').replace('.', ',')
+
+
+def _date(valeur, motif, defaut=''):
+    if isinstance(valeur, str):
+        valeur = datetime.fromisoformat(valeur)
+    if isinstance(valeur, datetime):
+        valeur = timezone.localtime(valeur) if timezone.is_aware(valeur) else valeur
+    return valeur.strftime(motif) if valeur else defaut
+
+
+MOIS = ['janvier', 'février', 'mars', 'avril', 'mai', 'juin', 'juillet', 'août', 'septembre',
+        'octobre', 'novembre', 'décembre']
+
+# Mêmes formats que reports/static/reports/js/series.js
+FORMATS = {
+    'texte': lambda v: '' if v is None else str(v),
+    'reference': lambda v: f"#{v}",
+    'entier': lambda v: _nombre(v, 0),
+    'nombre': lambda v: _nombre(v, 1),
+    'signe': lambda v: ('+' if (v or 0) > 0 else '') + _nombre(v, 1),
+    'm3': lambda v: _nombre(v, 1) + 'm³',
+    'euro': lambda v: _nombre(v, 2) + '€',
+    'pourcentage': lambda v: _nombre(v, 1) + '%',
+    'tendance': lambda v: '-' if v is None else ('+' if v > 0 else '') + _nombre(v, 1) + '%',
+    'date': lambda v: _date(v, '%d/%m/%Y', 'N/A'),
+    'dateheure': lambda v: _date(v, '%d/%m/%Y %H:%M'),
+    'mois': lambda v: f"{MOIS[v.month - 1]} {v.year}" if isinstance(v, (date, datetime)) else '',
+}
+A_DROITE = {'entier', 'nombre', 'signe', 'm3', 'euro', 'pourcentage', 'tendance'}
+
+
+def _lisible(texte):
+    # Les polices standard du PDF ne couvrent que le jeu Windows-1252 (pas d'émoji)
+    return texte.encode('cp1252', 'ignore').decode('cp1252').strip()
+
+
+def _cellule(colonne, valeur):
+    if colonne['format'] == 'badge':
+        texte = str((colonne.get('choix') or {}).get(valeur, valeur))
+    elif colonne['format'] == 'alerte':
+        texte = colonne['texte'] if valeur else ''
+    else:
+        if isinstance(valeur, Decimal) and colonne['format'] in A_DROITE:
+            valeur = float(valeur)
+        texte = FORMATS.get(colonne['format'], FORMATS['texte'])(valeur)
+    return _lisible(texte)
+
+
+# ==================== RENDU ====================
+
+def _pdf(gabarit, contexte):
+    html = get_template(gabarit).render(contexte)
+    sortie = io.BytesIO()
+    if pisa.CreatePDF(html, dest=sortie, encoding='utf-8').err:
+        raise RenduImpossible(gabarit)
+    sortie.seek(0)
+    return sortie
+
+
+def _sections(type_rapport, date_debut, date_fin, statut, taille):
+    """Tableaux du rapport découpés en blocs d'au plus ``taille`` lignes.
+
+    Un bloc regroupe plusieurs petits tableaux ; un grand tableau se poursuit
+    sur les blocs suivants (section marquée ``suite``).
+    """
+    bloc, restant = [], taille
+    for serie, titre, vide in TABLEAUX[type_rapport]:
+        colonnes, lignes = SERIES[type_rapport][serie](date_debut, date_fin, statut=statut)
+        colonnes = [{**colonne, 'a_droite': colonne['format'] in A_DROITE} for colonne in colonnes]
+        lignes = iter(lignes)
+        suite = False
+        while True:
+            partie = list(islice(lignes, restant))
+            if partie or not suite:
+                bloc.append({
+                    'titre': titre,
+                    'vide': vide,
+                    'suite': suite,
+                    'colonnes': colonnes,
+                    'lignes': [
+                        [(_cellule(colonne, valeur), colonne) for colonne, valeur in zip(colonnes, ligne)]
+                        for ligne in partie
+                    ],
+                })
+                restant -= max(len(partie), 1)
+            if restant > 0:
+                break
+            yield bloc
+            bloc, restant, suite = [], taille, True
+    if bloc:
+        yield bloc
+
+
+def rendre_rapport(type_rapport, date_debut, date_fin, statut=None, taille_bloc=LIGNES_PAR_BLOC):
+    """PDF d'un rapport, dans un fichier temporaire positionné au début"""
+    stock = type_rapport == 'stock'
+    contexte = construire(type_rapport, None if stock else date_debut, None if stock else date_fin, statut)
+    contexte['genere_le'] = timezone.now()
+
+    document = PdfWriter()
+    blocs = _sections(type_rapport, date_debut, date_fin, statut, taille_bloc)
+    # La synthèse ouvre le premier bloc ; les suivants ne contiennent que des tableaux
+    document.append(_pdf(f'reports/pdf/{type_rapport}_pdf.html', {**contexte, 'sections': next(blocs, [])}))
+    for sections in blocs:
+        document.append(_pdf('reports/pdf/suite_pdf.html', {
+            'title': contexte['title'], 'genere_le': contexte['genere_le'], 'sections': sections,
+        }))
+    document.add_metadata({'/Title': contexte['title']})
+
+    fichier = SpooledTemporaryFile(max_size=TAILLE_EN_MEMOIRE)
+    document.write(fichier)
+    document.close()
+    fichier.seek(0)
+    return fichier
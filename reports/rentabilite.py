@@ -0,0 +1,135 @@
+"""Rentabilité par commande : chiffre d'affaires facturé, coût matière consommé, volumes.
+
+Une page de commandes est calculée en un nombre fixe de requêtes groupées,
+quel que soit le nombre de commandes de la page : volumes commandés, factures,
+lots produits (table courante et archive) et coût des sorties de stock de ces
+lots (idem), retrouvées par l'index ``lot_production`` des mouvements.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Q, Sum
+
+from billing.models import Facture
+from logistics.models import Livraison
+from orders.models import Commande, LigneCommande
+from production.archives import sources_lots
+from stock.archives import sources_mouvements
+
+TAILLE_PAGE = 50
+
+
+@dataclass
+class RentabiliteCommande:
+    id: int
+    date_commande: object
+    statut: str
+    client: str
+    chantier: str
+    livree: bool
+    volume_commande: Decimal = Decimal('0')
+    volume_produit: Decimal = Decimal('0')
+    chiffre_affaires: Decimal = Decimal('0')
+    cout_matiere: Decimal = Decimal('0')
+    # Sorties sans coût unitaire (antérieures à la valorisation du stock)
+    sorties_non_valorisees: int = 0
+    facturee: bool = False
+
+    @property
+    def volume_livre(self):
+        return self.volume_commande if self.livree else Decimal('0')
+
+    @property
+    def marge(self):
+        return self.chiffre_affaires - self.cout_matiere
+
+    @property
+    def taux_marge(self):
+        return self.marge / self.chiffre_affaires * 100 if self.chiffre_affaires else None
+
+    @property
+    def marge_m3(self):
+        return self.marge / self.volume_livre if self.volume_livre else None
+
+    @property
+    def deficitaire(self):
+        return self.facturee and self.marge < 0
+
+
+def commandes_periode(date_debut, date_fin):
+    """Commandes non annulées passées sur la période, les plus récentes d'abord"""
+    livraisons = Livraison.objects.filter(commande=OuterRef('pk'), statut='livree')
+    return Commande.objects.filter(
+        date_commande__range=[date_debut, date_fin]
+    ).exclude(statut='annulee').annotate(
+        livree=Q(statut='livree') | Exists(livraisons)
+    ).order_by('-date_commande', '-id')
+
+
+def _couts_par_lot(lot_ids, depuis):
+    """Coût des sorties de stock par lot, sur la table courante et l'archive"""
+    couts = {}
+    if not lot_ids:
+        return couts
+    for mouvements in sources_mouvements(depuis):
+        lignes = mouvements.filter(
+            type_mouvement='sortie', lot_production_id__in=list(lot_ids),
+        ).values('lot_production_id').annotate(
+            cout=Sum(ExpressionWrapper(
+                F('quantite') * F('cout_unitaire'),
+                output_field=DecimalField(max_digits=20, decimal_places=6),
+            )),
+            non_valorisees=Count('id', filter=Q(cout_unitaire__isnull=True)),
+        ).values_list('lot_production_id', 'cout', 'non_valorisees')
+        for lot_id, cout, non_valorisees in lignes:
+            total, manquantes = couts.get(lot_id, (Decimal('0'), 0))
+            couts[lot_id] = (total + Decimal(cout or 0), manquantes + non_valorisees)
+    return couts
+
+
+def rentabilite_commandes(commandes, date_debut=None):
+    """Calcule la rentabilité d'une liste de commandes (une page)"""
+    lignes = {
+        commande['id']: RentabiliteCommande(
+            id=commande['id'],
+            date_commande=commande['date_commande'],
+            statut=commande['statut'],
+            client=commande['client__nom'],
+            chantier=commande['chantier__nom'],
+            livree=commande['livree'],
+        )
+        for commande in commandes.values(
+            'id', 'date_commande', 'statut', 'client__nom', 'chantier__nom', 'livree'
+        )
+    }
+    if not lignes:
+        return []
+
+    for commande_id, volume in LigneCommande.objects.filter(commande_id__in=lignes).values(
+        'commande_id'
+    ).annotate(volume=Sum('quantite')).values_list('commande_id', 'volume'):
+        lignes[commande_id].volume_commande = volume or Decimal('0')
+
+    for commande_id, montant in Facture.objects.filter(commande_id__in=lignes).exclude(
+        statut='annulee'
+    ).values_list('commande_id', 'montant_total'):
+        lignes[commande_id].chiffre_affaires = montant
+        lignes[commande_id].facturee = True
+
+    # Les lots (et leurs sorties) sont postérieurs à la commande
+    commande_par_lot = {}
+    for lots in sources_lots(date_debut):
+        for lot_id, commande_id, quantite in lots.filter(ordre_production__commande_id__in=lignes).values_list(
+            'id', 'ordre_production__commande_id', 'quantite_produite'
+        ):
+            commande_par_lot[lot_id] = commande_id
+            lignes[commande_id].volume_produit += quantite
+
+    for lot_id, (cout, non_valorisees) in _couts_par_lot(commande_par_lot, date_debut).items():
+        ligne = lignes[commande_par_lot[lot_id]]
+        ligne.cout_matiere += cout
+        ligne.sorties_non_valorisees += non_valorisees
+
+    for ligne in lignes.values():
+        ligne.cout_matiere = ligne.cout_matiere.quantize(Decimal('0.01'))
+    return list(lignes.values())
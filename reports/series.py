@@ -0,0 +1,643 @@
+"""Séries de données (tableaux et graphiques) servies en JSON aux rapports.
+
+Chaque série renvoie ``(colonnes, lignes)`` : ``colonnes`` décrit les colonnes
+(clé, libellé, format d'affichage) et ``lignes`` est un itérable de tuples.
+``en_colonnes`` transpose le résultat en tableaux par colonne, plus compacts
+en JSON et qui se compressent mieux.
+"""
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Sum, Count, Q, Max
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from production.archives import sources_lots
+from production.models import OrdreProduction
+from orders.models import Commande
+from customers.models import StatistiquesClient
+from stock.archives import sources_mouvements
+from stock.models import LigneInventaire
+from stock.previsions import HORIZON_JOURS, previsions
+from billing.balance_agee import TRANCHES, balance_agee
+from billing.models import Facture, LigneFacture
+
+STATUTS_ORDRE = dict(OrdreProduction._meta.get_field('statut').choices)
+STATUTS_COMMANDE = dict(Commande._meta.get_field('statut').choices)
+STATUTS_FACTURE = dict(Facture.STATUT_CHOICES)
+ECARTS_RENDEMENT = {
+    'conforme': 'Conforme',
+    'sur': 'Surproduction',
+    'sous': 'Sous-production',
+    'en_cours': 'En cours',
+}
+TYPES_MOUVEMENT = {'entree': '⬆️ Entrée', 'sortie': '⬇️ Sortie'}
+
+
+def colonne(cle, libelle, format='texte', **options):
+    return {'cle': cle, 'libelle': libelle, 'format': format, **options}
+
+
+def _valeur(valeur):
+    if isinstance(valeur, Decimal):
+        return float(valeur)
+    if isinstance(valeur, (date, datetime)):
+        return valeur.isoformat()
+    return valeur
+
+
+def en_colonnes(colonnes, lignes):
+    """Transpose les lignes en un tableau de valeurs par colonne"""
+    lignes = list(lignes)
+    valeurs = [[_valeur(v) for v in serie] for serie in zip(*lignes)] if lignes else [[] for _ in colonnes]
+    return {'colonnes': colonnes, 'valeurs': valeurs, 'total': len(lignes)}
+
+
+def _pourcentage(valeur, total):
+    return valeur / total * 100 if total else 0
+
+
+def _moyenne(valeur, nombre):
+    return valeur / nombre if nombre else 0
+
+
+# ==================== PRODUCTION ====================
+
+def _ordres(date_debut, date_fin):
+    return OrdreProduction.objects.filter(date_production__range=[date_debut, date_fin])
+
+
+def _produit_par(ordres, date_debut, champ):
+    """Quantité produite par valeur de ``champ`` (chemin depuis l'ordre), lots archivés compris"""
+    produit = {}
+    for lots in sources_lots(date_debut):
+        for cle, quantite in lots.filter(ordre_production__in=ordres).values(
+            f'ordre_production__{champ}'
+        ).annotate(quantite=Sum('quantite_produite')).values_list(f'ordre_production__{champ}', 'quantite'):
+            produit[cle] = produit.get(cle, 0) + quantite
+    return produit
+
+
+def _rendement(produit, planifie):
+    return _pourcentage(produit, planifie) if planifie else None
+
+
+def _ecart_rendement(produit, planifie, statut):
+    """Surproduction au-delà de la tolérance ; sous-production d'un ordre terminé en deçà"""
+    tolerance = Decimal(str(getattr(settings, 'PRODUCTION_TOLERANCE_RENDEMENT', 5))) / 100
+    if produit > planifie * (1 + tolerance):
+        return 'sur'
+    if statut != 'termine':
+        return 'en_cours'
+    if produit < planifie * (1 - tolerance):
+        return 'sous'
+    return 'conforme'
+
+
+def serie_ordres_production(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('date_production', 'Date', 'date'),
+        colonne('commande', 'Commande', 'reference'),
+        colonne('formule', 'Formule'),
+        colonne('quantite_produire', 'Quantité planifiée', 'm3'),
+        colonne('quantite_produite', 'Quantité produite', 'm3'),
+        colonne('rendement', 'Rendement', 'pourcentage'),
+        colonne('ecart', 'Écart', 'badge', classe='rendement-badge rendement-', choix=ECARTS_RENDEMENT),
+        colonne('statut', 'Statut', 'badge', classe='status-badge status-', choix=STATUTS_ORDRE),
+        colonne('client', 'Client'),
+    ]
+    ordres = _ordres(date_debut, date_fin)
+    produit = _produit_par(ordres, date_debut, 'id')
+    lignes = ordres.order_by('date_production', 'id').values_list(
+        'id', 'date_production', 'commande_id', 'formule__nom', 'quantite_produire', 'statut', 'commande__client__nom'
+    )
+    # Lignes produites au fil de l'eau : l'export PDF les consomme par blocs
+    return colonnes, (
+        (
+            jour, commande, formule, planifie, produit.get(pk, 0), _rendement(produit.get(pk, 0), planifie),
+            _ecart_rendement(produit.get(pk, 0), planifie, statut), statut, client,
+        )
+        for pk, jour, commande, formule, planifie, statut, client in lignes.iterator(chunk_size=2000)
+    )
+
+
+def serie_production_par_formule(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('formule', 'Formule'),
+        colonne('resistance', 'Résistance'),
+        colonne('quantite_planifiee', 'Quantité planifiée', 'm3'),
+        colonne('quantite_produite', 'Quantité produite', 'm3'),
+        colonne('rendement', 'Rendement', 'pourcentage'),
+        colonne('nombre_ordres', "Nombre d'ordres", 'entier'),
+        colonne('ordres_hors_tolerance', 'Ordres hors tolérance', 'entier'),
+        colonne('pourcentage', 'Pourcentage', 'pourcentage'),
+    ]
+    ordres = _ordres(date_debut, date_fin)
+    # Un seul passage par ordre donne à la fois les totaux et les écarts par formule
+    produit = _produit_par(ordres, date_debut, 'id')
+    formules = {}
+    for pk, nom, resistance, planifie, statut in ordres.values_list(
+        'id', 'formule__nom', 'formule__resistance_requise', 'quantite_produire', 'statut'
+    ):
+        ligne = formules.setdefault(nom, [resistance, 0, 0, 0, 0])
+        quantite = produit.get(pk, 0)
+        ligne[1] += planifie
+        ligne[2] += quantite
+        ligne[3] += 1
+        if _ecart_rendement(quantite, planifie, statut) in ('sur', 'sous'):
+            ligne[4] += 1
+    total = sum(ligne[1] for ligne in formules.values())
+    lignes = sorted(formules.items(), key=lambda item: item[1][1], reverse=True)
+    return colonnes, [
+        (nom, resistance, planifie, quantite, _rendement(quantite, planifie), nombre, hors_tolerance,
+         _pourcentage(planifie, total))
+        for nom, (resistance, planifie, quantite, nombre, hors_tolerance) in lignes
+    ]
+
+
+def serie_production_quotidienne(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('jour', 'Date', 'date'),
+        colonne('quantite', 'Quantité planifiée', 'm3'),
+        colonne('quantite_produite', 'Quantité produite', 'm3'),
+        colonne('rendement', 'Rendement', 'pourcentage'),
+        colonne('nombre_ordres', "Nombre d'ordres", 'entier'),
+    ]
+    ordres = _ordres(date_debut, date_fin)
+    # Les lots sont rattachés au jour planifié de leur ordre
+    produit = _produit_par(ordres, date_debut, 'date_production')
+    lignes = ordres.values('date_production').annotate(
+        quantite=Sum('quantite_produire'),
+        nombre_ordres=Count('id')
+    ).order_by('date_production').values_list('date_production', 'quantite', 'nombre_ordres')
+    return colonnes, [
+        (jour, quantite, produit.get(jour, 0), _rendement(produit.get(jour, 0), quantite), nombre)
+        for jour, quantite, nombre in lignes
+    ]
+
+
+# ==================== COMMANDES ====================
+
+def _commandes(date_debut, date_fin, statut=None):
+    commandes = Commande.objects.filter(date_commande__range=[date_debut, date_fin])
+    if statut:
+        commandes = commandes.filter(statut=statut)
+    return commandes
+
+
+def serie_commandes(date_debut, date_fin, statut=None, **filtres):
+    colonnes = [
+        colonne('commande', 'N° Commande', 'reference'),
+        colonne('client', 'Client'),
+        colonne('date_commande', 'Date commande', 'date'),
+        colonne('date_livraison_souhaitee', 'Date livraison souhaitée', 'date'),
+        colonne('delai', 'Délai (jours)', 'entier'),
+        colonne('statut', 'Statut', 'badge', classe='status-badge status-', choix=STATUTS_COMMANDE),
+        colonne('en_retard', 'Alerte', 'alerte', texte='⚠️ En retard', classe='retard-badge'),
+    ]
+    lignes = (
+        (pk, client, date_commande, date_livraison, (date_livraison - date_commande).days, statut_commande, en_retard)
+        for pk, client, date_commande, date_livraison, statut_commande, en_retard in _commandes(
+            date_debut, date_fin, statut
+        ).avec_retard().order_by('date_commande', 'id').values_list(
+            'id', 'client__nom', 'date_commande', 'date_livraison_souhaitee', 'statut', 'en_retard'
+        ).iterator(chunk_size=2000)
+    )
+    return colonnes, lignes
+
+
+def serie_top_clients_commandes(date_debut, date_fin, statut=None, **filtres):
+    colonnes = [
+        colonne('client', 'Client'),
+        colonne('nombre_commandes', 'Nombre de commandes', 'entier'),
+        colonne('pourcentage', 'Pourcentage', 'pourcentage'),
+    ]
+    commandes = _commandes(date_debut, date_fin, statut)
+    total = commandes.count()
+    lignes = commandes.values('client__nom').annotate(
+        nombre_commandes=Count('id')
+    ).order_by('-nombre_commandes').values_list('client__nom', 'nombre_commandes')[:10]
+    return colonnes, [(nom, nombre, _pourcentage(nombre, total)) for nom, nombre in lignes]
+
+
+def serie_commandes_quotidiennes(date_debut, date_fin, statut=None, **filtres):
+    colonnes = [
+        colonne('jour', 'Date', 'date'),
+        colonne('statut', 'Statut', 'badge', classe='status-badge status-', choix=STATUTS_COMMANDE),
+        colonne('nombre', 'Nombre', 'entier'),
+    ]
+    lignes = _commandes(date_debut, date_fin, statut).values('date_commande', 'statut').annotate(
+        nombre=Count('id')
+    ).order_by('date_commande', 'statut').values_list('date_commande', 'statut', 'nombre')
+    return colonnes, lignes
+
+
+# ==================== COMMERCIAL ====================
+
+def _factures(date_debut, date_fin):
+    return Facture.objects.filter(date_facturation__range=[date_debut, date_fin])
+
+
+def serie_ca_par_client(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('client', 'Client'),
+        colonne('ca_total', "Chiffre d'affaires", 'euro'),
+        colonne('nombre_factures', 'Nombre de factures', 'entier'),
+        colonne('ca_moyen', 'CA moyen par facture', 'euro'),
+        colonne('part', 'Part du CA total', 'pourcentage'),
+    ]
+    factures = _factures(date_debut, date_fin)
+    total = factures.aggregate(total=Sum('montant_total'))['total'] or 0
+    lignes = factures.values('commande__client__nom').annotate(
+        ca_total=Sum('montant_total'),
+        nombre_factures=Count('id')
+    ).order_by('-ca_total').values_list('commande__client__nom', 'ca_total', 'nombre_factures')[:10]
+    return colonnes, [
+        (nom, ca, nombre, _moyenne(ca, nombre), _pourcentage(ca, total))
+        for nom, ca, nombre in lignes
+    ]
+
+
+def _niveau_fidelite(nombre_commandes):
+    if nombre_commandes >= 10:
+        return 'excellent'
+    if nombre_commandes >= 5:
+        return 'bon'
+    if nombre_commandes >= 2:
+        return 'moyen'
+    return 'nouveau'
+
+
+NIVEAUX_FIDELITE = {'excellent': 'Excellent', 'bon': 'Bon', 'moyen': 'Moyen', 'nouveau': 'Nouveau'}
+
+
+RECENCES = dict(StatistiquesClient.RECENCES)
+
+
+def serie_fidelite_clients(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('client', 'Client'),
+        colonne('nombre_commandes', 'Nombre de commandes', 'entier'),
+        colonne('ca_total', 'CA total', 'euro'),
+        colonne('volume_moyen', 'Volume moyen par commande', 'm3'),
+        colonne('premiere_commande', 'Première commande', 'date'),
+        colonne('derniere_commande', 'Dernière commande', 'date'),
+        colonne('recence', 'Activité', 'badge', classe='fidelite-badge recence-', choix=RECENCES),
+        colonne('niveau', 'Niveau de fidélité', 'badge', classe='fidelite-badge fidelite-', choix=NIVEAUX_FIDELITE),
+    ]
+    # Statistiques cumulées tenues à jour par customers.services, lues dans l'ordre de l'index
+    statistiques = StatistiquesClient.objects.filter(
+        nombre_commandes__gt=0
+    ).select_related('client').order_by('-chiffre_affaires')[:15]
+    return colonnes, [
+        (
+            stats.client.nom, stats.nombre_commandes, stats.chiffre_affaires, stats.volume_moyen,
+            stats.premiere_commande, stats.derniere_commande, stats.recence,
+            _niveau_fidelite(stats.nombre_commandes),
+        )
+        for stats in statistiques
+    ]
+
+
+def serie_ca_mensuel_commercial(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('mois', 'Mois', 'mois'),
+        colonne('ca', 'CA facturé', 'euro'),
+        colonne('nombre_factures', 'Nombre de factures', 'entier'),
+        colonne('ca_moyen', 'CA moyen par facture', 'euro'),
+    ]
+    lignes = _factures(date_debut, date_fin).annotate(
+        mois=TruncMonth('date_facturation')
+    ).values('mois').annotate(
+        ca=Sum('montant_total'),
+        nombre_factures=Count('id')
+    ).order_by('mois').values_list('mois', 'ca', 'nombre_factures')
+    return colonnes, [(mois, ca, nombre, _moyenne(ca, nombre)) for mois, ca, nombre in lignes]
+
+
+def _repartition(date_debut, date_fin, champ, libelle, limite=None):
+    colonnes = [
+        colonne('localisation', libelle),
+        colonne('ca', "Chiffre d'affaires", 'euro'),
+        colonne('nombre_commandes', 'Nombre de commandes', 'entier'),
+        colonne('ca_moyen', 'CA moyen par commande', 'euro'),
+        colonne('part', 'Part du CA total', 'pourcentage'),
+    ]
+    factures = _factures(date_debut, date_fin)
+    total = factures.aggregate(total=Sum('montant_total'))['total'] or 0
+    # Localité du chantier livré (à défaut celle du client), normalisée sur une colonne indexée
+    lignes = factures.values(champ).annotate(
+        ca=Sum('montant_total'),
+        nombre_commandes=Count('id')
+    ).order_by('-ca').values_list(champ, 'ca', 'nombre_commandes')[:limite]
+    return colonnes, [
+        (localisation or 'Non renseigné', ca, nombre, _moyenne(ca, nombre), _pourcentage(ca, total))
+        for localisation, ca, nombre in lignes
+    ]
+
+
+def serie_repartition_geo(date_debut, date_fin, **filtres):
+    return _repartition(date_debut, date_fin, 'commande__chantier__ville', 'Ville', limite=10)
+
+
+def serie_repartition_region(date_debut, date_fin, **filtres):
+    return _repartition(date_debut, date_fin, 'commande__chantier__region', 'Région')
+
+
+# ==================== STOCK ====================
+
+def _mouvements_recents():
+    # Mouvements récents (30 derniers jours), archive comprise si la période y remonte
+    depuis = timezone.now() - timedelta(days=30)
+    return [mouvements.filter(date_mouvement__gte=depuis) for mouvements in sources_mouvements(depuis)]
+
+
+def serie_mouvements_recents(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('date_mouvement', 'Date', 'dateheure'),
+        colonne('matiere', 'Matière première'),
+        colonne('type_mouvement', 'Type', 'badge', classe='mouvement-badge mouvement-', choix=TYPES_MOUVEMENT),
+        colonne('quantite', 'Quantité', 'signe'),
+        colonne('unite', 'Unité'),
+        colonne('description', 'Description'),
+    ]
+    lignes = sorted(
+        (
+            ligne
+            for mouvements in _mouvements_recents()
+            for ligne in mouvements.order_by('-date_mouvement').values_list(
+                'date_mouvement', 'matiere_premiere__nom', 'type_mouvement', 'quantite',
+                'matiere_premiere__unite_mesure', 'description'
+            )[:20]
+        ),
+        key=lambda ligne: ligne[0],
+        reverse=True,
+    )[:20]
+    return colonnes, [
+        (date_mouvement, matiere, type_mouvement, quantite if type_mouvement == 'entree' else -quantite, unite, description or 'N/A')
+        for date_mouvement, matiere, type_mouvement, quantite, unite, description in lignes
+    ]
+
+
+def _fusionner(lignes, largeur):
+    """Additionne les lignes ``(cle, valeur, ...)`` de même clé (table courante + archive)"""
+    totaux = {}
+    for cle, *valeurs in lignes:
+        cumul = totaux.setdefault(cle, [0] * largeur)
+        for index, valeur in enumerate(valeurs):
+            cumul[index] += valeur or 0
+    return totaux
+
+
+def serie_mouvements_par_matiere(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('matiere', 'Matière première'),
+        colonne('entrees', 'Entrées (30j)', 'nombre'),
+        colonne('sorties', 'Sorties (30j)', 'nombre'),
+        colonne('solde', 'Solde', 'signe'),
+        colonne('nombre_mouvements', 'Nombre de mouvements', 'entier'),
+    ]
+    totaux = _fusionner((
+        ligne
+        for mouvements in _mouvements_recents()
+        for ligne in mouvements.values('matiere_premiere__nom').annotate(
+            entrees=Sum('quantite', filter=Q(type_mouvement='entree')),
+            sorties=Sum('quantite', filter=Q(type_mouvement='sortie')),
+            nombre_mouvements=Count('id')
+        ).values_list('matiere_premiere__nom', 'entrees', 'sorties', 'nombre_mouvements')
+    ), 3)
+    lignes = sorted(totaux.items(), key=lambda item: item[1][2], reverse=True)
+    return colonnes, [
+        (matiere, entrees, sorties, entrees - sorties, nombre)
+        for matiere, (entrees, sorties, nombre) in lignes
+    ]
+
+
+def serie_evolution_stock(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('jour', 'Date', 'date'),
+        colonne('entrees', 'Entrées', 'nombre'),
+        colonne('sorties', 'Sorties', 'nombre'),
+    ]
+    totaux = _fusionner((
+        ligne
+        for mouvements in _mouvements_recents()
+        for ligne in mouvements.annotate(
+            jour=TruncDate('date_mouvement')
+        ).values('jour').annotate(
+            entrees=Sum('quantite', filter=Q(type_mouvement='entree')),
+            sorties=Sum('quantite', filter=Q(type_mouvement='sortie')),
+        ).values_list('jour', 'entrees', 'sorties')
+    ), 2)
+    return colonnes, [(jour, entrees, sorties) for jour, (entrees, sorties) in sorted(totaux.items())]
+
+
+def serie_previsions_stock(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('matiere', 'Matière première'),
+        colonne('stock', 'Stock actuel', 'nombre'),
+        colonne('consommation', 'Consommation moyenne / jour', 'nombre'),
+        colonne('tendance', 'Tendance / jour', 'signe'),
+        colonne('besoin_planifie', 'Besoin des ordres planifiés', 'nombre'),
+        colonne('jours', 'Jours avant rupture'),
+        colonne('date_rupture', 'Rupture prévue', 'date'),
+        colonne('a_commander', 'Alerte', 'alerte', texte='🛒 À commander', classe='alerte-badge'),
+    ]
+    return colonnes, [
+        (
+            f"{prevision.matiere} ({prevision.unite})", prevision.stock, prevision.consommation_moyenne,
+            prevision.tendance, prevision.besoin_planifie,
+            prevision.jours_avant_rupture if prevision.jours_avant_rupture is not None else f"> {HORIZON_JOURS}",
+            prevision.date_rupture, prevision.a_commander,
+        )
+        for prevision in sorted(
+            previsions(), key=lambda p: (p.jours_avant_rupture is None, p.jours_avant_rupture or 0, p.matiere)
+        )
+    ]
+
+
+def serie_ecarts_inventaire(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('date_comptage', 'Date du comptage', 'date'),
+        colonne('inventaire', 'Inventaire', 'reference'),
+        colonne('matiere', 'Matière première'),
+        colonne('theorique', 'Solde calculé', 'nombre'),
+        colonne('comptee', 'Quantité comptée', 'nombre'),
+        colonne('ecart', 'Écart', 'signe'),
+        colonne('ecart_pourcentage', 'Écart relatif', 'pourcentage'),
+    ]
+    # Historique des inventaires validés : dérive des soldes calculés dans le temps
+    lignes = LigneInventaire.objects.filter(
+        inventaire__statut='valide', ecart__isnull=False,
+    ).order_by('-inventaire__date_comptage', 'matiere_premiere__nom').values_list(
+        'inventaire__date_comptage', 'inventaire_id', 'matiere_premiere__nom',
+        'quantite_theorique', 'quantite_comptee', 'ecart',
+    )[:200]
+    return colonnes, [
+        (jour, inventaire, matiere, theorique, comptee, ecart, _pourcentage(ecart, theorique))
+        for jour, inventaire, matiere, theorique, comptee, ecart in lignes
+    ]
+
+
+# ==================== FINANCIER ====================
+
+def serie_factures_par_statut(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('statut', 'Statut', 'badge', classe='status-badge status-', choix=STATUTS_FACTURE),
+        colonne('nombre', 'Nombre de factures', 'entier'),
+        colonne('montant_total', 'Montant total', 'euro'),
+        colonne('pourcentage', 'Pourcentage', 'pourcentage'),
+    ]
+    lignes = list(_factures(date_debut, date_fin).values('statut').annotate(
+        nombre=Count('id'),
+        montant=Sum('montant_total')
+    ).order_by('statut').values_list('statut', 'nombre', 'montant'))
+    total = sum(ligne[2] for ligne in lignes)
+    return colonnes, [ligne + (_pourcentage(ligne[2], total),) for ligne in lignes]
+
+
+def serie_top_clients_ca(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('client', 'Client'),
+        colonne('nombre_factures', 'Nombre de factures', 'entier'),
+        colonne('ca_total', "Chiffre d'affaires", 'euro'),
+        colonne('ca_moyen', 'CA moyen par facture', 'euro'),
+        colonne('derniere_facture', 'Dernière facture', 'date'),
+    ]
+    lignes = _factures(date_debut, date_fin).values('commande__client__nom').annotate(
+        nombre_factures=Count('id'),
+        ca_total=Sum('montant_total'),
+        derniere_facture=Max('date_facturation'),
+    ).order_by('-ca_total').values_list(
+        'commande__client__nom', 'nombre_factures', 'ca_total', 'derniere_facture'
+    )[:10]
+    return colonnes, [
+        (nom, nombre, ca, _moyenne(ca, nombre), derniere)
+        for nom, nombre, ca, derniere in lignes
+    ]
+
+
+def serie_ca_mensuel_financier(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('mois', 'Mois', 'mois'),
+        colonne('nombre_factures', 'Nombre de factures', 'entier'),
+        colonne('ca_facture', 'CA facturé', 'euro'),
+        colonne('ca_paye', 'CA encaissé', 'euro'),
+        colonne('evolution', 'Évolution', 'tendance'),
+    ]
+    lignes = _factures(date_debut, date_fin).annotate(
+        mois=TruncMonth('date_facturation')
+    ).values('mois').annotate(
+        nombre_factures=Count('id'),
+        ca_facture=Sum('montant_total'),
+        ca_paye=Sum('montant_paye', filter=~Q(statut='annulee')),
+    ).order_by('mois').values_list('mois', 'nombre_factures', 'ca_facture', 'ca_paye')
+    resultat = []
+    precedent = None
+    for mois, nombre, ca_facture, ca_paye in lignes:
+        evolution = (ca_facture - precedent) / precedent * 100 if precedent else None
+        resultat.append((mois, nombre, ca_facture, ca_paye or 0, evolution))
+        precedent = ca_facture
+    return colonnes, resultat
+
+
+def serie_marges_par_formule(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('formule', 'Formule'),
+        colonne('volume', 'Volume facturé', 'm3'),
+        colonne('ca', "Chiffre d'affaires", 'euro'),
+        colonne('cout_m3', 'Coût matière / m³', 'euro'),
+        colonne('cout_total', 'Coût matière', 'euro'),
+        colonne('marge', 'Marge', 'euro'),
+        colonne('taux_marge', 'Taux de marge', 'pourcentage'),
+        colonne('matieres_sans_cout', 'Matières sans coût', 'entier'),
+    ]
+    # Coût au m³ courant (formulas.CoutFormule) ; les lignes libres et suppléments n'ont pas de formule
+    lignes = LigneFacture.objects.filter(
+        facture__date_facturation__range=[date_debut, date_fin],
+        formule__isnull=False,
+    ).exclude(facture__statut='annulee').values('formule__nom').annotate(
+        volume=Sum('quantite'),
+        ca=Sum('montant_ligne'),
+        cout_m3=Max('formule__cout__cout_m3'),
+        sans_cout=Max('formule__cout__matieres_sans_cout'),
+    ).order_by('-ca').values_list('formule__nom', 'volume', 'ca', 'cout_m3', 'sans_cout')
+    resultat = []
+    for formule, volume, ca, cout_m3, sans_cout in lignes:
+        cout_total = volume * (cout_m3 or 0)
+        resultat.append((
+            formule, volume, ca, cout_m3 or 0, cout_total, ca - cout_total,
+            _pourcentage(ca - cout_total, ca), sans_cout or 0,
+        ))
+    return colonnes, resultat
+
+
+def serie_factures_en_retard(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('facture', 'N° Facture', 'reference'),
+        colonne('client', 'Client'),
+        colonne('date_facturation', 'Date de facturation', 'date'),
+        colonne('montant_total', 'Montant', 'euro'),
+        colonne('jours_retard', 'Jours de retard', 'entier'),
+    ]
+    # Factures en retard de paiement (envoyées depuis plus de 30 jours)
+    aujourd_hui = timezone.now().date()
+    lignes = _factures(date_debut, date_fin).filter(
+        statut='envoyee',
+        date_facturation__lt=aujourd_hui - timedelta(days=30)
+    ).order_by('date_facturation').values_list('id', 'commande__client__nom', 'date_facturation', 'montant_total')
+    return colonnes, [
+        (pk, client, date_facturation, montant, (aujourd_hui - date_facturation).days - 30)
+        for pk, client, date_facturation, montant in lignes
+    ]
+
+
+def serie_balance_agee(date_debut, date_fin, **filtres):
+    colonnes = [
+        colonne('client', 'Client'),
+        colonne('nombre_factures', 'Factures ouvertes', 'entier'),
+        *(colonne(cle, libelle, 'euro') for cle, libelle, _ in TRANCHES),
+        colonne('total', 'Total dû', 'euro'),
+    ]
+    # Toutes les factures ouvertes, indépendamment de la période affichée
+    return colonnes, [
+        (ligne.client, ligne.nombre_factures, *ligne.tranches, ligne.total)
+        for ligne in balance_agee()
+    ]
+
+
+SERIES = {
+    'production': {
+        'ordres': serie_ordres_production,
+        'par_formule': serie_production_par_formule,
+        'quotidienne': serie_production_quotidienne,
+    },
+    'commandes': {
+        'commandes': serie_commandes,
+        'top_clients': serie_top_clients_commandes,
+        'quotidiennes': serie_commandes_quotidiennes,
+    },
+    'commercial': {
+        'ca_par_client': serie_ca_par_client,
+        'fidelite': serie_fidelite_clients,
+        'ca_mensuel': serie_ca_mensuel_commercial,
+        'repartition_geo': serie_repartition_geo,
+        'repartition_region': serie_repartition_region,
+    },
+    'stock': {
+        'mouvements_recents': serie_mouvements_recents,
+        'par_matiere': serie_mouvements_par_matiere,
+        'evolution': serie_evolution_stock,
+        'previsions': serie_previsions_stock,
+        'ecarts_inventaire': serie_ecarts_inventaire,
+    },
+    'financier': {
+        'par_statut': serie_factures_par_statut,
+        'top_clients': serie_top_clients_ca,
+        'ca_mensuel': serie_ca_mensuel_financier,
+        'marges': serie_marges_par_formule,
+        'en_retard': serie_factures_en_retard,
+        'balance_agee': serie_balance_agee,
+    },
+}
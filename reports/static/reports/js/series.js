@@ -0,0 +1,137 @@
+/*
+ * Chargement différé des tableaux et graphiques des rapports.
+ *
+ * Chaque élément `.serie[data-serie]` pointe vers une série JSON
+ * (`{colonnes: [...], valeurs: [[...], ...]}`, une liste de valeurs par
+ * colonne). Les séries visibles sont demandées en parallèle ; les autres
+ * au moment où elles entrent dans la page.
+ */
+(function () {
+    'use strict';
+
+    const nombre = (valeur, decimales) => (valeur || 0).toLocaleString('fr-FR', {
+        minimumFractionDigits: decimales,
+        maximumFractionDigits: decimales,
+    });
+
+    // Une date seule ('AAAA-MM-JJ') est lue comme un jour local : `new Date`
+    // la prendrait pour minuit UTC, soit la veille à l'ouest de Greenwich.
+    const date = (valeur) => {
+        const jour = /^(\d{4})-(\d{2})-(\d{2})$/.exec(valeur);
+        return jour ? new Date(+jour[1], jour[2] - 1, +jour[3]) : new Date(valeur);
+    };
+
+    const FORMATS = {
+        texte: (v) => v == null ? '' : String(v),
+        reference: (v) => '#' + v,
+        entier: (v) => nombre(v, 0),
+        nombre: (v) => nombre(v, 1),
+        signe: (v) => (v > 0 ? '+' : '') + nombre(v, 1),
+        m3: (v) => nombre(v, 1) + 'm³',
+        euro: (v) => nombre(v, 2) + '€',
+        pourcentage: (v) => nombre(v, 1) + '%',
+        tendance: (v) => v == null ? '-' : (v > 0 ? '📈 +' : '📉 ') + nombre(v, 1) + '%',
+        date: (v) => v ? date(v).toLocaleDateString('fr-FR') : 'N/A',
+        dateheure: (v) => v ? date(v).toLocaleString('fr-FR', {dateStyle: 'short', timeStyle: 'short'}) : '',
+        mois: (v) => v ? date(v).toLocaleDateString('fr-FR', {month: 'long', year: 'numeric'}) : '',
+    };
+
+    function cellule(colonne, valeur) {
+        const td = document.createElement('td');
+        if (colonne.format === 'badge') {
+            const badge = document.createElement('span');
+            badge.className = colonne.classe + valeur;
+            badge.textContent = (colonne.choix && colonne.choix[valeur]) || valeur;
+            td.appendChild(badge);
+        } else if (colonne.format === 'alerte') {
+            if (valeur) {
+                const badge = document.createElement('span');
+                badge.className = colonne.classe || '';
+                badge.textContent = colonne.texte;
+                td.appendChild(badge);
+            }
+        } else {
+            td.textContent = (FORMATS[colonne.format] || FORMATS.texte)(valeur);
+        }
+        return td;
+    }
+
+    function tableau(donnees) {
+        const table = document.createElement('table');
+        table.className = 'table';
+        const entete = table.createTHead().insertRow();
+        donnees.colonnes.forEach((colonne) => {
+            const th = document.createElement('th');
+            th.textContent = colonne.libelle;
+            entete.appendChild(th);
+        });
+        const corps = table.createTBody();
+        for (let i = 0; i < donnees.total; i++) {
+            const ligne = corps.insertRow();
+            donnees.colonnes.forEach((colonne, c) => ligne.appendChild(cellule(colonne, donnees.valeurs[c][i])));
+        }
+        return table;
+    }
+
+    function graphique(conteneur, donnees) {
+        if (typeof Chart === 'undefined') {
+            return;
+        }
+        const index = Object.fromEntries(donnees.colonnes.map((colonne, c) => [colonne.cle, c]));
+        const x = donnees.valeurs[index[conteneur.dataset.x]].map((v) => FORMATS[donnees.colonnes[index[conteneur.dataset.x]].format](v));
+        const canvas = document.createElement('canvas');
+        canvas.height = 90;
+        conteneur.appendChild(canvas);
+        new Chart(canvas, {
+            type: conteneur.dataset.graphique,
+            data: {
+                labels: x,
+                datasets: conteneur.dataset.y.split(',').map((cle) => ({
+                    label: donnees.colonnes[index[cle]].libelle,
+                    data: donnees.valeurs[index[cle]],
+                })),
+            },
+            options: {animation: false},
+        });
+    }
+
+    async function charger(conteneur) {
+        conteneur.textContent = 'Chargement…';
+        try {
+            const reponse = await fetch(conteneur.dataset.serie, {headers: {Accept: 'application/json'}});
+            if (!reponse.ok) {
+                throw new Error(reponse.status);
+            }
+            const donnees = await reponse.json();
+            conteneur.textContent = '';
+            if (!donnees.total) {
+                const vide = document.createElement('div');
+                vide.className = 'no-data';
+                vide.textContent = conteneur.dataset.vide || 'Aucune donnée.';
+                conteneur.appendChild(vide);
+                return;
+            }
+            if (conteneur.dataset.graphique) {
+                graphique(conteneur, donnees);
+            }
+            conteneur.appendChild(tableau(donnees));
+        } catch (erreur) {
+            conteneur.textContent = 'Impossible de charger les données (' + erreur.message + ').';
+        }
+    }
+
+    document.addEventListener('DOMContentLoaded', () => {
+        const series = document.querySelectorAll('.serie[data-serie]');
+        if (!('IntersectionObserver' in window)) {
+            series.forEach(charger);
+            return;
+        }
+        const observateur = new IntersectionObserver((entrees) => {
+            entrees.filter((entree) => entree.isIntersecting).forEach((entree) => {
+                observateur.unobserve(entree.target);
+                charger(entree.target);
+            });
+        }, {rootMargin: '200px'});
+        series.forEach((serie) => observateur.observe(serie));
+    });
+})();
@@ -1,3 +1,390 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from pypdf import PdfReader
+
+from billing.models import Facture
+from customers.models import Chantier, Client
+from formulas.models import CompositionFormule, FormuleBeton
+from inventory.models import MatierePremiere
+from logistics.models import Livraison
+from orders.models import Commande, LigneCommande
+from production.models import LotProduction, OrdreProduction
+from stock.services import enregistrer_mouvement
+from .donnees import TYPES_RAPPORT, construire, construire_en_parallele, executer, preparer
+from .instantanes import periode_close, periodes_closes, prendre_instantanes, serie_instantane
+from .models import Rapport
+from .pdf import _cellule, _sections, rendre_rapport
+from .rentabilite import commandes_periode, rentabilite_commandes
+from .series import SERIES, en_colonnes
+from .versions import version_rapport
+
+
+class DonneesRapports:
+    def setUp(self):
+        self.ciment = MatierePremiere.objects.create(nom='Ciment', unite_mesure='kg')
+        self.formule = FormuleBeton.objects.create(nom='B25', resistance_requise='C25/30')
+        CompositionFormule.objects.create(formule=self.formule, matiere_premiere=self.ciment, quantite=350)
+        self.client_beton = Client.objects.create(nom='Client', adresse='1 rue A, Rabat')
+        self.chantier = Chantier.objects.create(nom='Chantier', adresse='2 rue B, Rabat', client=self.client_beton)
+        self.commande = Commande.objects.create(
+            client=self.client_beton, chantier=self.chantier, date_livraison_souhaitee=date(2030, 1, 1),
+        )
+        self.jour = date.today()
+        self.ordre = OrdreProduction.objects.create(
+            commande=self.commande, formule=self.formule, quantite_produire=10, date_production=self.jour,
+            statut='termine',
+        )
+        LotProduction.objects.create(ordre_production=self.ordre, quantite_produite=8)
+
+
+class ConstructionRapportTests(DonneesRapports, TestCase):
+    def test_rapport_production(self):
+        contexte = construire('production', self.jour, self.jour)
+        stats = contexte['stats_production']
+        self.assertEqual(stats['total_ordres'], 1)
+        self.assertEqual(stats['ordres_termines'], 1)
+        self.assertEqual(stats['quantite_totale_produite'], Decimal('8'))
+        self.assertEqual(stats['efficacite'], Decimal('80'))
+
+    def test_rapport_commandes_filtre_par_statut(self):
+        self.assertEqual(construire('commandes', self.jour, self.jour)['stats_commandes']['en_attente'], 1)
+        contexte = construire('commandes', self.jour, self.jour, statut='livree')
+        self.assertEqual(contexte['stats_commandes']['total_commandes'], 0)
+
+    def test_requetes_independantes(self):
+        # Chaque requête s'exécute seule : l'ordre d'exécution ne change pas le contexte
+        for type_rapport in TYPES_RAPPORT:
+            requetes, mise_en_forme = preparer(type_rapport, self.jour, self.jour)
+            a_rebours = {nom: requetes[nom]() for nom in reversed(list(requetes))}
+            self.assertEqual(
+                mise_en_forme(a_rebours).keys(), mise_en_forme(executer(requetes)).keys(), type_rapport,
+            )
+
+    def test_repartition_par_ville_et_region(self):
+        autre = Chantier.objects.create(nom='Autre', adresse='3 rue C, 20250 Casablanca', client=self.client_beton)
+        commande = Commande.objects.create(
+            client=self.client_beton, chantier=autre, date_livraison_souhaitee=date(2030, 1, 1),
+        )
+        Facture.objects.create(commande=self.commande, montant_total=100)
+        Facture.objects.create(commande=commande, montant_total=300)
+        _, villes = SERIES['commercial']['repartition_geo'](self.jour, self.jour)
+        self.assertEqual([ligne[:3] for ligne in villes], [('CASABLANCA', 300, 1), ('RABAT', 100, 1)])
+        _, regions = SERIES['commercial']['repartition_region'](self.jour, self.jour)
+        self.assertEqual([ligne[0] for ligne in regions], ['Casablanca-Settat', 'Non renseigné'])
+
+    def test_type_inconnu(self):
+        with self.assertRaises(KeyError):
+            preparer('inconnu')
+
+
+class RendementProductionTests(DonneesRapports, TestCase):
+    def setUp(self):
+        super().setUp()
+        # Ordre de DonneesRapports : 8 produits sur 10, terminé (sous-production)
+        for planifie, produits, statut in [(5, [3, 3], 'en_cours'), (4, [2], 'en_cours'), (20, [Decimal('19.5')], 'termine')]:
+            ordre = OrdreProduction.objects.create(
+                commande=self.commande, formule=self.formule, quantite_produire=planifie,
+                date_production=self.jour, statut=statut,
+            )
+            for quantite in produits:
+                LotProduction.objects.create(ordre_production=ordre, quantite_produite=quantite)
+
+    def serie(self, nom):
+        return list(SERIES['production'][nom](self.jour, self.jour)[1])
+
+    def test_rendement_et_ecart_par_ordre(self):
+        lignes = self.serie('ordres')
+        self.assertEqual(
+            [(ligne[3], ligne[4], ligne[5], ligne[6]) for ligne in lignes],
+            [
+                (10, 8, 80, 'sous'), (5, 6, 120, 'sur'), (4, 2, 50, 'en_cours'),
+                (20, Decimal('19.5'), Decimal('97.5'), 'conforme'),
+            ],
+        )
+
+    @override_settings(PRODUCTION_TOLERANCE_RENDEMENT=1)
+    def test_tolerance_configurable(self):
+        self.assertEqual(self.serie('ordres')[3][6], 'sous')
+
+    def test_par_formule_et_par_jour(self):
+        [formule] = self.serie('par_formule')
+        # Planifié, produit, rendement, ordres, ordres hors tolérance
+        self.assertEqual(formule[2:7], (39, Decimal('35.5'), Decimal('35.5') / 39 * 100, 4, 2))
+        [jour] = self.serie('quotidienne')
+        self.assertEqual(jour, (self.jour, 39, Decimal('35.5'), Decimal('35.5') / 39 * 100, 4))
+
+
+class RentabiliteTests(DonneesRapports, TestCase):
+    def setUp(self):
+        super().setUp()
+        LigneCommande.objects.create(commande=self.commande, formule=self.formule, quantite=10)
+        # Le lot de DonneesRapports est sorti à coût nul ; celui-ci au coût moyen de 0,10 €/kg
+        enregistrer_mouvement(self.ciment, 10000, 'entree', cout_unitaire=Decimal('0.10'))
+        LotProduction.objects.create(ordre_production=self.ordre, quantite_produite=2)
+
+    def rentabilite(self):
+        return rentabilite_commandes(commandes_periode(self.jour, self.jour), self.jour)
+
+    def test_chiffre_affaires_cout_et_volumes(self):
+        Facture.objects.create(commande=self.commande, montant_total=1000, statut='envoyee')
+        Livraison.objects.create(
+            commande=self.commande, date_livraison=self.jour, adresse_livraison='2 rue B', statut='livree',
+        )
+        [ligne] = self.rentabilite()
+        self.assertEqual((ligne.volume_commande, ligne.volume_produit, ligne.volume_livre), (10, 10, 10))
+        self.assertEqual((ligne.chiffre_affaires, ligne.cout_matiere), (Decimal('1000'), Decimal('70.00')))
+        self.assertEqual(ligne.marge, Decimal('930'))
+        self.assertEqual(ligne.taux_marge, Decimal('93'))
+        self.assertEqual(ligne.marge_m3, Decimal('93'))
+        self.assertFalse(ligne.deficitaire)
+
+    def test_facture_annulee_et_commande_non_livree(self):
+        Facture.objects.create(commande=self.commande, montant_total=1000, statut='annulee')
+        [ligne] = self.rentabilite()
+        self.assertFalse(ligne.facturee)
+        self.assertEqual(ligne.volume_livre, 0)
+        self.assertIsNone(ligne.taux_marge)
+        self.assertIsNone(ligne.marge_m3)
+        # Non facturée : une marge négative ne la rend pas déficitaire
+        self.assertFalse(ligne.deficitaire)
+
+    def test_commande_deficitaire(self):
+        Facture.objects.create(commande=self.commande, montant_total=50, statut='envoyee')
+        self.assertTrue(self.rentabilite()[0].deficitaire)
+
+    def test_commandes_annulees_exclues(self):
+        Commande.objects.filter(pk=self.commande.pk).update(statut='annulee')
+        self.assertEqual(self.rentabilite(), [])
+
+    def test_requetes_independantes_du_nombre_de_commandes(self):
+        # Commandes, volumes, factures, puis lots et sorties (limite d'archivage comprise)
+        with self.assertNumQueries(7):
+            self.rentabilite()
+        for _ in range(3):
+            commande = Commande.objects.create(
+                client=self.client_beton, chantier=self.chantier, date_livraison_souhaitee=date(2030, 1, 1),
+            )
+            LigneCommande.objects.create(commande=commande, formule=self.formule, quantite=5)
+            Facture.objects.create(commande=commande, montant_total=500)
+        with self.assertNumQueries(7):
+            self.assertEqual(len(self.rentabilite()), 4)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_page(self):
+        reponse = self.client.get('/reports/rentabilite/', {'date_debut': self.jour, 'date_fin': self.jour})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(len(reponse.context['lignes']), 1)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class VuesRapportTests(DonneesRapports, TestCase):
+    def test_pages_de_rapport(self):
+        for type_rapport in TYPES_RAPPORT:
+            reponse = self.client.get(f'/reports/{type_rapport}/')
+            self.assertEqual(reponse.status_code, 200, type_rapport)
+
+
+# Les séries sont lues dans un autre thread, sur une autre connexion : données validées
+@override_settings(SECURE_SSL_REDIRECT=False)
+class SeriesRapportTests(DonneesRapports, TransactionTestCase):
+    def test_serie_json(self):
+        reponse = self.client.get(
+            f'/reports/series/production/ordres/?date_debut={self.jour}&date_fin={self.jour}'
+        )
+        self.assertEqual(reponse.status_code, 200)
+        donnees = reponse.json()
+        self.assertEqual(donnees['total'], 1)
+        self.assertIn('no-cache', reponse.headers['Cache-Control'])
+
+    def test_series_en_parallele(self):
+        # Une série par thread : les résultats restent ceux des requêtes séquentielles
+        async def demander(client, serie):
+            return await client.get(f'/reports/series/production/{serie}/?date_debut={self.jour}&date_fin={self.jour}')
+
+        async def demander_toutes():
+            client = AsyncClient()
+            return await asyncio.gather(*(demander(client, serie) for serie in SERIES['production']))
+
+        reponses = async_to_sync(demander_toutes)()
+        self.assertEqual([reponse.status_code for reponse in reponses], [200] * len(SERIES['production']))
+        self.assertEqual([reponse.json()['total'] for reponse in reponses], [1, 1, 1])
+
+    def test_serie_inconnue(self):
+        self.assertEqual(self.client.get('/reports/series/production/inconnue/').status_code, 404)
+
+    def test_pages_asynchrones(self):
+        # Mêmes agrégats que la page synchrone, calculés chacun dans son thread
+        for type_rapport in TYPES_RAPPORT:
+            with self.subTest(type_rapport=type_rapport):
+                reponse = self.client.get(f'/reports/async/{type_rapport}/?date_debut={self.jour}&date_fin={self.jour}')
+                self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(
+            async_to_sync(construire_en_parallele)('production', self.jour, self.jour),
+            construire('production', self.jour, self.jour),
+        )
+
+
+class VersionRapportTests(DonneesRapports, TestCase):
+    def test_suppression_puis_ajout_change_la_version(self):
+        etag, _ = version_rapport('production', self.jour, self.jour)
+        dates = (self.ordre.date_modification, self.ordre.lots.get().date_modification)
+        self.ordre.delete()
+        ordre = OrdreProduction.objects.create(
+            commande=self.commande, formule=self.formule, quantite_produire=10, date_production=self.jour,
+            statut='termine',
+        )
+        LotProduction.objects.create(ordre_production=ordre, quantite_produite=8)
+        # Même nombre de lignes et mêmes dernières modifications (ajout dans la même seconde)
+        OrdreProduction.objects.filter(pk=ordre.pk).update(date_modification=dates[0])
+        LotProduction.objects.filter(ordre_production=ordre).update(date_modification=dates[1])
+        self.assertNotEqual(version_rapport('production', self.jour, self.jour)[0], etag)
+
+    def test_version_stable_sans_modification(self):
+        self.assertEqual(
+            version_rapport('rentabilite', self.jour, self.jour), version_rapport('rentabilite', self.jour, self.jour),
+        )
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_reponse_304_si_version_connue(self):
+        reponse = self.client.get('/reports/production/')
+        self.assertEqual(reponse.status_code, 200)
+        reponse = self.client.get('/reports/production/', HTTP_IF_NONE_MATCH=reponse.headers['ETag'])
+        self.assertEqual(reponse.status_code, 304)
+
+
+class ExportPdfTests(DonneesRapports, TestCase):
+    def setUp(self):
+        super().setUp()
+        for _ in range(4):
+            OrdreProduction.objects.create(
+                commande=self.commande, formule=self.formule, quantite_produire=5, date_production=self.jour,
+            )
+
+    def test_format_des_cellules(self):
+        self.assertEqual(_cellule({'format': 'euro'}, Decimal('1234.5')), '1 234,50€')
+        self.assertEqual(_cellule({'format': 'tendance'}, None), '-')
+        self.assertEqual(_cellule({'format': 'date'}, None), 'N/A')
+        self.assertEqual(_cellule({'format': 'badge', 'choix': {'termine': 'Terminé'}}, 'termine'), 'Terminé')
+        self.assertEqual(_cellule({'format': 'alerte', 'texte': 'Rupture'}, False), '')
+        # Hors Windows-1252 (émoji) : retiré plutôt qu'affiché en carré
+        self.assertEqual(_cellule({'format': 'texte'}, '⚠️ Stock bas'), 'Stock bas')
+
+    def test_tableaux_decoupes_en_blocs(self):
+        blocs = [
+            [(section['titre'], section['suite'], len(section['lignes'])) for section in bloc]
+            for bloc in _sections('production', self.jour, self.jour, None, 2)
+        ]
+        self.assertEqual(blocs, [
+            [('Ordres de production', False, 2)],
+            [('Ordres de production', True, 2)],
+            [('Ordres de production', True, 1), ('Production par formule', False, 1)],
+            [('Production quotidienne', False, 1)],
+        ])
+
+    def test_tableau_vide_garde_son_message(self):
+        (bloc,) = _sections('commandes', date(2000, 1, 1), date(2000, 1, 1), None, 10)
+        self.assertEqual([section['lignes'] for section in bloc], [[], [], []])
+        self.assertEqual(bloc[0]['vide'], 'Aucune commande trouvée pour cette période.')
+
+    def test_document_assemble_bloc_par_bloc(self):
+        en_un_bloc = PdfReader(rendre_rapport('production', self.jour, self.jour))
+        en_blocs = PdfReader(rendre_rapport('production', self.jour, self.jour, taille_bloc=2))
+        self.assertEqual(en_blocs.metadata.title, 'Rapport de Production')
+        # Chaque bloc suivant commence une nouvelle page
+        self.assertEqual(len(en_blocs.pages), len(en_un_bloc.pages) + 3)
+        self.assertIn('(suite)', en_blocs.pages[-2].extract_text())
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_vue_export(self):
+        for type_rapport in TYPES_RAPPORT:
+            with self.subTest(type_rapport=type_rapport):
+                reponse = self.client.get(
+                    f'/reports/export/{type_rapport}/?date_debut={self.jour}&date_fin={self.jour}'
+                )
+                self.assertEqual(reponse.status_code, 200)
+                self.assertEqual(reponse.headers['Content-Type'], 'application/pdf')
+                self.assertTrue(b''.join(reponse.streaming_content).startswith(b'%PDF'))
+        self.assertEqual(self.client.get('/reports/export/inconnu/').status_code, 400)
+
+
+class InstantanesTests(DonneesRapports, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.lendemain = self.jour + timedelta(days=1)
+
+    def instantane(self, type_rapport='production'):
+        return Rapport.objects.get(type_rapport=type_rapport, frequence='quotidien', date_debut=self.jour)
+
+    def test_periodes_closes(self):
+        mercredi = date(2030, 3, 6)
+        self.assertEqual(periode_close('quotidien', mercredi), (date(2030, 3, 5), date(2030, 3, 5)))
+        self.assertEqual(periode_close('hebdomadaire', mercredi), (date(2030, 2, 25), date(2030, 3, 3)))
+        self.assertEqual(periode_close('mensuel', mercredi), (date(2030, 2, 1), date(2030, 2, 28)))
+        self.assertEqual(
+            [debut for debut, _ in periodes_closes('mensuel', mercredi, depuis=date(2029, 12, 15))],
+            [date(2029, 12, 1), date(2030, 1, 1), date(2030, 2, 1)],
+        )
+        with self.assertRaises(ValueError):
+            periode_close('annuel', mercredi)
+
+    def test_periodes_deja_prises_ignorees(self):
+        self.assertEqual(len(prendre_instantanes(self.lendemain, frequences=['quotidien'])), len(TYPES_RAPPORT))
+        self.assertEqual(prendre_instantanes(self.lendemain, frequences=['quotidien']), [])
+        date_calcul = self.instantane().date_calcul
+        pris = prendre_instantanes(self.lendemain, frequences=['quotidien'], types=['production'], recalculer=True)
+        self.assertEqual(pris, [self.instantane()])
+        self.assertGreater(self.instantane().date_calcul, date_calcul)
+
+    def test_rattrapage_sans_le_stock(self):
+        call_command(
+            'prendre_instantanes', frequence=['quotidien'], date=self.lendemain,
+            depuis=self.jour - timedelta(days=2), stdout=io.StringIO(),
+        )
+        par_type = {
+            type_rapport: Rapport.objects.filter(type_rapport=type_rapport).count() for type_rapport in TYPES_RAPPORT
+        }
+        self.assertEqual(par_type, {'production': 3, 'commandes': 3, 'commercial': 3, 'stock': 1, 'financier': 3})
+
+    def test_series_enregistrees_egales_aux_series_calculees(self):
+        prendre_instantanes(self.lendemain, frequences=['quotidien'], types=['production'])
+        for nom, construire_serie in SERIES['production'].items():
+            calculee = json.loads(json.dumps(
+                en_colonnes(*construire_serie(self.jour, self.jour, statut=None)), cls=DjangoJSONEncoder,
+            ))
+            self.assertEqual(serie_instantane(self.instantane(), nom), calculee, nom)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_page_servie_depuis_l_instantane(self):
+        prendre_instantanes(self.lendemain, frequences=['quotidien'], types=['production'])
+        rapport = self.instantane()
+        # Données modifiées après coup : l'instantané n'en tient pas compte
+        self.ordre.delete()
+        reponse = self.client.get(rapport.url_instantane())
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(reponse.context['instantane'], rapport)
+        self.assertEqual(reponse.context['stats_production']['total_ordres'], 1)
+        self.assertEqual(reponse.context['date_debut'], self.jour)
+        reponse = self.client.get(rapport.url_instantane(), HTTP_IF_NONE_MATCH=reponse.headers['ETag'])
+        self.assertEqual(reponse.status_code, 304)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_instantane_inconnu(self):
+        prendre_instantanes(self.lendemain, frequences=['quotidien'], types=['production'])
+        self.assertEqual(self.client.get(f'/reports/commandes/?instantane={self.instantane().pk}').status_code, 404)
+        self.assertEqual(self.client.get('/reports/production/?instantane=abc').status_code, 404)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_tableau_de_bord_filtre(self):
+        prendre_instantanes(self.lendemain, frequences=['quotidien', 'mensuel'], types=['production', 'commandes'])
+        Rapport.objects.create(nom='Ancien rapport', contenu='...')
+        reponse = self.client.get('/reports/?type_rapport=production&frequence=quotidien')
+        self.assertEqual(list(reponse.context['instantanes']), [self.instantane()])
+        self.assertEqual(len(self.client.get('/reports/').context['instantanes']), 4)
@@ -13,7 +13,18 @@ urlpatterns = [
     path('commercial/', views.rapport_commercial, name='commercial'),
     path('stock/', views.rapport_stock, name='stock'),
     path('financier/', views.rapport_financier, name='financier'),
-    
+    path('rentabilite/', views.rapport_rentabilite, name='rentabilite'),
+
+    # Versions asynchrones (serveur ASGI) : requêtes lancées en parallèle
+    path('async/production/', views.rapport_production_async, name='production_async'),
+    path('async/commandes/', views.rapport_commandes_async, name='commandes_async'),
+    path('async/commercial/', views.rapport_commercial_async, name='commercial_async'),
+    path('async/stock/', views.rapport_stock_async, name='stock_async'),
+    path('async/financier/', views.rapport_financier_async, name='financier_async'),
+
+    # Données des tableaux et graphiques, chargées à la demande par les pages
+    path('series/<str:type_rapport>/<str:serie>/', views.serie_rapport, name='serie'),
+
     # Export PDF
     path('export/<str:type_rapport>/', views.export_rapport_pdf, name='export_pdf'),
 ]
\ No newline at end of file
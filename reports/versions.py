@@ -0,0 +1,214 @@
+"""Version des données des rapports et réponses conditionnelles.
+
+La version d'un rapport est calculée à partir du nombre de lignes, de la plus
+grande clé et de la dernière date de modification des tables sources sur la
+période demandée :
+quelques agrégats très légers, bien moins coûteux que le rapport lui-même.
+Elle sert d'ETag et de Last-Modified ; un navigateur (ou un écran d'atelier qui
+se rafraîchit) qui possède déjà la version courante reçoit un 304 vide.
+
+Un instantané (``?instantane=<id>``, voir ``reports.instantanes``) a pour
+version sa date de calcul.
+
+Les mises à jour en masse (``QuerySet.update``) ne touchent pas les champs
+``auto_now`` : seuls les ajouts, les suppressions et les modifications faites
+par ``save()`` sont détectés.
+"""
+import asyncio
+import hashlib
+from datetime import datetime, time
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from billing.models import Facture, Paiement
+from customers.models import Client, StatistiquesClient
+from formulas.models import CoutFormule
+from inventory.models import MatierePremiere
+from logistics.models import Livraison
+from orders.models import Commande
+from production.models import OrdreProduction, LotProduction
+from stock.models import Inventaire, MouvementStock, SoldeStock
+
+from .donnees import isoler, periode
+from .instantanes import id_instantane
+from .models import Rapport
+
+
+def _etat(queryset, champ_date=None):
+    """Nombre de lignes, plus grande clé et dernière modification d'un ensemble de lignes"""
+    # La plus grande clé distingue une suppression suivie d'un ajout (même nombre de lignes)
+    aggregats = {'nombre': Count('pk'), 'cle_max': Max('pk')}
+    if champ_date:
+        aggregats['derniere'] = Max(champ_date)
+    etat = queryset.aggregate(**aggregats)
+    return (etat['nombre'], etat['cle_max']), etat.get('derniere')
+
+
+def _etats_production(date_debut, date_fin):
+    ordres = OrdreProduction.objects.filter(date_production__range=[date_debut, date_fin])
+    return [
+        _etat(ordres, 'date_modification'),
+        _etat(LotProduction.objects.filter(ordre_production__in=ordres), 'date_modification'),
+        _etat(Client.objects.all(), 'date_modification'),
+    ]
+
+
+def _etats_commandes(date_debut, date_fin):
+    return [
+        _etat(Commande.objects.filter(date_commande__range=[date_debut, date_fin]), 'date_modification'),
+        _etat(Client.objects.all(), 'date_modification'),
+    ]
+
+
+def _etats_factures(date_debut, date_fin):
+    return [
+        _etat(Facture.objects.filter(date_facturation__range=[date_debut, date_fin]), 'date_modification'),
+        _etat(Client.objects.all(), 'date_modification'),
+    ]
+
+
+def _etats_financier(date_debut, date_fin):
+    # Les marges reprennent le coût courant des formules ; balance âgée et trésorerie, toutes les
+    # factures ouvertes et tous les paiements
+    return _etats_factures(date_debut, date_fin) + [
+        _etat(CoutFormule.objects.all(), 'date_maj'),
+        _etat(Facture.objects.filter(statut='envoyee'), 'date_modification'),
+        _etat(Paiement.objects.all(), 'date_creation'),
+    ]
+
+
+def _etats_rentabilite(date_debut, date_fin):
+    commandes = Commande.objects.filter(date_commande__range=[date_debut, date_fin])
+    return [
+        _etat(commandes, 'date_modification'),
+        _etat(Facture.objects.filter(commande__in=commandes), 'date_modification'),
+        _etat(LotProduction.objects.filter(ordre_production__commande__in=commandes), 'date_modification'),
+        _etat(MouvementStock.objects.all(), 'date_mouvement'),
+        # Les livraisons n'ont pas de date de modification : seuls leur nombre et leur plus grande clé sont suivis
+        _etat(Livraison.objects.filter(commande__in=commandes, statut='livree')),
+    ]
+
+
+def _etats_commercial(date_debut, date_fin):
+    # La fidélité client est cumulée sur tout l'historique : pas de filtre de période
+    return _etats_factures(date_debut, date_fin) + [
+        _etat(StatistiquesClient.objects.all(), 'date_maj'),
+    ]
+
+
+def _etats_stock(date_debut, date_fin):
+    # Le rapport de stock ne dépend pas de la période demandée
+    return [
+        _etat(MouvementStock.objects.all(), 'date_mouvement'),
+        _etat(SoldeStock.objects.all(), 'date_maj'),
+        _etat(MatierePremiere.objects.all(), 'date_modification'),
+        _etat(Inventaire.objects.filter(statut='valide'), 'date_validation'),
+        # Les prévisions tiennent compte des ordres restant à produire
+        _etat(OrdreProduction.objects.all(), 'date_modification'),
+    ]
+
+
+ETATS = {
+    'production': _etats_production,
+    'commandes': _etats_commandes,
+    'commercial': _etats_commercial,
+    'stock': _etats_stock,
+    'financier': _etats_financier,
+    'rentabilite': _etats_rentabilite,
+}
+
+
+def version_rapport(type_rapport, date_debut, date_fin):
+    """Renvoie ``(etag, derniere_modification)`` des données d'un rapport"""
+    etats = ETATS[type_rapport](date_debut, date_fin)
+    # Les rapports dépendent aussi du jour courant (30 derniers jours, retards de paiement)
+    aujourd_hui = timezone.localdate()
+    debut_du_jour = timezone.make_aware(datetime.combine(aujourd_hui, time.min))
+    derniere_modification = max([debut_du_jour] + [derniere for _, derniere in etats if derniere])
+
+    empreinte = hashlib.md5(
+        repr((type_rapport, date_debut, date_fin, aujourd_hui, etats)).encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    return empreinte, derniere_modification
+
+
+def _version_instantane(request, pk):
+    # Un instantané ne change qu'en cas de recalcul explicite
+    date_calcul = Rapport.objects.filter(pk=pk).values_list('date_calcul', flat=True).first()
+    if date_calcul is None:
+        raise Http404("Instantané inconnu.")
+    return quote_etag(f"instantane-{pk}-{date_calcul.timestamp()}-{request.user.pk or 0}"), int(date_calcul.timestamp())
+
+
+def _version_requete(request, type_rapport):
+    pk = id_instantane(request)
+    if pk is not None:
+        return _version_instantane(request, pk)
+    date_debut, date_fin = periode(request)
+    etag, derniere_modification = version_rapport(type_rapport, date_debut, date_fin)
+    # Les pages affichent l'utilisateur connecté : une version par utilisateur
+    etag = quote_etag(f"{etag}-{request.user.pk or 0}")
+    return etag, int(derniere_modification.timestamp())
+
+
+def _completer(request, reponse, etag, derniere_modification):
+    if request.method in ('GET', 'HEAD') and reponse.status_code == 200:
+        if not reponse.has_header('ETag'):
+            reponse.headers['ETag'] = etag
+        if not reponse.has_header('Last-Modified'):
+            reponse.headers['Last-Modified'] = http_date(derniere_modification)
+    # Toujours revalider : le coût d'un 304 est celui des quelques agrégats de version
+    patch_cache_control(reponse, private=True, no_cache=True, max_age=0)
+    patch_vary_headers(reponse, ('Cookie',))
+    return reponse
+
+
+def reponse_conditionnelle(type_rapport=None):
+    """Décorateur : répond 304 si le client a déjà la version courante du rapport.
+
+    ``type_rapport`` est fixe pour une page de rapport ; pour les séries JSON il
+    est lu dans l'argument d'URL du même nom. Fonctionne pour les vues
+    synchrones et asynchrones.
+    """
+    def decorateur(vue):
+        def version(request, kwargs):
+            return _version_requete(request, type_rapport or kwargs['type_rapport'])
+
+        if asyncio.iscoroutinefunction(vue):
+            @wraps(vue)
+            async def vue_conditionnelle(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await vue(request, *args, **kwargs)
+                try:
+                    etag, derniere_modification = await isoler(lambda: version(request, kwargs))()
+                except KeyError:
+                    return await vue(request, *args, **kwargs)
+                reponse = get_conditional_response(
+                    request, etag=etag, last_modified=derniere_modification
+                )
+                if reponse is None:
+                    reponse = await vue(request, *args, **kwargs)
+                return _completer(request, reponse, etag, derniere_modification)
+        else:
+            @wraps(vue)
+            def vue_conditionnelle(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return vue(request, *args, **kwargs)
+                try:
+                    etag, derniere_modification = version(request, kwargs)
+                except KeyError:
+                    return vue(request, *args, **kwargs)
+                reponse = get_conditional_response(
+                    request, etag=etag, last_modified=derniere_modification
+                )
+                if reponse is None:
+                    reponse = vue(request, *args, **kwargs)
+                return _completer(request, reponse, etag, derniere_modification)
+        return vue_conditionnelle
+    return decorateur
@@ -1,481 +1,182 @@
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse, JsonResponse
-from django.template.loader import get_template
-from django.db.models import Sum, Count, Avg, Q, Max
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.utils import timezone
-from datetime import datetime, timedelta
-from decimal import Decimal
-import json
+from django.views.decorators.gzip import gzip_page
 
 # Import des modèles
 from .models import Rapport
-from production.models import OrdreProduction, LotProduction
-from orders.models import Commande, LigneCommande
-from customers.models import Client, Chantier
-from stock.models import MouvementStock
-from inventory.models import MatierePremiere
-from billing.models import Facture, LigneFacture
-from formulas.models import FormuleBeton, CompositionFormule
+from .donnees import TYPES_RAPPORT, construire, construire_en_parallele, isoler, periode
+from .instantanes import contexte_instantane, id_instantane, serie_instantane
+from .pdf import RenduImpossible, rendre_rapport
+from .rentabilite import TAILLE_PAGE, commandes_periode, rentabilite_commandes
+from .series import SERIES, en_colonnes
+from .versions import reponse_conditionnelle
 
 # Vue principale des rapports
 def dashboard_reports(request):
     """Vue principale du tableau de bord des rapports"""
+    # Instantanés programmés les plus récents, filtrables par rapport et par fréquence
+    instantanes = Rapport.objects.exclude(frequence='').defer('donnees', 'contenu')
+    filtres = {
+        cle: request.GET.get(cle) for cle in ('type_rapport', 'frequence') if request.GET.get(cle)
+    }
     context = {
         'title': 'Tableau de Bord - Rapports',
+        'instantanes': instantanes.filter(**filtres).order_by('-date_debut', 'frequence', 'type_rapport')[:30],
+        'filtres': filtres,
+        'types_rapport': Rapport.TYPES,
+        'frequences': Rapport.FREQUENCES,
     }
     return render(request, 'reports/dashboard.html', context)
 
+def _contexte(request, type_rapport):
+    """Contexte d'un instantané (``?instantane=<id>``) ou du rapport calculé sur la période demandée"""
+    pk = id_instantane(request)
+    if pk is not None:
+        return contexte_instantane(get_object_or_404(Rapport, pk=pk, type_rapport=type_rapport))
+    return construire(type_rapport, *periode(request), statut=request.GET.get('statut'))
+
+async def _contexte_async(request, type_rapport):
+    if id_instantane(request) is not None:
+        return await sync_to_async(_contexte)(request, type_rapport)
+    return await construire_en_parallele(type_rapport, *periode(request), statut=request.GET.get('statut'))
+
 # ==================== RAPPORTS DE PRODUCTION ====================
 
+@reponse_conditionnelle('production')
 def rapport_production(request):
     """Rapport de production avec quantités, formules et efficacité"""
-    # Filtres de date
-    date_debut = request.GET.get('date_debut')
-    date_fin = request.GET.get('date_fin')
-    
-    if not date_debut:
-        date_debut = (timezone.now() - timedelta(days=30)).date()
-    else:
-        date_debut = datetime.strptime(date_debut, '%Y-%m-%d').date()
-    
-    if not date_fin:
-        date_fin = timezone.now().date()
-    else:
-        date_fin = datetime.strptime(date_fin, '%Y-%m-%d').date()
-    
-    # Ordres de production dans la période
-    ordres = OrdreProduction.objects.filter(
-        date_production__range=[date_debut, date_fin]
-    ).select_related('commande', 'formule')
-    
-    # Statistiques de production
-    stats_production = {
-        'total_ordres': ordres.count(),
-        'ordres_termines': ordres.filter(statut='termine').count(),
-        'ordres_en_cours': ordres.filter(statut='en_cours').count(),
-        'quantite_totale_planifiee': ordres.aggregate(total=Sum('quantite_produire'))['total'] or 0,
-        'quantite_totale_produite': LotProduction.objects.filter(
-            ordre_production__in=ordres
-        ).aggregate(total=Sum('quantite_produite'))['total'] or 0,
-    }
-    
-    # Efficacité de production
-    if stats_production['quantite_totale_planifiee'] > 0:
-        stats_production['efficacite'] = (
-            stats_production['quantite_totale_produite'] / 
-            stats_production['quantite_totale_planifiee'] * 100
-        )
-    else:
-        stats_production['efficacite'] = 0
-    
-    # Production par formule
-    production_par_formule = ordres.values(
-        'formule__nom', 'formule__resistance_requise'
-    ).annotate(
-        quantite_planifiee=Sum('quantite_produire'),
-        nombre_ordres=Count('id')
-    ).order_by('-quantite_planifiee')
-    
-    # Production quotidienne
-    production_quotidienne = ordres.extra(
-        select={'jour': 'date(date_production)'}
-    ).values('jour').annotate(
-        quantite=Sum('quantite_produire'),
-        nombre_ordres=Count('id')
-    ).order_by('jour')
-    
-    context = {
-        'title': 'Rapport de Production',
-        'date_debut': date_debut,
-        'date_fin': date_fin,
-        'stats_production': stats_production,
-        'ordres': ordres,
-        'production_par_formule': production_par_formule,
-        'production_quotidienne': production_quotidienne,
-    }
-    
+    context = _contexte(request, 'production')
     return render(request, 'reports/production.html', context)
 
+@reponse_conditionnelle('production')
+async def rapport_production_async(request):
+    """Rapport de production, requêtes exécutées en parallèle"""
+    context = await _contexte_async(request, 'production')
+    return await sync_to_async(render)(request, 'reports/production.html', context)
+
 # ==================== RAPPORTS DE COMMANDES ====================
 
+@reponse_conditionnelle('commandes')
 def rapport_commandes(request):
     """Rapport des commandes avec statuts, délais et clients"""
-    # Filtres
-    date_debut = request.GET.get('date_debut')
-    date_fin = request.GET.get('date_fin')
-    statut_filtre = request.GET.get('statut')
-    
-    if not date_debut:
-        date_debut = (timezone.now() - timedelta(days=30)).date()
-    else:
-        date_debut = datetime.strptime(date_debut, '%Y-%m-%d').date()
-    
-    if not date_fin:
-        date_fin = timezone.now().date()
-    else:
-        date_fin = datetime.strptime(date_fin, '%Y-%m-%d').date()
-    
-    # Commandes dans la période
-    commandes = Commande.objects.filter(
-        date_commande__range=[date_debut, date_fin]
-    ).select_related('client', 'chantier')
-    
-    if statut_filtre:
-        commandes = commandes.filter(statut=statut_filtre)
-    
-    # Statistiques des commandes
-    stats_commandes = {
-        'total_commandes': commandes.count(),
-        'en_attente': commandes.filter(statut='en_attente').count(),
-        'validees': commandes.filter(statut='validee').count(),
-        'en_production': commandes.filter(statut='en_production').count(),
-        'livrees': commandes.filter(statut='livree').count(),
-        'annulees': commandes.filter(statut='annulee').count(),
-    }
-    
-    # Délais de livraison
-    commandes_avec_delais = []
-    for commande in commandes:
-        delai = (commande.date_livraison_souhaitee - commande.date_commande).days
-        commandes_avec_delais.append({
-            'commande': commande,
-            'delai_souhaite': delai,
-            'en_retard': commande.date_livraison_souhaitee < timezone.now().date() and commande.statut != 'livree'
-        })
-    
-    # Top clients
-    top_clients = commandes.values(
-        'client__nom'
-    ).annotate(
-        nombre_commandes=Count('id')
-    ).order_by('-nombre_commandes')[:10]
-    
-    # Commandes par statut et par jour
-    commandes_quotidiennes = commandes.extra(
-        select={'jour': 'date(date_commande)'}
-    ).values('jour', 'statut').annotate(
-        nombre=Count('id')
-    ).order_by('jour')
-    
-    context = {
-        'title': 'Rapport des Commandes',
-        'date_debut': date_debut,
-        'date_fin': date_fin,
-        'statut_filtre': statut_filtre,
-        'stats_commandes': stats_commandes,
-        'commandes_avec_delais': commandes_avec_delais,
-        'top_clients': top_clients,
-        'commandes_quotidiennes': commandes_quotidiennes,
-        'statuts_choices': Commande._meta.get_field('statut').choices,
-    }
-    
+    context = _contexte(request, 'commandes')
     return render(request, 'reports/commandes.html', context)
 
+@reponse_conditionnelle('commandes')
+async def rapport_commandes_async(request):
+    """Rapport des commandes, requêtes exécutées en parallèle"""
+    context = await _contexte_async(request, 'commandes')
+    return await sync_to_async(render)(request, 'reports/commandes.html', context)
+
 # ==================== RAPPORTS COMMERCIAUX & CLIENTS ====================
 
+@reponse_conditionnelle('commercial')
 def rapport_commercial(request):
     """Rapport commercial avec CA, fidélité et géographie"""
-    # Filtres
-    date_debut = request.GET.get('date_debut')
-    date_fin = request.GET.get('date_fin')
-    
-    if not date_debut:
-        date_debut = (timezone.now() - timedelta(days=30)).date()
-    else:
-        date_debut = datetime.strptime(date_debut, '%Y-%m-%d').date()
-    
-    if not date_fin:
-        date_fin = timezone.now().date()
-    else:
-        date_fin = datetime.strptime(date_fin, '%Y-%m-%d').date()
-    
-    # Factures dans la période
-    factures = Facture.objects.filter(
-        date_facturation__range=[date_debut, date_fin]
-    ).select_related('commande__client')
-    
-    # Chiffre d'affaires
-    ca_stats = {
-        'ca_total': factures.aggregate(total=Sum('montant_total'))['total'] or 0,
-        'ca_paye': factures.filter(statut='payee').aggregate(total=Sum('montant_total'))['total'] or 0,
-        'ca_en_attente': factures.exclude(statut='payee').aggregate(total=Sum('montant_total'))['total'] or 0,
-        'nombre_factures': factures.count(),
-        'factures_payees': factures.filter(statut='payee').count(),
-    }
-    
-    # CA par client
-    ca_par_client = factures.values(
-        'commande__client__nom'
-    ).annotate(
-        ca_total=Sum('montant_total'),
-        nombre_factures=Count('id')
-    ).order_by('-ca_total')[:10]
-    
-    # Analyse de fidélité des clients
-    clients_fidelite = Client.objects.annotate(
-        nombre_commandes=Count('commande'),
-        ca_total=Sum('commande__facture__montant_total'),
-        derniere_commande=Max('commande__date_commande')
-    ).filter(nombre_commandes__gt=0).order_by('-ca_total')
-    
-    # CA mensuel
-    ca_mensuel = factures.extra(
-        select={'mois': "strftime('%%Y-%%m', date_facturation)"}
-    ).values('mois').annotate(
-        ca=Sum('montant_total'),
-        nombre_factures=Count('id')
-    ).order_by('mois')
-    
-    # Répartition géographique (par ville des clients)
-    repartition_geo = factures.values(
-        'commande__client__adresse'
-    ).annotate(
-        ca=Sum('montant_total'),
-        nombre_commandes=Count('id')
-    ).order_by('-ca')
-    
-    context = {
-        'title': 'Rapport Commercial',
-        'date_debut': date_debut,
-        'date_fin': date_fin,
-        'ca_stats': ca_stats,
-        'ca_par_client': ca_par_client,
-        'clients_fidelite': clients_fidelite,
-        'ca_mensuel': ca_mensuel,
-        'repartition_geo': repartition_geo,
-    }
-    
+    context = _contexte(request, 'commercial')
     return render(request, 'reports/commercial.html', context)
 
+@reponse_conditionnelle('commercial')
+async def rapport_commercial_async(request):
+    """Rapport commercial, requêtes exécutées en parallèle"""
+    context = await _contexte_async(request, 'commercial')
+    return await sync_to_async(render)(request, 'reports/commercial.html', context)
+
 # ==================== RAPPORTS DE STOCK ====================
 
+@reponse_conditionnelle('stock')
 def rapport_stock(request):
     """Rapport de stock avec niveaux, mouvements et alertes"""
-    # Seuils d'alerte (peuvent être configurés)
-    seuil_critique = Decimal('10.0')
-    seuil_bas = Decimal('50.0')
-    
-    # Stock actuel de toutes les matières premières
-    matieres_premieres = MatierePremiere.objects.all()
-    stocks_actuels = []
-    
-    for matiere in matieres_premieres:
-        stock_actuel = matiere.stock_actuel
-        niveau_alerte = 'normal'
-        
-        if stock_actuel <= seuil_critique:
-            niveau_alerte = 'critique'
-        elif stock_actuel <= seuil_bas:
-            niveau_alerte = 'bas'
-        
-        stocks_actuels.append({
-            'matiere': matiere,
-            'stock_actuel': stock_actuel,
-            'niveau_alerte': niveau_alerte
-        })
-    
-    # Mouvements récents (30 derniers jours)
-    date_limite = timezone.now() - timedelta(days=30)
-    mouvements_recents = MouvementStock.objects.filter(
-        date_mouvement__gte=date_limite
-    ).select_related('matiere_premiere').order_by('-date_mouvement')
-    
-    # Statistiques des mouvements
-    stats_mouvements = {
-        'total_entrees': mouvements_recents.filter(type_mouvement='entree').aggregate(
-            total=Sum('quantite'))['total'] or 0,
-        'total_sorties': mouvements_recents.filter(type_mouvement='sortie').aggregate(
-            total=Sum('quantite'))['total'] or 0,
-        'nombre_mouvements': mouvements_recents.count(),
-    }
-    
-    # Mouvements par matière première
-    mouvements_par_matiere = mouvements_recents.values(
-        'matiere_premiere__nom'
-    ).annotate(
-        entrees=Sum('quantite', filter=Q(type_mouvement='entree')),
-        sorties=Sum('quantite', filter=Q(type_mouvement='sortie')),
-        nombre_mouvements=Count('id')
-    ).order_by('-nombre_mouvements')
-    
-    # Évolution du stock (par jour)
-    evolution_stock = mouvements_recents.extra(
-        select={'jour': 'date(date_mouvement)'}
-    ).values('jour', 'type_mouvement').annotate(
-        quantite_totale=Sum('quantite')
-    ).order_by('jour')
-    
-    # Alertes de stock
-    alertes = [stock for stock in stocks_actuels if stock['niveau_alerte'] in ['critique', 'bas']]
-    
-    context = {
-        'title': 'Rapport de Stock',
-        'stocks_actuels': stocks_actuels,
-        'mouvements_recents': mouvements_recents[:20],  # Limiter l'affichage
-        'stats_mouvements': stats_mouvements,
-        'mouvements_par_matiere': mouvements_par_matiere,
-        'evolution_stock': evolution_stock,
-        'alertes': alertes,
-        'seuil_critique': seuil_critique,
-        'seuil_bas': seuil_bas,
-    }
-    
+    context = _contexte(request, 'stock')
     return render(request, 'reports/stock.html', context)
 
+@reponse_conditionnelle('stock')
+async def rapport_stock_async(request):
+    """Rapport de stock, requêtes exécutées en parallèle"""
+    context = await _contexte_async(request, 'stock')
+    return await sync_to_async(render)(request, 'reports/stock.html', context)
+
 # ==================== RAPPORTS FINANCIERS ====================
 
+@reponse_conditionnelle('financier')
 def rapport_financier(request):
     """Rapport financier avec factures, paiements et rentabilité"""
-    # Filtres
-    date_debut = request.GET.get('date_debut')
-    date_fin = request.GET.get('date_fin')
-    
-    if not date_debut:
-        date_debut = (timezone.now() - timedelta(days=30)).date()
-    else:
-        date_debut = datetime.strptime(date_debut, '%Y-%m-%d').date()
-    
-    if not date_fin:
-        date_fin = timezone.now().date()
-    else:
-        date_fin = datetime.strptime(date_fin, '%Y-%m-%d').date()
-    
-    # Factures dans la période
-    factures = Facture.objects.filter(
-        date_facturation__range=[date_debut, date_fin]
-    ).select_related('commande__client')
-    
-    # Statistiques financières
-    stats_financieres = {
-        'ca_total': factures.aggregate(total=Sum('montant_total'))['total'] or 0,
-        'ca_facture': factures.aggregate(total=Sum('montant_total'))['total'] or 0,
-        'ca_paye': factures.filter(statut='payee').aggregate(total=Sum('montant_total'))['total'] or 0,
-        'ca_en_attente': factures.filter(statut='envoyee').aggregate(total=Sum('montant_total'))['total'] or 0,
-        'ca_brouillon': factures.filter(statut='brouillon').aggregate(total=Sum('montant_total'))['total'] or 0,
-        'nombre_factures': factures.count(),
-        'factures_payees': factures.filter(statut='payee').count(),
-        'factures_en_attente': factures.filter(statut='envoyee').count(),
-    }
-    
-    # Taux de recouvrement
-    if stats_financieres['ca_facture'] > 0:
-        stats_financieres['taux_recouvrement'] = (
-            stats_financieres['ca_paye'] / stats_financieres['ca_facture'] * 100
-        )
-    else:
-        stats_financieres['taux_recouvrement'] = 0
-    
-    # Factures par statut
-    factures_par_statut = factures.values('statut').annotate(
-        nombre=Count('id'),
-        montant_total=Sum('montant_total')
-    ).order_by('statut')
-    
-    # Évolution du CA mensuel
-    ca_mensuel = factures.extra(
-        select={'mois': "strftime('%%Y-%%m', date_facturation)"}
-    ).values('mois').annotate(
-        ca_facture=Sum('montant_total'),
-        ca_paye=Sum('montant_total', filter=Q(statut='payee')),
-        nombre_factures=Count('id')
-    ).order_by('mois')
-    
-    # Top clients par CA
-    top_clients_ca = factures.values(
-        'commande__client__nom'
-    ).annotate(
-        ca_total=Sum('montant_total'),
-        ca_paye=Sum('montant_total', filter=Q(statut='payee')),
-        nombre_factures=Count('id')
-    ).order_by('-ca_total')[:10]
-    
-    # Factures en retard de paiement (envoyées depuis plus de 30 jours)
-    date_limite_paiement = timezone.now().date() - timedelta(days=30)
-    factures_en_retard = factures.filter(
-        statut='envoyee',
-        date_facturation__lt=date_limite_paiement
-    )
-    
+    context = _contexte(request, 'financier')
+    return render(request, 'reports/financier.html', context)
+
+@reponse_conditionnelle('financier')
+async def rapport_financier_async(request):
+    """Rapport financier, requêtes exécutées en parallèle"""
+    context = await _contexte_async(request, 'financier')
+    return await sync_to_async(render)(request, 'reports/financier.html', context)
+
+@reponse_conditionnelle('rentabilite')
+def rapport_rentabilite(request):
+    """Rentabilité par commande : CA facturé, coût matière consommé et volumes"""
+    date_debut, date_fin = periode(request)
+    page = Paginator(commandes_periode(date_debut, date_fin), TAILLE_PAGE).get_page(request.GET.get('page'))
+    lignes = rentabilite_commandes(page.object_list, date_debut)
+    parametres = request.GET.copy()
+    parametres.pop('page', None)
     context = {
-        'title': 'Rapport Financier',
+        'title': 'Rentabilité par Commande',
         'date_debut': date_debut,
         'date_fin': date_fin,
-        'stats_financieres': stats_financieres,
-        'factures_par_statut': factures_par_statut,
-        'ca_mensuel': ca_mensuel,
-        'top_clients_ca': top_clients_ca,
-        'factures_en_retard': factures_en_retard,
-        'factures': factures,
+        'page': page,
+        'lignes': lignes,
+        'parametres': parametres.urlencode(),
+        'total_ca': sum((ligne.chiffre_affaires for ligne in lignes), 0),
+        'total_cout': sum((ligne.cout_matiere for ligne in lignes), 0),
+        'deficitaires': sum(1 for ligne in lignes if ligne.deficitaire),
     }
-    
-    return render(request, 'reports/financier.html', context)
+    context['total_marge'] = context['total_ca'] - context['total_cout']
+    return render(request, 'reports/rentabilite.html', context)
+
+# ==================== SÉRIES JSON ====================
+
+def _donnees_serie(request, type_rapport, serie):
+    try:
+        construire_serie = SERIES[type_rapport][serie]
+    except KeyError:
+        raise Http404("Série de rapport inconnue.")
+    pk = id_instantane(request)
+    if pk is not None:
+        try:
+            return serie_instantane(get_object_or_404(Rapport, pk=pk, type_rapport=type_rapport), serie)
+        except KeyError:
+            raise Http404("Série absente de cet instantané.")
+    date_debut, date_fin = periode(request)
+    return en_colonnes(*construire_serie(date_debut, date_fin, statut=request.GET.get('statut')))
+
+@gzip_page
+@reponse_conditionnelle()
+async def serie_rapport(request, type_rapport, serie):
+    """Données d'un tableau ou graphique de rapport, en JSON par colonnes.
+
+    Vue asynchrone : les séries qu'une page demande ensemble sont calculées en
+    parallèle, chacune sur sa propre connexion.
+    """
+    donnees = await isoler(partial(_donnees_serie, request, type_rapport, serie))()
+    return JsonResponse(
+        donnees,
+        json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False},
+    )
 
 # ==================== EXPORT PDF ====================
 
 def export_rapport_pdf(request, type_rapport):
-    """Export d'un rapport en PDF"""
-    try:
-        from xhtml2pdf import pisa
-    except ImportError:
-        return HttpResponse("La bibliothèque xhtml2pdf n'est pas installée.", status=500)
-    
-    # Déterminer le template et les données selon le type de rapport
-    if type_rapport == 'production':
-        context = _get_production_data(request)
-        template_path = 'reports/pdf/production_pdf.html'
-        filename = f'rapport_production_{timezone.now().strftime("%Y%m%d")}.pdf'
-    elif type_rapport == 'commandes':
-        context = _get_commandes_data(request)
-        template_path = 'reports/pdf/commandes_pdf.html'
-        filename = f'rapport_commandes_{timezone.now().strftime("%Y%m%d")}.pdf'
-    elif type_rapport == 'commercial':
-        context = _get_commercial_data(request)
-        template_path = 'reports/pdf/commercial_pdf.html'
-        filename = f'rapport_commercial_{timezone.now().strftime("%Y%m%d")}.pdf'
-    elif type_rapport == 'stock':
-        context = _get_stock_data(request)
-        template_path = 'reports/pdf/stock_pdf.html'
-        filename = f'rapport_stock_{timezone.now().strftime("%Y%m%d")}.pdf'
-    elif type_rapport == 'financier':
-        context = _get_financier_data(request)
-        template_path = 'reports/pdf/financier_pdf.html'
-        filename = f'rapport_financier_{timezone.now().strftime("%Y%m%d")}.pdf'
-    else:
+    """Export d'un rapport en PDF, tableaux compris"""
+    if type_rapport not in TYPES_RAPPORT:
         return HttpResponse("Type de rapport non reconnu.", status=400)
-    
-    # Créer la réponse PDF
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    # Rendre le template
-    template = get_template(template_path)
-    html = template.render(context)
-    
-    # Créer le PDF
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    
-    if pisa_status.err:
+    date_debut, date_fin = periode(request)
+    try:
+        fichier = rendre_rapport(type_rapport, date_debut, date_fin, statut=request.GET.get('statut'))
+    except RenduImpossible:
         return HttpResponse('Erreur lors de la génération du PDF', status=500)
-    
-    return response
-
-# Fonctions utilitaires pour récupérer les données
-def _get_production_data(request):
-    # Logique similaire à rapport_production mais simplifiée pour PDF
-    pass
-
-def _get_commandes_data(request):
-    # Logique similaire à rapport_commandes mais simplifiée pour PDF
-    pass
-
-def _get_commercial_data(request):
-    # Logique similaire à rapport_commercial mais simplifiée pour PDF
-    pass
-
-def _get_stock_data(request):
-    # Logique similaire à rapport_stock mais simplifiée pour PDF
-    pass
-
-def _get_financier_data(request):
-    # Logique similaire à rapport_financier mais simplifiée pour PDF
-    pass
+    filename = f'rapport_{type_rapport}_{timezone.now().strftime("%Y%m%d")}.pdf'
+    return FileResponse(fichier, as_attachment=True, filename=filename, content_type='application/pdf')
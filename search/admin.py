@@ -0,0 +1,22 @@
+from django.contrib.admin.views.main import ORDER_VAR
+
+from .recherche import pertinence, rechercher
+
+
+class RechercheIndexeeMixin:
+    """Remplace la recherche ``icontains`` de l'admin par l'index de recherche.
+
+    Les ``search_fields`` restent déclarés : ils font apparaître le champ de
+    recherche et documentent ce qui est indexé (voir search.documents). Sans
+    tri choisi dans la liste, les résultats les plus pertinents viennent en tête.
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.split():
+            return super().get_search_results(request, queryset, search_term)
+        queryset = queryset.filter(pk__in=rechercher(self.model, search_term)).annotate(
+            pertinence=pertinence(self.model, search_term)
+        )
+        if not request.GET.get(ORDER_VAR):
+            queryset = queryset.order_by('-pertinence', *queryset.query.order_by)
+        return queryset, False
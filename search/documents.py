@@ -0,0 +1,128 @@
+"""Objets recherchables et texte indexé pour chacun.
+
+Chaque entrée de ``DOCUMENTS`` indique comment charger les objets d'un modèle
+(avec leurs jointures) et quel texte indexer ; ``DEPENDANCES`` liste, pour un
+modèle donné, les documents d'autres modèles qui reprennent ses champs (le nom
+du client figure dans le document de ses commandes, par exemple) et doivent
+être réindexés avec lui.
+
+L'enregistrement d'un objet ne réindexe rien sur le moment : ``planifier_indexation``
+note l'objet et la réindexation, dépendances comprises, a lieu une seule fois
+à la validation de la transaction, pour tous les objets touchés.
+"""
+from threading import local
+
+from django.db import transaction
+
+from customers.models import Client, Chantier
+from logistics.models import Livraison
+from orders.models import Commande
+
+from .models import DocumentRecherche
+
+TAILLE_LOT = 500
+
+_en_attente = local()
+
+
+def _texte(*valeurs):
+    return ' '.join(str(valeur) for valeur in valeurs if valeur)
+
+
+DOCUMENTS = {
+    Client: (
+        lambda: Client.objects.all(),
+        lambda client: _texte(client.nom, client.adresse, client.ville, client.email, client.telephone),
+    ),
+    Chantier: (
+        lambda: Chantier.objects.select_related('client'),
+        lambda chantier: _texte(chantier.nom, chantier.adresse, chantier.ville, chantier.client.nom),
+    ),
+    Commande: (
+        lambda: Commande.objects.select_related('client', 'chantier'),
+        lambda commande: _texte(commande.pk, commande.client.nom, commande.chantier.nom),
+    ),
+    Livraison: (
+        lambda: Livraison.objects.select_related('commande__client'),
+        lambda livraison: _texte(livraison.commande_id, livraison.commande.client.nom, livraison.adresse_livraison),
+    ),
+}
+
+DEPENDANCES = {
+    Client: [(Chantier, 'client_id'), (Commande, 'client_id'), (Livraison, 'commande__client_id')],
+    Chantier: [(Commande, 'chantier_id')],
+    Commande: [(Livraison, 'commande_id')],
+}
+
+
+def cle_modele(modele):
+    return modele._meta.label_lower
+
+
+def indexer(modele, ids=None):
+    """(Ré)indexe les objets ``ids`` du modèle (tous par défaut) ; renvoie leur nombre"""
+    charger, texte = DOCUMENTS[modele]
+    objets = charger()
+    if ids is not None:
+        objets = objets.filter(pk__in=ids)
+    cle = cle_modele(modele)
+    nombre = 0
+    lot = []
+    with transaction.atomic():
+        for objet in objets.order_by('pk').iterator(chunk_size=TAILLE_LOT):
+            lot.append(DocumentRecherche(modele=cle, objet_id=objet.pk, texte=texte(objet)))
+            if len(lot) >= TAILLE_LOT:
+                nombre += _enregistrer(lot)
+                lot = []
+        if lot:
+            nombre += _enregistrer(lot)
+    return nombre
+
+
+def _enregistrer(documents):
+    DocumentRecherche.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=['modele', 'objet_id'],
+        update_fields=['texte'],
+    )
+    return len(documents)
+
+
+def indexer_avec_dependances(objets):
+    """Réindexe les objets ``{modele: ids}`` et les documents des autres modèles qui reprennent leurs champs"""
+    a_indexer = {}
+    # DOCUMENTS suit l'ordre des dépendances (client -> chantiers -> commandes -> livraisons) :
+    # un seul passage par modèle
+    for modele in DOCUMENTS:
+        a_indexer.setdefault(modele, set()).update(objets.get(modele, ()))
+        for dependant, champ in DEPENDANCES.get(modele, []):
+            if a_indexer[modele]:
+                a_indexer.setdefault(dependant, set()).update(
+                    dependant.objects.filter(**{f'{champ}__in': a_indexer[modele]}).values_list('pk', flat=True)
+                )
+    return sum(indexer(modele, ids) for modele, ids in a_indexer.items() if ids)
+
+
+def _indexer_en_attente():
+    objets = getattr(_en_attente, 'objets', {})
+    _en_attente.objets = {}
+    if objets:
+        indexer_avec_dependances(objets)
+
+
+def planifier_indexation(modele, pk):
+    """Réindexe l'objet et ses dépendances à la validation de la transaction.
+
+    Les objets touchés pendant une même transaction sont regroupés : une
+    commande et ses livraisons saisies ensemble, ou un client dont plusieurs
+    chantiers sont mis à jour, ne sont réindexés qu'une fois.
+    """
+    if not hasattr(_en_attente, 'objets'):
+        _en_attente.objets = {}
+    _en_attente.objets.setdefault(modele, set()).add(pk)
+    transaction.on_commit(_indexer_en_attente)
+
+
+def desindexer(modele, pk):
+    DocumentRecherche.objects.filter(modele=cle_modele(modele), objet_id=pk).delete()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from search.documents import DOCUMENTS, indexer
+from search.models import DocumentRecherche
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche de l'admin (clients, chantiers, commandes, livraisons)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vider', action='store_true', help="Supprime l'index existant avant de le reconstruire")
+
+    def handle(self, *args, **options):
+        if options['vider']:
+            DocumentRecherche.objects.all().delete()
+        for modele in DOCUMENTS:
+            nombre = indexer(modele)
+            self.stdout.write(f"{modele._meta.verbose_name_plural} : {nombre} document(s) indexé(s)")
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:11
+
+from django.db import migrations, models
+
+SQLITE = [
+    """CREATE VIRTUAL TABLE search_documentrecherche_fts USING fts5(
+        texte, content='search_documentrecherche', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER search_documentrecherche_ai AFTER INSERT ON search_documentrecherche BEGIN
+        INSERT INTO search_documentrecherche_fts(rowid, texte) VALUES (new.id, new.texte);
+    END""",
+    """CREATE TRIGGER search_documentrecherche_ad AFTER DELETE ON search_documentrecherche BEGIN
+        INSERT INTO search_documentrecherche_fts(search_documentrecherche_fts, rowid, texte)
+        VALUES ('delete', old.id, old.texte);
+    END""",
+    """CREATE TRIGGER search_documentrecherche_au AFTER UPDATE ON search_documentrecherche BEGIN
+        INSERT INTO search_documentrecherche_fts(search_documentrecherche_fts, rowid, texte)
+        VALUES ('delete', old.id, old.texte);
+        INSERT INTO search_documentrecherche_fts(rowid, texte) VALUES (new.id, new.texte);
+    END""",
+]
+
+SQLITE_INVERSE = [
+    'DROP TRIGGER IF EXISTS search_documentrecherche_au',
+    'DROP TRIGGER IF EXISTS search_documentrecherche_ad',
+    'DROP TRIGGER IF EXISTS search_documentrecherche_ai',
+    'DROP TABLE IF EXISTS search_documentrecherche_fts',
+]
+
+POSTGRESQL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    # Même expression que le lookup icontains de Django : UPPER(texte) LIKE UPPER(%s)
+    'CREATE INDEX search_documentrecherche_trgm ON search_documentrecherche USING gin (UPPER(texte) gin_trgm_ops)',
+]
+
+POSTGRESQL_INVERSE = [
+    'DROP INDEX IF EXISTS search_documentrecherche_trgm',
+]
+
+
+def _executer(schema_editor, requetes):
+    for requete in requetes.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(requete)
+
+
+def creer_index(apps, schema_editor):
+    _executer(schema_editor, {'sqlite': SQLITE, 'postgresql': POSTGRESQL})
+
+
+def supprimer_index(apps, schema_editor):
+    _executer(schema_editor, {'sqlite': SQLITE_INVERSE, 'postgresql': POSTGRESQL_INVERSE})
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentRecherche',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modele', models.CharField(max_length=50)),
+                ('objet_id', models.PositiveBigIntegerField()),
+                ('texte', models.TextField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('modele', 'objet_id'), name='document_recherche_unique')],
+            },
+        ),
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+# Même expression que search.recherche._vecteur_pg
+POSTGRESQL = [
+    "CREATE INDEX search_documentrecherche_fts_pg ON search_documentrecherche "
+    "USING gin (to_tsvector('simple'::regconfig, texte))",
+]
+
+POSTGRESQL_INVERSE = [
+    'DROP INDEX IF EXISTS search_documentrecherche_fts_pg',
+]
+
+
+def creer_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for requete in POSTGRESQL:
+            schema_editor.execute(requete)
+
+
+def supprimer_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for requete in POSTGRESQL_INVERSE:
+            schema_editor.execute(requete)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
@@ -0,0 +1,20 @@
+from django.db import models
+
+class DocumentRecherche(models.Model):
+    """Texte indexé d'un objet recherchable depuis l'admin (voir search.documents).
+
+    L'index lui-même dépend de la base : table FTS5 alimentée par triggers sous
+    SQLite, index GIN plein texte et trigramme sous PostgreSQL (créés par les
+    migrations).
+    """
+    modele = models.CharField(max_length=50)
+    objet_id = models.PositiveBigIntegerField()
+    texte = models.TextField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['modele', 'objet_id'], name='document_recherche_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.modele} {self.objet_id}'
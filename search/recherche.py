@@ -0,0 +1,97 @@
+"""Interrogation de l'index de recherche selon la base utilisée.
+
+- SQLite : table virtuelle FTS5 ``search_documentrecherche_fts`` (préfixes,
+  insensible à la casse et aux accents), pertinence BM25 ;
+- PostgreSQL : recherche plein texte sur ``to_tsvector('simple', texte)``
+  (index GIN, préfixes), pertinence ``ts_rank`` ; un terme qui n'est pas le
+  début d'un mot (fragment de téléphone, d'adresse) est retrouvé par
+  ``UPPER(texte) LIKE``, servi par l'index GIN trigramme, avec une pertinence
+  nulle ;
+- autres bases : simple ``icontains`` sur la table des documents.
+
+Tous les termes doivent être présents (ET logique).
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import connection
+from django.db.models import F, FloatField, Func, OuterRef, Q, Subquery, Value
+from django.db.models.expressions import RawSQL
+
+from .documents import cle_modele
+from .models import DocumentRecherche
+
+TABLE_FTS = 'search_documentrecherche_fts'
+# Configuration plein texte PostgreSQL, identique à celle de l'index (migration 0002)
+CONFIGURATION_PG = 'simple'
+
+
+def _termes(recherche):
+    return [terme for terme in recherche.split() if terme]
+
+
+def _requete_fts(termes):
+    # Chaque terme est cité (pas de syntaxe FTS5 injectée) et cherché comme préfixe
+    return ' '.join('"{}"*'.format(terme.replace('"', '""')) for terme in termes)
+
+
+def _requete_tsquery(termes):
+    # Même principe pour to_tsquery : lexèmes cités, préfixes, tous requis
+    lexemes = [re.sub(r"[\\']", '', terme) for terme in termes]
+    return ' & '.join(f"'{lexeme}':*" for lexeme in lexemes if lexeme)
+
+
+def _vecteur_pg():
+    # Même expression que l'index search_documentrecherche_fts_pg
+    return Func(
+        F('texte'), function='to_tsvector',
+        template=f"%(function)s('{CONFIGURATION_PG}'::regconfig, %(expressions)s)",
+        output_field=SearchVectorField(),
+    )
+
+
+def documents(modele, recherche):
+    """Documents du modèle correspondant à la recherche"""
+    termes = _termes(recherche)
+    documents = DocumentRecherche.objects.filter(modele=cle_modele(modele))
+    if connection.vendor == 'sqlite':
+        return documents.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {TABLE_FTS} WHERE {TABLE_FTS} MATCH %s', (_requete_fts(termes),)
+        ))
+    sous_chaines = Q()
+    for terme in termes:
+        sous_chaines &= Q(texte__icontains=terme)
+    if connection.vendor == 'postgresql' and _requete_tsquery(termes):
+        requete = SearchQuery(_requete_tsquery(termes), config=CONFIGURATION_PG, search_type='raw')
+        return documents.annotate(vecteur=_vecteur_pg()).filter(Q(vecteur=requete) | sous_chaines)
+    return documents.filter(sous_chaines)
+
+
+def rechercher(modele, recherche):
+    """Identifiants (sous-requête) des objets du modèle correspondant à la recherche"""
+    return documents(modele, recherche).values('objet_id')
+
+
+def pertinence(modele, recherche):
+    """Expression de pertinence d'un objet du modèle pour la recherche (plus grande = meilleure).
+
+    À annoter sur les objets déjà filtrés par ``rechercher``.
+    """
+    termes = _termes(recherche)
+    if connection.vendor == 'sqlite':
+        # bm25() n'existe que dans la requête FTS5 elle-même : sous-requête corrélée à l'objet
+        cle = f'{connection.ops.quote_name(modele._meta.db_table)}.{connection.ops.quote_name(modele._meta.pk.column)}'
+        return RawSQL(
+            f'SELECT -bm25({TABLE_FTS}) FROM {TABLE_FTS} '
+            f'JOIN search_documentrecherche document ON document.id = {TABLE_FTS}.rowid '
+            f'WHERE {TABLE_FTS} MATCH %s AND document.modele = %s AND document.objet_id = {cle}',
+            (_requete_fts(termes), cle_modele(modele)),
+            output_field=FloatField(),
+        )
+    if connection.vendor == 'postgresql' and _requete_tsquery(termes):
+        requete = SearchQuery(_requete_tsquery(termes), config=CONFIGURATION_PG, search_type='raw')
+        rangs = DocumentRecherche.objects.filter(
+            modele=cle_modele(modele), objet_id=OuterRef('pk'),
+        ).annotate(rang=SearchRank(_vecteur_pg(), requete)).values('rang')[:1]
+        return Subquery(rangs, output_field=FloatField())
+    return Value(0.0, output_field=FloatField())
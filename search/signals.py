@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save, post_delete
+from .documents import DOCUMENTS, desindexer, planifier_indexation
+
+def indexer_apres_enregistrement(sender, instance, raw=False, **kwargs):
+    if not raw:
+        planifier_indexation(sender, instance.pk)
+
+def desindexer_apres_suppression(sender, instance, **kwargs):
+    desindexer(sender, instance.pk)
+
+for modele in DOCUMENTS:
+    post_save.connect(indexer_apres_enregistrement, sender=modele, dispatch_uid=f'search_indexer_{modele._meta.label_lower}')
+    post_delete.connect(desindexer_apres_suppression, sender=modele, dispatch_uid=f'search_desindexer_{modele._meta.label_lower}')
@@ -0,0 +1,107 @@
+from datetime import date
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from customers.models import Chantier, Client
+from orders.models import Commande
+from .documents import indexer
+from .models import DocumentRecherche
+from .recherche import _requete_fts, _requete_tsquery, pertinence, rechercher
+
+
+def trouves(modele, recherche):
+    return list(
+        modele.objects.filter(pk__in=rechercher(modele, recherche)).annotate(
+            pertinence=pertinence(modele, recherche)
+        ).order_by('-pertinence', 'pk').values_list('nom', flat=True)
+    )
+
+
+class IndexationTests(TestCase):
+    def test_indexation_a_la_validation(self):
+        with self.captureOnCommitCallbacks(execute=False) as rappels:
+            client = Client.objects.create(nom='Dupont Béton', adresse='1 rue A, 69003 Lyon')
+            # Rien n'est indexé avant la validation de la transaction
+            self.assertFalse(DocumentRecherche.objects.exists())
+        for rappel in rappels:
+            rappel()
+        self.assertEqual(DocumentRecherche.objects.get().objet_id, client.pk)
+
+    def test_dependances_reindexees(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            client = Client.objects.create(nom='Dupont', adresse='1 rue A, Lyon')
+            chantier = Chantier.objects.create(nom='Tour', adresse='2 rue B, Lyon', client=client)
+            Commande.objects.create(client=client, chantier=chantier, date_livraison_souhaitee=date(2030, 1, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            client.nom = 'Martin'
+            client.save()
+        document = DocumentRecherche.objects.get(modele='orders.commande')
+        self.assertIn('Martin', document.texte)
+        self.assertIn('Martin', DocumentRecherche.objects.get(modele='customers.chantier').texte)
+
+    def test_suppression_desindexe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            client = Client.objects.create(nom='Dupont', adresse='1 rue A, Lyon')
+        client.delete()
+        self.assertFalse(DocumentRecherche.objects.exists())
+
+
+class RequetesTests(TestCase):
+    def test_termes_cites(self):
+        self.assertEqual(_requete_fts(['du"pont', 'NEAR']), '"du""pont"* "NEAR"*')
+        self.assertEqual(_requete_tsquery(["l'ile", 'a\\b', "'"]), "'lile':* & 'ab':*")
+
+
+class RechercheTests(TestCase):
+    def setUp(self):
+        for nom, adresse in [
+            ('Dupont Béton', '1 rue A, 69003 Lyon'),
+            ('Martin', '2 rue Dupont, 13001 Marseille'),
+            ('Durand', '3 rue C, 33000 Bordeaux'),
+        ]:
+            Client.objects.create(nom=nom, adresse=adresse, telephone='0612345678')
+        indexer(Client)
+
+    def test_tous_les_termes_requis(self):
+        self.assertEqual(trouves(Client, 'dupont lyon'), ['Dupont Béton'])
+        self.assertEqual(trouves(Client, 'dupont paris'), [])
+
+    def test_prefixe_insensible_a_la_casse(self):
+        self.assertEqual(set(trouves(Client, 'DUP')), {'Dupont Béton', 'Martin'})
+
+    @skipUnless(connection.vendor == 'sqlite', 'FTS5 : SQLite seulement')
+    def test_sqlite_accents_et_pertinence(self):
+        self.assertEqual(trouves(Client, 'beton'), ['Dupont Béton'])
+        # Le nom qui contient deux fois le terme devance l'adresse qui le contient une fois
+        Client.objects.filter(nom='Dupont Béton').update(nom='Dupont Dupont')
+        indexer(Client)
+        self.assertEqual(trouves(Client, 'dupont'), ['Dupont Dupont', 'Martin'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'plein texte et trigrammes : PostgreSQL seulement')
+    def test_postgresql_plein_texte_et_fragments(self):
+        # Un fragment en milieu de mot passe par l'index trigramme, avec une pertinence nulle
+        self.assertEqual(set(trouves(Client, '345678')), {'Dupont Béton', 'Martin', 'Durand'})
+        self.assertEqual(trouves(Client, 'bordeaux 0612'), ['Durand'])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AdminRechercheTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Client.objects.create(nom='Martin', adresse='2 rue Dupont, Marseille')
+            Client.objects.create(nom='Dupont Dupont', adresse='1 rue A, Lyon')
+
+    def test_resultats_par_pertinence(self):
+        reponse = self.client.get('/admin/customers/client/', {'q': 'dupont'})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual([client.nom for client in reponse.context['cl'].result_list], ['Dupont Dupont', 'Martin'])
+
+    def test_tri_choisi_prioritaire(self):
+        reponse = self.client.get('/admin/customers/client/', {'q': 'dupont', 'o': '1'})
+        self.assertEqual([client.nom for client in reponse.context['cl'].result_list], ['Dupont Dupont', 'Martin'])
+        reponse = self.client.get('/admin/customers/client/', {'q': 'dupont', 'o': '-1'})
+        self.assertEqual([client.nom for client in reponse.context['cl'].result_list], ['Martin', 'Dupont Dupont'])
@@ -1,14 +1,212 @@
-from django.contrib import admin
-from .models import MouvementStock
-
-# Temporairement désactivé pour débogage
-# @admin.register(MouvementStock)
-# class MouvementStockAdmin(admin.ModelAdmin):
-#     list_display = ('matiere_premiere_id', 'quantite', 'type_mouvement', 'date_mouvement', 'description')
-#     # list_filter = ('type_mouvement', 'matiere_premiere')
-#     # search_fields = ('matiere_premiere__nom', 'description')
-#     # date_hierarchy = 'date_mouvement'
-#     # list_select_related = ('matiere_premiere',)
-
-# Enregistrement basique temporaire
-admin.site.register(MouvementStock)
+import uuid
+
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+from beton_project.paginators import PaginateurApproximatif
+from .inventaires import InventaireValide, completer_lignes, solde_au_comptage, valider_inventaire
+from .models import (
+    Archivage, Inventaire, InstantaneStock, LigneInventaire, MouvementStock, MouvementStockArchive, SoldeStock,
+)
+from .services import enregistrer_mouvements, supprimer_mouvements
+
+
+class MouvementStockForm(forms.ModelForm):
+    # Jeton généré à l'affichage du formulaire : une double soumission ne crée qu'un mouvement
+    jeton = forms.CharField(widget=forms.HiddenInput, required=False)
+
+    class Meta:
+        model = MouvementStock
+        fields = ('matiere_premiere', 'quantite', 'type_mouvement', 'cout_unitaire', 'type_source', 'reference_source', 'description')
+        labels = {'cout_unitaire': "Prix d'achat unitaire", 'reference_source': 'Référence (bon de livraison, inventaire...)'}
+        help_texts = {'cout_unitaire': "Pour une entrée : met à jour le coût moyen pondéré de la matière."}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.is_bound and self.instance.pk is None:
+            self.initial['jeton'] = uuid.uuid4().hex
+        if 'type_source' in self.fields:
+            # Les sorties de production sont créées par les lots eux-mêmes
+            self.fields['type_source'].choices = [
+                choix for choix in MouvementStock.TYPE_SOURCE_CHOICES if choix[0] != 'lot'
+            ]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        matiere = cleaned_data.get('matiere_premiere')
+        quantite = cleaned_data.get('quantite')
+        if (
+            self.instance.pk is None
+            and getattr(settings, 'STOCK_INTERDIRE_NEGATIF', False)
+            and cleaned_data.get('type_mouvement') == 'sortie'
+            and matiere is not None and quantite is not None
+            and quantite > matiere.stock_actuel
+        ):
+            raise forms.ValidationError(
+                f"Stock insuffisant : {matiere.stock_actuel} {matiere.unite_mesure} disponible(s)."
+            )
+        return cleaned_data
+
+
+@admin.register(MouvementStock)
+class MouvementStockAdmin(admin.ModelAdmin):
+    form = MouvementStockForm
+    list_display = ('matiere_premiere', 'quantite', 'type_mouvement', 'cout_unitaire', 'type_source', 'lot_production_id', 'reference_source', 'date_mouvement', 'description')
+    list_filter = ('type_mouvement', 'type_source', 'matiere_premiere')
+    search_fields = ('matiere_premiere__nom', 'reference_source', 'description')
+    list_select_related = ('matiere_premiere',)
+    # Table appelée à compter des millions de lignes : pas de COUNT(*) complet
+    paginator = PaginateurApproximatif
+    show_full_result_count = False
+
+    def get_readonly_fields(self, request, obj=None):
+        # Un mouvement enregistré ne change plus de quantité : on le supprime et on en saisit un autre
+        if obj is not None:
+            return ('matiere_premiere', 'quantite', 'type_mouvement', 'cout_unitaire', 'type_source', 'lot_production', 'reference_source')
+        return ()
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            super().save_model(request, obj, form, change)
+            return
+        jeton = form.cleaned_data.get('jeton')
+        if jeton:
+            obj.cle_idempotence = f"saisie:{jeton}"
+        enregistrer_mouvements([obj])
+
+    def delete_model(self, request, obj):
+        supprimer_mouvements(MouvementStock.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        supprimer_mouvements(queryset)
+
+
+class LectureSeuleAdmin(admin.ModelAdmin):
+    """Données tenues par les services de stock : consultation uniquement"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SoldeStock)
+class SoldeStockAdmin(LectureSeuleAdmin):
+    list_display = ('matiere_premiere', 'quantite', 'cout_unitaire_moyen', 'date_maj')
+    search_fields = ('matiere_premiere__nom',)
+    list_select_related = ('matiere_premiere',)
+
+
+@admin.register(MouvementStockArchive)
+class MouvementStockArchiveAdmin(LectureSeuleAdmin):
+    list_display = ('matiere_premiere', 'quantite', 'type_mouvement', 'type_source', 'lot_production_id', 'reference_source', 'date_mouvement', 'description')
+    list_filter = ('type_mouvement', 'type_source', 'matiere_premiere')
+    list_select_related = ('matiere_premiere',)
+    date_hierarchy = 'date_mouvement'
+    paginator = PaginateurApproximatif
+    show_full_result_count = False
+
+
+@admin.register(InstantaneStock)
+class InstantaneStockAdmin(LectureSeuleAdmin):
+    list_display = ('matiere_premiere', 'entrees', 'sorties', 'quantite', 'date_arrete')
+    list_select_related = ('matiere_premiere',)
+
+
+@admin.register(Archivage)
+class ArchivageAdmin(LectureSeuleAdmin):
+    list_display = ('table', 'date_limite', 'nombre_lignes', 'date_execution')
+    list_filter = ('table',)
+
+
+class LigneInventaireInline(admin.TabularInline):
+    model = LigneInventaire
+    fields = ('matiere_premiere', 'quantite_comptee', 'solde', 'ecart_affiche')
+    readonly_fields = ('matiere_premiere', 'solde', 'ecart_affiche')
+    extra = 0
+    can_delete = False
+
+    def get_queryset(self, request):
+        # Solde à la date de comptage (brouillon) ou figé (validé), et écart, en une requête
+        return super().get_queryset(request).select_related('matiere_premiere').annotate(
+            solde_calcule=Coalesce(F('quantite_theorique'), solde_au_comptage()),
+            ecart_calcule=Coalesce(F('ecart'), F('quantite_comptee') - F('solde_calcule')),
+        )
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Solde au comptage')
+    def solde(self, obj):
+        return getattr(obj, 'solde_calcule', None)
+
+    @admin.display(description='Écart')
+    def ecart_affiche(self, obj):
+        return getattr(obj, 'ecart_calcule', None)
+
+
+@admin.register(Inventaire)
+class InventaireAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'date_comptage', 'statut', 'date_validation')
+    list_filter = ('statut',)
+    # Le statut ne change que par l'action de validation
+    fields = ('date_comptage', 'commentaire')
+    date_hierarchy = 'date_comptage'
+    inlines = [LigneInventaireInline]
+    actions = ['valider']
+
+    def has_change_permission(self, request, obj=None):
+        # Un inventaire validé a déjà ajusté les soldes : il n'est plus modifiable
+        if obj is not None and obj.statut == 'valide':
+            return False
+        return super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and obj.statut == 'valide':
+            return False
+        return super().has_delete_permission(request, obj)
+
+    def response_add(self, request, obj, post_url_continue=None):
+        # La feuille de comptage vient d'être créée : elle s'ouvre pour la saisie
+        return HttpResponseRedirect(reverse('admin:stock_inventaire_change', args=[obj.pk]))
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Une ligne par matière, y compris celles créées depuis l'ouverture de l'inventaire
+        completer_lignes(form.instance)
+
+    @admin.action(description="Valider les inventaires sélectionnés et ajuster les soldes")
+    def valider(self, request, queryset):
+        for inventaire in queryset.filter(statut='brouillon').order_by('date_comptage', 'pk'):
+            try:
+                nombre = valider_inventaire(inventaire)
+            except InventaireValide as erreur:
+                self.message_user(request, str(erreur), messages.WARNING)
+                continue
+            self.message_user(
+                request, f"{inventaire} validé : {nombre} ajustement(s) enregistré(s).", messages.SUCCESS,
+            )
+
+
+@admin.register(LigneInventaire)
+class LigneInventaireAdmin(LectureSeuleAdmin):
+    """Historique des écarts d'inventaire : dérive des soldes calculés par matière"""
+    list_display = ('inventaire', 'date_comptage', 'matiere_premiere', 'quantite_theorique', 'quantite_comptee', 'ecart')
+    list_filter = ('matiere_premiere',)
+    list_select_related = ('inventaire', 'matiere_premiere')
+    ordering = ('-inventaire__date_comptage', 'matiere_premiere__nom')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(inventaire__statut='valide')
+
+    @admin.display(description='Date de comptage', ordering='inventaire__date_comptage')
+    def date_comptage(self, obj):
+        return obj.inventaire.date_comptage
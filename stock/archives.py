@@ -0,0 +1,140 @@
+"""Archivage des périodes closes.
+
+Les lignes antérieures à une date limite (début de mois) quittent la table
+courante pour une table d'archive de même structure, par lots, chaque lot dans
+sa propre transaction : la table courante, ses index et son vacuum gardent une
+taille bornée. Les soldes restent justes : ``SoldeStock`` est tenu de façon
+incrémentale et ``InstantaneStock`` conserve le cumul des mouvements archivés
+pour ``recalculer_soldes``.
+
+Les lectures qui remontent avant la dernière date limite interrogent aussi
+l'archive (``sources``) ; les champs ayant les mêmes noms des deux côtés, une
+même requête s'applique à chaque source.
+"""
+from datetime import datetime, time
+
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+
+from .models import Archivage, InstantaneStock, MouvementStock, MouvementStockArchive
+
+ARCHIVE_MOIS_DEFAUT = 12
+TAILLE_LOT = 5000
+
+CHAMPS_MOUVEMENT = [
+    'id', 'matiere_premiere_id', 'quantite', 'type_mouvement', 'date_mouvement', 'description',
+    'cout_unitaire', 'type_source', 'lot_production_id', 'reference_source', 'cle_idempotence',
+]
+
+
+def date_limite_mois(mois, maintenant=None):
+    """Premier jour du mois, ``mois`` mois avant le mois courant"""
+    aujourd_hui = timezone.localdate(maintenant)
+    index = aujourd_hui.year * 12 + aujourd_hui.month - 1 - mois
+    debut = aujourd_hui.replace(year=index // 12, month=index % 12 + 1, day=1)
+    return timezone.make_aware(datetime.combine(debut, time.min))
+
+
+def date_limite_archive(table):
+    """Date avant laquelle des lignes de ``table`` peuvent se trouver dans l'archive"""
+    return Archivage.objects.filter(table=table).aggregate(limite=Max('date_limite'))['limite']
+
+
+def sources(modele, archive, table, depuis=None):
+    """Managers à interroger pour des données postérieures à ``depuis`` (tout l'historique si None)"""
+    limite = date_limite_archive(table)
+    if limite is None:
+        return [modele.objects]
+    if depuis is not None:
+        if not isinstance(depuis, datetime):
+            depuis = timezone.make_aware(datetime.combine(depuis, time.min))
+        if depuis >= limite:
+            return [modele.objects]
+    return [modele.objects, archive.objects]
+
+
+def sources_mouvements(depuis=None):
+    return sources(MouvementStock, MouvementStockArchive, 'stock.mouvementstock', depuis)
+
+
+def archiver_mouvements(date_limite, taille_lot=TAILLE_LOT):
+    """Déplace les mouvements antérieurs à ``date_limite`` vers l'archive ; renvoie leur nombre"""
+    from .services import _verrouiller_soldes
+
+    total = 0
+    while True:
+        with transaction.atomic():
+            # Même ordre de verrouillage que supprimer_mouvements : mouvements puis soldes
+            mouvements = list(
+                MouvementStock.objects.select_for_update().filter(
+                    date_mouvement__lt=date_limite
+                ).order_by('id').values(*CHAMPS_MOUVEMENT)[:taille_lot]
+            )
+            if not mouvements:
+                break
+            _verrouiller_soldes(m['matiere_premiere_id'] for m in mouvements)
+
+            MouvementStockArchive.objects.bulk_create(
+                [MouvementStockArchive(**mouvement) for mouvement in mouvements]
+            )
+            _cumuler(mouvements, date_limite)
+            MouvementStock.objects.filter(id__in=[m['id'] for m in mouvements]).delete()
+        total += len(mouvements)
+
+    Archivage.objects.create(table='stock.mouvementstock', date_limite=date_limite, nombre_lignes=total)
+    return total
+
+
+def _cumuler(mouvements, date_limite):
+    variations = {}
+    for mouvement in mouvements:
+        entrees, sorties = variations.get(mouvement['matiere_premiere_id'], (0, 0))
+        if mouvement['type_mouvement'] == 'entree':
+            entrees += mouvement['quantite']
+        else:
+            sorties += mouvement['quantite']
+        variations[mouvement['matiere_premiere_id']] = (entrees, sorties)
+
+    instantanes = {
+        instantane.matiere_premiere_id: instantane
+        for instantane in InstantaneStock.objects.filter(matiere_premiere_id__in=variations)
+    }
+    for matiere_id, (entrees, sorties) in variations.items():
+        instantane = instantanes.setdefault(matiere_id, InstantaneStock(matiere_premiere_id=matiere_id))
+        instantane.entrees += entrees
+        instantane.sorties += sorties
+        instantane.date_arrete = date_limite
+    InstantaneStock.objects.bulk_create(
+        list(instantanes.values()),
+        update_conflicts=True,
+        unique_fields=['matiere_premiere'],
+        update_fields=['entrees', 'sorties', 'date_arrete'],
+    )
+
+
+def totaux_archives(matiere_ids):
+    """Cumul net archivé par matière"""
+    return {
+        instantane.matiere_premiere_id: instantane.quantite
+        for instantane in InstantaneStock.objects.filter(matiere_premiere_id__in=matiere_ids)
+    }
+
+
+def verifier_instantanes():
+    """Matières dont le cumul archivé diffère de la somme de l'archive (contrôle)"""
+    calcules = {
+        ligne['matiere_premiere_id']: (ligne['entrees'] or 0) - (ligne['sorties'] or 0)
+        for ligne in MouvementStockArchive.objects.values('matiere_premiere_id').annotate(
+            entrees=Sum('quantite', filter=Q(type_mouvement='entree')),
+            sorties=Sum('quantite', filter=Q(type_mouvement='sortie')),
+        )
+    }
+    ecarts = {}
+    for instantane in InstantaneStock.objects.all():
+        attendu = calcules.pop(instantane.matiere_premiere_id, 0)
+        if instantane.quantite != attendu:
+            ecarts[instantane.matiere_premiere_id] = (instantane.quantite, attendu)
+    for matiere_id, attendu in calcules.items():
+        ecarts[matiere_id] = (0, attendu)
+    return ecarts
@@ -0,0 +1,114 @@
+"""Inventaires physiques : feuille de comptage, écarts et ajustements des soldes.
+
+Un inventaire en brouillon reçoit une ligne par matière ; les quantités
+comptées y sont saisies. Les écarts avec les soldes calculés sont obtenus en
+une requête (annotation sur les lignes). La validation verrouille les soldes,
+fige solde théorique et écart sur chaque ligne et enregistre tous les
+ajustements en un seul lot de mouvements, dans une transaction.
+
+Le solde théorique est celui de la date de comptage, reconstitué à partir des
+mouvements : solde courant moins les mouvements postérieurs à cette date. Le
+comptage est réputé fait en fin de journée ; un inventaire validé plusieurs
+jours après le comptage n'impute donc pas à l'écart les mouvements survenus
+entre-temps, qui restent acquis.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from inventory.models import MatierePremiere
+
+from .archives import sources_mouvements
+from .models import Inventaire, LigneInventaire, MouvementStock
+from .services import _verrouiller_soldes, enregistrer_mouvements
+
+
+class InventaireValide(Exception):
+    """Levée quand on tente de modifier ou revalider un inventaire déjà validé"""
+
+
+def creer_inventaire(date_comptage=None, commentaire=''):
+    """Crée un inventaire en brouillon avec une ligne (à compter) par matière"""
+    with transaction.atomic():
+        inventaire = Inventaire.objects.create(
+            date_comptage=date_comptage or timezone.localdate(), commentaire=commentaire,
+        )
+        completer_lignes(inventaire)
+    return inventaire
+
+
+def completer_lignes(inventaire):
+    """Ajoute les lignes des matières absentes de la feuille de comptage"""
+    presentes = inventaire.lignes.values_list('matiere_premiere_id', flat=True)
+    LigneInventaire.objects.bulk_create([
+        LigneInventaire(inventaire=inventaire, matiere_premiere_id=matiere_id)
+        for matiere_id in MatierePremiere.objects.exclude(id__in=presentes).values_list('id', flat=True)
+    ])
+
+
+def solde_au_comptage(depuis=None):
+    """Expression, sur une ligne d'inventaire, du solde de sa matière à la fin du jour de comptage.
+
+    Solde courant moins le net des mouvements datés des jours suivants, sur la
+    table courante et, si ``depuis`` précède la dernière date d'archivage,
+    l'archive (sous-requêtes corrélées).
+    """
+    nul = Value(Decimal('0'))
+    solde = Coalesce(F('matiere_premiere__solde__quantite'), nul)
+    for mouvements in sources_mouvements(depuis):
+        nets = mouvements.filter(
+            matiere_premiere=OuterRef('matiere_premiere_id'),
+            date_mouvement__date__gt=OuterRef('inventaire__date_comptage'),
+        ).values('matiere_premiere').annotate(net=Sum(Case(
+            When(type_mouvement='entree', then=F('quantite')),
+            default=-F('quantite'),
+        ))).values('net')
+        solde = solde - Coalesce(Subquery(nets), nul)
+    return ExpressionWrapper(solde, output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def lignes_avec_ecarts(inventaire):
+    """Lignes annotées du solde à la date de comptage et de l'écart (une seule requête)"""
+    return inventaire.lignes.annotate(
+        solde_calcule=solde_au_comptage(inventaire.date_comptage),
+        ecart_calcule=F('quantite_comptee') - F('solde_calcule'),
+    )
+
+
+def valider_inventaire(inventaire):
+    """Fige les écarts et enregistre les ajustements ; renvoie le nombre de mouvements créés"""
+    with transaction.atomic():
+        inventaire = Inventaire.objects.select_for_update().get(pk=inventaire.pk)
+        if inventaire.statut == 'valide':
+            raise InventaireValide(f"L'inventaire {inventaire.reference} est déjà validé.")
+
+        comptees = inventaire.lignes.filter(quantite_comptee__isnull=False)
+        # Soldes verrouillés avant lecture : aucun mouvement ne s'intercale
+        _verrouiller_soldes(comptees.values_list('matiere_premiere_id', flat=True))
+        lignes = list(lignes_avec_ecarts(inventaire).filter(quantite_comptee__isnull=False))
+
+        ajustements = []
+        for ligne in lignes:
+            ligne.quantite_theorique = ligne.solde_calcule
+            ligne.ecart = ligne.quantite_comptee - ligne.solde_calcule
+            if ligne.ecart:
+                ajustements.append(MouvementStock(
+                    matiere_premiere_id=ligne.matiere_premiere_id,
+                    quantite=abs(ligne.ecart),
+                    type_mouvement='entree' if ligne.ecart > 0 else 'sortie',
+                    description=f"Ajustement d'inventaire {inventaire.reference}",
+                    type_source='ajustement',
+                    reference_source=inventaire.reference,
+                    cle_idempotence=f"inventaire:{inventaire.pk}:{ligne.matiere_premiere_id}",
+                ))
+        LigneInventaire.objects.bulk_update(lignes, ['quantite_theorique', 'ecart'])
+        # L'ajustement ramène le solde au compté, même en deçà de zéro
+        crees = enregistrer_mouvements(ajustements, interdire_negatif=False)
+
+        inventaire.statut = 'valide'
+        inventaire.date_validation = timezone.now()
+        inventaire.save(update_fields=['statut', 'date_validation'])
+    return len(crees)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from production.archives import archiver_lots
+from stock.archives import ARCHIVE_MOIS_DEFAUT, TAILLE_LOT, archiver_mouvements, date_limite_mois, verifier_instantanes
+
+
+class Command(BaseCommand):
+    help = (
+        "Déplace vers les tables d'archive les mouvements de stock et les lots de "
+        "production (commandes facturées) antérieurs aux N derniers mois entiers"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mois', type=int, default=ARCHIVE_MOIS_DEFAUT,
+                            help='Nombre de mois entiers gardés dans les tables courantes')
+        parser.add_argument('--taille-lot', type=int, default=TAILLE_LOT)
+        parser.add_argument('--verifier', action='store_true',
+                            help="Contrôle ensuite les cumuls archivés par matière")
+
+    def handle(self, *args, **options):
+        if options['mois'] < 1:
+            raise CommandError("--mois doit valoir au moins 1.")
+        date_limite = date_limite_mois(options['mois'])
+        self.stdout.write(f"Archivage des données antérieures au {date_limite:%d/%m/%Y}")
+
+        nombre = archiver_mouvements(date_limite, options['taille_lot'])
+        self.stdout.write(f"  mouvements de stock : {nombre} archivé(s)")
+        nombre = archiver_lots(date_limite, options['taille_lot'])
+        self.stdout.write(f"  lots de production  : {nombre} archivé(s)")
+
+        if options['verifier']:
+            ecarts = verifier_instantanes()
+            for matiere_id, (cumul, attendu) in ecarts.items():
+                self.stdout.write(self.style.ERROR(
+                    f"  matière {matiere_id} : cumul {cumul}, archive {attendu}"
+                ))
+            if not ecarts:
+                self.stdout.write(self.style.SUCCESS("  cumuls archivés cohérents"))
@@ -0,0 +1,71 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from inventory.models import MatierePremiere
+from stock.services import enregistrer_mouvement
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le débit des mouvements de stock sous charge concurrente, "
+        "sur une même matière puis sur des matières distinctes "
+        "(à lancer sur PostgreSQL : SQLite sérialise toutes les écritures)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--mouvements', type=int, default=200, help='Mouvements par thread')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        par_thread = options['mouvements']
+        prefixe = f"__bench_{uuid.uuid4().hex[:8]}"
+        matieres = [
+            MatierePremiere.objects.create(nom=f"{prefixe}_{i}", unite_mesure='kg')
+            for i in range(threads)
+        ]
+        try:
+            meme = self._mesurer([matieres[0]] * threads, par_thread, prefixe + '_meme')
+            distinctes = self._mesurer(matieres, par_thread, prefixe + '_distinctes')
+            total = threads * par_thread
+            self.stdout.write(f"{threads} threads x {par_thread} mouvements")
+            self.stdout.write(f"  même matière       : {meme:.2f}s ({total / meme:.0f} mvt/s)")
+            self.stdout.write(f"  matières distinctes: {distinctes:.2f}s ({total / distinctes:.0f} mvt/s)")
+            for matiere in matieres:
+                matiere.refresh_from_db()
+                self.stdout.write(f"  solde {matiere.nom}: {matiere.stock_actuel}")
+        finally:
+            MatierePremiere.objects.filter(nom__startswith=prefixe).delete()
+
+    def _mesurer(self, matieres, par_thread, prefixe):
+        erreurs = []
+
+        def travailler(numero, matiere):
+            try:
+                for i in range(par_thread):
+                    cle = f"{prefixe}:{numero}:{i}"
+                    enregistrer_mouvement(matiere, 1, 'entree', description='bench', cle_idempotence=cle)
+                    # Rejeu volontaire : doit être ignoré grâce à la clé d'idempotence
+                    enregistrer_mouvement(matiere, 1, 'entree', description='bench', cle_idempotence=cle)
+            except Exception as exc:
+                erreurs.append(exc)
+            finally:
+                connection.close()
+
+        debut = time.perf_counter()
+        workers = [
+            threading.Thread(target=travailler, args=(numero, matiere))
+            for numero, matiere in enumerate(matieres)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        duree = time.perf_counter() - debut
+        for erreur in erreurs:
+            self.stderr.write(f"Erreur: {erreur}")
+        return duree
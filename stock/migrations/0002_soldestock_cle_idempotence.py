@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q, Sum
+
+
+def initialiser_soldes(apps, schema_editor):
+    MatierePremiere = apps.get_model('inventory', 'MatierePremiere')
+    MouvementStock = apps.get_model('stock', 'MouvementStock')
+    SoldeStock = apps.get_model('stock', 'SoldeStock')
+    totaux = {
+        ligne['matiere_premiere']: (ligne['entrees'] or 0) - (ligne['sorties'] or 0)
+        for ligne in MouvementStock.objects.values('matiere_premiere').annotate(
+            entrees=Sum('quantite', filter=Q(type_mouvement='entree')),
+            sorties=Sum('quantite', filter=Q(type_mouvement='sortie')),
+        )
+    }
+    SoldeStock.objects.bulk_create([
+        SoldeStock(matiere_premiere_id=matiere_id, quantite=totaux.get(matiere_id, 0))
+        for matiere_id in MatierePremiere.objects.values_list('id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+        ('stock', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mouvementstock',
+            name='cle_idempotence',
+            field=models.CharField(blank=True, editable=False, max_length=100, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='SoldeStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantite', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('date_maj', models.DateTimeField(auto_now=True)),
+                ('matiere_premiere', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='solde', to='inventory.matierepremiere')),
+            ],
+        ),
+        migrations.RunPython(initialiser_soldes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_matierepremiere_date_modification'),
+        ('stock', '0002_soldestock_cle_idempotence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Archivage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(choices=[('stock.mouvementstock', 'Mouvements de stock'), ('production.lotproduction', 'Lots de production')], max_length=30)),
+                ('date_limite', models.DateTimeField()),
+                ('nombre_lignes', models.PositiveIntegerField(default=0)),
+                ('date_execution', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InstantaneStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entrees', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('sorties', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('date_arrete', models.DateTimeField(blank=True, null=True)),
+                ('matiere_premiere', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='instantane', to='inventory.matierepremiere')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MouvementStockArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantite', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('type_mouvement', models.CharField(choices=[('entree', 'Entrée'), ('sortie', 'Sortie')], max_length=6)),
+                ('date_mouvement', models.DateTimeField(db_index=True)),
+                ('description', models.TextField(blank=True)),
+                ('cle_idempotence', models.CharField(blank=True, editable=False, max_length=100, null=True, unique=True)),
+                ('matiere_premiere', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mouvements_archives', to='inventory.matierepremiere')),
+            ],
+        ),
+    ]
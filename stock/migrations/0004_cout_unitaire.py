@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock', '0003_archivage_instantanestock_mouvementstockarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mouvementstock',
+            name='cout_unitaire',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='mouvementstockarchive',
+            name='cout_unitaire',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='soldestock',
+            name='cout_unitaire_moyen',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=12),
+        ),
+    ]
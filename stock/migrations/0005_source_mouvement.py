@@ -0,0 +1,77 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:23
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q
+
+# Clé d'idempotence des déductions de production, sinon leur description d'origine
+CLE_LOT = re.compile(r'^lot:(\d+):')
+DESCRIPTION_LOT = re.compile(r'^Production du lot (\d+)\b')
+
+
+def renseigner_sources(apps, schema_editor):
+    for nom in ('MouvementStock', 'MouvementStockArchive'):
+        modele = apps.get_model('stock', nom)
+        candidats = modele.objects.filter(
+            Q(cle_idempotence__startswith='lot:') | Q(description__startswith='Production du lot ')
+        ).only('id', 'cle_idempotence', 'description')
+        lot = []
+        for mouvement in candidats.iterator(chunk_size=2000):
+            correspondance = CLE_LOT.match(mouvement.cle_idempotence or '') or DESCRIPTION_LOT.match(mouvement.description)
+            if correspondance:
+                mouvement.type_source = 'lot'
+                mouvement.lot_production_id = int(correspondance.group(1))
+                lot.append(mouvement)
+            if len(lot) >= 2000:
+                modele.objects.bulk_update(lot, ['type_source', 'lot_production_id'])
+                lot = []
+        modele.objects.bulk_update(lot, ['type_source', 'lot_production_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_matierepremiere_date_modification'),
+        ('production', '0003_lotproductionarchive'),
+        ('stock', '0004_cout_unitaire'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mouvementstock',
+            name='lot_production',
+            field=models.ForeignKey(blank=True, db_constraint=False, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='mouvements_stock', to='production.lotproduction'),
+        ),
+        migrations.AddField(
+            model_name='mouvementstock',
+            name='reference_source',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='mouvementstock',
+            name='type_source',
+            field=models.CharField(choices=[('saisie', 'Saisie manuelle'), ('lot', 'Lot de production'), ('reception', 'Réception fournisseur'), ('ajustement', "Ajustement d'inventaire")], default='saisie', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='mouvementstockarchive',
+            name='lot_production_id',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mouvementstockarchive',
+            name='reference_source',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='mouvementstockarchive',
+            name='type_source',
+            field=models.CharField(choices=[('saisie', 'Saisie manuelle'), ('lot', 'Lot de production'), ('reception', 'Réception fournisseur'), ('ajustement', "Ajustement d'inventaire")], default='saisie', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='mouvementstock',
+            index=models.Index(fields=['type_source', 'reference_source'], name='mvt_source_reference_idx'),
+        ),
+        migrations.RunPython(renseigner_sources, migrations.RunPython.noop),
+    ]
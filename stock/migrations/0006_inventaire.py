@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_matierepremiere_date_modification'),
+        ('stock', '0005_source_mouvement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Inventaire',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_comptage', models.DateField()),
+                ('statut', models.CharField(choices=[('brouillon', 'Brouillon'), ('valide', 'Validé')], default='brouillon', max_length=10)),
+                ('commentaire', models.TextField(blank=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_validation', models.DateTimeField(blank=True, editable=False, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LigneInventaire',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantite_comptee', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('quantite_theorique', models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True)),
+                ('ecart', models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True)),
+                ('inventaire', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lignes', to='stock.inventaire')),
+                ('matiere_premiere', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lignes_inventaire', to='inventory.matierepremiere')),
+            ],
+            options={
+                'unique_together': {('inventaire', 'matiere_premiere')},
+            },
+        ),
+    ]
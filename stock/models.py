@@ -6,12 +6,127 @@ class MouvementStock(models.Model):
         ('entree', 'Entrée'),
         ('sortie', 'Sortie'),
     ]
+    TYPE_SOURCE_CHOICES = [
+        ('saisie', 'Saisie manuelle'),
+        ('lot', 'Lot de production'),
+        ('reception', 'Réception fournisseur'),
+        ('ajustement', "Ajustement d'inventaire"),
+    ]
 
     matiere_premiere = models.ForeignKey(MatierePremiere, on_delete=models.CASCADE)
     quantite = models.DecimalField(max_digits=10, decimal_places=2)
     type_mouvement = models.CharField(max_length=6, choices=TYPE_MOUVEMENT_CHOICES)
     date_mouvement = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True)
+    # Prix d'achat unitaire pour une entrée ; coût moyen pondéré du moment pour une sortie
+    cout_unitaire = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    # Document source : lot de production, ou référence de réception / d'ajustement
+    type_source = models.CharField(max_length=10, choices=TYPE_SOURCE_CHOICES, default='saisie')
+    # Sans contrainte en base : le lot peut partir dans l'archive (production.archives)
+    lot_production = models.ForeignKey(
+        'production.LotProduction', null=True, blank=True, on_delete=models.DO_NOTHING,
+        db_constraint=False, related_name='mouvements_stock', editable=False,
+    )
+    reference_source = models.CharField(max_length=50, blank=True)
+    # Clé fournie par le document source (lot, réception...) pour ignorer les doublons
+    cle_idempotence = models.CharField(max_length=100, unique=True, null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['type_source', 'reference_source'], name='mvt_source_reference_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_type_mouvement_display()} de {self.quantite} {self.matiere_premiere.unite_mesure} de {self.matiere_premiere.nom}"
+
+class SoldeStock(models.Model):
+    """Solde courant d'une matière première, verrouillé à chaque mouvement"""
+    matiere_premiere = models.OneToOneField(MatierePremiere, related_name='solde', on_delete=models.CASCADE)
+    quantite = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Coût moyen pondéré, mis à jour à chaque entrée valorisée
+    cout_unitaire_moyen = models.DecimalField(max_digits=12, decimal_places=4, default=0)
+    date_maj = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Solde de {self.matiere_premiere.nom}: {self.quantite} {self.matiere_premiere.unite_mesure}"
+
+class MouvementStockArchive(models.Model):
+    """Mouvement d'une période close, déplacé hors de la table courante (voir stock.archives)"""
+    # Identifiant d'origine conservé
+    id = models.BigIntegerField(primary_key=True)
+    matiere_premiere = models.ForeignKey(MatierePremiere, related_name='mouvements_archives', on_delete=models.CASCADE)
+    quantite = models.DecimalField(max_digits=10, decimal_places=2)
+    type_mouvement = models.CharField(max_length=6, choices=MouvementStock.TYPE_MOUVEMENT_CHOICES)
+    date_mouvement = models.DateTimeField(db_index=True)
+    description = models.TextField(blank=True)
+    cout_unitaire = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    type_source = models.CharField(max_length=10, choices=MouvementStock.TYPE_SOURCE_CHOICES, default='saisie')
+    # Identifiant du lot, dans LotProduction ou LotProductionArchive
+    lot_production_id = models.BigIntegerField(null=True, blank=True, db_index=True)
+    reference_source = models.CharField(max_length=50, blank=True)
+    cle_idempotence = models.CharField(max_length=100, unique=True, null=True, blank=True, editable=False)
+
+    def __str__(self):
+        return f"{self.get_type_mouvement_display()} de {self.quantite} {self.matiere_premiere.unite_mesure} de {self.matiere_premiere.nom} (archivé)"
+
+class InstantaneStock(models.Model):
+    """Cumul des mouvements archivés d'une matière : solde = cumul + mouvements courants"""
+    matiere_premiere = models.OneToOneField(MatierePremiere, related_name='instantane', on_delete=models.CASCADE)
+    entrees = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    sorties = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    date_arrete = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def quantite(self):
+        return self.entrees - self.sorties
+
+    def __str__(self):
+        return f"Cumul archivé de {self.matiere_premiere.nom} au {self.date_arrete}"
+
+class Archivage(models.Model):
+    """Journal des archivages ; la dernière date limite sépare table courante et archive"""
+    TABLE_CHOICES = [
+        ('stock.mouvementstock', 'Mouvements de stock'),
+        ('production.lotproduction', 'Lots de production'),
+    ]
+    table = models.CharField(max_length=30, choices=TABLE_CHOICES)
+    date_limite = models.DateTimeField()
+    nombre_lignes = models.PositiveIntegerField(default=0)
+    date_execution = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archivage {self.get_table_display()} avant le {self.date_limite:%d/%m/%Y}"
+
+class Inventaire(models.Model):
+    """Comptage physique des matières ; sa validation ajuste les soldes (voir stock.inventaires)"""
+    STATUT_CHOICES = [
+        ('brouillon', 'Brouillon'),
+        ('valide', 'Validé'),
+    ]
+    date_comptage = models.DateField()
+    statut = models.CharField(max_length=10, choices=STATUT_CHOICES, default='brouillon')
+    commentaire = models.TextField(blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_validation = models.DateTimeField(null=True, blank=True, editable=False)
+
+    @property
+    def reference(self):
+        return f"INV-{self.pk}"
+
+    def __str__(self):
+        return f"Inventaire {self.reference} du {self.date_comptage:%d/%m/%Y}"
+
+class LigneInventaire(models.Model):
+    inventaire = models.ForeignKey(Inventaire, related_name='lignes', on_delete=models.CASCADE)
+    matiere_premiere = models.ForeignKey(MatierePremiere, related_name='lignes_inventaire', on_delete=models.CASCADE)
+    # Vide tant que la matière n'est pas comptée : pas d'ajustement
+    quantite_comptee = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    # Solde calculé à la date de comptage et écart, figés à la validation
+    quantite_theorique = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
+    ecart = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
+
+    class Meta:
+        unique_together = ('inventaire', 'matiere_premiere')
+
+    def __str__(self):
+        return f"{self.matiere_premiere.nom}: {self.quantite_comptee} compté(s)"
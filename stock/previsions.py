@@ -0,0 +1,190 @@
+"""Prévision de consommation des matières premières.
+
+La consommation quotidienne de chaque matière est lue en une requête groupée
+sur les sorties des derniers jours, puis rangée dans une matrice matières ×
+jours. Moyenne et tendance (droite des moindres carrés) sont calculées pour
+toutes les matières à la fois avec NumPy.
+
+Les ordres de production planifiés donnent un second besoin, certain : volume
+restant à produire par jour, multiplié par la matrice de composition des
+formules. Le besoin cumulé retenu est, jour après jour, le plus grand des deux
+(la tendance couvre la demande non encore planifiée) ; la rupture est le
+premier jour où il dépasse le stock. Les deux besoins sont rangés sur les
+mêmes jours, le premier étant aujourd'hui : la rupture au jour ``n`` tombe le
+``aujourd'hui + n``.
+
+La prévision est mise en cache tant qu'aucun mouvement, ordre, solde, matière
+ou formule n'a changé (et au plus jusqu'au lendemain).
+"""
+import hashlib
+from dataclasses import dataclass
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from formulas.models import CompositionFormule, FormuleBeton
+from inventory.models import MatierePremiere
+from production.models import LotProduction, OrdreProduction
+
+from .models import MouvementStock, SoldeStock
+
+HISTORIQUE_JOURS = 90
+HORIZON_JOURS = 180
+STATUTS_A_PRODUIRE = ['planifie', 'en_cours']
+# Les ajustements d'inventaire corrigent le stock, ils ne sont pas consommés
+SOURCES_CONSOMMATION = ['lot', 'saisie']
+
+
+@dataclass
+class Prevision:
+    matiere_id: int
+    matiere: str
+    unite: str
+    stock: float
+    consommation_moyenne: float
+    tendance: float
+    besoin_planifie: float
+    jours_avant_rupture: int = None
+
+    @property
+    def date_rupture(self):
+        if self.jours_avant_rupture is None:
+            return None
+        return timezone.localdate() + timedelta(days=self.jours_avant_rupture)
+
+    @property
+    def a_commander(self):
+        delai = getattr(settings, 'STOCK_DELAI_APPROVISIONNEMENT', 7)
+        return self.jours_avant_rupture is not None and self.jours_avant_rupture <= delai
+
+
+def _historique(matieres, aujourd_hui, jours):
+    """Matrice (matières × jours) des quantités sorties, le dernier jour étant la veille"""
+    debut = aujourd_hui - timedelta(days=jours)
+    index = {matiere_id: i for i, matiere_id in enumerate(matieres)}
+    lignes = list(MouvementStock.objects.filter(
+        type_mouvement='sortie',
+        type_source__in=SOURCES_CONSOMMATION,
+        date_mouvement__date__gte=debut,
+        date_mouvement__date__lt=aujourd_hui,
+        matiere_premiere_id__in=matieres,
+    ).annotate(jour=TruncDate('date_mouvement')).values('matiere_premiere_id', 'jour').annotate(
+        quantite=Sum('quantite')
+    ).values_list('matiere_premiere_id', 'jour', 'quantite'))
+
+    historique = np.zeros((len(matieres), jours))
+    if lignes:
+        lignes_idx = np.array([index[matiere_id] for matiere_id, _, _ in lignes])
+        jours_idx = np.array([(jour - debut).days for _, jour, _ in lignes])
+        np.add.at(historique, (lignes_idx, jours_idx), np.array([float(q) for _, _, q in lignes]))
+    return historique
+
+
+def _tendance(historique):
+    """Consommation moyenne, pente (par jour) et ordonnée à l'origine (premier jour de l'historique), par matière"""
+    jours = historique.shape[1]
+    x = np.arange(jours)
+    moyenne = historique.mean(axis=1)
+    # Moindres carrés pour toutes les matières à la fois : pente = cov(x, y) / var(x)
+    x_centre = x - x.mean()
+    pente = (historique - moyenne[:, None]) @ x_centre / (x_centre @ x_centre)
+    origine = moyenne - pente * x.mean()
+    return moyenne, pente, origine
+
+
+def _besoins_planifies(matieres, aujourd_hui, horizon):
+    """Matrice (matières × jours) des besoins des ordres restant à produire, le jour 0 étant aujourd'hui"""
+    ordres = OrdreProduction.objects.filter(statut__in=STATUTS_A_PRODUIRE)
+    produit = dict(
+        LotProduction.objects.filter(ordre_production__in=ordres).values('ordre_production_id').annotate(
+            total=Sum('quantite_produite')
+        ).values_list('ordre_production_id', 'total')
+    )
+    planifies = list(ordres.values_list('id', 'formule_id', 'quantite_produire', 'date_production'))
+    formules = sorted({formule_id for _, formule_id, _, _ in planifies})
+    besoins = np.zeros((len(matieres), horizon))
+    if not formules:
+        return besoins
+
+    # Volumes restants (formules × jours) ; un ordre en retard compte pour aujourd'hui
+    index_formule = {formule_id: i for i, formule_id in enumerate(formules)}
+    volumes = np.zeros((len(formules), horizon))
+    for ordre_id, formule_id, quantite, jour in planifies:
+        reste = float(quantite - (produit.get(ordre_id) or 0))
+        decalage = max((jour - aujourd_hui).days, 0)
+        if reste > 0 and decalage < horizon:
+            volumes[index_formule[formule_id], decalage] += reste
+
+    # Composition par m³ (matières × formules)
+    index_matiere = {matiere_id: i for i, matiere_id in enumerate(matieres)}
+    composition = np.zeros((len(matieres), len(formules)))
+    for formule_id, matiere_id, quantite, reference in CompositionFormule.objects.filter(
+        formule_id__in=formules, matiere_premiere_id__in=matieres,
+    ).values_list('formule_id', 'matiere_premiere_id', 'quantite', 'formule__quantite_produite_reference'):
+        if reference:
+            composition[index_matiere[matiere_id], index_formule[formule_id]] = float(quantite / reference)
+    return composition @ volumes
+
+
+def calculer_previsions(aujourd_hui=None, historique_jours=HISTORIQUE_JOURS, horizon=HORIZON_JOURS):
+    aujourd_hui = aujourd_hui or timezone.localdate()
+    matieres = list(MatierePremiere.objects.order_by('nom').values_list('id', 'nom', 'unite_mesure'))
+    if not matieres:
+        return []
+    ids = [matiere_id for matiere_id, _, _ in matieres]
+    soldes = dict(SoldeStock.objects.filter(matiere_premiere_id__in=ids).values_list('matiere_premiere_id', 'quantite'))
+    stock = np.array([float(soldes.get(matiere_id) or 0) for matiere_id in ids])
+
+    moyenne, pente, origine = _tendance(_historique(ids, aujourd_hui, historique_jours))
+    # Jours de l'horizon, aujourd'hui en premier, repérés sur l'axe de l'historique (qui finit la veille) ;
+    # la tendance et les besoins planifiés partagent ainsi le même jour 0
+    jours = historique_jours + np.arange(horizon)
+    # Projection de la tendance, jamais négative
+    tendance = np.clip(origine[:, None] + pente[:, None] * jours, 0, None)
+    planifie = _besoins_planifies(ids, aujourd_hui, horizon)
+    besoin = np.maximum(np.cumsum(tendance, axis=1), np.cumsum(planifie, axis=1))
+
+    depasse = besoin > stock[:, None]
+    rupture = np.where(depasse.any(axis=1), depasse.argmax(axis=1), -1)
+
+    return [
+        Prevision(
+            matiere_id=matiere_id,
+            matiere=nom,
+            unite=unite,
+            stock=float(stock[i]),
+            consommation_moyenne=float(moyenne[i]),
+            tendance=float(pente[i]),
+            besoin_planifie=float(planifie[i].sum()),
+            jours_avant_rupture=int(rupture[i]) if rupture[i] >= 0 else None,
+        )
+        for i, (matiere_id, nom, unite) in enumerate(matieres)
+    ]
+
+
+def _version():
+    """Empreinte des données sources : tout nouveau mouvement, ordre ou changement de formule la change"""
+    etats = (
+        timezone.localdate(),
+        # Tout mouvement (création ou suppression) touche aussi la date du solde
+        MouvementStock.objects.aggregate(dernier=Max('pk')),
+        OrdreProduction.objects.aggregate(nombre=Count('pk'), derniere=Max('date_modification')),
+        SoldeStock.objects.aggregate(derniere=Max('date_maj')),
+        MatierePremiere.objects.aggregate(nombre=Count('pk'), derniere=Max('date_modification')),
+        # Quantité de référence des formules et quantités de leur composition
+        FormuleBeton.objects.aggregate(nombre=Count('pk'), derniere=Max('date_modification')),
+        CompositionFormule.objects.aggregate(
+            nombre=Count('pk'), cle_max=Max('pk'), derniere=Max('date_modification'),
+        ),
+    )
+    return hashlib.md5(repr(etats).encode(), usedforsecurity=False).hexdigest()
+
+
+def previsions():
+    """Prévisions en cache, recalculées quand les mouvements ou les ordres changent"""
+    return cache.get_or_set(f'stock:previsions:{_version()}', calculer_previsions, 24 * 3600)
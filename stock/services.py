@@ -0,0 +1,225 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .models import MouvementStock, MouvementStockArchive, SoldeStock
+
+PRECISION_QUANTITE = Decimal('0.01')
+PRECISION_COUT = Decimal('0.0001')
+
+
+class StockInsuffisant(Exception):
+    """Levée quand un mouvement ferait passer le stock d'une matière sous zéro"""
+
+    def __init__(self, matiere_premiere_id, disponible, demande):
+        self.matiere_premiere_id = matiere_premiere_id
+        self.disponible = disponible
+        self.demande = demande
+        super().__init__(
+            f"Stock insuffisant pour la matière {matiere_premiere_id}: "
+            f"{disponible} disponible, {demande} demandé"
+        )
+
+
+def _variation(mouvement):
+    return mouvement.quantite if mouvement.type_mouvement == 'entree' else -mouvement.quantite
+
+
+def _valoriser(solde, mouvement):
+    """Met à jour le coût moyen pondéré du solde ; renvoie True s'il a changé.
+
+    Une entrée au prix connu pondère le coût moyen par le stock disponible
+    (un stock négatif compte pour zéro) ; une sortie est valorisée au coût moyen
+    du moment.
+    """
+    if mouvement.type_mouvement == 'sortie':
+        mouvement.cout_unitaire = solde.cout_unitaire_moyen
+        return False
+    if mouvement.cout_unitaire is None or mouvement.quantite <= 0:
+        return False
+    mouvement.cout_unitaire = Decimal(mouvement.cout_unitaire).quantize(PRECISION_COUT)
+    disponible = max(solde.quantite, Decimal('0'))
+    cout = (
+        (disponible * solde.cout_unitaire_moyen + mouvement.quantite * mouvement.cout_unitaire)
+        / (disponible + mouvement.quantite)
+    ).quantize(PRECISION_COUT)
+    if cout == solde.cout_unitaire_moyen:
+        return False
+    solde.cout_unitaire_moyen = cout
+    return True
+
+
+def _verrouiller_soldes(matiere_ids):
+    """Verrouille (select_for_update) les soldes des matières, en les créant au besoin.
+
+    Les lignes sont toujours verrouillées dans l'ordre des matières pour éviter
+    les interblocages ; seules les matières concernées sont bloquées.
+    """
+    matiere_ids = sorted(set(matiere_ids))
+    soldes = {
+        solde.matiere_premiere_id: solde
+        for solde in SoldeStock.objects.select_for_update().filter(
+            matiere_premiere_id__in=matiere_ids
+        ).order_by('matiere_premiere_id')
+    }
+    manquants = [matiere_id for matiere_id in matiere_ids if matiere_id not in soldes]
+    if manquants:
+        SoldeStock.objects.bulk_create(
+            [SoldeStock(matiere_premiere_id=matiere_id) for matiere_id in manquants],
+            ignore_conflicts=True,
+        )
+        soldes.update({
+            solde.matiere_premiere_id: solde
+            for solde in SoldeStock.objects.select_for_update().filter(
+                matiere_premiere_id__in=manquants
+            ).order_by('matiere_premiere_id')
+        })
+    return soldes
+
+
+def enregistrer_mouvements(mouvements, interdire_negatif=None):
+    """Enregistre des mouvements de stock et met à jour les soldes dans une transaction.
+
+    Les mouvements dont la clé d'idempotence existe déjà sont ignorés : leur
+    ``pk`` est renseigné avec celui du mouvement existant. Si ``interdire_negatif``
+    est vrai (par défaut ``settings.STOCK_INTERDIRE_NEGATIF``), un mouvement qui
+    rendrait un solde négatif lève ``StockInsuffisant`` et rien n'est écrit.
+
+    Les entrées portant un ``cout_unitaire`` mettent à jour le coût moyen pondéré
+    de la matière ; les coûts des formules qui l'utilisent sont recalculés après
+    validation.
+
+    Renvoie la liste des mouvements effectivement créés.
+    """
+    if interdire_negatif is None:
+        interdire_negatif = getattr(settings, 'STOCK_INTERDIRE_NEGATIF', False)
+    mouvements = list(mouvements)
+    if not mouvements:
+        return []
+
+    for mouvement in mouvements:
+        mouvement.quantite = Decimal(mouvement.quantite).quantize(PRECISION_QUANTITE)
+
+    with transaction.atomic():
+        soldes = _verrouiller_soldes(m.matiere_premiere_id for m in mouvements)
+
+        # Les verrous sont pris : un doublon concurrent est forcément déjà commité
+        cles = [m.cle_idempotence for m in mouvements if m.cle_idempotence]
+        existants = {}
+        if cles:
+            # Une clé rejouée après archivage de son mouvement reste un doublon
+            for modele in (MouvementStock, MouvementStockArchive):
+                existants.update(
+                    modele.objects.filter(cle_idempotence__in=cles).values_list('cle_idempotence', 'pk')
+                )
+
+        a_creer = []
+        cles_du_lot = set()
+        for mouvement in mouvements:
+            cle = mouvement.cle_idempotence
+            if cle in existants:
+                mouvement.pk = existants[cle]
+                mouvement._state.adding = False
+                continue
+            if cle in cles_du_lot:
+                continue
+            if cle:
+                cles_du_lot.add(cle)
+            a_creer.append(mouvement)
+
+        modifies = {}
+        couts_modifies = set()
+        for mouvement in a_creer:
+            solde = soldes[mouvement.matiere_premiere_id]
+            if _valoriser(solde, mouvement):
+                couts_modifies.add(solde.matiere_premiere_id)
+            solde.quantite += _variation(mouvement)
+            modifies[solde.matiere_premiere_id] = solde
+            if interdire_negatif and mouvement.type_mouvement == 'sortie' and solde.quantite < 0:
+                raise StockInsuffisant(
+                    mouvement.matiere_premiere_id,
+                    solde.quantite + mouvement.quantite,
+                    mouvement.quantite,
+                )
+
+        crees = MouvementStock.objects.bulk_create(a_creer)
+        maintenant = timezone.now()
+        for solde in modifies.values():
+            solde.date_maj = maintenant
+        SoldeStock.objects.bulk_update(modifies.values(), ['quantite', 'cout_unitaire_moyen', 'date_maj'])
+
+        if couts_modifies:
+            from formulas.services import planifier_recalcul_couts
+            planifier_recalcul_couts(matiere_ids=couts_modifies)
+
+    return crees
+
+
+def enregistrer_mouvement(matiere_premiere, quantite, type_mouvement, description='',
+                          cle_idempotence=None, interdire_negatif=None, cout_unitaire=None):
+    """Raccourci pour enregistrer un seul mouvement ; renvoie le mouvement (créé ou existant)"""
+    mouvement = MouvementStock(
+        matiere_premiere=matiere_premiere,
+        quantite=quantite,
+        type_mouvement=type_mouvement,
+        description=description,
+        cout_unitaire=cout_unitaire,
+        cle_idempotence=cle_idempotence,
+    )
+    enregistrer_mouvements([mouvement], interdire_negatif=interdire_negatif)
+    return mouvement
+
+
+def supprimer_mouvements(queryset):
+    """Supprime des mouvements en annulant leur effet sur les soldes.
+
+    Le coût moyen pondéré n'est pas recalculé : il reflète les achats passés.
+    """
+    with transaction.atomic():
+        mouvements = list(queryset.select_for_update().only('pk', 'matiere_premiere_id', 'quantite', 'type_mouvement'))
+        if not mouvements:
+            return 0
+        soldes = _verrouiller_soldes(m.matiere_premiere_id for m in mouvements)
+        for mouvement in mouvements:
+            soldes[mouvement.matiere_premiere_id].quantite -= _variation(mouvement)
+        maintenant = timezone.now()
+        for solde in soldes.values():
+            solde.date_maj = maintenant
+        SoldeStock.objects.bulk_update(soldes.values(), ['quantite', 'date_maj'])
+        MouvementStock.objects.filter(pk__in=[m.pk for m in mouvements]).delete()
+    return len(mouvements)
+
+
+def recalculer_soldes(matiere_ids=None):
+    """Recalcule les soldes à partir de l'historique des mouvements (réparation).
+
+    Les mouvements archivés comptent via leur cumul (``InstantaneStock``).
+    """
+    from inventory.models import MatierePremiere
+    from .archives import totaux_archives
+
+    if matiere_ids is None:
+        matiere_ids = MatierePremiere.objects.values_list('id', flat=True)
+    with transaction.atomic():
+        soldes = _verrouiller_soldes(matiere_ids)
+        totaux = MouvementStock.objects.filter(
+            matiere_premiere_id__in=soldes.keys()
+        ).values('matiere_premiere_id').annotate(
+            entrees=Sum('quantite', filter=Q(type_mouvement='entree')),
+            sorties=Sum('quantite', filter=Q(type_mouvement='sortie')),
+        )
+        calcules = totaux_archives(soldes.keys())
+        for ligne in totaux:
+            calcules[ligne['matiere_premiere_id']] = (
+                calcules.get(ligne['matiere_premiere_id'], 0)
+                + (ligne['entrees'] or 0) - (ligne['sorties'] or 0)
+            )
+        maintenant = timezone.now()
+        for matiere_id, solde in soldes.items():
+            solde.quantite = calcules.get(matiere_id, Decimal('0'))
+            solde.date_maj = maintenant
+        SoldeStock.objects.bulk_update(soldes.values(), ['quantite', 'date_maj'])
+    return soldes
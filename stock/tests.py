@@ -1,3 +1,228 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from customers.models import Chantier, Client
+from formulas.models import CompositionFormule, FormuleBeton
+from inventory.models import MatierePremiere
+from orders.models import Commande
+from production.models import OrdreProduction
+from .admin import MouvementStockForm
+from .inventaires import InventaireValide, creer_inventaire, lignes_avec_ecarts, valider_inventaire
+from .models import LigneInventaire, MouvementStock, SoldeStock
+from .previsions import _version, calculer_previsions, previsions
+from .services import (
+    StockInsuffisant, enregistrer_mouvement, enregistrer_mouvements, recalculer_soldes, supprimer_mouvements,
+)
+
+
+class ServiceMouvementsTests(TestCase):
+    def setUp(self):
+        self.ciment = MatierePremiere.objects.create(nom='Ciment', unite_mesure='kg')
+        self.sable = MatierePremiere.objects.create(nom='Sable', unite_mesure='t')
+
+    def solde(self, matiere):
+        return SoldeStock.objects.get(matiere_premiere=matiere).quantite
+
+    def test_entree_et_sortie_mettent_a_jour_le_solde(self):
+        enregistrer_mouvement(self.ciment, 100, 'entree')
+        enregistrer_mouvement(self.ciment, Decimal('30.5'), 'sortie')
+        self.assertEqual(self.solde(self.ciment), Decimal('69.50'))
+
+    def test_cle_idempotence_rejouee_ignoree(self):
+        premier = enregistrer_mouvement(self.ciment, 100, 'entree', cle_idempotence='reception:1')
+        rejoue = enregistrer_mouvement(self.ciment, 100, 'entree', cle_idempotence='reception:1')
+        self.assertEqual(rejoue.pk, premier.pk)
+        self.assertEqual(MouvementStock.objects.count(), 1)
+        self.assertEqual(self.solde(self.ciment), 100)
+
+    def test_cle_en_double_dans_un_meme_lot(self):
+        crees = enregistrer_mouvements([
+            MouvementStock(matiere_premiere=self.ciment, quantite=10, type_mouvement='entree', cle_idempotence='k'),
+            MouvementStock(matiere_premiere=self.ciment, quantite=10, type_mouvement='entree', cle_idempotence='k'),
+        ])
+        self.assertEqual(len(crees), 1)
+        self.assertEqual(self.solde(self.ciment), 10)
+
+    def test_stock_negatif_interdit_n_ecrit_rien(self):
+        enregistrer_mouvement(self.ciment, 50, 'entree')
+        enregistrer_mouvement(self.sable, 5, 'entree')
+        with self.assertRaises(StockInsuffisant) as erreur:
+            enregistrer_mouvements([
+                MouvementStock(matiere_premiere=self.sable, quantite=1, type_mouvement='sortie'),
+                MouvementStock(matiere_premiere=self.ciment, quantite=80, type_mouvement='sortie'),
+            ], interdire_negatif=True)
+        self.assertEqual(erreur.exception.matiere_premiere_id, self.ciment.id)
+        self.assertEqual(erreur.exception.disponible, 50)
+        self.assertEqual(MouvementStock.objects.filter(type_mouvement='sortie').count(), 0)
+        self.assertEqual(self.solde(self.ciment), 50)
+        self.assertEqual(self.solde(self.sable), 5)
+
+    def test_stock_negatif_permis_par_defaut(self):
+        enregistrer_mouvement(self.ciment, 20, 'sortie')
+        self.assertEqual(self.solde(self.ciment), -20)
+
+    def test_suppression_annule_l_effet_sur_le_solde(self):
+        enregistrer_mouvement(self.ciment, 100, 'entree')
+        enregistrer_mouvement(self.ciment, 40, 'sortie', description='à annuler')
+        self.assertEqual(supprimer_mouvements(MouvementStock.objects.filter(description='à annuler')), 1)
+        self.assertEqual(self.solde(self.ciment), 100)
+
+    def test_recalculer_soldes_repare_un_solde_faux(self):
+        enregistrer_mouvement(self.ciment, 100, 'entree')
+        enregistrer_mouvement(self.ciment, 25, 'sortie')
+        SoldeStock.objects.filter(matiere_premiere=self.ciment).update(quantite=999)
+        recalculer_soldes([self.ciment.id])
+        self.assertEqual(self.solde(self.ciment), 75)
+
+
+class FormulaireMouvementTests(TestCase):
+    def test_source_lot_reservee_a_la_production(self):
+        choix = [valeur for valeur, _ in MouvementStockForm().fields['type_source'].choices]
+        self.assertEqual(choix, ['saisie', 'reception', 'ajustement'])
+
+
+class InventaireTests(TestCase):
+    def setUp(self):
+        self.ciment = MatierePremiere.objects.create(nom='Ciment', unite_mesure='kg')
+        self.sable = MatierePremiere.objects.create(nom='Sable', unite_mesure='t')
+        self.hier = timezone.localdate() - timedelta(days=1)
+        enregistrer_mouvement(self.ciment, 100, 'entree')
+        enregistrer_mouvement(self.sable, 40, 'entree')
+        # Stock constitué la veille, jour du comptage
+        MouvementStock.objects.update(date_mouvement=timezone.now() - timedelta(days=1))
+        self.inventaire = creer_inventaire(self.hier)
+
+    def compter(self, matiere, quantite):
+        LigneInventaire.objects.filter(inventaire=self.inventaire, matiere_premiere=matiere).update(
+            quantite_comptee=quantite,
+        )
+
+    def solde(self, matiere):
+        return SoldeStock.objects.get(matiere_premiere=matiere).quantite
+
+    def test_une_ligne_par_matiere(self):
+        self.assertEqual(self.inventaire.lignes.count(), 2)
+
+    def test_validation_ajuste_au_compte(self):
+        self.compter(self.ciment, 90)
+        self.assertEqual(valider_inventaire(self.inventaire), 1)
+        ligne = self.inventaire.lignes.get(matiere_premiere=self.ciment)
+        self.assertEqual((ligne.quantite_theorique, ligne.ecart), (100, -10))
+        self.assertEqual(self.solde(self.ciment), 90)
+        # Matière non comptée : ni écart ni ajustement
+        self.assertIsNone(self.inventaire.lignes.get(matiere_premiere=self.sable).ecart)
+        self.assertEqual(self.solde(self.sable), 40)
+        ajustement = MouvementStock.objects.get(type_source='ajustement')
+        self.assertEqual(ajustement.reference_source, self.inventaire.reference)
+
+    def test_mouvements_posterieurs_au_comptage_conserves(self):
+        self.compter(self.ciment, 90)
+        enregistrer_mouvement(self.ciment, 30, 'sortie')
+        self.assertEqual(lignes_avec_ecarts(self.inventaire).get(matiere_premiere=self.ciment).solde_calcule, 100)
+        valider_inventaire(self.inventaire)
+        ligne = self.inventaire.lignes.get(matiere_premiere=self.ciment)
+        self.assertEqual((ligne.quantite_theorique, ligne.ecart), (100, -10))
+        # La sortie du jour reste acquise après l'ajustement de l'écart compté
+        self.assertEqual(self.solde(self.ciment), 60)
+
+    def test_revalidation_refusee(self):
+        self.compter(self.ciment, 90)
+        valider_inventaire(self.inventaire)
+        with self.assertRaises(InventaireValide):
+            valider_inventaire(self.inventaire)
+        self.assertEqual(self.solde(self.ciment), 90)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_feuille_de_comptage_admin(self):
+        self.compter(self.ciment, 90)
+        enregistrer_mouvement(self.ciment, 30, 'sortie')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'x'))
+        reponse = self.client.get(f'/admin/stock/inventaire/{self.inventaire.pk}/change/')
+        self.assertEqual(reponse.status_code, 200)
+        ligne = reponse.context['inline_admin_formsets'][0].formset.queryset.get(matiere_premiere=self.ciment)
+        self.assertEqual((ligne.solde_calcule, ligne.ecart_calcule), (100, -10))
+
+
+class PrevisionsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ciment = MatierePremiere.objects.create(nom='Ciment', unite_mesure='kg')
+        self.formule = FormuleBeton.objects.create(nom='B25', resistance_requise='C25/30')
+        self.composition = CompositionFormule.objects.create(
+            formule=self.formule, matiere_premiere=self.ciment, quantite=350,
+        )
+        client = Client.objects.create(nom='Client', adresse='1 rue A, Rabat')
+        chantier = Chantier.objects.create(nom='Chantier', adresse='2 rue B, Rabat', client=client)
+        commande = Commande.objects.create(client=client, chantier=chantier, date_livraison_souhaitee=date(2030, 1, 1))
+        self.aujourd_hui = timezone.localdate()
+        OrdreProduction.objects.create(
+            commande=commande, formule=self.formule, quantite_produire=4,
+            date_production=self.aujourd_hui + timedelta(days=3),
+        )
+        enregistrer_mouvement(self.ciment, 2000, 'entree')
+
+    def test_rupture_par_les_ordres_planifies(self):
+        [prevision] = calculer_previsions(self.aujourd_hui)
+        self.assertEqual(prevision.besoin_planifie, 1400)
+        self.assertIsNone(prevision.jours_avant_rupture)
+        OrdreProduction.objects.update(quantite_produire=8)
+        [prevision] = calculer_previsions(self.aujourd_hui)
+        self.assertEqual(prevision.jours_avant_rupture, 3)
+        self.assertTrue(prevision.a_commander)
+
+    def test_tendance_des_sorties(self):
+        enregistrer_mouvement(self.ciment, 90, 'sortie')
+        MouvementStock.objects.filter(type_mouvement='sortie').update(
+            date_mouvement=timezone.now() - timedelta(days=1),
+        )
+        # L'ajustement d'inventaire n'est pas une consommation
+        enregistrer_mouvements([MouvementStock(
+            matiere_premiere=self.ciment, quantite=500, type_mouvement='sortie', type_source='ajustement',
+        )])
+        MouvementStock.objects.filter(type_source='ajustement').update(
+            date_mouvement=timezone.now() - timedelta(days=2),
+        )
+        [prevision] = calculer_previsions(self.aujourd_hui, historique_jours=10)
+        self.assertAlmostEqual(prevision.consommation_moyenne, 9)
+        self.assertGreater(prevision.tendance, 0)
+
+    def consommer(self, quantite, jours):
+        """Une sortie de ``quantite`` sur chacun des ``jours`` derniers jours"""
+        for decalage in range(1, jours + 1):
+            mouvement = enregistrer_mouvement(self.ciment, quantite, 'sortie')
+            MouvementStock.objects.filter(pk=mouvement.pk).update(
+                date_mouvement=timezone.now() - timedelta(days=decalage),
+            )
+
+    def test_tendance_et_ordres_sur_les_memes_jours(self):
+        # Stock de 1000 et 100 par jour : la tendance seule épuise le stock le onzième jour (aujourd'hui compris)
+        self.consommer(100, 10)
+        OrdreProduction.objects.update(quantite_produire=1)
+        [prevision] = calculer_previsions(self.aujourd_hui, historique_jours=10)
+        self.assertAlmostEqual(prevision.tendance, 0)
+        self.assertEqual(prevision.jours_avant_rupture, 10)
+        self.assertEqual(prevision.date_rupture, self.aujourd_hui + timedelta(days=10))
+        # L'ordre de J+3 (1400) dépasse le stock le jour même de sa production, pas la veille ni le lendemain
+        OrdreProduction.objects.update(quantite_produire=4)
+        [prevision] = calculer_previsions(self.aujourd_hui, historique_jours=10)
+        self.assertEqual(prevision.jours_avant_rupture, 3)
+        self.assertEqual(prevision.date_rupture, self.aujourd_hui + timedelta(days=3))
+
+    def test_cache_invalide_par_les_formules(self):
+        self.assertEqual(previsions()[0].besoin_planifie, 1400)
+        version = _version()
+        self.composition.quantite = 400
+        self.composition.save()
+        self.assertNotEqual(_version(), version)
+        self.assertEqual(previsions()[0].besoin_planifie, 1600)
+
+        version = _version()
+        self.formule.quantite_produite_reference = 2
+        self.formule.save()
+        self.assertNotEqual(_version(), version)
+        self.assertEqual(previsions()[0].besoin_planifie, 800)